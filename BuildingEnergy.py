@@ -4,16 +4,29 @@
 # Last update: Nov 2024
 # =================================================
 
-from psychrometrics import psychrometrics, moist_air_density
+from psychrometrics import moist_air_density, relative_humidity
 import FuzzySetpoint
 import logging
 import numpy
 import copy
-import math
 import Read_Input
 from Simparam import SimParam
 from PMV import calculate_pmv
-from FuzzySetpoint import FuzzyControlSystem
+from FuzzySetpoint import get_fuzzy_control_system
+
+def SelectPerBuilding(Condition,Value,Otherwise):
+    # numpy.where that returns a scalar for one building type and an array for all building types (BuildingStock)
+    Selected = numpy.where(Condition,Value,Otherwise)
+    return Selected if Selected.ndim else Selected[()]
+
+def EvaluatePerBuilding(Fun,*Args):
+    # Evaluate a scalar function (the fuzzy setpoint controllers) for one building type, or for each building type when
+    # some of the arguments are arrays (BuildingStock); the outputs are then returned as arrays
+    nB = [len(Arg) for Arg in Args if isinstance(Arg,numpy.ndarray)]
+    if not nB:
+        return Fun(*Args)
+    Outputs = [Fun(*[Arg[i] if isinstance(Arg,numpy.ndarray) else Arg for Arg in Args]) for i in range(nB[0])]
+    return tuple(numpy.array(Output,dtype=float) for Output in zip(*Outputs))
 
 class Building(object):
 
@@ -67,7 +80,11 @@ class Building(object):
         return abs(float(val)) < tol
 
     def BEMCalc(self,canTemp,canHum,BEM,MeteoData,ParCalculation,simTime,Geometry_m,FractionsRoof,SWR,SmartBuildingParam,TOU):
-        
+
+        # The building attributes and the BEM inputs are scalars for one building type, or arrays with one value per
+        # building type when all building types are advanced together (BuildingStock); the HVAC modes are then selected
+        # per building type with numpy.where
+
         self.coolTempSetpointDay = SmartBuildingParam.coolTempSetpointDay      # [K]
         self.coolTempSetpointNight = SmartBuildingParam.coolTempSetpointNight  # [K]
         self.heatTempSetpointDay = SmartBuildingParam.heatTempSetpointDay      # [K]
@@ -77,30 +94,28 @@ class Building(object):
         self.humRHSetpointDay = SmartBuildingParam.humRHSetpointDay            # [%]
         self.humRHSetpointNight = SmartBuildingParam.humRHSetpointNight        # [%]
         self.T_can = canTemp                                                   # Canyon temperature [K]
-        
+
         self.TOU_Low_Summer = TOU.TOU_Low_Summer                               # [hr] Low price hours for summer
         self.TOU_Medium_Summer = TOU.TOU_Medium_Summer                         # [hr] Medium price hours for summer
         self.TOU_High_Summer = TOU.TOU_High_Summer                             # [hr] High price hours for summer
         self.TOU_Low_Winter = TOU.TOU_Low_Winter                               # [hr] Low price hours for winter
         self.TOU_Medium_Winter = TOU.TOU_Medium_Winter                         # [hr] Medium price hours for winter
         self.TOU_High_Winter = TOU.TOU_High_Winter                             # [hr] High price hours for winter
-        
-        fuzzy_system = FuzzyControlSystem(self.TOU_Low_Summer, self.TOU_Medium_Summer, self.TOU_High_Summer,
-                                          self.TOU_Low_Winter, self.TOU_Medium_Winter, self.TOU_High_Winter)
+
+        # Fuzzy setpoint controller, built once per TOU configuration and shared by all buildings
+        fuzzy_system = get_fuzzy_control_system(TOU, SmartBuildingParam.FuzzyTabulated == 1)
 
         # calculating the outdoor relative hum based on outdoor temp
-        _Tdb, _w, _phi, _h, _Tdp, _v = psychrometrics(self.T_can, canHum, MeteoData.Pre)
-        self.outdoorRH_Outtemp = _phi                                           # Indoor relative humidity[%]
+        self.outdoorRH_Outtemp = relative_humidity(self.T_can, canHum, MeteoData.Pre)       # Indoor relative humidity[%]
 
         # calculating the Outdoor relative hum based on indoor temp
-        _Tdb, _w, _phi, _h, _Tdp, _v = psychrometrics(self.indoorTemp, canHum, MeteoData.Pre)
-        self.outdoorRH_Intemp = _phi                                            # Indoor relative humidity[%]
+        self.outdoorRH_Intemp = relative_humidity(self.indoorTemp, canHum, MeteoData.Pre)   # Indoor relative humidity[%]
 
         self.logger.debug("Logging at {} {}".format(__name__, self.__repr__()))
 
         # Building Energy Model
         self.ElecTotal = 0.0                                       # total electricity consumption [W m^-2]
-        self.nFloor = max(Geometry_m.Height_canyon/float(self.floorHeight),1)   # At least one floor
+        self.nFloor = numpy.maximum(Geometry_m.Height_canyon/self.floorHeight,1)   # At least one floor
         self.sensCoolDemand = 0.0                                  # building sensible cooling demand per unit building footprint area [W m^-2]
         self.sensHeatDemand = 0.0                                  # building sensible heating demand per unit building footprint area [W m^-2]
         self.sensWaterHeatDemand = 0.0                             # building sensible water heating demand per unit building footprint area [W m^-2]
@@ -177,15 +192,15 @@ class Building(object):
                 self.heatTempSetpointLowLow = numpy.NaN         # [ K ]
 
                 self.wTemp = numpy.NaN  # [-]
-            
+
             # When the humidistat is on the controller adjusts the setpoint based on inputs and fuzzy logic controller
             # Here we calculate and adjust both heating and cooling setpoints [K] but only one of them is being used finally based
             # on the building loads
             # Here w represents the variations of the controller output for setpoint adjustment [-]
             else:
-                self.TempSetPointHeat, self.wTemp = fuzzy_system.TempSetpointHeatFun(self.Nocc, self.TempSetPointHeat, simTime, SmartBuildingParam, MeteoData, canTemp, self.dayType)
+                self.TempSetPointHeat, self.wTemp = EvaluatePerBuilding(fuzzy_system.TempSetpointHeatFun, self.Nocc, self.TempSetPointHeat, simTime, SmartBuildingParam, MeteoData, canTemp, self.dayType)
                 T_heat = self.TempSetPointHeat
-                self.TempSetPointCool, self.wTemp = fuzzy_system.TempSetpointCoolFun(self.Nocc, self.TempSetPointCool, simTime, SmartBuildingParam, MeteoData, canTemp, self.dayType)
+                self.TempSetPointCool, self.wTemp = EvaluatePerBuilding(fuzzy_system.TempSetpointCoolFun, self.Nocc, self.TempSetPointCool, simTime, SmartBuildingParam, MeteoData, canTemp, self.dayType)
                 T_cool = self.TempSetPointCool
 
             # RH night [%]
@@ -198,8 +213,8 @@ class Building(object):
                 # Set point specific humidities [kgv kga^-1]
                 # Tetens equation: Pg = 610.78 exp(17.27 T / (T+237.3)) with Pg [Pa] ant T [C]
                 # Saturation pressure [Pa]
-                Pg_cool = 610.78 * math.exp(17.27 * (T_cool - 273.15) / ((T_cool - 273.15) + 237.3))
-                Pg_heat = 610.78 * math.exp(17.27 * (T_heat - 273.15) / ((T_heat - 273.15) + 237.3))
+                Pg_cool = 610.78 * numpy.exp(17.27 * (T_cool - 273.15) / ((T_cool - 273.15) + 237.3))
+                Pg_heat = 610.78 * numpy.exp(17.27 * (T_heat - 273.15) / ((T_heat - 273.15) + 237.3))
                 # Specific humidity set points [kgv kga^-1]
                 q_dehum = 0.622 * (RH_dehum/ 100) * Pg_cool / (MeteoData.Pre - (RH_dehum / 100) * Pg_cool)
                 q_hum= 0.622 * (RH_hum / 100) * Pg_heat / (MeteoData.Pre - (RH_hum / 100) * Pg_heat)
@@ -228,22 +243,20 @@ class Building(object):
                 # Humidity Control is on and the new thresholds and variable setpoints are calculated
                 self.SmartHumSetPoint, self.LowHumSetPoint, self.LowLowHumSetPoint, self.HighHumSetPoint, self.HighHighHumSetPoint,\
                 self.LowRHSetPoint, self.LowLowRHSetPoint, self.HighRHSetPoint, self.HighHighRHSetPoint, self.wHum = \
-                    fuzzy_system.HumSetpointFun( self.Nocc, self.SmartRHSetPoint, SmartBuildingParam, canHum, T_indoor, MeteoData, simTime, self.dayType)
+                    EvaluatePerBuilding(fuzzy_system.HumSetpointFun, self.Nocc, self.SmartRHSetPoint, SmartBuildingParam, canHum, T_indoor, MeteoData, simTime, self.dayType)
                 q_hum = self.SmartHumSetPoint                   # [kgv kga^-1]
                 self.SmartDehumSetPoint, self.wHum = \
-                    fuzzy_system.DehumSetpointFun(self.Nocc, self.SmartRHSetPoint, SmartBuildingParam, canHum, T_indoor, MeteoData, simTime, self.dayType)
+                    EvaluatePerBuilding(fuzzy_system.DehumSetpointFun, self.Nocc, self.SmartRHSetPoint, SmartBuildingParam, canHum, T_indoor, MeteoData, simTime, self.dayType)
                 q_dehum =  self.SmartDehumSetPoint              # [kgv kga^-1]
 
                 # calculating the smart setpoint relative hum
-                _Tdb, _w, _phi, _h, _Tdp, _v = psychrometrics(T_indoor, self.SmartHumSetPoint, MeteoData.Pre)
                 # Indoor relative humidity [%]
-                self.SmartRHHumSetPoint = _phi
+                self.SmartRHHumSetPoint = relative_humidity(T_indoor, self.SmartHumSetPoint, MeteoData.Pre)
                 RH_hum = self.SmartRHHumSetPoint
 
                 # calculating the smart setpoint relative dehum
-                _Tdb, _w, _phi, _h, _Tdp, _v = psychrometrics(T_indoor, self.SmartDehumSetPoint, MeteoData.Pre)
                 # Indoor relative humidity [%]
-                self.SmartRHDehumSetPoint = _phi
+                self.SmartRHDehumSetPoint = relative_humidity(T_indoor, self.SmartDehumSetPoint, MeteoData.Pre)
                 RH_dehum = self.SmartRHDehumSetPoint
 
             self.outdoorHum = canHum                              # [kgv kga^-1]
@@ -278,9 +291,9 @@ class Building(object):
 
             #Smart
             else:
-                self.TempSetPointHeat , self.wTemp = fuzzy_system.TempSetpointHeatFun(self.Nocc, self.TempSetPointHeat, simTime,SmartBuildingParam, MeteoData, canTemp, self.dayType)
+                self.TempSetPointHeat , self.wTemp = EvaluatePerBuilding(fuzzy_system.TempSetpointHeatFun, self.Nocc, self.TempSetPointHeat, simTime,SmartBuildingParam, MeteoData, canTemp, self.dayType)
                 T_heat = self.TempSetPointHeat
-                self.TempSetPointCool , self.wTemp = fuzzy_system.TempSetpointCoolFun(self.Nocc, self.TempSetPointCool, simTime, SmartBuildingParam, MeteoData, canTemp, self.dayType)
+                self.TempSetPointCool , self.wTemp = EvaluatePerBuilding(fuzzy_system.TempSetpointCoolFun, self.Nocc, self.TempSetPointCool, simTime, SmartBuildingParam, MeteoData, canTemp, self.dayType)
                 T_cool = self.TempSetPointCool
 
             #Relative humidity setpoint during the day [%]
@@ -291,12 +304,12 @@ class Building(object):
                 # Set point specific humidities [kgv kga^-1]
                 # Tetens equation: Pg = 610.78 exp(17.27 T / (T+237.3)) with Pg [Pa] ant T [C]
                 # Saturation pressure [Pa]
-                Pg_cool = 610.78 * math.exp(17.27 * (T_cool - 273.15) / ((T_cool - 273.15) + 237.3))
-                Pg_heat = 610.78 * math.exp(17.27 * (T_heat - 273.15) / ((T_heat - 273.15) + 237.3))
+                Pg_cool = 610.78 * numpy.exp(17.27 * (T_cool - 273.15) / ((T_cool - 273.15) + 237.3))
+                Pg_heat = 610.78 * numpy.exp(17.27 * (T_heat - 273.15) / ((T_heat - 273.15) + 237.3))
                 # Specific humidity set points [kgv kga^-1]
                 q_dehum = 0.622 * (RH_dehum / 100) * Pg_cool / (MeteoData.Pre - (RH_dehum/ 100) * Pg_cool)
                 q_hum = 0.622 * (RH_hum/ 100) * Pg_heat / (MeteoData.Pre - (RH_hum / 100) * Pg_heat)
-                
+
                 # Writing NaN for smart parameters when the setpoints are not controlled
                 self.SmartHumSetPoint = numpy.NaN               # [kgv kga^-1]
                 self.SmartDehumSetPoint = numpy.NaN             # [kgv kga^-1]
@@ -321,43 +334,26 @@ class Building(object):
             else:
                 self.SmartHumSetPoint, self.LowHumSetPoint, self.LowLowHumSetPoint, self.HighHumSetPoint, self.HighHighHumSetPoint,\
                 self.LowRHSetPoint, self.LowLowRHSetPoint, self.HighRHSetPoint, self.HighHighRHSetPoint, self.wHum = \
-                    fuzzy_system.HumSetpointFun(self.Nocc, self.SmartRHSetPoint, SmartBuildingParam, canHum, T_indoor, MeteoData, simTime, self.dayType)   # [kgv kga^-1]
+                    EvaluatePerBuilding(fuzzy_system.HumSetpointFun, self.Nocc, self.SmartRHSetPoint, SmartBuildingParam, canHum, T_indoor, MeteoData, simTime, self.dayType)   # [kgv kga^-1]
                 q_hum = self.SmartHumSetPoint                   # [kgv kga^-1]
 
                 self.SmartDehumSetPoint , self.wHum= \
-                    fuzzy_system.DehumSetpointFun(self.Nocc, self.SmartRHSetPoint, SmartBuildingParam, canHum, T_indoor, MeteoData, simTime, self.dayType)
+                    EvaluatePerBuilding(fuzzy_system.DehumSetpointFun, self.Nocc, self.SmartRHSetPoint, SmartBuildingParam, canHum, T_indoor, MeteoData, simTime, self.dayType)
                 q_dehum = self.SmartDehumSetPoint               # [kgv kga^-1]
 
                 # calculating the smart setpoint relative hum
-                _Tdb, _w, _phi, _h, _Tdp, _v = psychrometrics(T_indoor, self.SmartHumSetPoint, MeteoData.Pre)
                 # Indoor relative humidity [%]
-                self.SmartRHHumSetPoint = _phi
+                self.SmartRHHumSetPoint = relative_humidity(T_indoor, self.SmartHumSetPoint, MeteoData.Pre)
                 RH_hum = self.SmartRHHumSetPoint
 
                 # calculating the smart setpoint relative dehum
-                _Tdb, _w, _phi, _h, _Tdp, _v = psychrometrics(T_indoor, self.SmartDehumSetPoint, MeteoData.Pre)
                 # Indoor relative humidity [%]
-                self.SmartRHDehumSetPoint = _phi
+                self.SmartRHDehumSetPoint = relative_humidity(T_indoor, self.SmartDehumSetPoint, MeteoData.Pre)
                 RH_dehum = self.SmartRHDehumSetPoint
-                
+
             # Internal heat per unit building footprint area [W m^-2]
             self.intHeat = self.intHeatDay*self.nFloor
 
-        # Initialize building envelop loads to NaN
-        self.wallheatload = numpy.NaN       # [W m^-2]
-        self.massheatload = numpy.NaN       # [W m^-2]
-        self.winheatload = numpy.NaN        # [W m^-2]
-        self.ceilingheatload = numpy.NaN    # [W m^-2]
-        self.infilheatload = numpy.NaN      # [W m^-2]
-        self.ventheatload = numpy.NaN       # [W m^-2]
-
-        self.wallcoolload = numpy.NaN       # [W m^-2]
-        self.masscoolload = numpy.NaN       # [W m^-2]
-        self.wincoolload = numpy.NaN        # [W m^-2]
-        self.ceilingcoolload = numpy.NaN    # [W m^-2]
-        self.infilcoolload = numpy.NaN      # [W m^-2]
-        self.ventcoolload = numpy.NaN       # [W m^-2]
-
         # Indoor convection heat transfer coefficients
         # wall convective heat transfer coefficient [W m^-2 K^-1]
         zac_in_wall = 3.076
@@ -378,7 +374,7 @@ class Building(object):
         # Latent heat load per unit building footprint area [W m^-2]
         QLintload = self.intHeat * self.intHeatFLat
 
-        self.sensCoolDemand = max(
+        self.sensCoolDemand = numpy.maximum(
             wallArea*zac_in_wall*(T_wall-T_cool) +                        # wall load per unit building footprint area [W m^-2]
             massArea*zac_in_mass*(T_mass-T_cool) +                        # other surfaces load per unit building footprint area [W m^-2]
             winArea*self.uValue*(self.T_can-T_cool) +                     # window load due to temperature difference per unit building footprint area [W m^-2]
@@ -389,7 +385,7 @@ class Building(object):
             self.QWindowSolar,                                            # solar load through window per unit building footprint area
             0.)
 
-        self.sensHeatDemand = max(
+        self.sensHeatDemand = numpy.maximum(
             -(wallArea*zac_in_wall*(T_wall-T_heat) +                      # wall load per unit building footprint area [W m^-2]
             massArea*zac_in_mass*(T_mass-T_heat) +                        # other surfaces load per unit building footprint area [W m^-2]
             winArea*self.uValue*(self.T_can-T_heat) +                     # window load due to temperature difference per unit building footprint area [W m^-2]
@@ -400,181 +396,135 @@ class Building(object):
             self.QWindowSolar),                                           # solar load through window per unit building footprint area [W m^-2]
             0.)
 
-        self.dehumDemand = max(
+        self.dehumDemand = numpy.maximum(
             volInfil * dens * ParCalculation.Lv * (canHum - q_dehum) +    # Moisture load from infiltration
             volVent * dens *ParCalculation.Lv * (canHum - q_dehum) +      # Moisture load from ventilation
             QLintload,                                                    # Internal sources of moisture (people, equipment)
             0.
         )
 
-        self.humDemand = max(
+        self.humDemand = numpy.maximum(
             -(volInfil * dens * ParCalculation.Lv * (canHum - q_hum) +    # Moisture load from infiltration
               volVent * dens * ParCalculation.Lv *(canHum - q_hum) +      # Moisture load from ventilation
               QLintload),                                                 # Internal sources of moisture
             0.
         )
-        
+
         # System under dehumidification
-        if self.dehumDemand > 0:                                          # [W m^-2]
-            self.q_Setpoint = q_dehum                                     # [kgv kga^-1]
-            self.RH_Setpoint = RH_dehum                                   # [%]
-            self.humDemand = 0                                            # [W m^-2]
+        Dehum = self.dehumDemand > 0                                      # [W m^-2]
         # System under humidification
-        elif self.humDemand > 0:                                          # [W m^-2]
-            self.q_Setpoint = q_hum                                       # [kgv kga^-1]
-            self.RH_Setpoint = RH_hum                                     # [%]
-            self.dehumDemand = 0                                          # [W m^-2]
-        # System in neutral mode
-        else:
-            self.q_Setpoint = numpy.NaN                                   # [kgv kga^-1]
-            self.RH_Setpoint = numpy.NaN                                  # [%]
+        Hum = ~Dehum & (self.humDemand > 0)                               # [W m^-2]
+        # Otherwise the system is in neutral mode and the setpoints are NaN
+        self.q_Setpoint = SelectPerBuilding(Dehum,q_dehum,SelectPerBuilding(Hum,q_hum,numpy.NaN))     # [kgv kga^-1]
+        self.RH_Setpoint = SelectPerBuilding(Dehum,RH_dehum,SelectPerBuilding(Hum,RH_hum,numpy.NaN))  # [%]
+        self.humDemand = SelectPerBuilding(Dehum,0.,self.humDemand)                                   # [W m^-2]
+        self.dehumDemand = SelectPerBuilding(Hum,0.,self.dehumDemand)                                 # [W m^-2]
         # dehumDemand>0 and humDemand<0
         self.LatentLoad = self.dehumDemand - self.humDemand               # [W m^-2]
-        
+
         # -------------------------------------------------------------
         # HVAC system (cooling demand = [W m^-2] bld footprint)
         # -------------------------------------------------------------
         # If the canyon air temperature is greater than 288 K building energy system is under cooling mode
-        if self.sensCoolDemand > 0. and self.T_can > 288.:                              #[W m^-2]
-
-            # QL: Latent heat per unit floor area [W m^-2] from infiltration & ventilation
-            # volInfil and volVent: volumetric rate of infiltration or ventilation per unit area [m^3 s^-1 m^-2]
-            # ParCalculation.Lv: latent heat of evaporation [J kgv^-1]
-            # dens: density [kga m^-3]
-            # canHum: canyon specific humidity [kgv kga^-1]
-            # q_cool, q_heat, or q_smart: indoor specific humidity set point [kgv kga^-1]
-
-            self.T_smart = T_cool                                                       # [ K ]
-
-            # Wall cooling load per unit building footprint area [W m^-2]
-            self.wallcoolload = wallArea * zac_in_wall * (T_wall - T_cool)
-            # Other surfaces (mass) cooling load per unit building footprint area [W m^-2]
-            self.masscoolload = massArea * zac_in_mass * (T_mass - T_cool)
-            # Window cooling load due to temperature difference per unit building footprint area [W m^-2]
-            self.wincoolload = winArea * self.uValue * (self.T_can - T_cool)
-            # Ceiling cooling load per unit building footprint area [W m^-2]
-            self.ceilingcoolload = ceilingArea * zac_in_ceil * (T_ceil - T_cool)
-            # Infiltration cooling load per unit building footprint area [W m^-2]
-            self.infilcoolload = volInfil * dens * ParCalculation.cp_atm * (self.T_can - T_cool)
-            # Ventilation cooling load per unit building footprint area [W m^-2]
-            self.ventcoolload = volVent * dens * ParCalculation.cp_atm * (self.T_can - T_cool)
-
-            # Calculate input work required by the refrigeration cycle per unit building footprint area [W m^-2]
-            # COP = QL/Win or Win = QL/COP
-            self.coolConsump = (max(self.sensCoolDemand+self.dehumDemand,0.0))/self.copAdj
-
-            # Calculate waste heat from HVAC system per unit building footprint area [W m^-2]
-            # Using 1st law of thermodynamics QH = Win + QL
-            if (self.condType == 'AIR'):
-                self.sensWasteCoolHeatLatent = max(self.sensCoolDemand+self.dehumDemand,0)+self.coolConsump
-                self.latWaste = 0.0
-            # We have not tested this option; it must be investigated further
-            elif (self.condType == 'WAT'):
-                self.sensWasteCoolHeatLatent = max(self.sensCoolDemand+self.dehumDemand,0)+self.coolConsump*(1.-evapEff)
-                self.latWaste = max(self.sensCoolDemand+self.dehumDemand,0)+self.coolConsump*evapEff
-
-            self.sensHeatDemand = 0                                                      # [W m^-2]
-            
-            # Reading constant setpoint thresholds for saving in output
-            if self.ThermostatMode == 1:
-                self.coolTempSetpointHighHigh = SmartBuildingParam.coolTempSetpointHighHigh  # [ K ]
-                self.coolTempSetpointHigh = SmartBuildingParam.coolTempSetpointHigh          # [ K ]
-                self.coolTempSetpointLow = SmartBuildingParam.coolTempSetpointLow            # [ K ]
-                self.coolTempSetpointLowLow = SmartBuildingParam.coolTempSetpointLowLow      # [ K ]
-            
-            # NaN heating calculations under cooling for in saving outputs
-            self.heatTempSetpointHighHigh = numpy.NaN                                    # [ K ]
-            self.heatTempSetpointHigh = numpy.NaN                                        # [ K ]
-            self.heatTempSetpointLow = numpy.NaN                                         # [ K ]
-            self.heatTempSetpointLowLow = numpy.NaN                                      # [ K ]
-            self.wallheatload = numpy.NaN                                                # [W m^-2]
-            self.massheatload = numpy.NaN                                                # [W m^-2]
-            self.winheatload = numpy.NaN                                                 # [W m^-2]
-            self.ceilingheatload = numpy.NaN                                             # [W m^-2]
-            self.infilheatload = numpy.NaN                                               # [W m^-2]
-            self.ventheatload = numpy.NaN                                                # [W m^-2]
-
-        # -------------------------------------------------------------
-        # HVAC system (heating demand = [W m^-2] bld footprint)
-        # -------------------------------------------------------------
+        Cool = (self.sensCoolDemand > 0.) & (self.T_can > 288.)
         # If the canyon air temperature is less than 288 K building energy system is under heating mode
         # Under heating mode, there is no dehumidification
-        elif self.sensHeatDemand > 0. and self.T_can < 288.:
-
-            self.T_smart = T_heat                                                        # [ K ]
-
-            # Wall heating load per unit building footprint area [W m^-2]
-            self.wallheatload = wallArea * zac_in_wall * (T_wall - T_heat)
-            # Other surfaces (mass) heating load per unit building footprint area [W m^-2]
-            self.massheatload = massArea * zac_in_mass * (T_mass - T_heat)
-            # Window heating load due to temperature difference per unit building footprint area [W m^-2]
-            self.winheatload = winArea * self.uValue * (self.T_can - T_heat)
-            # Ceiling heating load per unit building footprint area [W m^-2]
-            self.ceilingheatload = ceilingArea * zac_in_ceil * (T_ceil - T_heat)
-            # Infiltration heating load per unit building footprint area [W m^-2]
-            self.infilheatload = volInfil * dens * ParCalculation.cp_atm * (self.T_can - T_heat)
-            # Ventilation heating load per unit building footprint area [W m^-2]
-            self.ventheatload = volVent * dens * ParCalculation.cp_atm * (self.T_can - T_heat)
-
-            # Calculate the energy consumption of the heating system per unit building footprint area [W m^-2] from heating demand divided by efficiency
-            self.heatConsump  = (self.sensHeatDemand + self.humDemand) / self.heatEff
-            # Calculate waste heat from HVAC system per unit building footprint area [W m^-2]
-            # Using 1st law of thermodynamics QL = Win - QH
-            self.sensWasteCoolHeatLatent = self.heatConsump - (self.sensHeatDemand + self.humDemand)
-            self.sensCoolDemand = 0.0                                                       # [W m^-2]
-
-            # Reading constant setpoint thresholds for saving in output
-            if self.ThermostatMode == 1:
-                self.heatTempSetpointHighHigh = SmartBuildingParam.heatTempSetpointHighHigh     # [ K ]
-                self.heatTempSetpointHigh = SmartBuildingParam.heatTempSetpointHigh             # [ K ]
-                self.heatTempSetpointLow = SmartBuildingParam.heatTempSetpointLow               # [ K ]
-                self.heatTempSetpointLowLow = SmartBuildingParam.heatTempSetpointLowLow         # [ K ]
-            
-            # NaN cooling calculations under heating for in saving outputs
-            self.coolTempSetpointHighHigh = numpy.NaN                                       # [ K ]
-            self.coolTempSetpointHigh = numpy.NaN                                           # [ K ]
-            self.coolTempSetpointLow = numpy.NaN                                            # [ K ]
-            self.coolTempSetpointLowLow = numpy.NaN                                         # [ K ]
-            self.wallcoolload = numpy.NaN                                                   # [W m^-2]
-            self.masscoolload = numpy.NaN                                                   # [W m^-2]
-            self.wincoolload = numpy.NaN                                                    # [W m^-2]
-            self.ceilingcoolload = numpy.NaN                                                # [W m^-2]
-            self.infilcoolload = numpy.NaN                                                  # [W m^-2]
-            self.ventcoolload = numpy.NaN                                                   # [W m^-2]
-
-        else:
-            
-            # Writing NaN for smart parameters when the setpoints are under no control
-            self.SmartHumSetPoint = numpy.NaN           # [kgv kga^-1]
-            self.SmartDehumSetPoint = numpy.NaN         # [kgv kga^-1]
-
-            self.LowHumSetPoint =  numpy.NaN            # [kgv kga^-1]
-            self.LowLowHumSetPoint =  numpy.NaN         # [kgv kga^-1]
-            self.HighHumSetPoint =  numpy.NaN           # [kgv kga^-1]
-            self.HighHighHumSetPoint =  numpy.NaN       # [kgv kga^-1]
-
-            self.SmartRHSetPoint = numpy.NaN            # [%]
-            self.SmartRHHumSetPoint = numpy.NaN         # [%]
-            self.SmartRHDehumSetPoint = numpy.NaN       # [%]
-
-            self.LowRHSetPoint = numpy.NaN              # [%]
-            self.LowLowRHSetPoint = numpy.NaN           # [%]
-            self.HighRHSetPoint = numpy.NaN             # [%]
-            self.HighHighRHSetPoint = numpy.NaN         # [%]
-            
-            self.T_smart = numpy.NaN                    # [ K ]
-            self.coolTempSetpointHighHigh = numpy.NaN   # [ K ]
-            self.coolTempSetpointHigh = numpy.NaN       # [ K ]
-            self.coolTempSetpointLow = numpy.NaN        # [ K ]
-            self.coolTempSetpointLowLow = numpy.NaN     # [ K ]
-
-            self.heatTempSetpointHighHigh = numpy.NaN   # [ K ]
-            self.heatTempSetpointHigh = numpy.NaN       # [ K ]
-            self.heatTempSetpointLow = numpy.NaN        # [ K ]
-            self.heatTempSetpointLowLow = numpy.NaN     # [ K ]
-
-            self.wTemp = numpy.NaN                      # [-]
-            self.wHum = numpy.NaN                       # [-]
+        Heat = ~Cool & (self.sensHeatDemand > 0.) & (self.T_can < 288.)
+        # Otherwise the building energy system is in neutral mode
+        Neutral = ~Cool & ~Heat
+
+        # QL: Latent heat per unit floor area [W m^-2] from infiltration & ventilation
+        # volInfil and volVent: volumetric rate of infiltration or ventilation per unit area [m^3 s^-1 m^-2]
+        # ParCalculation.Lv: latent heat of evaporation [J kgv^-1]
+        # dens: density [kga m^-3]
+        # canHum: canyon specific humidity [kgv kga^-1]
+        # q_cool, q_heat, or q_smart: indoor specific humidity set point [kgv kga^-1]
+
+        self.T_smart = SelectPerBuilding(Cool,T_cool,SelectPerBuilding(Heat,T_heat,numpy.NaN))          # [ K ]
+
+        # Building envelope loads are NaN when the system is not under cooling or heating
+        # Wall cooling load per unit building footprint area [W m^-2]
+        self.wallcoolload = SelectPerBuilding(Cool,wallArea * zac_in_wall * (T_wall - T_cool),numpy.NaN)
+        # Other surfaces (mass) cooling load per unit building footprint area [W m^-2]
+        self.masscoolload = SelectPerBuilding(Cool,massArea * zac_in_mass * (T_mass - T_cool),numpy.NaN)
+        # Window cooling load due to temperature difference per unit building footprint area [W m^-2]
+        self.wincoolload = SelectPerBuilding(Cool,winArea * self.uValue * (self.T_can - T_cool),numpy.NaN)
+        # Ceiling cooling load per unit building footprint area [W m^-2]
+        self.ceilingcoolload = SelectPerBuilding(Cool,ceilingArea * zac_in_ceil * (T_ceil - T_cool),numpy.NaN)
+        # Infiltration cooling load per unit building footprint area [W m^-2]
+        self.infilcoolload = SelectPerBuilding(Cool,volInfil * dens * ParCalculation.cp_atm * (self.T_can - T_cool),numpy.NaN)
+        # Ventilation cooling load per unit building footprint area [W m^-2]
+        self.ventcoolload = SelectPerBuilding(Cool,volVent * dens * ParCalculation.cp_atm * (self.T_can - T_cool),numpy.NaN)
+
+        # Wall heating load per unit building footprint area [W m^-2]
+        self.wallheatload = SelectPerBuilding(Heat,wallArea * zac_in_wall * (T_wall - T_heat),numpy.NaN)
+        # Other surfaces (mass) heating load per unit building footprint area [W m^-2]
+        self.massheatload = SelectPerBuilding(Heat,massArea * zac_in_mass * (T_mass - T_heat),numpy.NaN)
+        # Window heating load due to temperature difference per unit building footprint area [W m^-2]
+        self.winheatload = SelectPerBuilding(Heat,winArea * self.uValue * (self.T_can - T_heat),numpy.NaN)
+        # Ceiling heating load per unit building footprint area [W m^-2]
+        self.ceilingheatload = SelectPerBuilding(Heat,ceilingArea * zac_in_ceil * (T_ceil - T_heat),numpy.NaN)
+        # Infiltration heating load per unit building footprint area [W m^-2]
+        self.infilheatload = SelectPerBuilding(Heat,volInfil * dens * ParCalculation.cp_atm * (self.T_can - T_heat),numpy.NaN)
+        # Ventilation heating load per unit building footprint area [W m^-2]
+        self.ventheatload = SelectPerBuilding(Heat,volVent * dens * ParCalculation.cp_atm * (self.T_can - T_heat),numpy.NaN)
+
+        # Calculate input work required by the refrigeration cycle per unit building footprint area [W m^-2]
+        # COP = QL/Win or Win = QL/COP
+        coolDemand = numpy.maximum(self.sensCoolDemand+self.dehumDemand,0.0)
+        self.coolConsump = SelectPerBuilding(Cool,coolDemand/self.copAdj,0.0)
+        # Calculate the energy consumption of the heating system per unit building footprint area [W m^-2] from heating demand divided by efficiency
+        self.heatConsump = SelectPerBuilding(Heat,(self.sensHeatDemand + self.humDemand) / self.heatEff,0.0)
+
+        # Calculate waste heat from HVAC system per unit building footprint area [W m^-2]
+        # Under cooling using 1st law of thermodynamics QH = Win + QL; the WAT condensation type has not been tested and
+        # must be investigated further
+        # Under heating using 1st law of thermodynamics QL = Win - QH
+        CoolAir = Cool & (self.condType == 'AIR')
+        CoolWater = Cool & (self.condType == 'WAT')
+        self.sensWasteCoolHeatLatent = SelectPerBuilding(CoolAir,coolDemand+self.coolConsump,
+                                       SelectPerBuilding(CoolWater,coolDemand+self.coolConsump*(1.-evapEff),
+                                       SelectPerBuilding(Heat,self.heatConsump - (self.sensHeatDemand + self.humDemand),0.0)))
+        # Latent waste heat [W m^-2] is only updated under cooling
+        self.latWaste = SelectPerBuilding(CoolAir,0.0,SelectPerBuilding(CoolWater,coolDemand+self.coolConsump*evapEff,
+                                                                        getattr(self,'latWaste',numpy.NaN)))
+
+        self.sensHeatDemand = SelectPerBuilding(Cool,0,self.sensHeatDemand)                    # [W m^-2]
+        self.sensCoolDemand = SelectPerBuilding(Heat,0.0,self.sensCoolDemand)                  # [W m^-2]
+
+        # Reading constant setpoint thresholds for saving in output; NaN heating thresholds under cooling and NaN cooling
+        # thresholds under heating
+        if self.ThermostatMode == 1:
+            self.coolTempSetpointHighHigh = SelectPerBuilding(Cool,SmartBuildingParam.coolTempSetpointHighHigh,numpy.NaN)  # [ K ]
+            self.coolTempSetpointHigh = SelectPerBuilding(Cool,SmartBuildingParam.coolTempSetpointHigh,numpy.NaN)          # [ K ]
+            self.coolTempSetpointLow = SelectPerBuilding(Cool,SmartBuildingParam.coolTempSetpointLow,numpy.NaN)            # [ K ]
+            self.coolTempSetpointLowLow = SelectPerBuilding(Cool,SmartBuildingParam.coolTempSetpointLowLow,numpy.NaN)      # [ K ]
+
+            self.heatTempSetpointHighHigh = SelectPerBuilding(Heat,SmartBuildingParam.heatTempSetpointHighHigh,numpy.NaN)  # [ K ]
+            self.heatTempSetpointHigh = SelectPerBuilding(Heat,SmartBuildingParam.heatTempSetpointHigh,numpy.NaN)          # [ K ]
+            self.heatTempSetpointLow = SelectPerBuilding(Heat,SmartBuildingParam.heatTempSetpointLow,numpy.NaN)            # [ K ]
+            self.heatTempSetpointLowLow = SelectPerBuilding(Heat,SmartBuildingParam.heatTempSetpointLowLow,numpy.NaN)      # [ K ]
+
+        # Writing NaN for smart parameters when the setpoints are under no control
+        self.SmartHumSetPoint = SelectPerBuilding(Neutral,numpy.NaN,self.SmartHumSetPoint)           # [kgv kga^-1]
+        self.SmartDehumSetPoint = SelectPerBuilding(Neutral,numpy.NaN,self.SmartDehumSetPoint)       # [kgv kga^-1]
+
+        self.LowHumSetPoint = SelectPerBuilding(Neutral,numpy.NaN,self.LowHumSetPoint)               # [kgv kga^-1]
+        self.LowLowHumSetPoint = SelectPerBuilding(Neutral,numpy.NaN,self.LowLowHumSetPoint)         # [kgv kga^-1]
+        self.HighHumSetPoint = SelectPerBuilding(Neutral,numpy.NaN,self.HighHumSetPoint)             # [kgv kga^-1]
+        self.HighHighHumSetPoint = SelectPerBuilding(Neutral,numpy.NaN,self.HighHighHumSetPoint)     # [kgv kga^-1]
+
+        self.SmartRHSetPoint = SelectPerBuilding(Neutral,numpy.NaN,self.SmartRHSetPoint)             # [%]
+        self.SmartRHHumSetPoint = SelectPerBuilding(Neutral,numpy.NaN,self.SmartRHHumSetPoint)       # [%]
+        self.SmartRHDehumSetPoint = SelectPerBuilding(Neutral,numpy.NaN,self.SmartRHDehumSetPoint)   # [%]
+
+        self.LowRHSetPoint = SelectPerBuilding(Neutral,numpy.NaN,self.LowRHSetPoint)                 # [%]
+        self.LowLowRHSetPoint = SelectPerBuilding(Neutral,numpy.NaN,self.LowLowRHSetPoint)           # [%]
+        self.HighRHSetPoint = SelectPerBuilding(Neutral,numpy.NaN,self.HighRHSetPoint)               # [%]
+        self.HighHighRHSetPoint = SelectPerBuilding(Neutral,numpy.NaN,self.HighHighRHSetPoint)       # [%]
+
+        self.wTemp = SelectPerBuilding(Neutral,numpy.NaN,self.wTemp)                                 # [-]
+        self.wHum = SelectPerBuilding(Neutral,numpy.NaN,self.wHum)                                   # [-]
 
         # -------------------------------------------------------------
         # Evolution of the internal temperature and humidity
@@ -613,9 +563,8 @@ class Building(object):
         self.indoorHum = (HL1 - QL) / HL2
 
         # Calculate relative humidity ((Pw/Pws)*100) using pressure, indoor temperature, humidity
-        _Tdb, _w, _phi, _h, _Tdp, _v = psychrometrics(self.indoorTemp, self.indoorHum, MeteoData.Pre)
         # Indoor relative humidity [%]
-        self.indoorRH = _phi
+        self.indoorRH = relative_humidity(self.indoorTemp, self.indoorHum, MeteoData.Pre)
 
         # Calculate MRT using area-weighted mean surface temperatures of walls, ceiling, and floor
         A_wall = wallArea                                                    # Wall area per unit building footprint area [m^2/m^2]
@@ -672,3 +621,151 @@ class Building(object):
         # Calculate total gas consumption per unit floor area [W m^-2] which is equal to gas consumption per unit floor area +
         # energy consumption for domestic hot water per unit floor area + energy consumption of the heating system per unit floor area
         self.GasTotal = BEM.Gas + (massFlowRateSWH*CpH20*(T_hot - MeteoData.waterTemp)/self.nFloor)/self.heatEff + self.heatConsump/self.nFloor
+
+class BuildingStockArrays_Def():
+    # Attributes of the BEM objects or of their elements with one value per building type (see BuildingStock)
+    pass
+
+class BuildingStock(object):
+
+    """
+    Building energy model of all building types advanced together (struct of arrays)
+    The schedules and parameters of the building types are stacked in arrays once, and the schedules of a time step are
+    gathered with one index on the day type and hour. Building.BEMCalc is evaluated once for all building types on a
+    building whose attributes are arrays, and the results are written to the attributes of the BEM and building objects,
+    so that the rest of the model and the output writers are unchanged.
+    ------
+    BEM: List of building energy models (one per building type)
+    Sch: List of schedules of the building types
+    """
+
+    # Schedules stacked per building type (fractions or setpoints per day type and hour)
+    ScheduleNames = ['Cool','Heat','RHCool','RHHeat','Occ','Elec','Light','SWH','Gas']
+    # Building parameters that do not change during the simulation
+    ParameterNames = ['floorHeight','infil','glazingRatio','uValue','shgc','copAdj','heatEff']
+    # State of the buildings carried from one time step to the next by Building.BEMCalc
+    StateNames = ['indoorTemp','indoorHum','TempSetPointHeat','TempSetPointCool','SmartRHSetPoint','latWaste']
+
+    def __init__(self,BEM,Sch):
+        self.BEM = BEM
+        self.buildings = [BEM[i].building for i in range(len(BEM))]
+        # Schedules [building type, schedule, day type, hour]
+        self.Schedules = numpy.array([[getattr(Sch[i],name) for name in self.ScheduleNames] for i in range(len(BEM))],
+                                     dtype=float)
+        # Peak loads of the schedules [building type]
+        self.Nocc = numpy.array([Sch[i].Nocc for i in range(len(BEM))],dtype=float)    # [# m^-2]
+        self.Qelec = numpy.array([Sch[i].Qelec for i in range(len(BEM))],dtype=float)  # [W m^-2]
+        self.Qlight = numpy.array([Sch[i].Qlight for i in range(len(BEM))],dtype=float)# [W m^-2]
+        self.Vswh = numpy.array([Sch[i].Vswh for i in range(len(BEM))],dtype=float)    # [kg hr^-1 m^-2]
+        self.Qgas = numpy.array([Sch[i].Qgas for i in range(len(BEM))],dtype=float)    # [W m^-2]
+        self.Vent = numpy.array([Sch[i].Vent for i in range(len(BEM))],dtype=float)    # [m^3 s^-1 m^-2]
+        self.fl_area = numpy.array([BEM[i].fl_area for i in range(len(BEM))],dtype=float)   # [m^2]
+
+        # Building with one value per building type in each attribute, on which Building.BEMCalc is evaluated
+        self.building = Building.__new__(Building)
+        self.building.Type = "all building types"
+        self.building.Era = "null"
+        self.building.Zone = "null"
+        self.building.logger = logging.getLogger(__name__)
+        for name in self.ParameterNames:
+            setattr(self.building,name,self._gather(name))
+        self.building.condType = numpy.array([b.condType for b in self.buildings])
+        # Attributes of the building that are not written back to the building objects
+        self.Static = set(vars(self.building))
+        # BEM inputs of Building.BEMCalc
+        self.Envelope = BuildingStockArrays_Def()
+        for obj in ['wallSun','wallShade','roofImp','roofVeg','mass']:
+            setattr(self.Envelope,obj,BuildingStockArrays_Def())
+
+    def _gather(self,attr,obj=None):
+        # Attribute of the building objects (or of an element of the BEM objects) of all building types as an array
+        if obj is None:
+            return numpy.array([getattr(b,attr,numpy.NaN) for b in self.buildings],dtype=float)
+        return numpy.array([getattr(getattr(bem,obj),attr) for bem in self.BEM],dtype=float)
+
+    def _scatter(self,objs,values):
+        # Set the attributes of the objects from a dictionary of arrays (one value per building type) and scalars
+        names = list(values)
+        columns = [values[name].tolist() if isinstance(values[name],numpy.ndarray) else [values[name]]*len(objs)
+                   for name in names]
+        for obj,row in zip(objs,zip(*columns)):
+            obj.__dict__.update(zip(names,row))
+
+    def UpdateSchedule(self,dayType,hourDay,BEMParam,FractionsRoof):
+
+        """
+        Update the schedules, internal heat loads, and envelope temperatures of all building types
+        ------
+        INPUT:
+        dayType: Day type (1 = weekday, 2 = sat, 3 = sun/other)
+        hourDay: Hour of the day (0 - 23hr)
+        BEMParam: Building energy model parameters
+        FractionsRoof: Roof fractions
+        """
+
+        # Schedules of all building types at this hour [building type, schedule]
+        S = self.Schedules[:,:,dayType - 1,hourDay]
+        Cool,Heat,RHCool,RHHeat,Occ,Elec,Light,SWH,Gas = S.T
+        Envelope = self.Envelope
+
+        # Set point temperatures [K] and relative humidities [%]
+        coolTempSetpoint = Cool + 273.15
+        heatTempSetpoint = Heat + 273.15
+        # Number of occupants x occ fraction for day
+        Nocc = self.Nocc * Occ
+        # Electricity consumption and lighting per unit floor area [W m^-2]
+        Envelope.Elec = self.Qelec * Elec
+        Envelope.Light = self.Qlight * Light
+        # Sensible Q occupant * fraction occupant sensible Q * number of occupants
+        Qocc = BEMParam.sensOcc*(1-BEMParam.LatFOcc)*Nocc
+        # Solar water heating per unit floor area [kg hr^-1 m^-2]
+        Envelope.SWH = self.Vswh * SWH
+        # Gas consumption per unit floor area [W m^-2]
+        Envelope.Gas = self.Qgas * Gas
+        # Internal heat and corresponding fractional loads per unit floor area [W m^-2]
+        intHeat = Envelope.Light + Envelope.Elec + Qocc
+        intHeatFRad = (BEMParam.RadFLight*Envelope.Light+BEMParam.RadFEquip*Envelope.Elec)/intHeat
+        intHeatFLat = BEMParam.LatFOcc*BEMParam.sensOcc*Nocc/intHeat
+
+        # Envelope temperatures [K]
+        for obj in ['wallSun','wallShade','roofImp','roofVeg','mass']:
+            getattr(Envelope,obj).Tint = self._gather('Tint',obj)
+            getattr(Envelope,obj).Text = self._gather('Text',obj)
+
+        self._scatter(self.BEM,{'Elec': Envelope.Elec, 'Light': Envelope.Light, 'Nocc': Nocc, 'Qocc': Qocc,
+                                'SWH': Envelope.SWH, 'Gas': Envelope.Gas,
+                                'T_wallex': (Envelope.wallSun.Text + Envelope.wallShade.Text)/2,
+                                'T_wallin': (Envelope.wallSun.Tint + Envelope.wallShade.Tint)/2,
+                                'T_roofex': FractionsRoof.fimp*Envelope.roofImp.Text+FractionsRoof.fveg*Envelope.roofVeg.Text,
+                                'T_roofin': FractionsRoof.fimp*Envelope.roofImp.Tint+FractionsRoof.fveg*Envelope.roofVeg.Tint})
+        Schedule = {'coolTempSetpointDay': coolTempSetpoint, 'coolTempSetpointNight': coolTempSetpoint,
+                    'heatTempSetpointDay': heatTempSetpoint, 'heatTempSetpointNight': heatTempSetpoint,
+                    'coolRHSetpointDay': RHCool, 'coolRHSetpointNight': RHCool,
+                    'heatRHSetpointDay': RHHeat, 'heatRHSetpointNight': RHHeat,
+                    'Nocc': Nocc, 'vent': self.Vent,
+                    'intHeatDay': intHeat, 'intHeatNight': intHeat,
+                    'intHeatFRad': intHeatFRad, 'intHeatFLat': intHeatFLat}
+        self.building.__dict__.update(Schedule)
+        self._scatter(self.buildings,Schedule)
+
+    def BEMCalc(self,canTemp,canHum,MeteoData,ParCalculation,simTime,Geometry_m,FractionsRoof,SWR,SmartBuildingParam,TOU):
+
+        """
+        Building.BEMCalc for all building types; UpdateSchedule must be called before at each time step
+        ------
+        INPUT:
+        canTemp: Canyon temperature [K]
+        canHum: Canyon specific humidity [kgv kga^-1]
+        Other inputs as in Building.BEMCalc
+        """
+
+        # State of the previous time step (the building objects may have been restored from a checkpoint)
+        for name in self.StateNames:
+            setattr(self.building,name,self._gather(name))
+
+        self.building.BEMCalc(canTemp,canHum,self.Envelope,MeteoData,ParCalculation,simTime,Geometry_m,FractionsRoof,SWR,
+                              SmartBuildingParam,TOU)
+
+        self._scatter(self.buildings,{name: value for name,value in vars(self.building).items() if name not in self.Static})
+        # Electricity consumption of urban area [W]
+        self._scatter(self.BEM,{'ElecTotal': self.building.ElecTotal * self.fl_area})
@@ -0,0 +1,127 @@
+import numpy
+import pickle
+import logging
+from FileUtilities import WriteFileAtomic
+
+"""
+Save and restore the state of a simulation (checkpoint/restart)
+Last update: October 2026
+"""
+
+# Many model objects are instances of classes defined inside functions, which cannot be pickled. The checkpoint
+# therefore stores the attribute values of the model objects (numbers, arrays, strings, and nested lists/objects) and
+# restores them into the objects of a newly instantiated simulation. Loggers hold the state of the logging module, not of
+# the model, and are neither saved nor restored.
+
+class StateObject_Def():
+    # Container for restored objects that do not exist in the new simulation
+    pass
+
+class _Object_Def():
+    # Attribute values of a saved object
+    def __init__(self,attrs):
+        self.attrs = attrs
+
+_Skip = object()
+
+def _state(value,ancestors):
+    if value is None or isinstance(value,(bool,int,float,complex,str,bytes,numpy.number,numpy.bool_)):
+        return value
+    if isinstance(value,numpy.ndarray):
+        return value.copy()
+    if callable(value) or isinstance(value,logging.Logger) or id(value) in ancestors:
+        return _Skip
+    ancestors.add(id(value))
+    state = _Skip
+    if isinstance(value,(list,tuple,set,frozenset)):
+        state = [_state(v,ancestors) for v in value]
+        if any(s is _Skip for s in state):
+            state = _Skip
+        elif not isinstance(value,list):
+            state = type(value)(state)
+    elif isinstance(value,dict):
+        state = {k: _state(v,ancestors) for k,v in value.items()}
+        state = {k: s for k,s in state.items() if s is not _Skip}
+    elif hasattr(value,'__dict__'):
+        attrs = {}
+        for attr,v in vars(value).items():
+            s = _state(v,ancestors)
+            if s is not _Skip:
+                attrs[attr] = s
+        state = _Object_Def(attrs)
+    ancestors.discard(id(value))
+    return state
+
+def GetState(obj,attrs=None):
+
+    """
+    Return the attribute values of a model object as a picklable structure; only the attributes in attrs if given
+    Callables, modules, and references back to an enclosing object are skipped.
+    """
+
+    ancestors = set([id(obj)])
+    state = {}
+    for attr in (vars(obj) if attrs is None else attrs):
+        if hasattr(obj,attr):
+            s = _state(getattr(obj,attr),ancestors)
+            if s is not _Skip:
+                state[attr] = s
+    return _Object_Def(state)
+
+def _build(state):
+    # Build a new value from a saved state
+    if isinstance(state,_Object_Def):
+        obj = StateObject_Def()
+        for attr,s in state.attrs.items():
+            setattr(obj,attr,_build(s))
+        return obj
+    if isinstance(state,list):
+        return [_build(s) for s in state]
+    if isinstance(state,(tuple,set,frozenset)):
+        return type(state)(_build(s) for s in state)
+    if isinstance(state,dict):
+        return {k: _build(s) for k,s in state.items()}
+    if isinstance(state,numpy.ndarray):
+        return state.copy()
+    return state
+
+def _restore(current,state):
+    # Return the restored value; objects, lists, and arrays of the new simulation are updated in place so that
+    # references shared between model objects are kept
+    if isinstance(current,logging.Logger):
+        return current
+    if isinstance(state,_Object_Def) and hasattr(current,'__dict__') and not callable(current):
+        SetState(current,state)
+        return current
+    if isinstance(state,list) and isinstance(current,list) and len(state) == len(current):
+        for i in range(len(state)):
+            current[i] = _restore(current[i],state[i])
+        return current
+    if isinstance(state,numpy.ndarray) and isinstance(current,numpy.ndarray) and \
+            state.shape == current.shape and state.dtype == current.dtype:
+        current[...] = state
+        return current
+    return _build(state)
+
+def SetState(obj,state):
+
+    """
+    Restore the attribute values saved by GetState into obj
+    """
+
+    for attr,s in state.attrs.items():
+        setattr(obj,attr,_restore(getattr(obj,attr,None),s))
+
+def SaveCheckpoint(checkpointFileName,checkpoint):
+
+    """
+    Write a checkpoint (dictionary of saved states) to a file; the file is replaced atomically so that an interrupted
+    write does not destroy the previous checkpoint
+    """
+
+    WriteFileAtomic(checkpointFileName,lambda f: pickle.dump(checkpoint,f,protocol=pickle.HIGHEST_PROTOCOL),binary=True)
+
+def LoadCheckpoint(checkpointFileName):
+
+    with open(checkpointFileName,'rb') as f:
+        return pickle.load(f)
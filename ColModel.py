@@ -5,7 +5,6 @@ from DragTurb import TurbCoeff
 from shear import ShearProd
 from Buoyancy import BuoProd
 from NumericalSolver import Diff
-from Invert import Invert
 import copy
 
 """
@@ -233,18 +232,19 @@ def ColumnModelCal(z0_road,z0_roof,Ceps,Cdrag,Ck,thb,qhb,tvb,FractionsGround,Fra
         srim_qn[i] = srim_qn[i]
 
 
-    # Solve transport equations
+    # Solve transport equations; all five equations share the grid and are solved in one banded solve
     Sol = Diff(Geometry_m.nz, dts, sf, vol, Geometry_m.dz, rho)
-    # Solve x component of momentum equation
-    vx_new,uw,duwdz = Sol.Solver(Geometry_m.nz,Geometry_m.nz,Wind_bc_bottom,Wind_bc_top,dts,rho,vx,Km,srim_vx,srex_vx,sf,vol,Geometry_m.dz)
-    # Solve y component of momentum equation
-    vy_new,vw,dvwdz = Sol.Solver(Geometry_m.nz,Geometry_m.nz,Wind_bc_bottom,Wind_bc_top,dts,rho,vy,Km,srim_vy,srex_vy,sf,vol,Geometry_m.dz)
-    # Solve TKE equation
-    tke_new,wtke,dwtkedz = Sol.Solver(Geometry_m.nz,Geometry_m.nz,tke_bc_bottom,tke_bc_top,dts,rho,tke,Km,srim_tke,srex_tke,sf,vol,Geometry_m.dz)
-    # Solve temperature equation
-    th_new,wth,dwthdz = Sol.Solver(Geometry_m.nz,Geometry_m.nz,T_bc_bottom,T_bc_top,dts,rho,th,Km/ColParam.prandtl,srim_th,srex_th,sf,vol,Geometry_m.dz)
-    # Solve specific humidity equation
-    qn_new,wqn,dwqndz = Sol.Solver(Geometry_m.nz,Geometry_m.nz,q_bc_bottom,q_bc_top,dts,rho,qn,Km/ColParam.schmidt,srim_qn,srex_qn,sf,vol,Geometry_m.dz)
+    [(vx_new,uw,duwdz),(vy_new,vw,dvwdz),(tke_new,wtke,dwtkedz),(th_new,wth,dwthdz),(qn_new,wqn,dwqndz)] = Sol.SolverBatch([
+        # x component of momentum equation
+        (Wind_bc_bottom,Wind_bc_top,vx,Km,srim_vx,srex_vx),
+        # y component of momentum equation
+        (Wind_bc_bottom,Wind_bc_top,vy,Km,srim_vy,srex_vy),
+        # TKE equation
+        (tke_bc_bottom,tke_bc_top,tke,Km,srim_tke,srex_tke),
+        # Temperature equation
+        (T_bc_bottom,T_bc_top,th,Km/ColParam.prandtl,srim_th,srex_th),
+        # Specific humidity equation
+        (q_bc_bottom,q_bc_top,qn,Km/ColParam.schmidt,srim_qn,srex_qn)])
 
     vx = copy.copy(vx_new)
     vy = copy.copy(vy_new)
@@ -506,7 +506,7 @@ class EnergyBalanceCanyon_Def():
 
     def EBSolver_Tree(self,Ttree,TemperatureC,MeteoData,Int,ExWater,Vwater,Owater,SoilPotW,CiCO2Leaf,ViewFactor,Gemeotry_m,ParTree,
                       geometry,FractionsGround,ParSoilGround,ParInterceptionTree,PropOpticalGround,PropOpticalWall,PropOpticalTree,
-                      ParVegGround,ParVegTree,SunPosition,ParCalculation,VerticalProfUrban,ColParam):
+                      ParVegGround,ParVegTree,SunPosition,ParCalculation,VerticalProfUrban,ColParam,SWR=None,Ground=None):
 
         """
         ------
@@ -536,6 +536,11 @@ class EnergyBalanceCanyon_Def():
         ParCalculation: General calculation parameters
         VerticalProfUrban: Vertical profile of variables obtained from 1-D model
         ColParam: 1-D model parameters
+        SWR: Absorbed shortwave radiation (SWRabs_t, SWRabsDir_t, SWRabsDiff_t) from SWRabsorbed_Tree; it does not depend
+             on the tree temperature and is computed if not given
+        Ground: Radiation and heat flux calculators and the terms of the heat fluxes from the ground (RadiationCal,
+                SurfaceHeatFlux, GroundParam) from Ground_Tree; they do not depend on the tree temperature and are computed
+                if not given
         -------
         OUTPUT:
         YTree: Energy balance
@@ -545,20 +550,21 @@ class EnergyBalanceCanyon_Def():
         # Update trees temperature in the temperature vector
         TemperatureC_update = [TemperatureC[0],TemperatureC[1],TemperatureC[2],TemperatureC[3],TemperatureC[4],Ttree[0]]
 
-
-        RadiationCal = RadiationFunctions()
-        SurfaceHeatFlux = Surface_HeatFlux()
-
         # Shortwave radiation
-        SWRin_t, SWRout_t, SWRabs_t, SWRabsDir_t, SWRabsDiff_t, SWREB_t = \
-            RadiationCal.TotalSWRabsorbed(geometry, FractionsGround, ParTree, PropOpticalGround, PropOpticalWall,
-                                          PropOpticalTree, ParVegTree, MeteoData, SunPosition, ViewFactor)
+        if SWR is None:
+            SWR = self.SWRabsorbed_Tree(geometry,FractionsGround,ParTree,PropOpticalGround,PropOpticalWall,PropOpticalTree,
+                                        ParVegTree,MeteoData,SunPosition,ViewFactor)
+        SWRabs_t, SWRabsDir_t, SWRabsDiff_t = SWR
+
+        # Terms of the heat fluxes from the ground
+        if Ground is None:
+            Ground = self.Ground_Tree(TemperatureC,MeteoData,Int,ExWater,Vwater,Owater,SoilPotW,CiCO2Leaf,Gemeotry_m,
+                                      ParTree,geometry,FractionsGround,ParSoilGround,ParInterceptionTree,ParVegGround,
+                                      ParVegTree,ParCalculation,VerticalProfUrban,ColParam,SWR)
+        RadiationCal, SurfaceHeatFlux, GroundParam = Ground
 
         # Tree absorbed: conversion from sphere to horizontal projected area
         Line2Circle_Multiplier = numpy.pi
-        SWRabs_t.SWRabsTree = SWRabs_t.SWRabsTree * Line2Circle_Multiplier
-        SWRabsDir_t.SWRabsTree = SWRabsDir_t.SWRabsTree * Line2Circle_Multiplier
-        SWRabsDiff_t.SWRabsTree = SWRabsDiff_t.SWRabsTree * Line2Circle_Multiplier
 
         # Longwave radiation
         LWRin_t, LWRout_t, LWRabs_t, LWREB_t = \
@@ -567,21 +573,12 @@ class EnergyBalanceCanyon_Def():
         # Tree absorbed: conversion from sphere to horizontal projected area
         LWRabs_t.LWRabsTree = LWRabs_t.LWRabsTree * Line2Circle_Multiplier
 
-        # Turbulent heat fluxes from ground and trees to canyon
-        HfluxGroundImp, HfluxGroundBare, HfluxGroundVeg, HfluxTree, Eground_imp_pond, Eground_bare_pond, Eground_bare_soil,\
-        Eground_veg_int, Eground_veg_pond, Eground_veg_soil, TEground_veg, E_tree_int, TE_tree, Ebare, Eveg, Etree, LEfluxGroundImp,\
-        LEfluxGroundBarePond, LEfluxGroundBareSoil, LEfluxGroundVegInt, LEfluxGroundVegPond, LEfluxGroundVegSoil, LTEfluxGroundVeg,\
-        LEfluxTreeInt, LTEfluxTree, LEbare, LEveg, LEtree, Ci_sun_tree, Ci_shd_tree, Ci_sun_ground, Ci_shd_ground, rap_can,\
-        rap_Htree_In, rb_H, rb_L, r_soil_bare, r_soil_veg, alp_soil_bare, alp_soil_veg, rs_sun_L, rs_shd_L, rs_sun_H,\
-        rs_shd_H, Fsun_L, Fshd_L, dw_L = \
-            SurfaceHeatFlux.HeatFlux_ground_1D(TemperatureC_update, MeteoData, Gemeotry_m, geometry, FractionsGround,ParTree,
-                                               ParVegGround, ParVegTree, ParSoilGround, SoilPotW, Owater, Vwater, ExWater,
-                                               Int, CiCO2Leaf, ParInterceptionTree, ParCalculation,SWRabsDir_t.SWRabsTree,
-                                               SWRabsDiff_t.SWRabsTree, SWRabsDir_t.SWRabsGroundVeg,SWRabsDiff_t.SWRabsGroundVeg,
-                                               VerticalProfUrban,ColParam)
+        # Turbulent heat fluxes from trees to canyon
+        HfluxTree, E_tree_int, TE_tree, Etree, LEfluxTreeInt, LTEfluxTree, LEtree, Ci_sun_tree, Ci_shd_tree, rap_Htree_In,\
+        rb_H, rs_sun_H, rs_shd_H = \
+            SurfaceHeatFlux.HeatFlux_tree_1D(Ttree[0], GroundParam, MeteoData, ParVegTree)
 
         if ParTree.trees == 0:
-            SWRabs_t.SWRabsTree = 0
             LWRabs_t.LWRabsTree = 0
 
         # Energy balance for trees
@@ -611,55 +608,179 @@ class EnergyBalanceCanyon_Def():
 
         return YTree
 
+    def SWRabsorbed_Tree(self,geometry,FractionsGround,ParTree,PropOpticalGround,PropOpticalWall,PropOpticalTree,
+                         ParVegTree,MeteoData,SunPosition,ViewFactor):
+
+        """
+        ------
+        OUTPUT:
+        SWRabs_t: Absorbed shortwave radiation [W m^-2]
+        SWRabsDir_t: Absorbed direct shortwave radiation [W m^-2]
+        SWRabsDiff_t: Absorbed diffuse shortwave radiation [W m^-2]
+        The radiation absorbed by the trees is per spherical surface area of the trees
+        """
+
+        RadiationCal = RadiationFunctions()
+        SWRin_t, SWRout_t, SWRabs_t, SWRabsDir_t, SWRabsDiff_t, SWREB_t = \
+            RadiationCal.TotalSWRabsorbed(geometry, FractionsGround, ParTree, PropOpticalGround, PropOpticalWall,
+                                          PropOpticalTree, ParVegTree, MeteoData, SunPosition, ViewFactor)
+
+        # Tree absorbed: conversion from sphere to horizontal projected area
+        Line2Circle_Multiplier = numpy.pi
+        SWRabs_t.SWRabsTree = SWRabs_t.SWRabsTree * Line2Circle_Multiplier
+        SWRabsDir_t.SWRabsTree = SWRabsDir_t.SWRabsTree * Line2Circle_Multiplier
+        SWRabsDiff_t.SWRabsTree = SWRabsDiff_t.SWRabsTree * Line2Circle_Multiplier
+
+        if ParTree.trees == 0:
+            SWRabs_t.SWRabsTree = 0
+
+        return SWRabs_t, SWRabsDir_t, SWRabsDiff_t
+
+    def Ground_Tree(self,TemperatureC,MeteoData,Int,ExWater,Vwater,Owater,SoilPotW,CiCO2Leaf,Gemeotry_m,ParTree,geometry,
+                    FractionsGround,ParSoilGround,ParInterceptionTree,ParVegGround,ParVegTree,ParCalculation,
+                    VerticalProfUrban,ColParam,SWR):
+
+        """
+        ------
+        OUTPUT:
+        RadiationCal: Radiation calculator
+        SurfaceHeatFlux: Heat flux calculator
+        GroundParam: Terms of the heat fluxes from the ground that do not depend on the tree temperature (soil parameters,
+                     resistances, ground fluxes, and water available to the trees)
+        """
+
+        SWRabs_t, SWRabsDir_t, SWRabsDiff_t = SWR
+
+        RadiationCal = RadiationFunctions()
+        SurfaceHeatFlux = Surface_HeatFlux()
+        GroundParam = \
+            SurfaceHeatFlux.HeatFlux_ground_Param(TemperatureC, MeteoData, Gemeotry_m, geometry, FractionsGround, ParTree,
+                                                  ParVegGround, ParVegTree, ParSoilGround, SoilPotW, Owater, Vwater, ExWater,
+                                                  Int, CiCO2Leaf, ParInterceptionTree, ParCalculation, SWRabsDir_t.SWRabsTree,
+                                                  SWRabsDiff_t.SWRabsTree, SWRabsDir_t.SWRabsGroundVeg,
+                                                  SWRabsDiff_t.SWRabsGroundVeg, VerticalProfUrban, ColParam)
+
+        return RadiationCal, SurfaceHeatFlux, GroundParam
+
+    def BracketedRoot(self,Func,x0,lb,ub,dx=0.1,xtol=1e-6,ftol=1e-6,maxiter=100):
+
+        """
+        Root of a scalar function that decreases with x (e.g. energy balance of a surface as a function of its temperature)
+        The last evaluation of the function is at the returned root.
+        ------
+        INPUT:
+        Func: Function
+        x0: Starting point (e.g. temperature at the previous time step)
+        lb: Lower bound
+        ub: Upper bound
+        dx: Initial step of the search for a bracket
+        xtol: Absolute tolerance of the root
+        ftol: Absolute tolerance of the function value
+        maxiter: Maximum number of iterations
+        -------
+        OUTPUT:
+        x: Root, or None if no sign change is found within the bounds
+        """
+
+        a = min(max(x0,lb),ub)
+        fa = Func(a)
+        if not numpy.isfinite(fa):
+            return None
+        if abs(fa) < ftol:
+            return a
+
+        # Starting from x0, search in the direction of the root with increasing steps until the sign changes
+        step = dx if fa > 0 else -dx
+        while True:
+            b = min(max(a+step,lb),ub)
+            if b == a:
+                return None
+            fb = Func(b)
+            if not numpy.isfinite(fb):
+                return None
+            if abs(fb) < ftol:
+                return b
+            if (fb > 0) != (fa > 0):
+                break
+            # Next step: at least twice the previous step, or beyond the root estimated by the secant
+            if fb != fa:
+                xs = b - fb*(b - a)/(fb - fa)
+                step = max(2*step,1.5*(xs - b)) if step > 0 else min(2*step,1.5*(xs - b))
+            else:
+                step = 2*step
+            a, fa = b, fb
+
+        # Regula falsi with the Illinois modification within the bracket [a,b]. If the bracket is not halved within two
+        # iterations (e.g. the function is discontinuous), a bisection step is taken instead.
+        x = b
+        side = 0
+        width = abs(b - a)
+        for i in range(maxiter):
+            if abs(b - a) < xtol:
+                break
+            if i % 2 == 0:
+                bisect = i > 0 and abs(b - a) > width/2
+                width = abs(b - a)
+            if bisect:
+                x = (a + b)/2
+                bisect = False
+            else:
+                x = (a*fb - b*fa)/(fb - fa)
+            fx = Func(x)
+            if abs(fx) < ftol:
+                break
+            if (fx > 0) == (fb > 0):
+                b, fb = x, fx
+                if side == -1:
+                    fa = fa/2
+                side = -1
+            else:
+                a, fa = x, fx
+                if side == 1:
+                    fb = fb/2
+                side = 1
+
+        return x
+
     def FSolver_Tree(self,TempVec,TemperatureC,MeteoData,Int,ExWater,Vwater,Owater,SoilPotW,CiCO2Leaf,ViewFactor,Gemeotry_m,
                      ParTree,geometry,FractionsGround,ParSoilGround,ParInterceptionTree,PropOpticalGround,PropOpticalWall,
                      PropOpticalTree,ParVegGround,ParVegTree,SunPosition,ParCalculation,VerticalProfUrban,ColParam):
 
-        # Use temperature from previous time step as a starting point
-        TTree = copy.copy(TemperatureC[5])
+        # The absorbed shortwave radiation and the terms of the heat fluxes from the ground (soil parameters, aerodynamic
+        # and soil resistances, and fluxes from the ground) do not depend on the tree temperature. They are computed once
+        # and not in every evaluation of the energy balance; the stomatal resistance of the ground vegetation is not
+        # needed for the energy balance of the trees.
+        SWR = self.SWRabsorbed_Tree(geometry,FractionsGround,ParTree,PropOpticalGround,PropOpticalWall,PropOpticalTree,
+                                    ParVegTree,MeteoData,SunPosition,ViewFactor)
+        Ground = self.Ground_Tree(TemperatureC,MeteoData,Int,ExWater,Vwater,Owater,SoilPotW,CiCO2Leaf,Gemeotry_m,ParTree,
+                                  geometry,FractionsGround,ParSoilGround,ParInterceptionTree,ParVegGround,ParVegTree,
+                                  ParCalculation,VerticalProfUrban,ColParam,SWR)
+
+        args = (TemperatureC,MeteoData,Int,ExWater,Vwater,Owater,SoilPotW,CiCO2Leaf,ViewFactor,Gemeotry_m,ParTree,geometry,
+                FractionsGround,ParSoilGround,ParInterceptionTree,PropOpticalGround,PropOpticalWall,PropOpticalTree,
+                ParVegGround,ParVegTree,SunPosition,ParCalculation,VerticalProfUrban,ColParam,SWR,Ground)
 
-        # For least squares fitting we need a lower bound and an upper bound temperature
+        def YTree(T):
+            return self.EBSolver_Tree([T],*args)
+
+        # Lower and upper bound of the tree temperature [K]
         lb = 243
         ub = 373
 
-        Result = least_squares(self.EBSolver_Tree, TTree, bounds=(lb,ub),
-                               args=(TemperatureC,MeteoData,Int,ExWater,Vwater,Owater,SoilPotW,CiCO2Leaf,ViewFactor,Gemeotry_m,
-                                     ParTree,geometry,FractionsGround,ParSoilGround,ParInterceptionTree,PropOpticalGround,
-                                     PropOpticalWall,PropOpticalTree,ParVegGround,ParVegTree,SunPosition,ParCalculation,
-                                     VerticalProfUrban,ColParam))
-        T = Result.x
-
-        # If solver failed, retry with different starting value
-        if Result.status < 1:
-            TTree = copy.copy(MeteoData.Tatm[itt])
-
-            Result = least_squares(self.EBSolver_Tree, TTree, bounds=(lb, ub),
-                                   args=(TemperatureC, MeteoData, Int, ExWater, Vwater, Owater, SoilPotW, CiCO2Leaf,
-                                         ViewFactor, Gemeotry_m,ParTree, geometry, FractionsGround, ParSoilGround, ParInterceptionTree,
-                                         PropOpticalGround,PropOpticalWall, PropOpticalTree, ParVegGround, ParVegTree, SunPosition,
-                                         ParCalculation,VerticalProfUrban,ColParam))
+        # Use temperature from previous time step as a starting point. The net energy flux to the leaves decreases with
+        # the tree temperature, so the root can be bracketed and refined with a scalar root finder. The last evaluation
+        # of the energy balance is at the root, so that the tree fluxes (self.EBTree) correspond to it.
+        T = self.BracketedRoot(YTree,float(TemperatureC[5]),lb,ub)
+        if T is not None:
+            return numpy.array([T])
+
+        # If no root is bracketed within the bounds, use least squares with different starting values
+        TTree_start = [copy.copy(TemperatureC[5]),copy.copy(MeteoData.Tatm)] + [TempVec.TTree + i for i in range(3)] + \
+                      [TempVec.TTree - i for i in range(3)]
+        for TTree in TTree_start:
+            Result = least_squares(self.EBSolver_Tree, TTree, bounds=(lb,ub), args=args)
             T = Result.x
-
-        for i in range(3):
-            if Result.status < 1:
-                TTree = TempVec.TTree + i
-
-                Result = least_squares(self.EBSolver_Tree, TTree, bounds=(lb, ub),
-                                       args=(TemperatureC, MeteoData, Int, ExWater, Vwater, Owater, SoilPotW, CiCO2Leaf,
-                                             ViewFactor, Gemeotry_m, ParTree, geometry, FractionsGround, ParSoilGround,
-                                             ParInterceptionTree,PropOpticalGround, PropOpticalWall, PropOpticalTree, ParVegGround,
-                                             ParVegTree, SunPosition,ParCalculation, VerticalProfUrban,ColParam))
-                T = Result.x
-
-        for i in range(3):
-            if Result.status < 1:
-                TTree = TempVec.TTree - i
-
-                Result = least_squares(self.EBSolver_Tree, TTree, bounds=(lb, ub),
-                                       args=(TemperatureC, MeteoData, Int, ExWater, Vwater, Owater, SoilPotW, CiCO2Leaf,
-                                             ViewFactor, Gemeotry_m, ParTree, geometry, FractionsGround, ParSoilGround,
-                                             ParInterceptionTree,PropOpticalGround, PropOpticalWall, PropOpticalTree, ParVegGround,
-                                             ParVegTree, SunPosition,ParCalculation, VerticalProfUrban,ColParam))
-                T = Result.x
+            if Result.status >= 1:
+                break
 
         return T
@@ -488,13 +488,14 @@ class EnergyBalanceRoof_Def(object):
             rb_L = ResistanceCal.Leaf_Boundary_Resistance(u_Hveg, Troof_veg - 273.15, T_above_canyon - 273.15, hc_roof,d_leaf_roof, LAI_roof,
                                                           MeteoData.Zatm, disp_h, zom)
 
+            # Stomatal resistance [s m^-1]; the sunlit and shaded leaves are solved together
             rs_sun, rs_shd, Ci_sun, Ci_shd, _An_, _Rdark_, _Lpho_, _SIF_, _DCi_ = \
                 ResistanceCal.Canopy_Resistance_An_Evolution(PAR_sun,PAR_shd,LAI_roof,ParVegRoof.Kopt, ParVegRoof.Knit, Fsun,Fshd,
                                                              CiCO2Leaf.CiCO2LeafRoofVegSun,CiCO2Leaf.CiCO2LeafRoofVegShd,MeteoData.Catm_CO2,
-                                                             ra,rb_L,Troof_veg-273.15,T_above_canyon-273.15,Pre/100,Ds_atm,SoilPotW,ParVegRoof.Psi_sto_50,
+                                                             ra,rb_L,Troof_veg-273.15,Pre/100,Ds_atm,SoilPotW,ParVegRoof.Psi_sto_50,
                                                              ParVegRoof.Psi_sto_00,ParVegRoof.CT,ParVegRoof.Vmax,ParVegRoof.DSE,ParVegRoof.Ha,ParVegRoof.FI,
                                                              MeteoData.Catm_O2,ParVegRoof.Do,ParVegRoof.a1,ParVegRoof.go,ParVegRoof.e_rel,ParVegRoof.e_relN,
-                                                             ParVegRoof.gmes,ParVegRoof.rjv,ParVegRoof.mSl,ParVegRoof.Sl)
+                                                             ParVegRoof.gmes,ParVegRoof.rjv)
 
             rb = ResistanceCal.Leaf_Boundary_Resistance(u_Hveg, Troof_veg - 273.15, T_above_canyon - 273.15, hc_roof,d_leaf_roof,LAI_roof,
                                                         MeteoData.Zatm, disp_h, zom)
@@ -1,6 +1,7 @@
 import numpy
 import pandas as pd
 from psychrometrics import psychrometrics,HumFromRHumTemp
+from weather import ReadEPW
 import functools
 import os
 
@@ -134,4 +135,7 @@ def write_epw(TopForcingFile,epw_precision,climate_file,timeInitial,climate_file
 
     epw_new_id.close()
 
+    # Convert the new file to the weather cache once, so that the simulations only read the rows of their period
+    ReadEPW(TopForcing_EPW)
+
 
@@ -0,0 +1,190 @@
+import os
+import time
+import json
+import itertools
+import traceback
+import multiprocessing
+import numpy
+from VCWG_Smart import VCWG_Smart
+from Read_Input import read_VCWG_param
+from ReadDOE import GetDOELibrary
+
+"""
+Run an ensemble of VCWG simulations (e.g. a parameter sweep) with a pool of processes
+Last update: October 2026
+"""
+
+# Each ensemble member is a dictionary of parameter overrides applied to the .uwg files of all months. The parameters of
+# the members are built in memory (VCWGParam.Override), so the .uwg files are never modified and several ensembles can
+# run at the same time. Every member x month simulation is one job of the pool; the outputs of member i are written to
+# Results/date_str/Member_i.
+
+def EnsembleGrid(values):
+
+    """
+    Return the members of a full factorial sweep
+    ------
+    INPUT:
+    values: Dictionary of parameter names and lists of values, e.g. {'SmartHumidistat': [0,1], 'glzR': [0.2,0.4]}
+    -------
+    OUTPUT:
+    Overrides: List of dictionaries of parameter overrides, one per combination of values
+    """
+
+    names = list(values)
+    return [dict(zip(names,combination)) for combination in itertools.product(*[values[name] for name in names])]
+
+def EnsembleMemberDir(date_str,iMember):
+    # Output folder of an ensemble member within the Results directory
+    return os.path.join(date_str,'Member_' + str(iMember))
+
+def _select(data,fields):
+    # Recorded arrays with "RecordName/path" keys matching fields (keys or key prefixes, as in Read_NPZ)
+    selected = {}
+    for name in data:
+        for path in data[name]:
+            key = name + '/' + path
+            if any(key == f or key.startswith(f + '.') or key.startswith(f + '/') for f in fields):
+                selected[key] = data[name][path]
+    return selected
+
+def RunEnsembleJob(Task):
+
+    """
+    Run the simulation of one ensemble member and month (a job of RunEnsemble)
+    ------
+    INPUT:
+    Task: Tuple of the member index, the parameter overrides, the month name, the .uwg file name, the epw, top forcing,
+          and view factor file names, the case name, date_str, and the fields to return
+    -------
+    OUTPUT:
+    Result: Dictionary with the member index, month name, output folder, run time [s], error message (None if the run
+            succeeded), and the time and requested fields of the simulation
+    """
+
+    iMember,Overrides,month_name,VCWGParamFileName,epwFileName,TopForcingFileName,ViewFactorFileName,case,date_str,fields = Task
+    Output_dir = EnsembleMemberDir(date_str,iMember)
+    Result = {'Member': iMember, 'Month': month_name, 'Output_dir': os.path.join('Results',Output_dir), 'Error': None,
+              'time': None, 'data': {}}
+
+    start = time.time()
+    try:
+        VCWGParam = read_VCWG_param(os.path.join('resources','Parameters',VCWGParamFileName)).Override(Overrides)
+        VCWG = VCWG_Smart(epwFileName,TopForcingFileName,VCWGParamFileName,ViewFactorFileName,case,month_name,
+                          Output_dir,VCWGParam)
+        VCWG.run()
+        if fields is not None:
+            Result['time'] = numpy.array([numpy.NaN if t is None else t for t in VCWG.time],dtype=float)
+            Result['data'] = _select(VCWG.Recorder.complete(),fields)
+    except Exception:
+        # A failed job is reported in the index and does not stop the other jobs
+        Result['Error'] = traceback.format_exc()
+    Result['RunTime'] = time.time() - start
+
+    return Result
+
+class EnsembleResults(object):
+
+    """
+    Results of an ensemble indexed by member and month
+    ------
+    Overrides: Parameter overrides of each member
+    index: Dictionary of (member, month name) -> output folder, run time [s], and error message of each job
+    time, data: Dictionaries of (member, month name) -> time of the records [s] and requested fields
+    """
+
+    def __init__(self,Overrides):
+        self.Overrides = Overrides
+        self.index = {}
+        self.time = {}
+        self.data = {}
+
+    def add(self,Result):
+        key = (Result['Member'],Result['Month'])
+        self.index[key] = {'Output_dir': Result['Output_dir'], 'RunTime': Result['RunTime'], 'Error': Result['Error']}
+        if Result['time'] is not None:
+            self.time[key] = Result['time']
+            self.data[key] = Result['data']
+
+    def failed(self):
+        # Jobs that raised an error
+        return [key for key in sorted(self.index) if self.index[key]['Error'] is not None]
+
+    def stack(self,field,month_name):
+
+        """
+        Return a requested field of all members for one month as one array with the member as the first dimension
+        Members without this field (e.g. failed jobs) are NaN.
+        """
+
+        arrays = [self.data.get((i,month_name),{}).get(field) for i in range(len(self.Overrides))]
+        if all(a is None for a in arrays):
+            raise KeyError("Field not returned by any member: " + field)
+        shape = next(a.shape for a in arrays if a is not None)
+        return numpy.stack([numpy.full(shape,numpy.NaN) if a is None else a for a in arrays])
+
+    def write_index(self,IndexFileName):
+
+        # Write the index of the jobs and the overrides of the members as a JSON file
+        with open(IndexFileName,'w') as f:
+            json.dump({'Members': [{'Member': i, 'Overrides': self.Overrides[i]} for i in range(len(self.Overrides))],
+                       'Jobs': [dict(Member=key[0],Month=key[1],**self.index[key]) for key in sorted(self.index)]},
+                      f,indent=1)
+
+def RunEnsemble(epwFileName,TopForcingFileName,VCWGParamFileNames,ViewFactorFileName,case,Month_names,date_str,
+                Overrides,nProcesses=None,fields=None):
+
+    """
+    Run every ensemble member for every month with a pool of processes
+    ------
+    INPUT:
+    epwFileName, TopForcingFileName, ViewFactorFileName, case: As in VCWG_Smart
+    VCWGParamFileNames: Base .uwg file of each month
+    Month_names: Name of each month (e.g. 'Jan')
+    date_str: Name of the output folder within the Results directory
+    Overrides: List of dictionaries of parameter overrides, one per member (see EnsembleGrid)
+    nProcesses: Number of processes; None: number of CPU cores, 1: the jobs are run in this process
+    fields: Recorded fields returned to the results (keys or key prefixes such as "EBCanyonData/SWRabs", as in Read_NPZ);
+            None: the outputs are only written to the output folders
+    -------
+    OUTPUT:
+    Results: EnsembleResults of all jobs; the index is also written to Results/date_str/EnsembleIndex.json
+    """
+
+    # Check the overrides of all members before starting the jobs
+    for VCWGParamFileName in set(VCWGParamFileNames):
+        VCWGParam = read_VCWG_param(os.path.join('resources','Parameters',VCWGParamFileName))
+        for Override in Overrides:
+            VCWGParam.Override(Override)
+
+    Tasks = [(iMember,Overrides[iMember],Month_names[m],VCWGParamFileNames[m],epwFileName,TopForcingFileName,
+              ViewFactorFileName,case,date_str,fields) for iMember in range(len(Overrides)) for m in range(len(Month_names))]
+
+    Results = EnsembleResults(Overrides)
+    pool = None
+    if nProcesses != 1:
+        # The DOE library is opened before the workers are started so that they share it
+        GetDOELibrary()
+        pool = multiprocessing.Pool(nProcesses)
+    try:
+        if pool is None:
+            Jobs = map(RunEnsembleJob,Tasks)
+        else:
+            # Jobs are handed out one at a time since their run times differ
+            Jobs = pool.imap_unordered(RunEnsembleJob,Tasks,chunksize=1)
+        for Result in Jobs:
+            Results.add(Result)
+            print('Ensemble: member', Result['Member'], Result['Month'], 'finished in', round(Result['RunTime']), 's',
+                  '(failed)' if Result['Error'] is not None else '')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    Output_dir = os.path.join('Results',date_str)
+    os.makedirs(Output_dir,exist_ok=True)
+    Results.write_index(os.path.join(Output_dir,'EnsembleIndex.json'))
+    for key in Results.failed():
+        print('Ensemble: member', key[0], key[1], 'failed\n', Results.index[key]['Error'])
+
+    return Results
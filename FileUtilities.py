@@ -0,0 +1,39 @@
+import os
+import hashlib
+
+"""
+Helpers for the files written at run time (caches, libraries, and checkpoints)
+Last update: October 2026
+"""
+
+def CacheKey(*Param):
+
+    """
+    Return the key of a cache file as a hexadecimal SHA-1 hash of its parameters (numbers, strings, and lists or tuples
+    of them); the key changes when any parameter changes
+    """
+
+    return hashlib.sha1(repr(Param).encode()).hexdigest()
+
+def WriteFileAtomic(FileName,write,binary=False):
+
+    """
+    Write a file so that other processes never read a partially written file: the content is written to a temporary
+    file in the same directory which then replaces the file
+    ------
+    INPUT:
+    FileName: Name of the file
+    write: Function writing the content to the open temporary file
+    binary: True to open the temporary file in binary mode
+    """
+
+    tmp_file = FileName + '.' + str(os.getpid()) + '.tmp'
+    try:
+        with open(tmp_file,'wb' if binary else 'w') as f:
+            write(f)
+        os.replace(tmp_file,FileName)
+    except BaseException:
+        # Do not leave the temporary file behind if the write failed
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
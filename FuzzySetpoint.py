@@ -8,6 +8,43 @@ import numpy as np
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
 import math
+import os
+from FileUtilities import CacheKey,WriteFileAtomic
+
+# Universes of discourse shared by all fuzzy controllers
+OCCUPANCY_UNIVERSE = np.arange(0, 1, 0.01)     # Occupancy fraction [-]
+PRICE_UNIVERSE = np.arange(0, 24, 1)           # Hour of day for TOU price class [hr]
+WEIGHT_UNIVERSE = np.arange(-1, 1, 0.01)       # Setpoint adjustment weight [-]
+
+# Grids used to tabulate the controllers [-], [hr]
+# The hour of day grid has a 5 min spacing, so the tables are exact in hour of day for the default 300 s time step
+# Occupancy membership functions change between 0 and 0.03, so the grid is fine there and coarse above
+OCCUPANCY_TABLE_GRID = np.concatenate([np.linspace(0, 0.04, 81), [0.05, 0.1, 0.5, 1]])
+PRICE_TABLE_GRID = np.linspace(0, 24, 24*12+1)
+
+# Directory of the tabulated controllers saved on disk
+FUZZY_TABLE_DIR = os.path.join('resources', 'FuzzyTables')
+# Changed when the tabulation changes so that older saved tables are not used
+FUZZY_TABLE_VERSION = 1
+
+# Fuzzy controllers built so far, one per TOU configuration and controller mode
+_fuzzy_control_systems = {}
+
+def get_fuzzy_control_system(TOU, tabulated=False):
+    # Return the fuzzy controller for a TOU configuration, building it on first use.
+    # Building the membership functions, rules and control system graphs is expensive, so the controllers are shared
+    # by all buildings and time steps with the same TOU price hours.
+    # tabulated: use the lookup-table surrogate (TabulatedFuzzyControlSystem) instead of the exact fuzzy inference
+    TOU_key = tuple(tuple(float(hr) for hr in TOU_hours) for TOU_hours in
+                    [TOU.TOU_Low_Summer, TOU.TOU_Medium_Summer, TOU.TOU_High_Summer,
+                     TOU.TOU_Low_Winter, TOU.TOU_Medium_Winter, TOU.TOU_High_Winter])
+    key = (TOU_key, bool(tabulated))
+    if key not in _fuzzy_control_systems:
+        if tabulated:
+            _fuzzy_control_systems[key] = TabulatedFuzzyControlSystem(*TOU_key)
+        else:
+            _fuzzy_control_systems[key] = FuzzyControlSystem(*TOU_key)
+    return _fuzzy_control_systems[key]
 
 class FuzzyControlSystem:
     def __init__(self, TOU_Low_Summer, TOU_Medium_Summer, TOU_High_Summer, TOU_Low_Winter, TOU_Medium_Winter, TOU_High_Winter):
@@ -22,12 +59,12 @@ class FuzzyControlSystem:
 
     def initialize_fuzzy_systems(self):
         # Define fuzzy variables and membership functions
-        self.occupancy = ctrl.Antecedent(np.arange(0, 1, 0.01), 'occupancy')
-        self.price_Summer = ctrl.Antecedent(np.arange(0, 24, 1), 'price_Summer')
-        self.price_Winter = ctrl.Antecedent(np.arange(0, 24, 1), 'price_Winter')
-        self.w_Temp = ctrl.Consequent(np.arange(-1, 1, 0.01), 'w_Temp')
-        self.w_Hum = ctrl.Consequent(np.arange(-1, 1, 0.01), 'w_Hum')
-        self.w_Dehum = ctrl.Consequent(np.arange(-1, 1, 0.01), 'w_Dehum')
+        self.occupancy = ctrl.Antecedent(OCCUPANCY_UNIVERSE, 'occupancy')
+        self.price_Summer = ctrl.Antecedent(PRICE_UNIVERSE, 'price_Summer')
+        self.price_Winter = ctrl.Antecedent(PRICE_UNIVERSE, 'price_Winter')
+        self.w_Temp = ctrl.Consequent(WEIGHT_UNIVERSE, 'w_Temp')
+        self.w_Hum = ctrl.Consequent(WEIGHT_UNIVERSE, 'w_Hum')
+        self.w_Dehum = ctrl.Consequent(WEIGHT_UNIVERSE, 'w_Dehum')
 
         # Define membership functions
         self.define_membership_functions()
@@ -147,6 +184,62 @@ class FuzzyControlSystem:
         self.DHumWend = ctrl.ControlSystemSimulation(self.ruleDHumWend_ctrl)
         self.hum = ctrl.ControlSystemSimulation(self.hum_ctrl)
     
+    # Weight factors from the fuzzy inference [-]
+    # The setpoint functions below only depend on the fuzzy controllers through these methods
+    def HeatWeight(self, Nocc):
+        # Energy Price in heating is constant, so TOU is not applicable
+        self.heating.input['occupancy'] = Nocc
+        self.heating.compute()
+        return self.heating.output['w_Temp']
+
+    def CoolWeight(self, Nocc, hourDay, Season, dayType):
+        # Weekday
+        if dayType == 1:
+            # Season Check for TOU
+            # Summer
+            if Season == 1:
+                self.cooling_Summer.input['price_Summer'] = hourDay
+                self.cooling_Summer.input['occupancy'] = Nocc
+                self.cooling_Summer.compute()
+                return self.cooling_Summer.output['w_Temp']
+            # Winter
+            else:
+                self.cooling_Winter.input['price_Winter'] = hourDay
+                self.cooling_Winter.input['occupancy'] = Nocc
+                self.cooling_Winter.compute()
+                return self.cooling_Winter.output['w_Temp']
+        # weekend summer/winter
+        else:
+            self.cooling_weekend.input['occupancy'] = Nocc
+            self.cooling_weekend.compute()
+            return self.cooling_weekend.output['w_Temp']
+
+    def HumWeight(self, Nocc):
+        self.hum.input['occupancy'] = Nocc
+        self.hum.compute()
+        return self.hum.output['w_Hum']
+
+    def DehumWeight(self, Nocc, hourDay, Season, dayType):
+        # Weekday or Weekend check
+        if dayType == 1:  # Weekday
+            # Season check
+            if Season == 1:  # Summer
+                self.dehum_Summer.input['price_Summer'] = hourDay
+                self.dehum_Summer.input['occupancy'] = Nocc
+                self.dehum_Summer.compute()
+                return self.dehum_Summer.output['w_Dehum']
+            else:  # Winter
+                self.dehum_Winter.input['price_Winter'] = hourDay
+                self.dehum_Winter.input['occupancy'] = Nocc
+                self.dehum_Winter.compute()
+                return self.dehum_Winter.output['w_Dehum']
+        # weekend summer/winter (If the price should be considered we should have different
+        # weekend prices for summer and winter prices
+        else:
+            self.DHumWend.input['occupancy'] = Nocc
+            self.DHumWend.compute()
+            return self.DHumWend.output['w_Dehum']
+
     def TempSetpointHeatFun(self, Nocc, SmartTempSetPoint, simTime, SmartBuildingParam, MeteoData, canTemp, dayType):
         
         heatTempSetpointHighHigh = SmartBuildingParam.heatTempSetpointHighHigh      # [K]
@@ -156,9 +249,7 @@ class FuzzyControlSystem:
         Season = SmartBuildingParam.Season  # Season Type: Winter 0, summer 1 for TOU pricing [-]
         
         # Energy Price in heating is constant, so TOU is not applicable
-        self.heating.input['occupancy'] = Nocc
-        self.heating.compute()
-        w = self.heating.output['w_Temp']  # Weight factor from fuzzy logic [-]
+        w = self.HeatWeight(Nocc)  # Weight factor from fuzzy logic [-]
         
         # Calculate the new setpoint based on the value of w
         if canTemp < heatTempSetpointLow:                               # [K]
@@ -188,26 +279,7 @@ class FuzzyControlSystem:
         coolTempSetpointLowLow = SmartBuildingParam.coolTempSetpointLowLow              # [ K ]
         Season = SmartBuildingParam.Season  # Season Type: Winter 0 summer 1 for TOU pricing [ - ]
         
-        # Weekday
-        if dayType == 1:
-            # Season Check for TOU
-            # Summer
-            if Season == 1:
-                self.cooling_Summer.input['price_Summer'] = simTime.secDay / 3600
-                self.cooling_Summer.input['occupancy'] = Nocc
-                self.cooling_Summer.compute()
-                w = self.cooling_Summer.output['w_Temp']
-            # Winter
-            else:
-                self.cooling_Winter.input['price_Winter'] = simTime.secDay / 3600
-                self.cooling_Winter.input['occupancy'] = Nocc
-                self.cooling_Winter.compute()
-                w = self.cooling_Winter.output['w_Temp']
-        # weekend summer/winter
-        else:
-            self.cooling_weekend.input['occupancy'] = Nocc
-            self.cooling_weekend.compute()
-            w = self.cooling_weekend.output['w_Temp']               # [-]
+        w = self.CoolWeight(Nocc, simTime.secDay / 3600, Season, dayType)     # [-]
         
         # Calculate the new setpoint based on the value of U
         if canTemp < coolTempSetpointLow:                           # [K]
@@ -254,9 +326,7 @@ class FuzzyControlSystem:
                 MeteoData.Pre - (RHSetPointHighHigh / 100) * SatPre)
         
         # Calculate the value of w using the fuzzy control system
-        self.hum.input['occupancy'] = Nocc  # [Person m^-2]
-        self.hum.compute()
-        w = self.hum.output['w_Hum']  # [-]
+        w = self.HumWeight(Nocc)  # [-]
         
         # Calculate the new setpoint based on the value of U
         if canHum < LowHumSetPoint:  # [kgv kga^-1]
@@ -304,26 +374,8 @@ class FuzzyControlSystem:
         HighHighHumSetPoint = 0.622 * (RHSetPointHighHigh / 100) * SatPre / (
                 MeteoData.Pre - (RHSetPointHighHigh / 100) * SatPre)
         
-        # Weekday or Weekend check
-        if dayType == 1:  # Weekday
-            # Season check
-            if Season == 1:  # Summer
-                self.dehum_Summer.input['price_Summer'] = simTime.secDay / 3600
-                self.dehum_Summer.input['occupancy'] = Nocc
-                self.dehum_Summer.compute()
-                w = self.dehum_Summer.output['w_Dehum']  # [-]
-            else:  # Winter
-                self.dehum_Winter.input['price_Winter'] = simTime.secDay / 3600
-                self.dehum_Winter.input['occupancy'] = Nocc
-                self.dehum_Winter.compute()
-                w = self.dehum_Winter.output['w_Dehum']
-        
-        # weekend summer/winter (If the price should be considered we should have different
-        # weekend prices for summer and winter prices
-        else:
-            self.DHumWend.input['occupancy'] = Nocc
-            self.DHumWend.compute()
-            w = self.DHumWend.output['w_Dehum']     # [-]
+        # Calculate the value of w using the fuzzy control system
+        w = self.DehumWeight(Nocc, simTime.secDay / 3600, Season, dayType)    # [-]
         
         # Calculate the new setpoint based on the value of U
         if canHum < LowHumSetPoint:                 # [kgv kga^-1]
@@ -343,4 +395,143 @@ class FuzzyControlSystem:
         
         # Ensure the setpoint stays within the defined bounds
         new_DehumSetpoint = min(max(new_DehumSetpoint, LowLowHumSetPoint), HighHighHumSetPoint)  # [kgv kga^-1]
-        return new_DehumSetpoint, w                                                              # [kgv kga^-1]
\ No newline at end of file
+        return new_DehumSetpoint, w                                                              # [kgv kga^-1]
+
+
+class TabulatedFuzzyControlSystem(FuzzyControlSystem):
+    # Lookup-table surrogate of the fuzzy controllers
+    # The weight factors only depend on occupancy and hour of day (price class), so each ControlSystemSimulation is
+    # evaluated once over OCCUPANCY_TABLE_GRID (x PRICE_TABLE_GRID) and the weights are then found by linear
+    # (bilinear) interpolation. Tables are saved in table_dir keyed by the controllers and grids and reused by later runs.
+
+    # Controllers with occupancy as the only input, and with occupancy and hour of day as inputs
+    TABLES_1D = {'heating': 'w_Temp', 'cooling_weekend': 'w_Temp', 'hum': 'w_Hum', 'DHumWend': 'w_Dehum'}
+    TABLES_2D = {'cooling_Summer': ('price_Summer', 'w_Temp'), 'cooling_Winter': ('price_Winter', 'w_Temp'),
+                 'dehum_Summer': ('price_Summer', 'w_Dehum'), 'dehum_Winter': ('price_Winter', 'w_Dehum')}
+
+    def __init__(self, TOU_Low_Summer, TOU_Medium_Summer, TOU_High_Summer, TOU_Low_Winter, TOU_Medium_Winter,
+                 TOU_High_Winter, table_dir=FUZZY_TABLE_DIR):
+        FuzzyControlSystem.__init__(self, TOU_Low_Summer, TOU_Medium_Summer, TOU_High_Summer,
+                                    TOU_Low_Winter, TOU_Medium_Winter, TOU_High_Winter)
+        self.occupancy_grid = OCCUPANCY_TABLE_GRID
+        self.price_grid = PRICE_TABLE_GRID
+        self.table_dir = table_dir
+        self.tables = self.load_tables()
+
+    def controllers_key(self):
+        # Rules, membership functions, and defuzzification methods of the tabulated controllers. The membership
+        # functions of the hour of day include the TOU configuration, so editing the rules, the membership functions,
+        # or the TOU hours changes the key.
+        key = []
+        for name in list(self.TABLES_1D) + list(self.TABLES_2D):
+            system = getattr(self, name).ctrl
+            key.append((name, [str(rule) for rule in system.rules]))
+            for var in list(system.antecedents) + list(system.consequents):
+                key.append((var.label, var.universe.tolist(), getattr(var, 'defuzzify_method', None),
+                            [(term, var.terms[term].mf.tolist()) for term in var.terms]))
+        return key
+
+    def table_file(self):
+        # Table file name from the hash of the table version, controllers, and table grids
+        key = CacheKey(FUZZY_TABLE_VERSION, self.controllers_key(), self.occupancy_grid.tolist(), self.price_grid.tolist())
+        return os.path.join(self.table_dir, 'FuzzyTable_' + key + '.npz')
+
+    def load_tables(self):
+        table_file = self.table_file()
+        if os.path.exists(table_file):
+            with np.load(table_file) as data:
+                return {name: data[name] for name in data.files}
+
+        tables = self.build_tables()
+        # Concurrent runs never read a partially written table
+        os.makedirs(self.table_dir, exist_ok=True)
+        WriteFileAtomic(table_file, lambda f: np.savez(f, **tables), binary=True)
+        return tables
+
+    def build_tables(self):
+        # Evaluate the fuzzy inference over the grids using array inputs. A separate simulation is used for each
+        # controller so that the simulations of the exact controllers keep operating on single inputs.
+        tables = {}
+        for name, output in self.TABLES_1D.items():
+            sim = ctrl.ControlSystemSimulation(getattr(self, name).ctrl)
+            sim.input['occupancy'] = self.occupancy_grid
+            sim.compute()
+            tables[name] = np.asarray(sim.output[output], dtype=float)
+        occupancy_2d, price_2d = np.meshgrid(self.occupancy_grid, self.price_grid)
+        for name, (price, output) in self.TABLES_2D.items():
+            sim = ctrl.ControlSystemSimulation(getattr(self, name).ctrl)
+            sim.input['occupancy'] = occupancy_2d
+            sim.input[price] = price_2d
+            sim.compute()
+            tables[name] = np.asarray(sim.output[output], dtype=float)
+        return tables
+
+    def interp_1d(self, name, Nocc):
+        return float(np.interp(Nocc, self.occupancy_grid, self.tables[name]))
+
+    def interp_2d(self, name, Nocc, hourDay):
+        # Bilinear interpolation; inputs outside the grids are clipped to the grid bounds
+        table = self.tables[name]
+        i = min(max(np.searchsorted(self.price_grid, hourDay) - 1, 0), len(self.price_grid) - 2)
+        j = min(max(np.searchsorted(self.occupancy_grid, Nocc) - 1, 0), len(self.occupancy_grid) - 2)
+        fi = min(max((hourDay - self.price_grid[i]) / (self.price_grid[i+1] - self.price_grid[i]), 0.), 1.)
+        fj = min(max((Nocc - self.occupancy_grid[j]) / (self.occupancy_grid[j+1] - self.occupancy_grid[j]), 0.), 1.)
+        return float((1-fi)*(1-fj)*table[i, j] + (1-fi)*fj*table[i, j+1] + fi*(1-fj)*table[i+1, j] + fi*fj*table[i+1, j+1])
+
+    def HeatWeight(self, Nocc):
+        return self.interp_1d('heating', Nocc)
+
+    def CoolWeight(self, Nocc, hourDay, Season, dayType):
+        if dayType == 1:
+            if Season == 1:
+                return self.interp_2d('cooling_Summer', Nocc, hourDay)
+            else:
+                return self.interp_2d('cooling_Winter', Nocc, hourDay)
+        else:
+            return self.interp_1d('cooling_weekend', Nocc)
+
+    def HumWeight(self, Nocc):
+        return self.interp_1d('hum', Nocc)
+
+    def DehumWeight(self, Nocc, hourDay, Season, dayType):
+        if dayType == 1:
+            if Season == 1:
+                return self.interp_2d('dehum_Summer', Nocc, hourDay)
+            else:
+                return self.interp_2d('dehum_Winter', Nocc, hourDay)
+        else:
+            return self.interp_1d('DHumWend', Nocc)
+
+    def validate(self, nSample=2000, seed=0, verbose=False):
+        """
+        Compare the tabulated weights with the exact fuzzy inference at random inputs
+        nSample: number of random (occupancy, hour of day) samples
+        verbose: print the deviations
+        Return the maximum absolute deviation [-] of each controller
+        """
+        rng = np.random.default_rng(seed)
+        # Sample densely where the occupancy membership functions change
+        Nocc = np.concatenate([rng.uniform(0, 0.04, nSample - nSample//4), rng.uniform(0, 1, nSample//4)])
+        hourDay = rng.uniform(0, 24, nSample)
+        maxDeviation = {}
+        for name, output in self.TABLES_1D.items():
+            sim = getattr(self, name)
+            deviation = 0.
+            for k in range(nSample):
+                sim.input['occupancy'] = Nocc[k]
+                sim.compute()
+                deviation = max(deviation, abs(sim.output[output] - self.interp_1d(name, Nocc[k])))
+            maxDeviation[name] = deviation
+        for name, (price, output) in self.TABLES_2D.items():
+            sim = getattr(self, name)
+            deviation = 0.
+            for k in range(nSample):
+                sim.input['occupancy'] = Nocc[k]
+                sim.input[price] = hourDay[k]
+                sim.compute()
+                deviation = max(deviation, abs(sim.output[output] - self.interp_2d(name, Nocc[k], hourDay[k])))
+            maxDeviation[name] = deviation
+        if verbose:
+            for name in maxDeviation:
+                print('Fuzzy table {a}: max deviation from exact inference {b:.3e} [-]'.format(a=name, b=maxDeviation[name]))
+        return maxDeviation
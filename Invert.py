@@ -1,5 +1,6 @@
 import numpy
 import math
+from scipy.linalg import solve_banded
 
 """
 Invert matrix in 1D mdoel
@@ -9,6 +10,38 @@ Last update: July 2020
 Originally developed by Alberto Martilli, Scott Krayenhoff, and Negin Nazarian
 """
 
+def SolveTridiagonal(A,RHS):
+
+    """
+    Solve one or several independent tri-diagonal systems with a single banded solve
+    ------
+    INPUT:
+    A: Coefficients of the tri-diagonal matrix, shape (nz,3) or (nsys,nz,3); A[...,i,0], A[...,i,1], and A[...,i,2]
+       are the sub-diagonal, diagonal, and super-diagonal coefficients of row i
+    RHS: Right hand side, shape (nz) or (nsys,nz)
+    -------
+    OUTPUT:
+    X: Solution with the same shape as RHS
+    """
+
+    A = numpy.asarray(A,dtype=float)
+    RHS = numpy.asarray(RHS,dtype=float)
+    nsys = 1 if A.ndim == 2 else A.shape[0]
+    nz = A.shape[-2]
+    A = A.reshape(nsys,nz,3)
+
+    # Stack all systems in one block-diagonal banded matrix. The sub-diagonal coefficient of the first row and the
+    # super-diagonal coefficient of the last row of each system are outside the matrix and are dropped so that
+    # the systems do not couple.
+    ab = numpy.zeros((3,nsys*nz))
+    ab[0,:].reshape(nsys,nz)[:,1:] = A[:,:-1,2]
+    ab[1,:] = A[:,:,1].ravel()
+    ab[2,:].reshape(nsys,nz)[:,:-1] = A[:,1:,0]
+
+    X = solve_banded((1,1),ab,RHS.ravel(),overwrite_ab=True,check_finite=False)
+
+    return X.reshape(RHS.shape)
+
 # This class is used to invert and resolve a tri-diagonal matrix
 class Invert:
     def __init__(self,nz,A,RHS):
@@ -17,15 +50,6 @@ class Invert:
         self.RHS = RHS
 
     def Output(self):
-        X = numpy.zeros(self.nz)
-        for i in range(self.nz-2,-1,-1):
-            self.RHS[i] = self.RHS[i]-self.A[i][2]*self.RHS[i+1]/self.A[i+1][1]
-            self.A[i][1] = self.A[i][1]-self.A[i][2]*self.A[i+1][0]/self.A[i+1][1]
-
-        for i in range(1,self.nz):
-            self.RHS[i] = self.RHS[i]-self.A[i][0]*self.RHS[i-1]/self.A[i-1][1]
-
-        for i in range(0,self.nz):
-            X[i] = self.RHS[i]/self.A[i][1]
+        X = SolveTridiagonal(numpy.asarray(self.A)[0:self.nz],numpy.asarray(self.RHS)[0:self.nz])
 
-        return X
\ No newline at end of file
+        return X
@@ -1,6 +1,7 @@
 import numpy
 import math
 import copy
+from Invert import SolveTridiagonal
 
 """
 Formulate linear system of equations to solve; make matrix of coefficients A and the right hand side RHS vector
@@ -19,33 +20,43 @@ class Diff:
         self.dz = dz
         self.rho = rho
 
-    def Solver(self,nzm,nz,iz1,izf,dt,rho,co,cd,aa,bb,sf,vl,dz):
-
-        def invert(nzm,nn,A,C):
-
-            # C = copy.copy(c)
-            # A = copy.copy(a)
-            for In in range(nn-2,-1,-1):
-                C[In] = C[In]-A[In][2]*C[In+1]/A[In+1][1]
-                A[In][1] = A[In][1]-A[In][2]*A[In+1][0]/A[In+1][1]
-
-            for In in range(1,nn):
-                C[In] = C[In]-A[In][0]*C[In-1]/A[In-1][1]
-
-            x = numpy.zeros(nn)
-            for In in range(0,nn):
-                x[In] = C[In]/A[In][1]
-            return x
+    def Coefficients(self,iz1,izf,co,cd,aa,bb):
+
+        """
+        Assemble the tri-diagonal matrix of coefficients and the right hand side for one transported variable
+        ------
+        INPUT:
+        iz1: Bottom boundary condition (1: Neumann, 2: Dirichlet)
+        izf: Top boundary condition (1: Neumann, 2: Dirichlet)
+        co: Profile of the variable at the previous time step
+        cd: Diffusion coefficient at the cell interfaces [m^2 s^-1]
+        aa: Implicit part of the source and sink terms [s^-1]
+        bb: Explicit part of the source and sink terms
+        -------
+        OUTPUT:
+        a: Coefficients of the tri-diagonal matrix (sub-diagonal, diagonal, super-diagonal), shape (nz,3)
+        c: Right hand side
+        cddz: Diffusion coefficient multiplied by density and air fraction divided by grid spacing at the interfaces
+        """
+
+        nz = self.nz
+        dt = self.dt
+        dz = self.dz
+        rho = numpy.asarray(self.rho,dtype=float)[0:nz]
+        sf = numpy.asarray(self.sf,dtype=float)
+        vl = numpy.asarray(self.vol,dtype=float)
+        co = numpy.asarray(co,dtype=float)
+        cd = numpy.asarray(cd,dtype=float)
+        aa = numpy.asarray(aa,dtype=float)
+        bb = numpy.asarray(bb,dtype=float)
 
         rhoz = numpy.zeros(nz)
         rhoz[0] = rho[0]
-        for iz in range(1,nz):
-            rhoz[iz] = (rho[iz]*dz+rho[iz-1]*dz)/(dz+dz)
+        rhoz[1:] = (rho[1:]*dz+rho[:-1]*dz)/(dz+dz)
 
         cddz = numpy.zeros(nz+1)
         cddz[0] = sf[0]*rho[0]*cd[0]/dz
-        for iz in range(1,nz):
-            cddz[iz] = rhoz[iz]*sf[iz]*cd[iz]/((dz+dz)/2)
+        cddz[1:nz] = rhoz[1:]*sf[1:nz]*cd[1:nz]/((dz+dz)/2)
         if izf > 1:
             cddz[nz] = sf[nz]*rho[nz-1]*cd[nz]/dz
         else:
@@ -54,52 +65,93 @@ class Diff:
         a = numpy.zeros((nz, 3))
         c = numpy.zeros(nz)
         if iz1 > 1:
-            a[0][0] = 0
-            a[0][1] = 1
-            a[0][2] = 0
+            a[0,1] = 1
             c[0] = co[0]
 
-        dzv = numpy.zeros(nz)
-        for iz in range(iz1-1,nz-izf+1):
-            dzv[iz] = vl[iz]*dz
-            a[iz][0] = -(1/rho[iz])*cddz[iz]*dt/dzv[iz]
-            a[iz][1] = (1/rho[iz])*dt*((1/dzv[iz])*(cddz[iz]+cddz[iz+1]))+1-aa[iz]*dt
-            a[iz][2] = -(1/rho[iz])*cddz[iz+1]*dt/dzv[iz]
-            c[iz] = co[iz]+bb[iz]*dt
+        # Interior cells
+        iz = numpy.arange(iz1-1,nz-izf+1)
+        dzv = vl[iz]*dz
+        a[iz,0] = -(1/rho[iz])*cddz[iz]*dt/dzv
+        a[iz,1] = (1/rho[iz])*dt*((1/dzv)*(cddz[iz]+cddz[iz+1]))+1-aa[iz]*dt
+        a[iz,2] = -(1/rho[iz])*cddz[iz+1]*dt/dzv
+        c[iz] = co[iz]+bb[iz]*dt
 
         if izf == 1:
-            dzv[nz-1] = vl[nz-1]*dz
-            a[nz-1][0] = -cddz[nz-1]*dt/dzv[nz-1]
-            a[nz-1][1] = 1+dt*(cddz[nz-1])/dzv[nz-1]-aa[nz-1]*dt
-            a[nz-1][2] = 0.
+            dzv_top = vl[nz-1]*dz
+            a[nz-1,0] = -cddz[nz-1]*dt/dzv_top
+            a[nz-1,1] = 1+dt*(cddz[nz-1])/dzv_top-aa[nz-1]*dt
+            a[nz-1,2] = 0.
             c[nz-1] = co[nz-1]+bb[nz-1]*dt
         else:
-            a[nz - 1][0] = 0
-            a[nz - 1][1] = 1.
-            a[nz - 1][2] = 0.
-            c[nz - 1] = co[nz - 1]
-
-        co_new = invert(nzm,nz,a,c)
+            a[nz-1,0] = 0
+            a[nz-1,1] = 1.
+            a[nz-1,2] = 0.
+            c[nz-1] = co[nz-1]
+
+        return a,c,cddz
+
+    def Fluxes(self,iz1,izf,co,cddz):
+
+        """
+        Calculate the turbulent flux and the flux divergence of one transported variable
+        ------
+        INPUT:
+        iz1: Bottom boundary condition (1: Neumann, 2: Dirichlet)
+        izf: Top boundary condition (1: Neumann, 2: Dirichlet)
+        co: Profile of the variable at the previous time step
+        cddz: Output of Coefficients
+        -------
+        OUTPUT:
+        fc: Turbulent flux at the cell interfaces
+        df: Turbulent flux divergence
+        """
+
+        nz = self.nz
+        dz = self.dz
+        rho = numpy.asarray(self.rho,dtype=float)[0:nz]
+        vl = numpy.asarray(self.vol,dtype=float)
+        co = numpy.asarray(co,dtype=float)
 
         fc = numpy.zeros(nz)
-        for iz in range(0,iz1):
-            fc[iz] = 0
-        for iz in range(iz1,nz):
-            fc[iz] = -(cddz[iz] * (co[iz] - co[iz - 1])) / rho[iz]
+        fc[iz1:] = -(cddz[iz1:nz]*(co[iz1:]-co[iz1-1:nz-1]))/rho[iz1:]
 
+        # The flux divergence is zero next to the boundaries
         df = numpy.zeros(nz)
-        for iz in range(0,iz1):
-            df[iz] = 0
-        for iz in range(iz1,nz-izf+1):
-            dzv = vl[iz]*dz
-            if iz < nz-1:
-                df[iz] = +(co[iz-1]*cddz[iz]-co[iz]*(cddz[iz]+cddz[iz+1])+co[iz+1]*cddz[iz+1])/dzv/rho[iz]
-            else:
-                df[iz] = +(co[iz-1]*cddz[iz]-co[iz]*(cddz[iz]+cddz[iz+1]))/dzv/rho[iz]
-
-        for iz in range(nz-izf-1,nz):
-            df[iz] = 0
+        iz = numpy.arange(iz1,nz-izf-1)
+        dzv = vl[iz]*dz
+        df[iz] = +(co[iz-1]*cddz[iz]-co[iz]*(cddz[iz]+cddz[iz+1])+co[iz+1]*cddz[iz+1])/dzv/rho[iz]
 
-        return co_new,fc,df
+        return fc,df
+
+    def SolverBatch(self,equations):
 
+        """
+        Solve several transport equations sharing the same grid with a single banded solve
+        ------
+        INPUT:
+        equations: List of (iz1,izf,co,cd,aa,bb) tuples, see Coefficients
+        -------
+        OUTPUT:
+        List of (co_new,fc,df) tuples, in the order of equations
+        """
 
+        assembled = [self.Coefficients(iz1,izf,co,cd,aa,bb) for (iz1,izf,co,cd,aa,bb) in equations]
+        co_new = SolveTridiagonal(numpy.array([a for (a,c,cddz) in assembled]),
+                                  numpy.array([c for (a,c,cddz) in assembled]))
+
+        solution = []
+        for n in range(len(equations)):
+            iz1,izf,co = equations[n][0:3]
+            fc,df = self.Fluxes(iz1,izf,co,assembled[n][2])
+            solution.append((co_new[n],fc,df))
+
+        return solution
+
+    def Solver(self,nzm,nz,iz1,izf,dt,rho,co,cd,aa,bb,sf,vl,dz):
+
+        Sol = Diff(nz,dt,sf,vl,dz,rho)
+        a,c,cddz = Sol.Coefficients(iz1,izf,co,cd,aa,bb)
+        co_new = SolveTridiagonal(a,c)
+        fc,df = Sol.Fluxes(iz1,izf,co,cddz)
+
+        return co_new,fc,df
@@ -0,0 +1,209 @@
+import numpy
+import numbers
+
+"""
+Record the model variables needed by the output writers at each print interval
+Last update: October 2026
+"""
+
+def _numeric(value):
+    # Return value as a float array if it is a number or an array/list of numbers, otherwise None
+    if isinstance(value,(numbers.Number,numpy.ndarray,list,tuple)):
+        try:
+            return numpy.asarray(value,dtype=float)
+        except (TypeError,ValueError):
+            return None
+    return None
+
+def _getpath(obj,path):
+    for attr in path.split('.'):
+        obj = getattr(obj,attr)
+    return obj
+
+def _expand(value,path,leaves,seen):
+    # Collect the paths of all numeric attributes at or below path
+    if _numeric(value) is not None:
+        leaves.append(path)
+    elif hasattr(value,'__dict__') and not callable(value) and id(value) not in seen:
+        seen.add(id(value))
+        for attr in vars(value):
+            _expand(getattr(value,attr),path+'.'+attr,leaves,seen)
+
+class OutputRecorder(object):
+
+    """
+    Store the output fields of the simulation in preallocated arrays instead of copies of the model objects
+    ------
+    nRecord: Number of records (print intervals) in the simulation
+    fields: List of dictionaries declaring the fields needed by each writer. Keys are record names (e.g. 'EBRoofData') and
+            values are attribute paths of the recorded object (e.g. 'SWR.SWRabsRoofImp'). A path to an object records all
+            numeric attributes below it. If the recorded object is a list (e.g. BEM), the paths refer to its elements.
+    nBuffer: Number of records held for the streamed fields (None to hold all records). Record n is stored in row
+             n % nBuffer, so the rows must be written (streamed output) before they are overwritten.
+    keep: List of dictionaries declaring the fields that hold all records even if nBuffer is given (e.g. the profiles
+          written at the end of the simulation)
+    """
+
+    def __init__(self,nRecord,fields,nBuffer=None,keep=None):
+        self.nRecord = nRecord
+        self.nBuffer = nBuffer
+        self.fields = {}
+        for f in fields:
+            for name,paths in f.items():
+                self.fields.setdefault(name,[])
+                self.fields[name] += [p for p in paths if p not in self.fields[name]]
+        self.keep = {}
+        for f in ([] if keep is None else keep):
+            for name,paths in f.items():
+                self.keep.setdefault(name,[])
+                self.keep[name] += [p for p in paths if p not in self.keep[name]]
+        # Leaf paths, number of list elements (None for objects), and arrays of each record name
+        self.leaves = {}
+        self.nElem = {}
+        self.data = {}
+        self.prefixes = {}
+        # Leaf paths held in the buffer of nBuffer records
+        self.streamed = {}
+
+    def allocate(self,name,source):
+
+        self.nElem[name] = len(source) if isinstance(source,list) else None
+        sample = source[0] if self.nElem[name] is not None else source
+
+        leaves = []
+        self.streamed[name] = set()
+        for path in self.fields[name]:
+            expanded = []
+            try:
+                _expand(_getpath(sample,path),path,expanded,set())
+            except AttributeError:
+                # Not available in this configuration; record NaN
+                expanded.append(path)
+            leaves += expanded
+            if self.nBuffer is not None and path not in self.keep.get(name,[]):
+                self.streamed[name].update(expanded)
+        self.leaves[name] = leaves
+
+        self.data[name] = {}
+        for path in leaves:
+            try:
+                value = _numeric(_getpath(sample,path))
+            except AttributeError:
+                value = None
+            shape = () if value is None else value.shape
+            if self.nElem[name] is not None:
+                shape = (self.nElem[name],) + shape
+            nRow = self.nBuffer if path in self.streamed[name] else self.nRecord
+            self.data[name][path] = numpy.full((nRow,) + shape,numpy.NaN)
+
+        self.prefixes[name] = set()
+        for path in leaves:
+            attrs = path.split('.')
+            for k in range(1,len(attrs)):
+                self.prefixes[name].add('.'.join(attrs[0:k]))
+
+    def row(self,name,path,n):
+        # Row of record n in the array of a field
+        return n % self.nBuffer if path in self.streamed.get(name,()) else n
+
+    def store(self,name,n,obj,j=None):
+
+        for path in self.leaves[name]:
+            try:
+                value = _getpath(obj,path)
+            except AttributeError:
+                continue
+            if value is None:
+                continue
+            if j is None:
+                self.data[name][path][self.row(name,path,n)] = value
+            else:
+                self.data[name][path][self.row(name,path,n),j] = value
+
+    def record(self,n,sources):
+
+        """
+        Record the declared fields of the model objects at print interval n
+        ------
+        INPUT:
+        n: Record index
+        sources: Dictionary of model objects (or lists of model objects) with the record names as keys
+        """
+
+        for name in self.fields:
+            source = sources[name]
+            if name not in self.data:
+                self.allocate(name,source)
+            if self.nElem[name] is None:
+                self.store(name,n,source)
+            else:
+                for j in range(self.nElem[name]):
+                    self.store(name,n,source[j],j)
+
+    def complete(self):
+
+        """
+        Return the arrays of the fields that hold all records (all fields unless nBuffer is given)
+        """
+
+        return {name: {path: self.data[name][path] for path in self.data[name] if path not in self.streamed.get(name,())}
+                for name in self.data}
+
+    def view(self,name):
+
+        """
+        Return a list-like view of the records so that the writers can use RecordData[i].attr1.attr2 as for the model objects
+        """
+
+        return RecordView(self,name)
+
+class RecordView(object):
+
+    def __init__(self,recorder,name,n=None):
+        self.recorder = recorder
+        self.name = name
+        self.n = n
+
+    def __len__(self):
+        if self.n is None:
+            return self.recorder.nRecord
+        return self.recorder.nElem[self.name]
+
+    def __getitem__(self,i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if self.n is None:
+            if self.name not in self.recorder.data:
+                return None
+            if self.recorder.nElem[self.name] is not None:
+                return RecordView(self.recorder,self.name,i)
+            return RecordEntry(self.recorder,self.name,(i,),'')
+        return RecordEntry(self.recorder,self.name,(self.n,i),'')
+
+class RecordEntry(object):
+
+    __slots__ = ('_recorder','_name','_index','_prefix')
+
+    def __init__(self,recorder,name,index,prefix):
+        object.__setattr__(self,'_recorder',recorder)
+        object.__setattr__(self,'_name',name)
+        object.__setattr__(self,'_index',index)
+        object.__setattr__(self,'_prefix',prefix)
+
+    def __getattr__(self,attr):
+        path = self._prefix + attr
+        data = self._recorder.data[self._name]
+        if path in data:
+            return data[path][(self._recorder.row(self._name,path,self._index[0]),) + self._index[1:]]
+        if path in self._recorder.prefixes[self._name]:
+            return RecordEntry(self._recorder,self._name,self._index,path + '.')
+        raise AttributeError("'" + self._name + "' record has no field '" + path + "'")
+
+    def __setattr__(self,attr,value):
+        path = self._prefix + attr
+        data = self._recorder.data[self._name]
+        if path not in data:
+            raise AttributeError("'" + self._name + "' record has no field '" + path + "'")
+        data[path][(self._recorder.row(self._name,path,self._index[0]),) + self._index[1:]] = value
@@ -1,8 +1,9 @@
-import math
+import numpy
 #Fanger 1970
 def calculate_pmv(T_a, RH, Met, Clo, v, T_r):
     """
     Calculate PMV (Predicted Mean Vote) for given environmental and personal factors.
+    T_a, RH, and T_r may be arrays (e.g. one value per building type).
 
     Parameters:
     T_a (float): Air temperature in °C
@@ -13,7 +14,7 @@ def calculate_pmv(T_a, RH, Met, Clo, v, T_r):
     T_r (float): Mean radiant temperature in °C (default is equal to T_a if not provided)
 
     Returns:
-    float: PMV value
+    PMV, PPD: Predicted Mean Vote [-] and Predicted Percentage of Dissatisfied [%]
     """
     # Constants
     M = Met * 58.15  # Metabolic rate in W/m² (1 Met = 58.15 W/m²)
@@ -27,10 +28,10 @@ def calculate_pmv(T_a, RH, Met, Clo, v, T_r):
     f_cl = 1.0 + 0.2 * Clo
 
     # Calculate air vapor pressure in Pa
-    p_a = RH / 100 * 6.112 * math.exp(17.67 * T_a / (T_a + 243.5))  # In hPa, convert to Pa
+    p_a = RH / 100 * 6.112 * numpy.exp(17.67 * T_a / (T_a + 243.5))  # In hPa, convert to Pa
 
     # Convective heat transfer coefficient
-    h_c = 12.1 * math.sqrt(v) if v > 0.1 else 2.38 * abs(T_a - T_r) ** 0.25
+    h_c = 12.1 * numpy.sqrt(v) if v > 0.1 else 2.38 * numpy.abs(T_a - T_r) ** 0.25
 
     # Calculate clothing surface temperature (T_cl)
     T_cl = 35.7 - 0.028 * (M - W) - h_c * (T_a - T_r)
@@ -42,7 +43,7 @@ def calculate_pmv(T_a, RH, Met, Clo, v, T_r):
         - 0.0014 * M * (34 - T_a)
 
     # PMV calculation
-    PMV = (0.303 * math.exp(-0.036 * M) + 0.028) * L
-    PPD = 100 - 95 * math.exp(-0.03353 * PMV ** 4 - 0.2179 * PMV ** 2)
+    PMV = (0.303 * numpy.exp(-0.036 * M) + 0.028) * L
+    PPD = 100 - 95 * numpy.exp(-0.03353 * PMV ** 4 - 0.2179 * PMV ** 2)
 
     return PMV, PPD
@@ -0,0 +1,238 @@
+import os
+import time
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy
+from VCWG_Smart import VCWG_Smart
+from ReadDOE import GetDOELibrary
+
+"""
+Run the simulations of several months with a pool of processes sharing the run-invariant inputs
+Last update: October 2026
+"""
+
+# The parent process parses the .uwg files, reads the epw file, interpolates the forcing, computes the solar geometry and
+# view factors, and opens the DOE library once. The arrays of each month are copied into one shared memory block and the
+# jobs only receive a handle (block name, offsets, shapes, and the small scalar values); the workers attach read-only
+# views of the arrays instead of repeating the setup. The DOE library is memory-mapped (ReadDOE.DOELibrary), so its
+# pages are already shared by all processes.
+
+# Objects of the prepared inputs stored in the shared memory blocks
+SharedObjects = ['MeteoDataRaw_intp','ViewFactor']
+# Alignment of the arrays within a block [bytes]
+SharedAlignment = 64
+
+class PreparedInputs_Def():
+    # Run-invariant inputs of a month (see VCWG_Smart, argument Prepared)
+    pass
+
+class SharedObject_Def():
+    # Object rebuilt from the shared arrays and scalars of a handle
+    pass
+
+def PrepareInputs(epwFileName,TopForcingFileName,VCWGParamFileName,ViewFactorFileName,case,month_name,date_str,
+                  VCWGParam=None):
+
+    """
+    Compute the run-invariant inputs of a month
+    ------
+    INPUT:
+    epwFileName, TopForcingFileName, VCWGParamFileName, ViewFactorFileName, case, month_name, date_str, VCWGParam: As in
+    VCWG_Smart
+    -------
+    OUTPUT:
+    Prepared: Parsed parameters, epw file name, view factors, simulation times [s], and interpolated forcing with the
+              solar geometry (MeteoDataRaw_intp)
+    """
+
+    VCWG = VCWG_Smart(epwFileName,TopForcingFileName,VCWGParamFileName,ViewFactorFileName,case,month_name,date_str,
+                      VCWGParam)
+    VCWG.read_input()
+    VCWG.read_epw()
+
+    Prepared = PreparedInputs_Def()
+    Prepared.VCWGParam = VCWG.VCWGParam
+    Prepared.epwFileName = VCWG.epwFileName
+    Prepared.ViewFactor = VCWG.ViewFactor
+    Prepared.time_n = VCWG.time_n
+    Prepared.MeteoDataRaw_intp = VCWG.MeteoDataRaw_intp
+    return Prepared
+
+class SharedInputs(object):
+
+    """
+    Handle of the prepared inputs of a month placed in a shared memory block; only the handle is sent to the workers
+    ------
+    name: Name of the shared memory block
+    arrays: Dictionary of "object.attribute" (or "time_n") -> offset [bytes], shape, and dtype of each array
+    scalars: Dictionary of "object.attribute" -> value of the attributes that are not arrays
+    VCWGParam, epwFileName: Parsed parameters and epw file name of the month
+    """
+
+    def __init__(self,Prepared):
+
+        values = {'time_n': Prepared.time_n}
+        for obj in SharedObjects:
+            for attr,value in vars(getattr(Prepared,obj)).items():
+                values[obj + '.' + attr] = value
+
+        self.arrays = {}
+        self.scalars = {}
+        size = 0
+        for key,value in values.items():
+            if isinstance(value,numpy.ndarray) and value.dtype != object:
+                self.arrays[key] = (size,value.shape,value.dtype.str)
+                size += -(-value.nbytes // SharedAlignment) * SharedAlignment
+            else:
+                self.scalars[key] = value
+        self.VCWGParam = Prepared.VCWGParam
+        self.epwFileName = Prepared.epwFileName
+
+        # The block is owned (and unlinked) by the process that created the handle
+        self._shm = shared_memory.SharedMemory(create=True,size=max(size,1))
+        self.name = self._shm.name
+        for key,(offset,shape,dtype) in self.arrays.items():
+            numpy.ndarray(shape,dtype=dtype,buffer=self._shm.buf,offset=offset)[...] = values[key]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_shm']
+        return state
+
+    def attach(self):
+
+        """
+        Return the prepared inputs as read-only views of the shared memory block
+        """
+
+        if getattr(self,'_shm',None) is None:
+            # The workers of the pool share the resource tracker of the owner, which unlinks the block
+            self._shm = shared_memory.SharedMemory(name=self.name)
+
+        Prepared = PreparedInputs_Def()
+        Prepared.VCWGParam = self.VCWGParam
+        Prepared.epwFileName = self.epwFileName
+        # Keep the block open as long as the prepared inputs are used
+        Prepared.SharedMemory = self._shm
+        for obj in SharedObjects:
+            setattr(Prepared,obj,SharedObject_Def())
+        for key,(offset,shape,dtype) in self.arrays.items():
+            view = numpy.ndarray(shape,dtype=dtype,buffer=self._shm.buf,offset=offset)
+            view.flags.writeable = False
+            self._set(Prepared,key,view)
+        for key,value in self.scalars.items():
+            self._set(Prepared,key,value)
+        return Prepared
+
+    @staticmethod
+    def _set(Prepared,key,value):
+        if '.' in key:
+            obj,attr = key.split('.',1)
+            setattr(getattr(Prepared,obj),attr,value)
+        else:
+            setattr(Prepared,key,value)
+
+    def close(self):
+        # Release the block; called by the owner when all jobs are finished
+        if getattr(self,'_shm',None) is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+def RunMonthJob(Task):
+
+    """
+    Run the simulation of one month (a job of RunMonths)
+    ------
+    INPUT:
+    Task: Tuple of the month name, the .uwg file name, the handle of the prepared inputs, the top forcing and view
+          factor file names, the case name, and date_str
+    -------
+    OUTPUT:
+    Result: Dictionary with the month name, process id, time to attach the prepared inputs [s], run time [s], and error
+            message (None if the run succeeded)
+    """
+
+    month_name,VCWGParamFileName,Handle,TopForcingFileName,ViewFactorFileName,case,date_str = Task
+    Result = {'Month': month_name, 'Process': os.getpid(), 'AttachTime': None, 'Error': None}
+
+    start = time.time()
+    try:
+        Prepared = Handle.attach()
+        Result['AttachTime'] = time.time() - start
+        VCWG = VCWG_Smart(Prepared.epwFileName,TopForcingFileName,VCWGParamFileName,ViewFactorFileName,case,month_name,
+                          date_str,Prepared.VCWGParam,Prepared)
+        VCWG.run()
+    except Exception:
+        # A failed job is reported and does not stop the other jobs
+        Result['Error'] = traceback.format_exc()
+    Result['RunTime'] = time.time() - start
+
+    return Result
+
+def RunMonths(epwFileName,TopForcingFileName,VCWGParamFileNames,ViewFactorFileName,case,Month_names,date_str,
+              nProcesses=None,chunksize=1):
+
+    """
+    Prepare the run-invariant inputs of all months in this process and run the simulations with a pool of processes
+    ------
+    INPUT:
+    epwFileName, TopForcingFileName, ViewFactorFileName, case, date_str: As in VCWG_Smart
+    VCWGParamFileNames: .uwg file of each month
+    Month_names: Name of each month (e.g. 'Jan')
+    nProcesses: Number of processes; None: number of CPU cores, 1: the jobs are run in this process
+    chunksize: Number of months handed to a process at a time
+    -------
+    OUTPUT:
+    Results: Dictionary of month name -> result of RunMonthJob, with the time to prepare the inputs of the month
+             (PrepareTime [s]); a month whose inputs cannot be prepared is not run and has the error of the preparation.
+             The results are also printed.
+    """
+
+    Handles = []
+    Tasks = []
+    PrepareTime = {}
+    Results = {}
+    pool = None
+    try:
+        GetDOELibrary()
+        for m in range(len(Month_names)):
+            start = time.time()
+            try:
+                Prepared = PrepareInputs(epwFileName,TopForcingFileName,VCWGParamFileNames[m],ViewFactorFileName,case,
+                                         Month_names[m],date_str)
+                Handle = SharedInputs(Prepared)
+            except Exception:
+                # A month whose inputs cannot be prepared is reported like a failed job and does not stop the other months
+                Results[Month_names[m]] = {'Month': Month_names[m], 'Process': os.getpid(), 'AttachTime': None,
+                                           'Error': traceback.format_exc(), 'RunTime': None,
+                                           'PrepareTime': time.time() - start}
+                continue
+            Handles.append(Handle)
+            PrepareTime[Month_names[m]] = time.time() - start
+            Tasks.append((Month_names[m],VCWGParamFileNames[m],Handle,TopForcingFileName,ViewFactorFileName,case,
+                          date_str))
+
+        if nProcesses != 1:
+            pool = multiprocessing.Pool(nProcesses)
+            Jobs = pool.imap_unordered(RunMonthJob,Tasks,chunksize=chunksize)
+        else:
+            Jobs = map(RunMonthJob,Tasks)
+        for Result in Jobs:
+            Result['PrepareTime'] = PrepareTime[Result['Month']]
+            Results[Result['Month']] = Result
+            print('Parallel:', Result['Month'], 'finished in', round(Result['RunTime']), 's on process', Result['Process'],
+                  '(failed)' if Result['Error'] is not None else '')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        for Handle in Handles:
+            Handle.close()
+
+    for month_name in Month_names:
+        if Results[month_name]['Error'] is not None:
+            print('Parallel:', month_name, 'failed\n', Results[month_name]['Error'])
+
+    return Results
@@ -1,7 +1,8 @@
 import os
 import numpy
 import math
-import copy
+import multiprocessing
+from FileUtilities import CacheKey,WriteFileAtomic
 
 '''
 Water Functions:
@@ -11,6 +12,101 @@ Last update: May 2021
 Originally developed by Naika Meili 
 '''
 
+# Exchange matrices of the canyon surfaces. They only depend on the view factors, optical properties, and ground
+# fractions, which are constant during a run, but the radiation functions are called many times per time step
+# (e.g. in the residual of the canyon energy balance solved by least_squares). They are computed once per set of
+# parameters and reused.
+_RadiationExchangeCache = {}
+
+class RadiationExchange_Def():
+    pass
+
+def RadiationExchange(key,ExchangeMatrices):
+
+    """
+    ------
+    INPUT:
+    key: Tuple of the parameters that define the exchange matrices (view factors, optical properties, ground fractions)
+    ExchangeMatrices: Function returning the view factor matrix of the infinite reflections equation (Tij) and the
+                      view factor matrix of the incoming radiation (Tij2)
+    -------
+    OUTPUT:
+    Exchange: Inverse of Tij (outgoing radiation B_i = Tinv*Omega_i) and Tij2 (incoming radiation A_i = Tij2*B_i)
+    """
+
+    Exchange = _RadiationExchangeCache.get(key)
+    if Exchange is None:
+        Tij, Tij2 = ExchangeMatrices()
+        Exchange = RadiationExchange_Def()
+        Exchange.Tinv = numpy.linalg.inv(Tij)
+        Exchange.Tij2 = Tij2
+        # Parameters changed (e.g. a new run in the same process); keep the cache small
+        if len(_RadiationExchangeCache) >= 16:
+            _RadiationExchangeCache.clear()
+        _RadiationExchangeCache[key] = Exchange
+    return Exchange
+
+# View factors calculated by ray tracing are stored in this directory (next to the view factor file), one file per
+# canyon geometry, person position, and sampling parameters. The file name is a hash of these parameters, so that a geometry is
+# only ray traced once across months, runs, and parallel processes.
+ViewFactorCacheDir = 'ViewFactorCache'
+# Changed when the ray tracing algorithm changes so that older cached view factors are not used
+ViewFactorCacheVersion = 2
+
+def ViewFactorCacheFile(ViewFactor_file_text,H,W,a,ht,d,Person,MCSampleSize,NRays,Seed,Tolerance=0,MaxSampleSize=0):
+
+    """
+    ------
+    INPUT:
+    ViewFactor_file_text: Name of the view factor file; the cache directory is created next to it
+    H, W: Height and width of the canyon [m]
+    a, ht, d: Normalized tree radius, height, and distance from the wall [-]
+    Person: Position of the person for the mean radiant temperature
+    MCSampleSize, NRays: Number of emitting points and rays of the ray tracing
+    Seed: Seed of the emitting points
+    Tolerance, MaxSampleSize: Standard error tolerance and maximum number of emitting points of the adaptive sampling
+    -------
+    OUTPUT:
+    CacheFile: Name of the cache file of these parameters
+    """
+
+    Param = (ViewFactorCacheVersion,float(H),float(W),float(a),float(ht),float(d),float(Person.PositionPz),
+             float(Person.PositionPx),int(MCSampleSize),int(NRays),int(Seed),float(Tolerance),int(MaxSampleSize))
+    return os.path.join(os.path.dirname(ViewFactor_file_text),ViewFactorCacheDir,'VF_' + CacheKey(*Param) + '.txt')
+
+# Number of emitting points in each chunk of the ray tracing. The chunks and their seeds do not depend on the number of
+# processes, so neither do the view factors.
+ViewFactorChunkSize = 25
+
+class PersonPosition_Def():
+    pass
+
+def ViewFactorsChunk(Task):
+
+    """
+    Ray trace one chunk of emitting points of one emitting surface (see VFRayTracingSample)
+    ------
+    INPUT:
+    Task: Tuple of H, W, a, ht, d, the person position (PositionPz, PositionPx), the emitting surface, the chunk index,
+          the number of emitting points of the chunk, NRays, and the seed
+    -------
+    OUTPUT:
+    Sum: Sum of the view factors VG,VW1,VW2,VS,VT1,VT2 of the emitting points of the chunk
+    SumSq: Sum of the squared view factors of the emitting points of the chunk
+    """
+
+    H,W,a,ht,d,PositionPz,PositionPx,option_surface,ichunk,nPoints,NRays,Seed = Task
+    Person = PersonPosition_Def()
+    Person.PositionPz = PositionPz
+    Person.PositionPx = PositionPx
+    # Each chunk has its own random stream defined by the seed, the emitting surface, and the chunk index
+    RandSZ = numpy.random.default_rng([Seed,option_surface,ichunk]).uniform(0,1,nPoints)
+
+    Rad = RadiationFunctions()
+    Rad.View_Factors_Geometry(H,W,a,ht,d,Person,option_surface,nPoints,NRays,RandSZ)
+
+    return numpy.sum(Rad.VFPoints,axis=0), numpy.sum(Rad.VFPoints**2,axis=0)
+
 class RadiationFunctions(object):
 
     def TotalLWRabsorbed(self,TemperatureC,geometry,MeteoData,FractionsGround,PropOpticalGround,PropOpticalWall,
@@ -310,13 +406,22 @@ class RadiationFunctions(object):
         else:
             Cveg = 0
 
-        #  View factor matrix to solve for infinite reflections equation
-        Tij = numpy.array([[1,0,0, -(1-egveg)*F_gw_nT*Cveg, -(1-egveg)*F_gw_nT*Cveg, -(1-egveg)*F_gs_nT*Cveg],
-               [0,1,0, -(1-egbare)*F_gw_nT*Cbare, -(1-egbare)*F_gw_nT*Cbare, -(1-egbare)*F_gs_nT*Cbare],
-               [0,0,1, -(1-egimp)*F_gw_nT*Cimp, -(1-egimp)*F_gw_nT*Cimp, -(1-egimp)*F_gs_nT*Cimp],
-               [-(1-ew)*F_wg_nT*fgveg*Cveg, -(1-ew)*F_wg_nT*fgbare*Cbare, -(1-ew)*F_wg_nT*fgimp*Cimp, 1, -(1-ew)*F_ww_nT, -(1-ew)*F_ws_nT],
-               [-(1-ew)*F_wg_nT*fgveg*Cveg, -(1-ew)*F_wg_nT*fgbare*Cbare, -(1-ew)*F_wg_nT*fgimp*Cimp, -(1-ew)*F_ww_nT, 1, -(1-ew)*F_ws_nT],
-               [0, 0, 0, 0, 0, 1]])
+        # View factor matrices of the infinite reflections equation (Tij) and of the incoming radiation (Tij2)
+        def ExchangeMatrices():
+            Tij = numpy.array([[1,0,0, -(1-egveg)*F_gw_nT*Cveg, -(1-egveg)*F_gw_nT*Cveg, -(1-egveg)*F_gs_nT*Cveg],
+                   [0,1,0, -(1-egbare)*F_gw_nT*Cbare, -(1-egbare)*F_gw_nT*Cbare, -(1-egbare)*F_gs_nT*Cbare],
+                   [0,0,1, -(1-egimp)*F_gw_nT*Cimp, -(1-egimp)*F_gw_nT*Cimp, -(1-egimp)*F_gs_nT*Cimp],
+                   [-(1-ew)*F_wg_nT*fgveg*Cveg, -(1-ew)*F_wg_nT*fgbare*Cbare, -(1-ew)*F_wg_nT*fgimp*Cimp, 1, -(1-ew)*F_ww_nT, -(1-ew)*F_ws_nT],
+                   [-(1-ew)*F_wg_nT*fgveg*Cveg, -(1-ew)*F_wg_nT*fgbare*Cbare, -(1-ew)*F_wg_nT*fgimp*Cimp, -(1-ew)*F_ww_nT, 1, -(1-ew)*F_ws_nT],
+                   [0, 0, 0, 0, 0, 1]])
+            Tij2 = numpy.array([[0, 0, 0, F_gw_nT*Cveg, F_gw_nT*Cveg, F_gs_nT*Cveg],
+                    [0, 0, 0, F_gw_nT*Cbare, F_gw_nT*Cbare, F_gs_nT*Cbare],
+                    [0, 0, 0, F_gw_nT*Cimp, F_gw_nT*Cimp, F_gs_nT*Cimp],
+                    [F_wg_nT*fgveg*Cveg, F_wg_nT*fgbare*Cbare, F_wg_nT*fgimp*Cimp, 0, F_ww_nT, F_ws_nT],
+                    [F_wg_nT*fgveg*Cveg, F_wg_nT*fgbare*Cbare, F_wg_nT*fgimp*Cimp, F_ww_nT, 0, F_ws_nT],
+                    [0, 0, 0, 0, 0, 0]])
+            return Tij,Tij2
+        Exchange = RadiationExchange(('LWR_nT',F_gs_nT,F_gw_nT,F_ww_nT,F_wg_nT,F_ws_nT,ew,egveg,egbare,egimp,fgveg,fgbare,fgimp),ExchangeMatrices)
 
         # Emitted radiation per surface
         Omega_i = numpy.array([(egveg*bolzm*(Tgveg)**4*Cveg),(egbare * bolzm * (Tgbare) ** 4 * Cbare),(egimp * bolzm * (Tgimp) ** 4 * Cimp),(ew * bolzm * (Twsun) ** 4),(ew * bolzm * (Twshade) ** 4),LWR])
@@ -324,20 +429,13 @@ class RadiationFunctions(object):
         # Outgoing radiation per surface
         # Outgoing radiation [W/m^2] per m^2 surface area
 
-        B_i = numpy.linalg.solve(Tij,Omega_i)
+        B_i = numpy.dot(Exchange.Tinv,Omega_i)
 
         if B_i[5] != LWR:
             print('Incoming lonwave radiation and emitted longwave radiation from the sky after the matrix inversion are not equal')
 
         # Incoming longwave radiation at each surface A_i
-        Tij2 = numpy.array([[0, 0, 0, F_gw_nT*Cveg, F_gw_nT*Cveg, F_gs_nT*Cveg],
-                [0, 0, 0, F_gw_nT*Cbare, F_gw_nT*Cbare, F_gs_nT*Cbare],
-                [0, 0, 0, F_gw_nT*Cimp, F_gw_nT*Cimp, F_gs_nT*Cimp],
-                [F_wg_nT*fgveg*Cveg, F_wg_nT*fgbare*Cbare, F_wg_nT*fgimp*Cimp, 0, F_ww_nT, F_ws_nT],
-                [F_wg_nT*fgveg*Cveg, F_wg_nT*fgbare*Cbare, F_wg_nT*fgimp*Cimp, F_ww_nT, 0, F_ws_nT],
-                [0, 0, 0, 0, 0, 0]])
-
-        A_i = numpy.dot(Tij2,B_i)
+        A_i = numpy.dot(Exchange.Tij2,B_i)
         e_i = [egveg,egbare,egimp,ew,ew,0]
         A_i2 = [(B_i[i]-Omega_i[i])/(1-e_i[i]) for i in range(0,len(e_i))]
         Qnet_i2 = A_i - B_i
@@ -510,13 +608,24 @@ class RadiationFunctions(object):
         else:
             Cveg = 0
 
-        Tij = numpy.array([[1,0,0, -(1-egveg)*F_gw_T*Cveg, -(1-egveg)*F_gw_T*Cveg, -(1-egveg)*F_gt_T*Cveg, -(1-egveg)*F_gs_T*Cveg],
-               [0,1,0, -(1-egbare)*F_gw_T*Cbare, -(1-egbare)*F_gw_T*Cbare, -(1-egbare)*F_gt_T*Cbare, -(1-egbare)*F_gs_T*Cbare],
-               [0,0,1, -(1-egimp)*F_gw_T*Cimp, -(1-egimp)*F_gw_T*Cimp, -(1-egimp)*F_gt_T*Cimp, -(1-egimp)*F_gs_T*Cimp],
-               [-(1-ew)*F_wg_T*fgveg*Cveg, -(1-ew)*F_wg_T*fgbare*Cbare, -(1-ew)*F_wg_T*fgimp*Cimp, 1, -(1-ew)*F_ww_T, -(1-ew)*F_wt_T, -(1-ew)*F_ws_T],
-               [-(1-ew)*F_wg_T*fgveg*Cveg, -(1-ew)*F_wg_T*fgbare*Cbare, -(1-ew)*F_wg_T*fgimp*Cimp, -(1-ew)*F_ww_T, 1, -(1-ew)*F_wt_T, -(1-ew)*F_ws_T],
-               [-(1-et)*F_tg_T*fgveg*Cveg, -(1-et)*F_tg_T*fgbare*Cbare, -(1-et)*F_tg_T*fgimp*Cimp, -(1-et)*F_tw_T, -(1-et)*F_tw_T, 1-(1-et)*F_tt_T, -(1-et)*F_ts_T],
-               [0, 0, 0, 0, 0, 0, 1]])
+        # View factor matrices of the infinite reflections equation (Tij) and of the incoming radiation (Tij2)
+        def ExchangeMatrices():
+            Tij = numpy.array([[1,0,0, -(1-egveg)*F_gw_T*Cveg, -(1-egveg)*F_gw_T*Cveg, -(1-egveg)*F_gt_T*Cveg, -(1-egveg)*F_gs_T*Cveg],
+                   [0,1,0, -(1-egbare)*F_gw_T*Cbare, -(1-egbare)*F_gw_T*Cbare, -(1-egbare)*F_gt_T*Cbare, -(1-egbare)*F_gs_T*Cbare],
+                   [0,0,1, -(1-egimp)*F_gw_T*Cimp, -(1-egimp)*F_gw_T*Cimp, -(1-egimp)*F_gt_T*Cimp, -(1-egimp)*F_gs_T*Cimp],
+                   [-(1-ew)*F_wg_T*fgveg*Cveg, -(1-ew)*F_wg_T*fgbare*Cbare, -(1-ew)*F_wg_T*fgimp*Cimp, 1, -(1-ew)*F_ww_T, -(1-ew)*F_wt_T, -(1-ew)*F_ws_T],
+                   [-(1-ew)*F_wg_T*fgveg*Cveg, -(1-ew)*F_wg_T*fgbare*Cbare, -(1-ew)*F_wg_T*fgimp*Cimp, -(1-ew)*F_ww_T, 1, -(1-ew)*F_wt_T, -(1-ew)*F_ws_T],
+                   [-(1-et)*F_tg_T*fgveg*Cveg, -(1-et)*F_tg_T*fgbare*Cbare, -(1-et)*F_tg_T*fgimp*Cimp, -(1-et)*F_tw_T, -(1-et)*F_tw_T, 1-(1-et)*F_tt_T, -(1-et)*F_ts_T],
+                   [0, 0, 0, 0, 0, 0, 1]])
+            Tij2 = numpy.array([[0, 0, 0, F_gw_T*Cveg, F_gw_T*Cveg, F_gt_T*Cveg, F_gs_T*Cveg],
+                    [0, 0, 0, F_gw_T*Cbare, F_gw_T*Cbare, F_gt_T*Cbare, F_gs_T*Cbare],
+                    [0, 0, 0, F_gw_T*Cimp, F_gw_T*Cimp, F_gt_T*Cimp, F_gs_T*Cimp],
+                    [F_wg_T*fgveg*Cveg, F_wg_T*fgbare*Cbare, F_wg_T*fgimp*Cimp, 0, F_ww_T, F_wt_T, F_ws_T],
+                    [F_wg_T*fgveg*Cveg, F_wg_T*fgbare*Cbare, F_wg_T*fgimp*Cimp, F_ww_T, 0, F_wt_T, F_ws_T],
+                    [F_tg_T*fgveg*Cveg, F_tg_T*fgbare*Cbare, F_tg_T*fgimp*Cimp, F_tw_T, F_tw_T, F_tt_T, F_ts_T],
+                    [0, 0, 0, 0, 0, 0, 0]])
+            return Tij,Tij2
+        Exchange = RadiationExchange(('LWR_T',F_gs_T,F_gt_T,F_gw_T,F_ww_T,F_wt_T,F_wg_T,F_ws_T,F_tg_T,F_tw_T,F_ts_T,F_tt_T,ew,et,egveg,egbare,egimp,fgveg,fgbare,fgimp),ExchangeMatrices)
 
         Omega_i = numpy.array([(egveg*bolzm*(Tgveg)**4*Cveg),
                    (egbare * bolzm * (Tgbare) ** 4 * Cbare),
@@ -528,20 +637,12 @@ class RadiationFunctions(object):
 
         # Outgoing radiation per surface
         # Outgoing radiation [W/m^2] per m^2 surface area
-        B_i = numpy.linalg.solve(Tij,Omega_i)
+        B_i = numpy.dot(Exchange.Tinv,Omega_i)
 
         if B_i[6] != LWR:
             print('Incoming lonwave radiation and emitted longwave radiation from the sky after the matrix inversion are not equal')
 
-        Tij2 = numpy.array([[0, 0, 0, F_gw_T*Cveg, F_gw_T*Cveg, F_gt_T*Cveg, F_gs_T*Cveg],
-                [0, 0, 0, F_gw_T*Cbare, F_gw_T*Cbare, F_gt_T*Cbare, F_gs_T*Cbare],
-                [0, 0, 0, F_gw_T*Cimp, F_gw_T*Cimp, F_gt_T*Cimp, F_gs_T*Cimp],
-                [F_wg_T*fgveg*Cveg, F_wg_T*fgbare*Cbare, F_wg_T*fgimp*Cimp, 0, F_ww_T, F_wt_T, F_ws_T],
-                [F_wg_T*fgveg*Cveg, F_wg_T*fgbare*Cbare, F_wg_T*fgimp*Cimp, F_ww_T, 0, F_wt_T, F_ws_T],
-                [F_tg_T*fgveg*Cveg, F_tg_T*fgbare*Cbare, F_tg_T*fgimp*Cimp, F_tw_T, F_tw_T, F_tt_T, F_ts_T],
-                [0, 0, 0, 0, 0, 0, 0]])
-
-        A_i = numpy.dot(Tij2, B_i)
+        A_i = numpy.dot(Exchange.Tij2,B_i)
         e_i = [egveg, egbare, egimp, ew, ew, et, 0]
         A_i2 = [(B_i[i] - Omega_i[i]) / (1 - e_i[i]) for i in range(0,len(e_i))]
         Qnet_i2 = A_i - B_i
@@ -718,13 +819,22 @@ class RadiationFunctions(object):
 
         ai = [agveg,agbare,agimp,aw,aw,0]
 
-        # View factor matrix to solve for infinite reflections equation
-        Tij = numpy.array([[1,0,0, -agveg*F_gw_nT*Cveg, -agveg*F_gw_nT*Cveg, -agveg*F_gs_nT*Cveg],
-               [0,1,0, -agbare*F_gw_nT*Cbare, -agbare*F_gw_nT*Cbare, -agbare*F_gs_nT*Cbare],
-               [0,0,1, -agimp*F_gw_nT*Cimp, -agimp*F_gw_nT*Cimp, -agimp*F_gs_nT*Cimp],
-               [-aw*F_wg_nT*fgveg*Cveg,-aw*F_wg_nT*fgbare*Cbare,-aw*F_wg_nT*fgimp*Cimp, 1, -aw*F_ww_nT, -aw*F_ws_nT],
-               [-aw*F_wg_nT*fgveg*Cveg,-aw*F_wg_nT*fgbare*Cbare,-aw*F_wg_nT*fgimp*Cimp, -aw*F_ww_nT, 1, -aw*F_ws_nT],
-               [0, 0, 0, 0, 0, 1]])
+        # View factor matrices of the infinite reflections equation (Tij) and of the incoming radiation (Tij2)
+        def ExchangeMatrices():
+            Tij = numpy.array([[1,0,0, -agveg*F_gw_nT*Cveg, -agveg*F_gw_nT*Cveg, -agveg*F_gs_nT*Cveg],
+                   [0,1,0, -agbare*F_gw_nT*Cbare, -agbare*F_gw_nT*Cbare, -agbare*F_gs_nT*Cbare],
+                   [0,0,1, -agimp*F_gw_nT*Cimp, -agimp*F_gw_nT*Cimp, -agimp*F_gs_nT*Cimp],
+                   [-aw*F_wg_nT*fgveg*Cveg,-aw*F_wg_nT*fgbare*Cbare,-aw*F_wg_nT*fgimp*Cimp, 1, -aw*F_ww_nT, -aw*F_ws_nT],
+                   [-aw*F_wg_nT*fgveg*Cveg,-aw*F_wg_nT*fgbare*Cbare,-aw*F_wg_nT*fgimp*Cimp, -aw*F_ww_nT, 1, -aw*F_ws_nT],
+                   [0, 0, 0, 0, 0, 1]])
+            Tij2 = numpy.array([[0, 0, 0, F_gw_nT*Cveg, F_gw_nT*Cveg, F_gs_nT*Cveg],
+                    [0, 0, 0, F_gw_nT*Cbare, F_gw_nT*Cbare, F_gs_nT*Cbare],
+                    [0, 0, 0, F_gw_nT*Cimp, F_gw_nT*Cimp, F_gs_nT*Cimp],
+                    [F_wg_nT*fgveg*Cveg, F_wg_nT*fgbare*Cbare, F_wg_nT*fgimp*Cimp, 0, F_ww_nT, F_ws_nT],
+                    [F_wg_nT*fgveg*Cveg, F_wg_nT*fgbare*Cbare, F_wg_nT*fgimp*Cimp, F_ww_nT, 0, F_ws_nT],
+                    [0, 0, 0, 0, 0, 0]])
+            return Tij,Tij2
+        Exchange = RadiationExchange(('SWR_nT',F_gs_nT,F_gw_nT,F_ww_nT,F_wg_nT,F_ws_nT,aw,agveg,agbare,agimp,fgveg,fgbare,fgimp),ExchangeMatrices)
 
         # Incoming shortwave radiation from sky
         Omega_i = numpy.array([agveg*SWRdir_ground*Cveg,
@@ -735,19 +845,12 @@ class RadiationFunctions(object):
                    SWR_diff])
 
         # Outgoing radiation per surface
-        B_i = numpy.linalg.solve(Tij,Omega_i)
+        B_i = numpy.dot(Exchange.Tinv,Omega_i)
 
         if B_i[5] != SWR_diff:
             print('Incoming lonwave radiation and emitted longwave radiation from the sky after the matrix inversion are not equal')
 
         # Incoming shortwave radiation at each surface A_i
-        Tij2 = numpy.array([[0, 0, 0, F_gw_nT*Cveg, F_gw_nT*Cveg, F_gs_nT*Cveg],
-                [0, 0, 0, F_gw_nT*Cbare, F_gw_nT*Cbare, F_gs_nT*Cbare],
-                [0, 0, 0, F_gw_nT*Cimp, F_gw_nT*Cimp, F_gs_nT*Cimp],
-                [F_wg_nT*fgveg*Cveg, F_wg_nT*fgbare*Cbare, F_wg_nT*fgimp*Cimp, 0, F_ww_nT, F_ws_nT],
-                [F_wg_nT*fgveg*Cveg, F_wg_nT*fgbare*Cbare, F_wg_nT*fgimp*Cimp, F_ww_nT, 0, F_ws_nT],
-                [0, 0, 0, 0, 0, 0]])
-
         SWRdir_i = numpy.array([SWRdir_ground*Cveg,
                     SWRdir_ground * Cbare,
                     SWRdir_ground * Cimp,
@@ -755,7 +858,7 @@ class RadiationFunctions(object):
                     0,
                     0])
 
-        A_i1	=	numpy.dot(Tij2,B_i)+SWRdir_i	# Incoming radiation [W/m^2] per m^2 surface area
+        A_i1	=	numpy.dot(Exchange.Tij2,B_i)+SWRdir_i	# Incoming radiation [W/m^2] per m^2 surface area
         A_i			=	B_i/ai		    # Incoming radiation [W/m^2] per m^2 surface area
         for i in range(0,len(ai)):
             if ai[i] == 0:
@@ -962,14 +1065,24 @@ class RadiationFunctions(object):
 
         ai = [agveg, agbare, agimp, aw, aw, at, 0]
 
-        # View factor matrix to solve for infinite reflections equation
-        Tij = numpy.array([[1,0,0, -agveg*F_gw_T*Cveg, -agveg*F_gw_T*Cveg, -agveg*F_gt_T*Cveg, -agveg*F_gs_T*Cveg],
-               [0,1,0, -agbare*F_gw_T*Cbare, -agbare*F_gw_T*Cbare, -agbare*F_gt_T*Cbare, -agbare*F_gs_T*Cbare],
-               [0,0,1, -agimp*F_gw_T*Cimp, -agimp*F_gw_T*Cimp, -agimp*F_gt_T*Cimp, -agimp*F_gs_T*Cimp],
-               [-aw*F_wg_T*fgveg*Cveg,-aw*F_wg_T*fgbare*Cbare,-aw*F_wg_T*fgimp*Cimp, 1, -aw*F_ww_T, -aw*F_wt_T, -aw*F_ws_T],
-               [-aw*F_wg_T*fgveg*Cveg,-aw*F_wg_T*fgbare*Cbare,-aw*F_wg_T*fgimp*Cimp, -aw*F_ww_T, 1, -aw*F_wt_T, -aw*F_ws_T],
-               [-at*F_tg_T*fgveg*Cveg,-at*F_tg_T*fgbare*Cbare,-at*F_tg_T*fgimp*Cimp, -at*F_tw_T, -at*F_tw_T, 1-at*F_tt_T, -at*F_ts_T],
-               [0, 0, 0, 0, 0, 0, 1]])
+        # View factor matrices of the infinite reflections equation (Tij) and of the incoming radiation (Tij2)
+        def ExchangeMatrices():
+            Tij = numpy.array([[1,0,0, -agveg*F_gw_T*Cveg, -agveg*F_gw_T*Cveg, -agveg*F_gt_T*Cveg, -agveg*F_gs_T*Cveg],
+                   [0,1,0, -agbare*F_gw_T*Cbare, -agbare*F_gw_T*Cbare, -agbare*F_gt_T*Cbare, -agbare*F_gs_T*Cbare],
+                   [0,0,1, -agimp*F_gw_T*Cimp, -agimp*F_gw_T*Cimp, -agimp*F_gt_T*Cimp, -agimp*F_gs_T*Cimp],
+                   [-aw*F_wg_T*fgveg*Cveg,-aw*F_wg_T*fgbare*Cbare,-aw*F_wg_T*fgimp*Cimp, 1, -aw*F_ww_T, -aw*F_wt_T, -aw*F_ws_T],
+                   [-aw*F_wg_T*fgveg*Cveg,-aw*F_wg_T*fgbare*Cbare,-aw*F_wg_T*fgimp*Cimp, -aw*F_ww_T, 1, -aw*F_wt_T, -aw*F_ws_T],
+                   [-at*F_tg_T*fgveg*Cveg,-at*F_tg_T*fgbare*Cbare,-at*F_tg_T*fgimp*Cimp, -at*F_tw_T, -at*F_tw_T, 1-at*F_tt_T, -at*F_ts_T],
+                   [0, 0, 0, 0, 0, 0, 1]])
+            Tij2 = numpy.array([[0, 0, 0, F_gw_T*Cveg, F_gw_T*Cveg, F_gt_T*Cveg, F_gs_T*Cveg],
+                    [0, 0, 0, F_gw_T*Cbare, F_gw_T*Cbare, F_gt_T*Cbare, F_gs_T*Cbare],
+                    [0, 0, 0, F_gw_T*Cimp, F_gw_T*Cimp, F_gt_T*Cimp, F_gs_T*Cimp],
+                    [F_wg_T*fgveg*Cveg, F_wg_T*fgbare*Cbare, F_wg_T*fgimp*Cimp, 0, F_ww_T, F_wt_T, F_ws_T],
+                    [F_wg_T*fgveg*Cveg, F_wg_T*fgbare*Cbare, F_wg_T*fgimp*Cimp, F_ww_T, 0, F_wt_T, F_ws_T],
+                    [F_tg_T*fgveg*Cveg, F_tg_T*fgbare*Cbare, F_tg_T*fgimp*Cimp, F_tw_T, F_tw_T, F_tt_T, F_ts_T],
+                    [0, 0, 0, 0, 0, 0, 0]])
+            return Tij,Tij2
+        Exchange = RadiationExchange(('SWR_T',F_gs_T,F_gt_T,F_gw_T,F_ww_T,F_wt_T,F_wg_T,F_ws_T,F_tg_T,F_tw_T,F_ts_T,F_tt_T,aw,at,agveg,agbare,agimp,fgveg,fgbare,fgimp),ExchangeMatrices)
 
         # Incoming shortwave radiation from sky
         Omega_i = numpy.array([agveg * SWRdir_ground * Cveg,
@@ -981,20 +1094,12 @@ class RadiationFunctions(object):
                    SWR_diff])
 
         # Outgoing radiation per surface
-        B_i = numpy.linalg.solve(Tij,Omega_i)
+        B_i = numpy.dot(Exchange.Tinv,Omega_i)
 
         if B_i[6] != SWR_diff:
             print('Incoming lonwave radiation and emitted longwave radiation from the sky after the matrix inversion are not equal')
 
         # Incoming shortwave radiation at each surface A_i
-        Tij2 = numpy.array([[0, 0, 0, F_gw_T*Cveg, F_gw_T*Cveg, F_gt_T*Cveg, F_gs_T*Cveg],
-                [0, 0, 0, F_gw_T*Cbare, F_gw_T*Cbare, F_gt_T*Cbare, F_gs_T*Cbare],
-                [0, 0, 0, F_gw_T*Cimp, F_gw_T*Cimp, F_gt_T*Cimp, F_gs_T*Cimp],
-                [F_wg_T*fgveg*Cveg, F_wg_T*fgbare*Cbare, F_wg_T*fgimp*Cimp, 0, F_ww_T, F_wt_T, F_ws_T],
-                [F_wg_T*fgveg*Cveg, F_wg_T*fgbare*Cbare, F_wg_T*fgimp*Cimp, F_ww_T, 0, F_wt_T, F_ws_T],
-                [F_tg_T*fgveg*Cveg, F_tg_T*fgbare*Cbare, F_tg_T*fgimp*Cimp, F_tw_T, F_tw_T, F_tt_T, F_ts_T],
-                [0, 0, 0, 0, 0, 0, 0]])
-
         SWRdir_i = numpy.array([SWRdir_ground * Cveg,
                     SWRdir_ground * Cbare,
                     SWRdir_ground * Cimp,
@@ -1003,7 +1108,7 @@ class RadiationFunctions(object):
                     SWRdir_tree,
                     0])
 
-        A_i1 = numpy.dot(Tij2, B_i) + SWRdir_i  # Incoming radiation [W/m^2] per m^2 surface area
+        A_i1 = numpy.dot(Exchange.Tij2,B_i) + SWRdir_i  # Incoming radiation [W/m^2] per m^2 surface area
         A_i = B_i / ai  # Incoming radiation [W/m^2] per m^2 surface area
         for i in range(0, len(ai)):
             if ai[i] == 0:
@@ -1379,26 +1484,54 @@ class RadiationFunctions(object):
                 geometry.htree = -Gemeotry_m.Height_canyon / 10000
                 geometry.distance_tree = 0
 
-            # compute view factors with monte carlo ray tracing
+            # Emitting points are drawn per chunk from the seed; with a tolerance, emitting points are added until the
+            # standard error of the view factors falls below it
+            nProcesses = int(ViewFactorCal_Param.VFProcesses)
+            Seed = int(ViewFactorCal_Param.VFSeed)
+            Tolerance = float(ViewFactorCal_Param.VFTolerance)
+            MaxSampleSize = int(ViewFactorCal_Param.VFMaxSample)
+
+            # Use the view factors of this geometry if they were calculated before
+            CacheFile = ViewFactorCacheFile(ViewFactor_file_text,Gemeotry_m.Height_canyon,Gemeotry_m.Width_canyon,
+                                            geometry.radius_tree,geometry.htree,geometry.distance_tree,Person,
+                                            ViewFactorCal_Param.MCSampleSize,ViewFactorCal_Param.NRays,Seed,
+                                            Tolerance,MaxSampleSize)
+            VF_T = None
+            if os.path.exists(CacheFile):
+                VF_T = numpy.atleast_1d(numpy.loadtxt(CacheFile))
+                if len(VF_T) != 18:
+                    VF_T = None
+
+            if VF_T is None:
+                # compute view factors with monte carlo ray tracing
+                VF_T = self.VFRayTracingReciprocity(Gemeotry_m.Height_canyon, Gemeotry_m.Width_canyon, geometry.radius_tree,
+                                                    geometry.htree,geometry.distance_tree, Person,
+                                                    int(ViewFactorCal_Param.MCSampleSize), int(ViewFactorCal_Param.NRays),
+                                                    nProcesses,Seed,Tolerance,MaxSampleSize)[0:18]
+                os.makedirs(os.path.dirname(CacheFile),exist_ok=True)
+                VF_text = "# F_gs_T F_gt_T F_gw_T F_ww_T F_wt_T F_wg_T F_ws_T F_ts_T F_tw_T F_tt_T F_tg_T F_sg_T F_sw_T F_st_T " \
+                          "F_pg F_ps F_pw F_pt \n" + " ".join(repr(float(v)) for v in VF_T) + "\n"
+                WriteFileAtomic(CacheFile,lambda f: f.write(VF_text))
+
             F_gs_T, F_gt_T, F_gw_T, F_ww_T, F_wt_T, F_wg_T, F_ws_T, F_ts_T, F_tw_T, F_tt_T, F_tg_T, F_sg_T, F_sw_T, F_st_T,\
-            F_pg, F_ps, F_pw, F_pt, VFRayTracingRaw_T, VFRayTracing_T = \
-                self.VFRayTracingReciprocity(Gemeotry_m.Height_canyon, Gemeotry_m.Width_canyon, geometry.radius_tree,geometry.htree,
-                                             geometry.distance_tree, Person, int(ViewFactorCal_Param.MCSampleSize), int(ViewFactorCal_Param.NRays))
+            F_pg, F_ps, F_pw, F_pt = VF_T
 
         # calculate view factors with analytical solutions
         F_gs_nT, F_gt_nT, F_gw_nT, F_ww_nT, F_wt_nT, F_wg_nT, F_ws_nT, F_ts_nT, F_tw_nT, F_tt_nT, F_tg_nT, F_sg_nT, \
         F_sw_nT,F_st_nT, ViewFactor_nT = self.VFAnalytical(Gemeotry_m.Height_canyon, Gemeotry_m.Width_canyon)
 
 
-        VF_values = [F_gs_nT,F_gw_nT,F_ww_nT,F_wg_nT,F_ws_nT,F_sg_nT,F_sw_nT,F_gs_T,F_gt_T,F_gw_T,F_ww_T,F_wt_T,F_wg_T,F_ws_T,
-                     F_sg_T,F_sw_T,F_st_T,F_tg_T,F_tw_T,F_ts_T,F_tt_T, F_pg, F_ps, F_pt, F_pw]
-        outputFile_VF = open(ViewFactor_file_text, "w")
-        outputFile_VF.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-        outputFile_VF.write("# View Factors \n")
-        outputFile_VF.write("# F_gs_nT	F_gw_nT	F_ww_nT	F_wg_nT	F_ws_nT	F_sg_nT	F_sw_nT	F_gs_T	F_gt_T	F_gw_T	F_ww_T	F_wt_T	F_wg_T	F_ws_T	F_sg_T	F_sw_T	F_st_T	F_tg_T	F_tw_T	F_ts_T	F_tt_T F_pg, F_ps, F_pt, F_pw \n")
-        for i in range(25):
-            outputFile_VF.write("%f " % (VF_values[i]))
-        outputFile_VF.close()
+        # Write the calculated view factors so that they can be read with OPTION_RAY = 1. The view factor file is not
+        # rewritten when it was read; parallel runs may read it at the same time.
+        if ViewFactorCal_Param.OPTION_RAY != 1:
+            VF_values = [F_gs_nT,F_gw_nT,F_ww_nT,F_wg_nT,F_ws_nT,F_sg_nT,F_sw_nT,F_gs_T,F_gt_T,F_gw_T,F_ww_T,F_wt_T,F_wg_T,F_ws_T,
+                         F_sg_T,F_sw_T,F_st_T,F_tg_T,F_tw_T,F_ts_T,F_tt_T, F_pg, F_ps, F_pt, F_pw]
+            VF_text = "#### \t Vertical City Weather Generator (VCWG)  \t #### \n"
+            VF_text += "# View Factors \n"
+            VF_text += "# F_gs_nT	F_gw_nT	F_ww_nT	F_wg_nT	F_ws_nT	F_sg_nT	F_sw_nT	F_gs_T	F_gt_T	F_gw_T	F_ww_T	F_wt_T	F_wg_T	F_ws_T	F_sg_T	F_sw_T	F_st_T	F_tg_T	F_tw_T	F_ts_T	F_tt_T F_pg, F_ps, F_pt, F_pw \n"
+            for i in range(25):
+                VF_text += "%f " % (VF_values[i])
+            WriteFileAtomic(ViewFactor_file_text,lambda f: f.write(VF_text))
 
 
         class ViewFactor_Def():
@@ -1436,11 +1569,12 @@ class RadiationFunctions(object):
 
         return  ViewFactor,ViewFactorPoint
 
-    def VFRayTracingReciprocity(self,H, W, a, ht, d, Person, MCSampleSize, NRays):
+    def VFRayTracingReciprocity(self,H, W, a, ht, d, Person, MCSampleSize, NRays, nProcesses=1, Seed=0, Tolerance=0,
+                                MaxSampleSize=0):
 
         _F_gs_T_, _F_gt_T_, _F_gw_T_, _F_ww_T_, _F_wt_T_, _F_wg_T_, _F_ws_T_, _F_ts_T_, _F_tw_T_, _F_tt_T_, _F_tg_T_, \
         _F_sg_T_, _F_sw_T_, _F_st_T_, F_pg, F_ps, F_pw, F_pt, VFRayTracingRaw_T = \
-            self.VFRayTracing(H, W, a, ht, d, Person, MCSampleSize, NRays)
+            self.VFRayTracing(H, W, a, ht, d, Person, MCSampleSize, NRays, nProcesses, Seed, Tolerance, MaxSampleSize)
 
         h = H / W
         w = W / W
@@ -1600,7 +1734,7 @@ class RadiationFunctions(object):
         return F_gs_nT,F_gt_nT,F_gw_nT,F_ww_nT,F_wt_nT,F_wg_nT,F_ws_nT,F_ts_nT,F_tw_nT,F_tt_nT,F_tg_nT,F_sg_nT,F_sw_nT,\
                F_st_nT,ViewFactor_nT
 
-    def VFRayTracing(self,H,W,a,ht,d,Person,MCSampleSize,NRays):
+    def VFRayTracing(self,H,W,a,ht,d,Person,MCSampleSize,NRays,nProcesses=1,Seed=0,Tolerance=0,MaxSampleSize=0):
 
         # Emitting surface
         # 1 = from wall 1
@@ -1611,9 +1745,13 @@ class RadiationFunctions(object):
         # 6 = from sky
         # 7 = from point p
 
+        # The emitting surfaces and chunks of emitting points are ray traced by nProcesses processes
+        View_factor_Surface = self.VFRayTracingSample(H,W,a,ht,d,Person,MCSampleSize,NRays,nProcesses,Seed,Tolerance,
+                                                      MaxSampleSize)
+
         View_factor = numpy.zeros((7,6))
         for option_surface in range(7):
-            VG, VW1, VW2, VS, VT1, VT2 = self.View_Factors_Geometry(H, W, a, ht, d, Person,option_surface, MCSampleSize,NRays)
+            VG, VW1, VW2, VS, VT1, VT2 = View_factor_Surface[option_surface]
             # towards wall 1
             View_factor[option_surface, 0] = VW1
             # towards wall 2
@@ -1722,7 +1860,96 @@ class RadiationFunctions(object):
         return F_gs_T,F_gt_T,F_gw_T,F_ww_T,F_wt_T,F_wg_T,F_ws_T,F_ts_T,F_tw_T,F_tt_T,F_tg_T,F_sg_T,F_sw_T,F_st_T,F_pg,\
                F_ps,F_pw,F_pt,VFRayTracingRaw_T
 
-    def View_Factors_Geometry(self,H,W,a,ht,d,Person,OPTION_SURFACE,MCSampleSize,NRays):
+    def VFRayTracingSample(self,H,W,a,ht,d,Person,MCSampleSize,NRays,nProcesses,Seed,Tolerance=0,MaxSampleSize=0):
+
+        """
+        Ray trace the seven emitting surfaces. The emitting points of each surface are drawn in chunks of
+        ViewFactorChunkSize points with their own random generator seeded by Seed, the surface, and the chunk index, so
+        the result does not depend on the number of processes. With Tolerance > 0, chunks are added to each surface
+        until the standard error of each of its mean view factors is below Tolerance or MaxSampleSize emitting points
+        are reached.
+        ------
+        INPUT:
+        MCSampleSize: Number of emitting points of each surface (initial number with Tolerance > 0)
+        nProcesses: Number of processes; 1: the chunks are ray traced in this process
+        Seed: Seed of the emitting points
+        Tolerance: Standard error tolerance of the view factors; 0: MCSampleSize emitting points are used [-]
+        MaxSampleSize: Maximum number of emitting points of each surface with Tolerance > 0
+        Other inputs as in VFRayTracing
+        -------
+        OUTPUT:
+        View_factor_Surface: Mean view factors VG,VW1,VW2,VS,VT1,VT2 of each emitting surface, shape (7,6)
+        self.VFStandardError: Standard error of the mean view factors, shape (7,6) [-]
+        self.VFSampleSize: Number of emitting points of each emitting surface
+        """
+
+        Sum = numpy.zeros((7,6))
+        SumSq = numpy.zeros((7,6))
+        nPoints = numpy.zeros(7,dtype=int)
+        nChunks = numpy.zeros(7,dtype=int)
+        Target = numpy.full(7,int(MCSampleSize))
+        MaxSampleSize = max(int(MaxSampleSize),int(MCSampleSize))
+        # Without trees, the view factors of the tree emitting points are not used
+        Used = numpy.array([a > 0 or option_surface not in [3,4] for option_surface in range(7)])
+
+        # Processes of a pool (e.g. the months run by Run_VCWGv3.0.0Parallel.py) can not start a pool themselves; the
+        # chunks are then ray traced in this process with the same result
+        pool = None
+        if nProcesses > 1 and not multiprocessing.current_process().daemon:
+            pool = multiprocessing.Pool(nProcesses)
+
+        try:
+            while True:
+                Tasks = []
+                for option_surface in range(7):
+                    nNew = nPoints[option_surface]
+                    while nNew < Target[option_surface]:
+                        nChunk = min(ViewFactorChunkSize,Target[option_surface]-nNew)
+                        Tasks.append((H,W,a,ht,d,Person.PositionPz,Person.PositionPx,option_surface,
+                                      nChunks[option_surface],nChunk,NRays,Seed))
+                        nChunks[option_surface] += 1
+                        nNew += nChunk
+                if len(Tasks) == 0:
+                    break
+
+                if pool is None:
+                    Results = [ViewFactorsChunk(Task) for Task in Tasks]
+                else:
+                    Results = pool.map(ViewFactorsChunk,Tasks)
+                for Task, Result in zip(Tasks,Results):
+                    option_surface = Task[7]
+                    Sum[option_surface] += Result[0]
+                    SumSq[option_surface] += Result[1]
+                    nPoints[option_surface] += Task[9]
+
+                # Standard error of the mean view factors
+                n = nPoints[:,None]
+                Variance = numpy.maximum(SumSq - Sum**2/n,0) / numpy.maximum(n-1,1)
+                StandardError = numpy.sqrt(Variance/n)
+                if Tolerance <= 0:
+                    break
+
+                # Number of emitting points expected to reach the tolerance, in whole chunks
+                MaxError = numpy.max(StandardError,axis=1)
+                for option_surface in range(7):
+                    if Used[option_surface] and MaxError[option_surface] > Tolerance and \
+                            nPoints[option_surface] < MaxSampleSize:
+                        nNeeded = nPoints[option_surface]*(MaxError[option_surface]/Tolerance)**2
+                        nNeeded = int(numpy.ceil(nNeeded/ViewFactorChunkSize))*ViewFactorChunkSize
+                        Target[option_surface] = min(max(nNeeded,nPoints[option_surface]+ViewFactorChunkSize),MaxSampleSize)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        self.VFStandardError = StandardError
+        self.VFSampleSize = nPoints
+        print('View factors: emitting points per surface', nPoints.tolist(), ', maximum standard error',
+              '%.2e' % numpy.max(StandardError[Used]))
+
+        return Sum / nPoints[:,None]
+
+    def View_Factors_Geometry(self,H,W,a,ht,d,Person,OPTION_SURFACE,MCSampleSize,NRays,RandSZ=None):
 
         # Geometry specification
         h = H / W
@@ -1780,7 +2007,8 @@ class RadiationFunctions(object):
         yp6 = [rp6 * math.sin(ang[i]) for i in range(len(ang))]
 
         # Monte Carlo Parameters
-        RandSZ = numpy.random.uniform(0,1,MCSampleSize)
+        if RandSZ is None:
+            RandSZ = numpy.random.uniform(0,1,MCSampleSize)
         # Uniformly distributed "random" values in the interval [0,1]
         DeltaRays = numpy.arange(0,1+1/(NRays/2),1/(NRays/2))
 
@@ -1807,7 +2035,6 @@ class RadiationFunctions(object):
 
         # Vector definition
         if OPTION_SURFACE == 0:
-            print('OPTION_SURFACE: ', OPTION_SURFACE)
             # View Factor from Wall-1
             # Randomly distributed emitting points
             YSv = [h * RandSZ[i] for i in range(len(RandSZ))]
@@ -1818,7 +2045,6 @@ class RadiationFunctions(object):
             dthe = numpy.ones((len(XSv), 1)) @ (RayAngle_array - numpy.pi / 2)
 
         elif OPTION_SURFACE == 1:
-            print('OPTION_SURFACE: ', OPTION_SURFACE)
             # View Factor from Wall-2
             # Randomly distributed emitting points
             YSv = [h * RandSZ[i] for i in range(len(RandSZ))]
@@ -1829,7 +2055,6 @@ class RadiationFunctions(object):
             dthe = numpy.ones((len(XSv), 1)) @ (RayAngle_array + numpy.pi / 2)
 
         elif OPTION_SURFACE == 2:
-            print('OPTION_SURFACE: ', OPTION_SURFACE)
             # View Factor from ground
             # Randomly distributed emitting points
             XSv = [1+w*RandSZ[i] for i in range(len(RandSZ))]
@@ -1840,7 +2065,6 @@ class RadiationFunctions(object):
             dthe = numpy.ones((len(XSv), 1)) @ (RayAngle_array)
 
         elif OPTION_SURFACE == 3:
-            print('OPTION_SURFACE: ', OPTION_SURFACE)
             # View from Tree-1
             # Randomly distributed emitting points
             ang = [2*numpy.pi*RandSZ[i] for i in range(len(RandSZ))]
@@ -1859,7 +2083,6 @@ class RadiationFunctions(object):
             dthe = numpy.ones((len(XSv),1)) @ (RayAngle_array-numpy.pi/2) + ang_array.T
 
         elif OPTION_SURFACE == 4:
-            print('OPTION_SURFACE: ', OPTION_SURFACE)
             # View from Tree-2
             # Randomly distributed emitting points
             ang = [2*numpy.pi*RandSZ[i] for i in range(len(RandSZ))]
@@ -1878,7 +2101,6 @@ class RadiationFunctions(object):
             dthe = numpy.ones((len(XSv), 1)) @ (RayAngle_array - numpy.pi / 2) + ang_array.T
 
         elif OPTION_SURFACE == 5:
-            print('OPTION_SURFACE: ', OPTION_SURFACE)
             # View Factor from sky
             # Randomly distributed emitting points
             XSv = [(1+w*RandSZ[i]) for i in range(len(RandSZ))]
@@ -1889,7 +2111,6 @@ class RadiationFunctions(object):
             dthe = numpy.ones((len(XSv), 1)) @ (RayAngle_array + numpy.pi)
 
         elif OPTION_SURFACE == 6:
-            print('OPTION_SURFACE: ', OPTION_SURFACE)
             # View from point for MRT
             ang = [2*numpy.pi*RandSZ[i] for i in range(len(RandSZ))]
 
@@ -1918,168 +2139,108 @@ class RadiationFunctions(object):
 
     def ViewFactorsComputation(self,XSv,YSv,dmax,sz,dthe,GRAPH,x2,z2,x3,z3,x4,z4,xc,yc,r,xc2,x5,z5):
 
+        """
+        Trace the rays of all emitting points and count the surface that each ray hits first. All rays are processed as
+        arrays: the intersections with the ground, walls, and sky are calculated analytically for line segments and the
+        intersections with the trees analytically for circles.
+        ------
+        INPUT:
+        XSv, YSv: Coordinates of the emitting points
+        dmax: Maximum ray length, maximum search distance
+        sz: Search step size
+        dthe: Angle of each ray of each emitting point, shape (number of emitting points, number of rays) [rad]
+        GRAPH: Not used
+        x2,z2,x3,z3,x4,z4,x5,z5: End points of the ground, wall 1, wall 2, and sky
+        xc,yc,xc2: Centre of tree 1 and tree 2
+        r: Tree radius
+        -------
+        OUTPUT:
+        VG,VW1,VW2,VS,VT1,VT2: Mean view factor of the emitting points to the ground, wall 1, wall 2, sky, tree 1, and tree 2
+        """
+
         # pass of search
         spass = numpy.sqrt(2)*sz
-        # search distance [m]
-        SD = numpy.arange(start=spass,step=spass,stop=dmax)
-
-        np = len(XSv)
-        VGv = numpy.zeros(np)
-        VW1v = numpy.zeros(np)
-        VW2v = numpy.zeros(np)
-        VSv = numpy.zeros(np)
-        VT1v = numpy.zeros(np)
-        VT2v = numpy.zeros(np)
-
-        # For the number of emitting points
-        for ii in range(np):
-            # search angle [angular degree]
-            Z = copy.copy(dthe[ii,:])
-
-            XS = XSv[ii]
-            YS = YSv[ii]
-            VG = 0
-            VW1 = 0
-            VW2 = 0
-            VS = 0
-            VT1 = 0
-            VT2 = 0
-
-            # For the number of rays emitted from each emitting point
-            for k in range(len(Z)):
-
-                ## Check
-                xp = [SD[ip]*numpy.cos(Z[k]) for ip in range(len(SD))]
-                yp = [SD[ip]*numpy.sin(Z[k]) for ip in range(len(SD))]
-
-                # Ground
-                l1 = [x2[0],z2[0],x2[1],z2[1]]
-                l2 = [XS,YS,XS+xp[-1],YS+yp[-1]]
-                out = self.lineSegmentIntersect(l1, l2)
-                Sfn = out.intAdjacencyMatrix
-                xI = out.intMatrixX
-                yI = out.intMatrixY
-                if Sfn == 1:
-                    # distance
-                    D2 = numpy.sqrt(abs(xI-XS)**2 + abs(yI-YS)**2)
-                else:
-                    D2 = numpy.NaN
-
-                # Wall-1
-                l1 = [x3[0],z3[0],x3[1],z3[1]]
-                l2 = [XS,YS,XS+xp[-1],YS+yp[-1]]
-                out = self.lineSegmentIntersect(l1, l2)
-                Sfn = out.intAdjacencyMatrix
-                xI = out.intMatrixX
-                yI = out.intMatrixY
-                if Sfn == 1:
-                    # distance
-                    D3 = numpy.sqrt(abs(xI-XS)**2 + abs(yI-YS)**2)
-                else:
-                    D3 = numpy.NaN
-
-                # Wall-2
-                l1 = [x4[0], z4[0], x4[1], z4[1]]
-                l2 = [XS, YS, XS + xp[-1], YS + yp[-1]]
-                out = self.lineSegmentIntersect(l1, l2)
-                Sfn = out.intAdjacencyMatrix
-                xI = out.intMatrixX
-                yI = out.intMatrixY
-                if Sfn == 1:
-                    # distance
-                    D4 = numpy.sqrt(abs(xI - XS) ** 2 + abs(yI - YS) ** 2)
-                else:
-                    D4 = numpy.NaN
-
-                # Sky
-                l1 = [x5[0], z5[0], x5[1], z5[1]]
-                l2 = [XS, YS, XS + xp[-1], YS + yp[-1]]
-                out = self.lineSegmentIntersect(l1, l2)
-                Sfn = out.intAdjacencyMatrix
-                xI = out.intMatrixX
-                yI = out.intMatrixY
-                if Sfn == 1:
-                    # distance
-                    D5 = numpy.sqrt(abs(xI - XS) ** 2 + abs(yI - YS) ** 2)
-                else:
-                    D5 = numpy.NaN
-
-                # Tree 1
-                # Inside tree
-                IC = numpy.zeros(len(xp))
-                for i in range(len(xp)):
-                    if (XS + xp[i] - xc)**2 + (YS + yp[i] - yc)**2 <= r**2:
-                        IC[i] = 1
-                    else:
-                        IC[i] = 0
-                if sum(IC) > 1:
-
-                    sdi = min(numpy.where(IC == 1)[0])
-                    DT1 = numpy.sqrt(abs(XS+xp[sdi] - XS) ** 2 + abs(YS+yp[sdi] - YS) ** 2)
-                else:
-                    DT1 = numpy.NaN
-
-                # Tree 2
-                # Inside tree
-                IC = numpy.zeros(len(xp))
-                for i in range(len(xp)):
-                    if (XS + xp[i] - xc2) ** 2 + (YS + yp[i] - yc) ** 2 <= r ** 2:
-                        IC[i] = 1
-                    else:
-                        IC[i] = 0
-                if sum(IC) > 1:
-
-                    sdi = min(numpy.where(IC == 1)[0])
-                    DT2 = numpy.sqrt(abs(XS + xp[sdi] - XS) ** 2 + abs(YS + yp[sdi] - YS) ** 2)
-                else:
-                    DT2 = numpy.NaN
-
-                # Assign a count for the surface that the ray is passing through
-                # Ground  Wall 1 Wall 2  Tree 1  Tree 2 Sky
-                md = min((imin for imin in [D2,D3,D4,DT1,DT2,D5] if not math.isnan(imin)))
-                pmin = numpy.where([D2,D3,D4,DT1,DT2,D5] == md)[0]
-
-                if numpy.isnan(md):
-                    pass
-                else:
-                    if pmin == 0:
-                        VG = VG + 1
-                    elif pmin == 1:
-                        VW1 = VW1 + 1
-                    elif pmin == 2:
-                        VW2 = VW2 + 1
-                    elif pmin == 3:
-                        VT1 = VT1 + 1
-                    elif pmin == 4:
-                        VT2 = VT2 + 1
-                    else:
-                        VS = VS + 1
-
-            # Calculates the view factors for each emitting point
-            VG = VG / len(Z)
-            VW1 = VW1 / len(Z)
-            VW2 = VW2 / len(Z)
-            VS = VS / len(Z)
-            VT1 = VT1 / len(Z)
-            VT2 = VT2 / len(Z)
-
-            # This should be 1
-            Sum_view = sum([VG,VW1,VW2,VS,VT1,VT2])
-
-            VGv[ii] = VG / Sum_view
-            VW1v[ii] = VW1 / Sum_view
-            VW2v[ii] = VW2 / Sum_view
-            VSv[ii] = VS / Sum_view
-            VT1v[ii] = VT1 / Sum_view
-            VT2v[ii] = VT2 / Sum_view
+        # Ray length [m]
+        Lray = numpy.arange(start=spass,step=spass,stop=dmax)[-1]
+
+        XSv = numpy.asarray(XSv,dtype=float)
+        YSv = numpy.asarray(YSv,dtype=float)
+        dthe = numpy.asarray(dthe,dtype=float)
+        np, nray = dthe.shape
+
+        # Surfaces in the order of the counts: ground, wall 1, wall 2, sky
+        Segments = [(x2[0],z2[0],x2[1],z2[1]),(x3[0],z3[0],x3[1],z3[1]),(x4[0],z4[0],x4[1],z4[1]),(x5[0],z5[0],x5[1],z5[1])]
+        Circles = [(xc,yc),(xc2,yc)]
+
+        # Number of rays of each emitting point hitting the ground, wall 1, wall 2, sky, tree 1, and tree 2
+        Counts = numpy.zeros((np,6))
+
+        # Emitting points are processed in blocks to limit the memory use
+        nblock = max(1,2**20 // max(nray,1))
+        for i0 in range(0,np,nblock):
+            XS = XSv[i0:i0+nblock,None]
+            YS = YSv[i0:i0+nblock,None]
+            Z = dthe[i0:i0+nblock,:]
+            ux = numpy.cos(Z)
+            uy = numpy.sin(Z)
+            # Distance to the first surface hit by each ray; NaN if it is not hit
+            D = numpy.full((6,)+Z.shape,numpy.nan)
+
+            # Line segments
+            for j, (X1,Y1,X2,Y2) in enumerate(Segments):
+                X4_X3 = Lray*ux
+                Y4_Y3 = Lray*uy
+                Y1_Y3 = Y1 - YS
+                X1_X3 = X1 - XS
+                X2_X1 = X2 - X1
+                Y2_Y1 = Y2 - Y1
+                numerator_a = X4_X3 * Y1_Y3 - Y4_Y3 * X1_X3
+                numerator_b = X2_X1 * Y1_Y3 - Y2_Y1 * X1_X3
+                denominator = Y4_Y3 * X2_X1 - X4_X3 * Y2_Y1
+                # Parallel rays do not hit the segment
+                Parallel = denominator == 0
+                denominator = numpy.where(Parallel,1,denominator)
+                u_a = numerator_a / denominator
+                u_b = numerator_b / denominator
+                Hit = ~Parallel & (u_a >= 0) & (u_a <= 1) & (u_b >= 0) & (u_b <= 1)
+                xI = X1 + X2_X1 * u_a
+                yI = Y1 + Y2_Y1 * u_a
+                D[[0,1,2,5][j]] = numpy.where(Hit,numpy.sqrt((xI - XS)**2 + (yI - YS)**2),numpy.nan)
+
+            # Trees: first intersection of the ray with the circle within the ray length
+            if r > 0:
+                for j, (xcj,ycj) in enumerate(Circles):
+                    b = (XS - xcj)*ux + (YS - ycj)*uy
+                    c = (XS - xcj)**2 + (YS - ycj)**2 - r**2
+                    disc = b**2 - c
+                    sq = numpy.sqrt(numpy.maximum(disc,0))
+                    t1 = -b - sq
+                    t2 = -b + sq
+                    Hit = (disc > 0) & (t2 >= 0) & (t1 <= Lray)
+                    # A ray starting inside the tree hits it immediately
+                    D[3+j] = numpy.where(Hit,numpy.maximum(t1,0),numpy.nan)
+
+            # Assign a count for the surface that the ray is passing through
+            # Ground  Wall 1 Wall 2  Tree 1  Tree 2 Sky
+            Dmin = numpy.where(numpy.isnan(D),numpy.inf,D)
+            Surface = numpy.argmin(Dmin,axis=0)
+            Surface = numpy.where(numpy.isinf(numpy.min(Dmin,axis=0)),-1,Surface)
+            for j, k in enumerate([0,1,2,4,5,3]):
+                Counts[i0:i0+nblock,k] = numpy.sum(Surface == j,axis=1)
+
+        # Calculates the view factors for each emitting point
+        V = Counts / nray
+        # This should be 1
+        Sum_view = numpy.sum(V,axis=1)
+        # The rays of the points of an absent surface (e.g. a tree of zero radius) hit nothing; their view factors stay zero
+        Hit = Sum_view > 0
+        V[Hit] = V[Hit] / Sum_view[Hit,None]
+
+        # View factors of each emitting point, for the standard error of the sampling
+        self.VFPoints = V
 
         # Calcualtes the mean view factor of all the emitting points together
-        VG = numpy.mean(VGv)
-        VW1 = numpy.mean(VW1v)
-        VW2 = numpy.mean(VW2v)
-        VS = numpy.mean(VSv)
-        VT1 = numpy.mean(VT1v)
-        VT2 = numpy.mean(VT2v)
+        VG, VW1, VW2, VS, VT1, VT2 = numpy.mean(V,axis=0)
 
         return VG,VW1,VW2,VS,VT1,VT2
 
@@ -1,6 +1,9 @@
-import sys
 import os
+import mmap
+import struct
+import zlib
 import _pickle as cPickle
+from FileUtilities import WriteFileAtomic
 from BuildingEnergy import Building
 from Material import Material
 # from Element import Element
@@ -21,6 +24,8 @@ Last update: 2012
 
 DIR_CURR = os.path.abspath(os.path.dirname(__file__))
 DIR_DOE_PATH = os.path.join(DIR_CURR,"resources","DOERefBuildings")
+# Indexed library of the DOE reference buildings generated from the csv files by readDOE
+DOE_LIBRARY_FILE = os.path.join(DIR_DOE_PATH,"DOELibrary.bin")
 
 # Define standards: 16 building types, 3 built eras, 17 climate zones
 
@@ -104,6 +109,7 @@ def readDOE(serialize_output=True):
             ...
             CLIMATE_ZONE_17]
 
+    serialize_output: Store refBEM and Schedule as the indexed DOE library (DOE_LIBRARY_FILE, see DOELibrary)
     """
 
     #Nested, nested lists of Building, SchDef, BEMDef objects
@@ -462,32 +468,91 @@ def readDOE(serialize_output=True):
                 Schedule[i][j][k].Vswh = SHW[j]/AreaFloor[j]        # litres per hour per m^2 of floor
 
 
-    # if not test serialize refDOE,refBEM,Schedule and store in resources
-    if not serialize_output:
+    # Store refBEM and Schedule as the indexed library in resources
+    if serialize_output:
+        WriteDOELibrary(refBEM, Schedule, DOE_LIBRARY_FILE)
 
-        # create a binary file for serialized obj
-        pkl_file_path = os.path.join(DIR_CURR,'readDOE.pkl')
-        pickle_readDOE = open(pkl_file_path, 'wb')
+    return refDOE, refBEM, Schedule
 
-        # dump in ../resources
-        # Pickle objects, protocol 1 b/c binary file
-        cPickle.dump(refDOE, pickle_readDOE,1)
-        cPickle.dump(refBEM, pickle_readDOE,1)
-        cPickle.dump(Schedule, pickle_readDOE,1)
+# The DOE library file holds one compressed pickled record (BEMDef, SchDef) per building type, era, and climate zone, so that a
+# simulation only loads the records of the building types in its urban area. The file starts with DOE_LIBRARY_MAGIC and
+# the offset of the index, a pickled dictionary of the offset and length of each record.
+DOE_LIBRARY_MAGIC = b'VCWGDOE1'
 
-        pickle_readDOE.close()
+def WriteDOELibrary(refBEM, Schedule, FileName):
 
-    return refDOE, refBEM, Schedule
+    """
+    ------
+    INPUT:
+    refBEM: Nested lists [type][era][zone] of BEMDef objects
+    Schedule: Nested lists [type][era][zone] of SchDef objects
+    FileName: Name of the library file
+    """
+
+    def write(f):
+        index = {}
+        f.write(DOE_LIBRARY_MAGIC + struct.pack('<Q', 0))
+        for i in range(len(refBEM)):
+            for j in range(len(refBEM[i])):
+                for k in range(len(refBEM[i][j])):
+                    record = zlib.compress(cPickle.dumps((refBEM[i][j][k], Schedule[i][j][k]), protocol=-1))
+                    index[(i, j, k)] = (f.tell(), len(record))
+                    f.write(record)
+        offset = f.tell()
+        f.write(cPickle.dumps(index, protocol=-1))
+        f.seek(len(DOE_LIBRARY_MAGIC))
+        f.write(struct.pack('<Q', offset))
+
+    WriteFileAtomic(FileName, write, binary=True)
+
+class DOELibrary(object):
+
+    """
+    Read-only access to the DOE library file
+    The file is memory-mapped, so the processes of a parallel run share its pages, and a record is only unpickled when it
+    is requested.
+    """
+
+    def __init__(self, FileName=DOE_LIBRARY_FILE):
+        self.FileName = FileName
+        with open(FileName, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        n = len(DOE_LIBRARY_MAGIC)
+        if self.buffer[0:n] != DOE_LIBRARY_MAGIC:
+            raise ValueError("Not a DOE library file: " + FileName)
+        offset = struct.unpack('<Q', self.buffer[n:n+8])[0]
+        self.index = cPickle.loads(self.buffer[offset:])
+
+    def record(self, i, j, k):
+
+        """
+        Return new BEMDef and SchDef objects of building type i, built era j, and climate zone k (indices as in readDOE)
+        """
+
+        offset, length = self.index[(i, j, k)]
+        return cPickle.loads(zlib.decompress(self.buffer[offset:offset+length]))
+
+# DOE libraries opened in this process; opening the library in the parent of a parallel run shares it with the workers
+_DOE_libraries = {}
+
+def GetDOELibrary(FileName=DOE_LIBRARY_FILE):
+
+    """
+    Return the DOE library of this file, opening it on first use; the library is generated from the csv files if the
+    file does not exist
+    """
+
+    if FileName not in _DOE_libraries:
+        if not os.path.isfile(FileName):
+            refDOE, refBEM, Schedule = readDOE(False)
+            WriteDOELibrary(refBEM, Schedule, FileName)
+        _DOE_libraries[FileName] = DOELibrary(FileName)
+    return _DOE_libraries[FileName]
 
-if __name__ == "ReadDOE": # "__main__":#
+if __name__ == "__main__":
 
-    # Set to True only if you want create new .pkls of DOE refs
-    # Use --serialize switch to serialize the readDOE data
-    print(sys.argv)
-    if len(sys.argv)> 1 and sys.argv[1]=="--serialize":
-        refDOE, refBEM, Schedule = readDOE(True)
-    else:
-        refDOE, refBEM, Schedule = readDOE(False)
+    # Regenerate the DOE library from the csv files
+    readDOE(True)
 
 
 # Material ref from E+
@@ -1,6 +1,7 @@
 import os
 import numpy
 import math
+from collections.abc import Mapping
 from pprint import pprint
 from scipy.interpolate import interp1d
 from scipy.optimize import least_squares
@@ -11,6 +12,7 @@ import pandas as pd
 from Soil_Functions import Soil_Calculations
 from datetime import datetime
 from datetime import datetime
+from FileUtilities import CacheKey
 
 """
 Read input variables
@@ -19,11 +21,89 @@ Atmospheric Innovations Research (AIR) Laboratory, University of Guelph, Guelph,
 Last update: February 2021
 """
 
+class VCWGParam(Mapping):
+    """
+    Immutable set of VCWG parameters read from a .uwg initialization file
+    Scalars are stored as floats and matrices (e.g. SchTraffic, bld, LAD, Zs_G) as nested tuples. Matrices are handed out
+    as fresh nested lists so that callers can modify them without changing the parameters shared by other callers.
+    """
+
+    def __init__(self, param_dict, file_hash):
+        object.__setattr__(self, '_param', {key: self._freeze(value) for key, value in param_dict.items()})
+        object.__setattr__(self, 'file_hash', file_hash)   # SHA-1 of the .uwg file content
+
+    @staticmethod
+    def _freeze(value):
+        if isinstance(value, list):
+            return tuple(VCWGParam._freeze(v) for v in value)
+        return value
+
+    @staticmethod
+    def _thaw(value):
+        if isinstance(value, tuple):
+            return [VCWGParam._thaw(v) for v in value]
+        return value
+
+    def __getitem__(self, key):
+        return self._thaw(self._param[key])
+
+    def __iter__(self):
+        return iter(self._param)
+
+    def __len__(self):
+        return len(self._param)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("VCWG parameters are read-only")
+
+    def __repr__(self):
+        return "VCWGParam: {a} parameters, hash {b}".format(a=len(self._param), b=self.file_hash)
+
+    def Override(self, overrides):
+        """
+        Return a new VCWGParam with some parameters replaced; the .uwg file is not changed
+        overrides: Dictionary of parameter names and values (numbers, or nested lists for matrices such as bld)
+        The hash of the new object combines the file hash and the overrides.
+        """
+
+        param_dict = dict(self._param)
+        for key, value in overrides.items():
+            if key not in param_dict:
+                raise KeyError("Unknown VCWG parameter: " + str(key))
+            param_dict[key] = self._thaw(self._freeze(value)) if isinstance(value, list) else float(value)
+        file_hash = CacheKey(self.file_hash, sorted(overrides.items()))
+        return VCWGParam(param_dict, file_hash)
+
+# In-process caches of parsed .uwg files
+# (file path, modification time, size) -> content hash, and content hash -> VCWGParam
+_VCWG_param_file_hash = {}
+_VCWG_param_cache = {}
+
 def read_VCWG_param(VCWG_param_file_path):
-    # Open .uwg file and feed csv data to initializeDataFile
+    """
+    Read a .uwg file into an immutable VCWGParam object
+    Parsed files are cached by the hash of their content, so repeated calls on the same (unchanged) file only cost a
+    stat call and identical files share one VCWGParam object.
+    """
+
+    file_stat = os.stat(VCWG_param_file_path)
+    file_key = (os.path.realpath(VCWG_param_file_path), file_stat.st_mtime_ns, file_stat.st_size)
+    file_hash = _VCWG_param_file_hash.get(file_key)
+    if file_hash is not None and file_hash in _VCWG_param_cache:
+        return _VCWG_param_cache[file_hash]
 
     with open(VCWG_param_file_path) as f:
         lines = f.readlines()
+    file_hash = CacheKey(''.join(lines))
+    _VCWG_param_file_hash[file_key] = file_hash
+    if file_hash not in _VCWG_param_cache:
+        _VCWG_param_cache[file_hash] = VCWGParam(parse_VCWG_param(lines), file_hash)
+
+    return _VCWG_param_cache[file_hash]
+
+def parse_VCWG_param(lines):
+    # Feed csv data of the .uwg file to initializeDataFile
+
     VCWG_param = []
     for i in range(len(lines)):
         VCWG_param.append(list(lines[i].split(",")))
@@ -179,14 +259,99 @@ def read_VCWG_param(VCWG_param_file_path):
 
     return ipd_vcwg
 
-def ForcingData(MeteoDataRaw, itt, varargin,VCWG_param_file_path,SimTime):
+def SetSunVariables(Year, Month, Day, Hour, Min, Sec, DeltaGMT, Lon, Lat, t_bef, t_aft):
+    """
+    ------
+    INPUT:
+    Year, Month, Day, Hour, Min, Sec: Arrays of dates
+    DeltaGMT: Difference with Greenwich Meridian Time [h]
+    Lon: Longitude positive east [deg]
+    Lat: Latitude positive north [deg]
+    t_bef, t_aft: Averaging window before and after each date [h]
+    -------
+    OUTPUT (arrays, one value per date):
+    h_S: Solar altitude averaged over the window [rad]
+    delta_S: Solar declination [rad]
+    zeta_S: Sun's azimuth averaged over the window [rad]
+    T_sunrise: Sunrise time [h]
+    T_sunset: Sunset time [h]
+    L_day: Day length [h]
+    jDay: Julian day
+    """
+
+    # Determine the julian day of each date
+    days = numpy.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+    nowYR = numpy.asarray(Year).astype(int)
+    nowMO = numpy.asarray(Month).astype(int)
+    nowDA = numpy.asarray(Day).astype(int)
+    nowHR = numpy.asarray(Hour) + numpy.asarray(Min) / 60 + numpy.asarray(Sec) / 3600
+
+    jDay = numpy.concatenate([[0], numpy.cumsum(days)])[nowMO - 1] + nowDA
+    isLeap = (nowYR % 4 == 0) & ((nowYR % 400 == 0) | (nowYR % 100 != 0))
+    jDay = jDay + ((nowMO > 2) & isLeap)
+
+    # Compute solar declination [rad]
+    delta_S = 23.45 * numpy.pi / 180 * numpy.cos(2 * numpy.pi / 365 * (172 - jDay))
+    # Compute time difference between standard and local meridian
+    if Lon < 0:
+        Delta_TSL = -1 / 15. * (15 * abs(DeltaGMT) - abs(Lon))
+    else:
+        Delta_TSL = 1 / 15. * (15 * abs(DeltaGMT) - abs(Lon))
+
+    # Averaging window with a time step of one minute (rows: dates, columns: minutes in the window)
+    nWindow = len(numpy.arange(-t_bef, t_aft, 0.0166666))
+    t = (nowHR - t_bef)[:, None] + 0.0166666 * numpy.arange(nWindow)[None, :]
+    # Compute hour angle of the sun [rad]
+    tau_S = numpy.where(t < (12 + Delta_TSL), 15 * numpy.pi / 180 * (t + 12 - Delta_TSL),
+                        15 * numpy.pi / 180 * (t - 12 - Delta_TSL))
+
+    # Compute solar altitude [rad]
+    Lat_rad = Lat * numpy.pi / 180
+    sinh_S = math.sin(Lat_rad) * numpy.sin(delta_S)[:, None] + \
+             math.cos(Lat_rad) * numpy.cos(delta_S)[:, None] * numpy.cos(tau_S)
+    h_S = numpy.mean(numpy.arcsin(sinh_S), axis=1)
+
+    # Compute Sun's azimuth [rad]
+    with numpy.errstate(divide='ignore'):
+        zeta_S = numpy.arctan(-numpy.sin(tau_S) / (numpy.tan(delta_S)[:, None] * math.cos(Lat_rad) -
+                                                   math.sin(Lat_rad) * numpy.cos(tau_S)))
+    morning = (tau_S > 0) & (tau_S <= numpy.pi)
+    afternoon = ~morning & (tau_S >= numpy.pi) & (tau_S <= 2 * numpy.pi)
+    zeta_S = numpy.where(morning & (zeta_S > 0.), zeta_S + numpy.pi,
+                         numpy.where(morning, zeta_S + (2. * numpy.pi),
+                                     numpy.where(afternoon & (zeta_S < 0.), zeta_S + numpy.pi, zeta_S)))
+    zeta_S = numpy.mean(zeta_S, axis=1)
+
+    # Compute sunrise time, sunset time, and total day length (NaN during polar day or night)
+    with numpy.errstate(invalid='ignore'):
+        omega_S = numpy.arccos(-numpy.tan(delta_S) * math.tan(Lat_rad))
+    T_sunrise = 180 / (15 * numpy.pi) * (2 * numpy.pi - omega_S) - 12
+    T_sunset = 180 / (15 * numpy.pi) * omega_S + 12
+    L_day = 360 / (15 * numpy.pi) * omega_S
+
+    return h_S, delta_S, zeta_S, T_sunrise, T_sunset, L_day, jDay
+
+def SolarEphemeris(MeteoDataRaw, t_bef=0.5, t_aft=0.5):
+    """
+    Compute the solar geometry for all time steps of the run and store it in MeteoDataRaw
+    Solar position only depends on time and site, so ForcingData only indexes into these arrays.
+    t_bef, t_aft: Averaging window before and after each time step [h]
+    """
+    MeteoDataRaw.t_bef = t_bef
+    MeteoDataRaw.t_aft = t_aft
+    MeteoDataRaw.h_S, MeteoDataRaw.delta_S, MeteoDataRaw.zeta_S, MeteoDataRaw.T_sunrise, MeteoDataRaw.T_sunset, \
+    MeteoDataRaw.L_day, MeteoDataRaw.jDay = \
+        SetSunVariables(MeteoDataRaw.Year, MeteoDataRaw.Month, MeteoDataRaw.Day, MeteoDataRaw.Hour, MeteoDataRaw.Min,
+                        MeteoDataRaw.Sec, MeteoDataRaw.GMT, MeteoDataRaw.lon, MeteoDataRaw.lat, t_bef, t_aft)
+
+def ForcingData(MeteoDataRaw, itt, varargin,VCWG_param,SimTime):
     """
     ------
     INPUT:
     MeteoDataRaw: Forced variables at all time
     itt: Current time step
     varargin: Soil water potential [MPa]
-    VCWG_param_file_path: VCWG parameters file path
+    VCWG_param: VCWG parameters (VCWGParam object, or file path of the .uwg file)
     -------
     OUTPUT:
     SunPosition: Sun angles
@@ -196,83 +361,13 @@ def ForcingData(MeteoDataRaw, itt, varargin,VCWG_param_file_path,SimTime):
     ParCalculation: General calculation parameters
     """
 
-    def SetSunVariables(Datam, DeltaGMT, Lon, Lat, t_bef, t_aft):
-        # Determine the julian day of the current time
-        days = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-        nowYR = int(Datam[0])
-        nowMO = int(Datam[1])
-        nowDA = int(Datam[2])
-        nowHR = Datam[3] + Datam[4] / 60 + Datam[5] / 3600
-
-        if nowMO == 1:
-            jDay = nowDA
-        elif nowMO == 2:
-            jDay = days[0] + nowDA
-        else:
-            jDay = sum(days[0:(nowMO - 1)]) + nowDA
-            if nowYR % 4 == 0:
-                if nowYR % 400 == 0:
-                    jDay = jDay + 1
-                elif nowYR % 100 != 0:
-                    jDay = jDay + 1
-
-        # Compute solar declination [rad]
-        delta_S = 23.45 * numpy.pi / 180 * math.cos(2 * numpy.pi / 365 * (172 - jDay))
-        # Compute time difference between standard and local meridian
-        if Lon < 0:
-            Delta_TSL = -1 / 15. * (15 * abs(DeltaGMT) - abs(Lon))
-        else:
-            Delta_TSL = 1 / 15. * (15 * abs(DeltaGMT) - abs(Lon))
-
-        t = numpy.arange(nowHR - t_bef, nowHR + t_aft, 0.0166666)
-        tau_S = numpy.zeros(len(t))
-        for i in range(0, len(t)):
-            # Compute hour angle of the sun [rad]
-            if (t[i] < (12 + Delta_TSL)):
-                tau_S[i] = 15 * numpy.pi / 180 * (t[i] + 12 - Delta_TSL)
-            else:
-                tau_S[i] = 15 * numpy.pi / 180 * (t[i] - 12 - Delta_TSL)
-
-        # Compute solar altitude [rad]
-        Lat_rad = Lat * numpy.pi / 180
-        sinh_S = [
-            math.sin(Lat_rad) * math.sin(delta_S) + math.cos(Lat_rad) * math.cos(delta_S) * math.cos(tau_S[i])
-            for i in range(0, len(tau_S))]
-        h_S = [math.asin(sinh_S[i]) for i in range(0, len(tau_S))]
-        h_S = numpy.mean(h_S)
-
-        # Compute Sun's azimuth [rad]
-        zeta_S = [math.atan(-math.sin(tau_S[i]) / (
-                math.tan(delta_S) * math.cos(Lat_rad) - math.sin(Lat_rad) * math.cos(tau_S[i]))) for i in
-                  range(0, len(tau_S))]
-
-        for i in range(0, len(t)):
-            if (tau_S[i] > 0 and tau_S[i] <= numpy.pi):
-                if (zeta_S[i] > 0.):
-                    zeta_S[i] = zeta_S[i] + numpy.pi
-                else:
-                    zeta_S[i] = zeta_S[i] + (2. * numpy.pi)
-            elif tau_S[i] >= numpy.pi and tau_S[i] <= 2 * numpy.pi:
-                if zeta_S[i] < 0.:
-                    zeta_S[i] = zeta_S[i] + numpy.pi
-
-        zeta_S = numpy.mean(zeta_S)
-
-        # Compute sunrise time, sunset time, and total day length
-        T_sunrise = 180 / (15 * numpy.pi) * (
-                2 * numpy.pi - math.acos(-math.tan(delta_S) * math.tan(Lat_rad))) - 12
-        T_sunset = 180 / (15 * numpy.pi) * math.acos(-math.tan(delta_S) * math.tan(Lat_rad)) + 12
-        L_day = 360 / (15 * numpy.pi) * math.acos(-math.tan(delta_S) * math.tan(Lat_rad))
-        T_sunrise = numpy.real(T_sunrise)
-        T_sunset = numpy.real(T_sunset)
-        L_day = numpy.real(L_day)
-
-        return h_S, delta_S, zeta_S, T_sunrise, T_sunset, L_day, jDay
-
     def is_near_zero(self,num,eps=1e-10):
         return abs(float(num)) < eps
 
-    ipd = read_VCWG_param(VCWG_param_file_path)
+    if isinstance(VCWG_param, VCWGParam):
+        ipd = VCWG_param
+    else:
+        ipd = read_VCWG_param(VCWG_param)
 
     # Input weather variables
     LWR_in = MeteoDataRaw.LWR_in             # [W m^-2]
@@ -311,10 +406,20 @@ def ForcingData(MeteoDataRaw, itt, varargin,VCWG_param_file_path,SimTime):
 
     Datam = [Year[itt], Month[itt], Day[itt], Hour[itt], Min[itt], Sec[itt]]
 
-    t_bef = 0.5
-    t_aft = 0.5
-
-    h_S, _a_, zeta_S, _b_, _c_, _d_, _e_ = SetSunVariables(Datam, DeltaGMT, Lambda, phi, t_bef, t_aft)
+    # Solar geometry precomputed for the whole run by SolarEphemeris, if available
+    if hasattr(MeteoDataRaw, 'h_S'):
+        t_bef = MeteoDataRaw.t_bef
+        t_aft = MeteoDataRaw.t_aft
+        h_S = MeteoDataRaw.h_S[itt]
+        zeta_S = MeteoDataRaw.zeta_S[itt]
+    else:
+        t_bef = 0.5
+        t_aft = 0.5
+        h_S, _a_, zeta_S, _b_, _c_, _d_, _e_ = SetSunVariables(Year[itt:itt+1], Month[itt:itt+1], Day[itt:itt+1],
+                                                               Hour[itt:itt+1], Min[itt:itt+1], Sec[itt:itt+1],
+                                                               DeltaGMT, Lambda, phi, t_bef, t_aft)
+        h_S = h_S[0]
+        zeta_S = zeta_S[0]
 
     # Solar zenith angle [rad]
     theta_Z = numpy.pi / 2 - h_S
@@ -461,10 +566,16 @@ def ForcingData(MeteoDataRaw, itt, varargin,VCWG_param_file_path,SimTime):
     return SunPosition, MeteoData, Anthropogenic, Location, ParCalculation
 
 def Data_Site(InputFile):
+    """
+    InputFile: VCWG parameters (VCWGParam object, or file path of the .uwg file)
+    """
 
     SoilCal = Soil_Calculations()
 
-    ipd = read_VCWG_param(InputFile)
+    if isinstance(InputFile, VCWGParam):
+        ipd = InputFile
+    else:
+        ipd = read_VCWG_param(InputFile)
 
     # Rural model parameters
     class RSMParam_Def():
@@ -1223,6 +1334,10 @@ def Data_Site(InputFile):
     TimeParam.Month = ipd['Month']
     TimeParam.dtWeather = ipd['dtWeather']
     TimeParam.nDay_spinup = ipd['nDay_spinup']
+    TimeParam.StreamOutput = ipd.get('StreamOutput', 0)
+    TimeParam.nFlush = ipd.get('nFlush', 24)
+    TimeParam.BinaryOutput = ipd.get('BinaryOutput', 0)
+    TimeParam.nCheckpoint = ipd.get('nCheckpoint', 0)
 
     class ViewFactorCal_Param_Def():
         pass
@@ -1230,6 +1345,10 @@ def Data_Site(InputFile):
     ViewFactorCal_Param.OPTION_RAY = ipd['OPTION_RAY']
     ViewFactorCal_Param.MCSampleSize = ipd['MCSampleSize']
     ViewFactorCal_Param.NRays = ipd['NRays']
+    ViewFactorCal_Param.VFProcesses = ipd.get('VFProcesses', 1)
+    ViewFactorCal_Param.VFSeed = ipd.get('VFSeed', 0)
+    ViewFactorCal_Param.VFTolerance = ipd.get('VFTolerance', 0)
+    ViewFactorCal_Param.VFMaxSample = ipd.get('VFMaxSample', 2000)
 
     bld = ipd['bld']
     zone = int(ipd['zone'])-1
@@ -1248,6 +1367,7 @@ def Data_Site(InputFile):
     BEMParam.RadFLight = ipd['RadFLight']
     BEMParam.hvac = ipd['hvac']
     BEMParam.h_floor = ipd['h_floor']
+    BEMParam.VectorizedBEM = ipd.get('VectorizedBEM', 0)
 
     RSMParam.fimp = 0
     RSMParam.fveg = 1
@@ -1308,6 +1428,8 @@ def Data_Site(InputFile):
     SmartBuildingParam = SmartBuildingParamDef()
     SmartBuildingParam.SmartThermostat = ipd['SmartThermostat']
     SmartBuildingParam.SmartHumidistat = ipd['SmartHumidistat']
+    # Fuzzy setpoint controller; 0: exact fuzzy inference, 1: tabulated fuzzy inference (optional, default 0)
+    SmartBuildingParam.FuzzyTabulated = ipd.get('FuzzyTabulated', 0)
 
     SmartBuildingParam.coolTempSetpointDay = ipd['coolTempSetpointDay']
     SmartBuildingParam.coolTempSetpointNight = ipd['coolTempSetpointNight']
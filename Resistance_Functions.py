@@ -2,7 +2,6 @@ import os
 import numpy
 import math
 from scipy.interpolate import interp1d
-from scipy.optimize import fsolve
 from ResistanceFunctionsDef import ResistanceSoil,CanopyResistanceAnEvolution,PhotosynthesisBiochemical
 from Soil_Functions import Soil_Calculations
 import copy
@@ -52,6 +51,8 @@ class Ressitance_Calculations(object):
         e_relN: Relative efficiency of the photosynthesis apparatus due to N limitations [-]
         gmes: Mesophyll conductance, not used [mol CO2 s^-1 m^-2]
         rjv: Scaling factor between Jmax and Vmax
+        The inputs can be arrays to calculate several canopies (e.g. trees and ground vegetation) at once; the sunlit and
+        shaded leaves of all canopies are solved together.
         -------
         OUTPUT:
         rs_sun: stomatal resistence [s m^-1]
@@ -60,19 +61,20 @@ class Ressitance_Calculations(object):
         Ci_shd: Leaf Interior CO2 mixing ratio of shaded [umolCO2 mol^-1]
         An: Net Assimiltation Rate [umolCO2 s^-1 m^-2 ]
         Rdark: Surface Leaf Concentration [umolCO2 s^-1 m^-2 ]
+        The outputs are arrays if any of the inputs is an array.
         """
 
-        # Re-define input parameters which are overwritten in this function
-        PAR_sun_local = copy.copy(PAR_sun)
-        PAR_shd_local = copy.copy(PAR_shd)
-        Citm1_sun_local = copy.copy(Citm1_sun)
-        Citm1_shd_local = copy.copy(Citm1_shd)
-        Vmax_local = copy.copy(Vmax)
+        Inputs = (PAR_sun,PAR_shd,LAI,Kopt,Knit,Fsun,Fshd,Citm1_sun,Citm1_shd,Ca,ra,rb,Ts,Pre,Ds,Psi_L,Psi_sto_50,
+                  Psi_sto_99,CT,Vmax,DS,Ha,FI,Oa,Do,a1,go,e_rel,e_relN,gmes,rjv)
+        scalar = all(numpy.ndim(x) == 0 for x in Inputs)
+
+        # Arrays of canopies; new arrays, so the input parameters are not overwritten in this function
+        PAR_sun_local,PAR_shd_local,LAI,Kopt,Knit,Fsun,Fshd,Citm1_sun_local,Citm1_shd_local,Ca,ra,rb,Ts,Pre,Ds,Psi_L,\
+        Psi_sto_50,Psi_sto_99,CT,Vmax_local,DS,Ha,FI,Oa,Do,a1,go,e_rel,e_relN,gmes,rjv = \
+            [numpy.array(x,dtype=float) for x in numpy.broadcast_arrays(*[numpy.atleast_1d(x) for x in Inputs])]
 
-        if Citm1_sun_local < 200:
-            Citm1_sun_local = 200
-        if Citm1_shd_local < 200:
-            Citm1_shd_local = 200
+        Citm1_sun_local = numpy.maximum(Citm1_sun_local,200)
+        Citm1_shd_local = numpy.maximum(Citm1_shd_local,200)
 
         # ANSW_SCA is assumed to be one
         # Relative efficiency for age
@@ -80,10 +82,8 @@ class Ressitance_Calculations(object):
         # Scaling from leaf to canopy
         # To be recomputed for Vmax only for LAI and with Kopt to avoid issue with SAI LAIdead
         FsunV = (1 - numpy.exp(-Kopt * (LAI))) / (Kopt * (LAI))
-        if FsunV < 0.01:
-            FsunV = 0
-        if FsunV > 1:
-            FsunV = 1
+        FsunV[FsunV < 0.01] = 0
+        FsunV[FsunV > 1] = 1
         FshdV = 1 - FsunV
 
         # Two big leaves with Kn
@@ -93,8 +93,7 @@ class Ressitance_Calculations(object):
         Vmax_sun = Vmax_local * Can_sun / (LAI * FsunV)
         Vmax_shd = Vmax_local * Can_shd / (LAI * FshdV)
 
-        if FsunV == 0:
-            Vmax_sun = 0
+        Vmax_sun[FsunV == 0] = 0
 
         # minimum canopy conductance
         go_sun = go
@@ -111,54 +110,42 @@ class Ressitance_Calculations(object):
         PAR_sun_local = PAR_sun_local / (LAI * Fsun)
         PAR_shd_local = PAR_shd_local / (LAI * Fshd)
 
-        # sunlit fraction
-        if Fsun > 0:
-            Ci_sun = fsolve(self.CO2_Concentration,Citm1_sun_local,args=(PAR_sun_local,Ca,ra,rb_sun,Ts,Pre,Ds,Psi_L,Psi_sto_50,
-                            Psi_sto_99,CT,Vmax_sun,DS,Ha,FI,Oa,Do,a1,go_sun,gmes_sun,rjv),xtol=1)
-
-            if Ci_sun.size == 1:
-                Ci_sun = Ci_sun[0]
-            else:
-                print('Size of Ci_shd is greater than 1')
-
-            self.Photosynthesis_Biochemical(Ci_sun,PAR_sun_local,Ca,ra,rb_sun,Ts,Pre,Ds,Psi_L,Psi_sto_50,Psi_sto_99,CT,
-                                            Vmax_sun,DS,Ha,FI,Oa,Do,a1,go_sun,gmes_sun,rjv)
-            CiF_sun = self.PhotoBiochem.CcF
-            An_sun = self.PhotoBiochem.An
-            rc_sun = self.PhotoBiochem.rs
-            Rdark_sun = self.PhotoBiochem.Rdark
-            SIF_sun = self.PhotoBiochem.F755nm
-        else:
-            Ci_sun = 0
-            CiF_sun = 0
-            An_sun = 0
-            Rdark_sun = 0
-            rc_sun = numpy.inf
-            SIF_sun = 0
-
-        # Shadowed fraction
-        if Fshd > 0:
-            Ci_shd = fsolve(self.CO2_Concentration,Citm1_shd_local,args=(PAR_shd_local,Ca,ra,rb_shd,Ts,Pre,Ds,Psi_L,Psi_sto_50,
-                                                                         Psi_sto_99,CT,Vmax_shd,DS,Ha,FI,Oa,Do,a1,go_shd,gmes_shd,rjv),xtol=1)
-            if Ci_shd.size == 1:
-                Ci_shd = Ci_shd[0]
-            else:
-                print('Size of Ci_shd is greater than 1')
-
-            self.Photosynthesis_Biochemical(Ci_shd,PAR_shd_local,Ca,ra,rb_shd,Ts,Pre,Ds,Psi_L,Psi_sto_50,Psi_sto_99,CT,
-                                            Vmax_shd,DS,Ha,FI,Oa,Do,a1,go_shd,gmes_shd,rjv)
-            CiF_shd = self.PhotoBiochem.CcF
-            An_shd = self.PhotoBiochem.An
-            rc_shd = self.PhotoBiochem.rs
-            Rdark_shd = self.PhotoBiochem.Rdark
-            SIF_shd = self.PhotoBiochem.F755nm
-        else:
-            Ci_shd = 0
-            CiF_shd = 0
-            An_shd = 0
-            Rdark_shd = 0
-            rc_shd = numpy.inf
-            SIF_shd = 0
+        # Sunlit and shaded leaves of all canopies are solved together; only fractions that are present are calculated
+        def Leaves(x_sun,x_shd):
+            return numpy.concatenate((x_sun,x_shd))[Present]
+
+        n = len(LAI)
+        Present = numpy.concatenate((Fsun > 0,Fshd > 0))
+        LeafParam = (Leaves(PAR_sun_local,PAR_shd_local),Leaves(Ca,Ca),Leaves(ra,ra),Leaves(rb_sun,rb_shd),Leaves(Ts,Ts),
+                     Leaves(Pre,Pre),Leaves(Ds,Ds),Leaves(Psi_L,Psi_L),Leaves(Psi_sto_50,Psi_sto_50),
+                     Leaves(Psi_sto_99,Psi_sto_99),Leaves(CT,CT),Leaves(Vmax_sun,Vmax_shd),Leaves(DS,DS),Leaves(Ha,Ha),
+                     Leaves(FI,FI),Leaves(Oa,Oa),Leaves(Do,Do),Leaves(a1,a1),Leaves(go_sun,go_shd),
+                     Leaves(gmes_sun,gmes_shd),Leaves(rjv,rjv))
+
+        Ci = numpy.zeros(2*n)
+        CiF = numpy.zeros(2*n)
+        An_leaf = numpy.zeros(2*n)
+        Rdark_leaf = numpy.zeros(2*n)
+        rc = numpy.full(2*n,numpy.inf)
+        SIF_leaf = numpy.zeros(2*n)
+
+        if Present.any():
+            PhotoParam = self.Photosynthesis_Parameters(*LeafParam)
+            Ci[Present] = self.CO2_Concentration_Batch(Leaves(Citm1_sun_local,Citm1_shd_local),PhotoParam)
+
+            self.Photosynthesis_Leaf(Ci[Present],PhotoParam)
+            CiF[Present] = self.PhotoBiochem.CcF
+            An_leaf[Present] = self.PhotoBiochem.An
+            rc[Present] = self.PhotoBiochem.rs
+            Rdark_leaf[Present] = self.PhotoBiochem.Rdark
+            SIF_leaf[Present] = self.PhotoBiochem.F755nm
+
+        Ci_sun, Ci_shd = Ci[0:n], Ci[n:2*n]
+        CiF_sun, CiF_shd = CiF[0:n], CiF[n:2*n]
+        An_sun, An_shd = An_leaf[0:n], An_leaf[n:2*n]
+        Rdark_sun, Rdark_shd = Rdark_leaf[0:n], Rdark_leaf[n:2*n]
+        rc_sun, rc_shd = rc[0:n], rc[n:2*n]
+        SIF_sun, SIF_shd = SIF_leaf[0:n], SIF_leaf[n:2*n]
 
         DCi_sun = Ci_sun - CiF_sun
         DCi_shd = Ci_shd - CiF_shd
@@ -175,6 +162,9 @@ class Ressitance_Calculations(object):
         lanp = 0.469 # [J umol^-1 CO2]
         Lpho = (An + Rdark) * lanp # [W m^-2]
 
+        if scalar:
+            rs_sun,rs_shd,Ci_sun,Ci_shd,An,Rdark,Lpho,SIF,DCi = [x[0] for x in (rs_sun,rs_shd,Ci_sun,Ci_shd,An,Rdark,Lpho,SIF,DCi)]
+
         self.CanopyResEvl = CanopyResistanceAnEvolution()
         self.CanopyResEvl.rs_sun = rs_sun
         self.CanopyResEvl.rs_shd = rs_shd
@@ -197,11 +187,55 @@ class Ressitance_Calculations(object):
 
         return self.DCi
 
+    def CO2_Concentration_Batch(self,Cc0,PhotoParam,xtol=1e-6,maxiter=50):
+
+        """
+        Solve the leaf interior CO2 concentration Cc = CcF(Cc) of several leaves at once with the secant method. The
+        leaves are independent, so all inputs are arrays with one element per leaf.
+        ------
+        INPUT:
+        Cc0: Starting value of the leaf interior CO2 concentration (e.g. of the previous time step) [umolCO2 mol^-1]
+        PhotoParam: Parameters of the photosynthesis model from Photosynthesis_Parameters
+        xtol: Relative tolerance of the leaf interior CO2 concentration
+        maxiter: Maximum number of iterations
+        -------
+        OUTPUT:
+        Cc: Leaf interior CO2 concentration [umolCO2 mol^-1]
+        """
+
+        Cc_old = numpy.array(Cc0,dtype=float)
+        self.Photosynthesis_Leaf(Cc_old,PhotoParam,False)
+        DCi_old = Cc_old - self.PhotoBiochem.CcF
+        # The first step is a fixed point iteration
+        Cc = Cc_old - DCi_old
+        for i in range(maxiter):
+            self.Photosynthesis_Leaf(Cc,PhotoParam,False)
+            DCi = Cc - self.PhotoBiochem.CcF
+            Converged = (abs(Cc - Cc_old) <= xtol*abs(Cc)) | (DCi == 0) | ~numpy.isfinite(Cc)
+            if Converged.all():
+                break
+            Slope = (DCi - DCi_old) / numpy.where(Cc != Cc_old,Cc - Cc_old,1)
+            Step = numpy.where(Converged | (Slope == 0),0,DCi/numpy.where(Slope == 0,1,Slope))
+            Cc_old, DCi_old = Cc, DCi
+            Cc = numpy.maximum(Cc - Step,0)
+
+        return Cc
+
     def Photosynthesis_Biochemical(self,Cc,IPAR,Csl,ra,rb,Ts,Pre,Ds,Psi_L,Psi_sto_50,Psi_sto_00,CT,Vmax,DS,Ha,FI,Oa,Do,
                                    a1,go,gmes,rjv):
 
+        # The inputs can be arrays with one element per leaf (including the photosynthetic pathway CT)
+        PhotoParam = self.Photosynthesis_Parameters(IPAR,Csl,ra,rb,Ts,Pre,Ds,Psi_L,Psi_sto_50,Psi_sto_00,CT,Vmax,DS,Ha,FI,Oa,
+                                                    Do,a1,go,gmes,rjv)
+        self.Photosynthesis_Leaf(Cc,PhotoParam)
+
+    def Photosynthesis_Parameters(self,IPAR,Csl,ra,rb,Ts,Pre,Ds,Psi_L,Psi_sto_50,Psi_sto_00,CT,Vmax,DS,Ha,FI,Oa,Do,a1,go,gmes,
+                                  rjv):
+
+        # Terms of the photosynthesis model that do not depend on the leaf interior CO2 concentration; they are
+        # calculated once for the iterations of CO2_Concentration_Batch
+
         # Re-define input parameters which are overwritten in this function
-        Cc_local = copy.copy(Cc)
         IPAR_local = copy.copy(IPAR)
         Csl_local = copy.copy(Csl)
         ra_local = copy.copy(ra)
@@ -221,7 +255,6 @@ class Ressitance_Calculations(object):
         IPAR_local = IPAR_local * 4.57  # [umolPhotons s^-1 m^-2]
         ra_local = ra_local * (0.0224 * (Ta + 273.15) * Pre0 / (Tf * Pre_local)) * 10 ** (-6) # [m^2 s umolH2O^-1]
         rb_local = rb_local * (0.0224 * (Ta + 273.15) * Pre0 / (Tf * Pre_local)) * 10 ** (-6) # [m^2 s umolH2O^-1]
-        Cc_local = Cc_local * 10 ** (-6) * Pre_local   # Partial Pressure [Pa * molCO2 molAIR^-1]
         Oa_local = Oa_local * 10 ** (-6) * Pre_local   # [Pa]
         Csl_local = Csl_local * 10 ** (-6) * Pre_local # Leaf surface CO2 concentration [Pa]
 
@@ -273,21 +306,25 @@ class Ressitance_Calculations(object):
              (1 + numpy.exp((Ts_k * DS_local - Hd) / (Ts_k * R)))
         TPU = TPU25 * kT # [umolCO2 s^-1 m^-2]
 
-        if CT == 4:
-            s1 = 0.3  # [1 K^-1]
-            s3 = 0.2  # [1 K^-1] 0.3 (Cox 2001)
-            Tup = 40  # [C]
-            Tlow = 15 # [C]
+        # Pathway of each leaf
+        C3 = numpy.equal(CT,3)
+        C4 = numpy.equal(CT,4)
+
+        # C4 plants
+        s1 = 0.3  # [1 K^-1]
+        s3 = 0.2  # [1 K^-1] 0.3 (Cox 2001)
+        Tup = 40  # [C]
+        Tlow = 15 # [C]
 
-            # Temperature Function 1 for Maximum Rubisco Capacity
-            f1T = 1 / (1 + numpy.exp(s1 * (Ts - Tup)))
-            # Temperature Function 2 for Maximum Rubisco Capacity
-            f2T = 1 / (1 + numpy.exp(s3 * (Tlow - Ts)))
-            fT = 2**(0.1 * (Ts - 25))
-            Vm = Vmax * fT * f1T * f2T   # [umolCO2 s^-1 m^-2]
+        # Temperature Function 1 for Maximum Rubisco Capacity
+        f1T = 1 / (1 + numpy.exp(s1 * (Ts - Tup)))
+        # Temperature Function 2 for Maximum Rubisco Capacity
+        f2T = 1 / (1 + numpy.exp(s3 * (Tlow - Ts)))
+        fT = 2**(0.1 * (Ts - 25))
+        Vm = numpy.where(C4,Vmax * fT * f1T * f2T,Vm)   # [umolCO2 s^-1 m^-2]
 
-            ke25 = 20000 * Vmax
-            ke = ke25 * fT
+        ke25 = 20000 * Vmax
+        ke = ke25 * fT
 
         # CO2 concentration point
         # ANSG is assumed to be 2
@@ -299,41 +336,43 @@ class Ressitance_Calculations(object):
         # Michaelis - Menten Constant for CO2 [Pa]
         GAM = GAM25 * kT
 
-        if CT == 3:
-            # Michaelis-Menten Constants for CO2 and O2
-            # Activation Energy [kJ mol^-1]
-            Ha_local = 79.43
-            Kc25 = 404.9 # [umol mol^-1]
-            Kc25 = Kc25 * 10 ** (-6) * Pre_local # [Pa]
-            kT = numpy.exp(Ha_local * (Ts_k - Tref) / (Tref * R * Ts_k))
-            Kc = Kc25 * kT
-
-            # Activation Energy [kJ mol^-1]
-            Ha_local = 36.38
-            Ko25 = 278.4 # [umol mol^-1]
-            Ko25 = Ko25 * 10 ** (-3) * Pre_local # [Pa]
-            kT = numpy.exp(Ha_local * (Ts_k - Tref) / (Tref * R * Ts_k))
-            # Michaelis-Menten Constant for O2
-            Ko = Ko25 * kT
+        # C3 plants
+        # Michaelis-Menten Constants for CO2 and O2
+        # Activation Energy [kJ mol^-1]
+        Ha_local = 79.43
+        Kc25 = 404.9 # [umol mol^-1]
+        Kc25 = Kc25 * 10 ** (-6) * Pre_local # [Pa]
+        kT = numpy.exp(Ha_local * (Ts_k - Tref) / (Tref * R * Ts_k))
+        Kc = Kc25 * kT
+
+        # Activation Energy [kJ mol^-1]
+        Ha_local = 36.38
+        Ko25 = 278.4 # [umol mol^-1]
+        Ko25 = Ko25 * 10 ** (-3) * Pre_local # [Pa]
+        kT = numpy.exp(Ha_local * (Ts_k - Tref) / (Tref * R * Ts_k))
+        # Michaelis-Menten Constant for O2
+        Ko = Ko25 * kT
 
         # Dark Respiration
-        if CT == 3:
-            Ha_local = 46.39
-            DS_local = 0.490
-            Hd = 150.65
-
-            Rdark25 = 0.015 * Vmax
-            kT = numpy.exp(Ha_local * (Ts_k - Tref) / (Tref * R * Ts_k)) * (1 + numpy.exp((Tref * DS_local - Hd) / (Tref * R))) / \
-                 (1 + numpy.exp((Ts_k * DS_local - Hd) / (Ts_k * R)))
-            Rdark = Rdark25 * kT
-
-        elif CT == 4:
-            fT = 2.0 ** (0.1 * (Ts - 25))
-            # Temperature Function 3 for Respiration
-            fT3 = 1 / (1 + numpy.exp(1.3 * (Ts - 55)))
-            Rdark25 = 0.025 * Vmax
-            # Leaf Maintainance Respiration / Dark Respiration [umolCO2 s^-1 m^-2]
-            Rdark = Rdark25 * fT * fT3
+        # C3 plants
+        Ha_local = 46.39
+        DS_local = 0.490
+        Hd = 150.65
+
+        Rdark25 = 0.015 * Vmax
+        kT = numpy.exp(Ha_local * (Ts_k - Tref) / (Tref * R * Ts_k)) * (1 + numpy.exp((Tref * DS_local - Hd) / (Tref * R))) / \
+             (1 + numpy.exp((Ts_k * DS_local - Hd) / (Ts_k * R)))
+        Rdark_C3 = Rdark25 * kT
+
+        # C4 plants
+        fT = 2.0 ** (0.1 * (Ts - 25))
+        # Temperature Function 3 for Respiration
+        fT3 = 1 / (1 + numpy.exp(1.3 * (Ts - 55)))
+        Rdark25 = 0.025 * Vmax
+        # Leaf Maintainance Respiration / Dark Respiration [umolCO2 s^-1 m^-2]
+        Rdark_C4 = Rdark25 * fT * fT3
+
+        Rdark = numpy.where(C3,Rdark_C3,numpy.where(C4,Rdark_C4,numpy.nan))
 
         # Photosynthesis factors
         # Light Absorbed by Photosystem II in CO2 units [umolCO2 s^-1 m^-2]
@@ -343,85 +382,127 @@ class Ressitance_Calculations(object):
         d3 = Q * Jm / 4
 
         # Electron Transport Rate
-        J = min((-d2 + numpy.sqrt(d2 ** 2 - 4 * d1 * d3)) / (2 * d1), (-d2 - numpy.sqrt(d2 ** 2 - 4 * d1 * d3)) / (2 * d1))
-
-        if CT == 3:
-            # Gross Assimilation Rate Limited by Rubisco [umolCO2 s^-1 m^-2]
-            JC = Vm * (Cc_local - GAM) / (Cc_local + Kc * (1 + Oa_local / Ko))
-            # Light Limited
-            # Gross Assimilation Rate Limited by Light [umolCO2 s^-1 m^-2]
-            JL = J * (Cc_local - GAM) / (Cc_local + 2 * GAM)
-            # Capacity of the leaf to export or utilize the products of photosynthesis
-            # Gross Assimilation Rate Limited by Export [umolCO2 s^-1 m^-2]
-            JE = 3 * TPU
-        elif CT == 4:
-            # Rubisco Limited
-            # Gross Assimilation Rate Limited by Rubisco [umolCO2 s^-1 m^-2]
-            JC = Vm
-            # Light Limited
-            # Gross Assimilation Rate Limited by Light [umolCO2 s^-1 m^-2]
-            JL = Q
-            # PEP Carboxylase Limited
-            JE = ke * Cc_local / Pre_local
-
-        # First Polynomium
-        if CT == 3:
-            b1 = 0.98
-            b2 = -(JC + JL)
-            b3 = JC * JL
-        elif CT == 4:
-            b1 = 0.80
-            b2 = -(JC + JL)
-            b3 = JC * JL
-
-        # Smoothed Minimum between JC and JE [umolCO2 s^-1 m^-2]
-        JP = min((-b2 + numpy.sqrt(b2 ** 2 - 4 * b1 * b3)) / (2 * b1), (-b2 - numpy.sqrt(b2 ** 2 - 4 * b1 * b3)) / (2 * b1))
-
-        # Second Polynomium
-        if CT == 3:
-            c1 = 0.95
-            c2 = -(JP + JE)
-            c3 = JP * JE
-        elif CT == 4:
-            c1 = 0.95
-            c2 = -(JP + JE)
-            c3 = JP * JE
-        # Gross Assimilation Rate Potential [umolCO2 s^-1 m^-2]
-        A = min((-c2 + numpy.sqrt(c2 ** 2 - 4 * c1 * c3)) / (2 * c1), (-c2 - numpy.sqrt(c2 ** 2 - 4 * c1 * c3)) / (2 * c1))
+        J = numpy.minimum((-d2 + numpy.sqrt(d2 ** 2 - 4 * d1 * d3)) / (2 * d1), (-d2 - numpy.sqrt(d2 ** 2 - 4 * d1 * d3)) / (2 * d1))
 
         # New Water Stress Function
         Rgsws = 0.02
-        p2 = math.log((1 - Rgsws) / Rgsws) / (Psi_sto_00 - Psi_sto_50) # [MPa^-1]
+        p2 = numpy.log((1 - Rgsws) / Rgsws) / (Psi_sto_00 - Psi_sto_50) # [MPa^-1]
         q2 = -p2 * Psi_sto_50 # [-]
         Rgsw = 1 / (1 + numpy.exp(p2 * Psi_L + q2))
-        fO = (1 - Rgsw)
-        if fO > 1:
-            fO = 1
-        if fO < 0:
-            fO = 0
-
-        # Solar-induced chlorophyll fluorescence (SIF)
-        # Je is the actual electron transport rate calculated from the CO2 exchange data
-        if CT == 3:
-            Jfe = A * (Cc_local + 2 * GAM) / (Cc_local - GAM)
-        elif CT == 4:
-            Jfe = A
-
-        fiP0= FI*4 # [umol Electrons umolPhotons^-1]
-        fiP = fiP0 * Jfe / Q # [0.4 max - stress decrease ]
-        # degree of light saturation
-        dls = 1 - fiP / fiP0
-
-        kf = 0.05
-        kd = max(0.03 * Ts + 0.0773, 0.087)
-        kn = (6.2473 * dls - 0.5944) * dls
-
-        fiF = kf / (kf + kd + kn) * (1 - fiP) # [umol Electrons umolPhotons^-1]
-        SIF = IPAR_local * fiF # [umol electrons s^-1 m^-2]
-
-        # k theoretically a function of Vmax and Chlorophyll content
-        k = 0.0375 * Vmax + 8.25 # [umol m^-2 s^-1 / W m^-2 sr^-1 um^-1]
-        F755nm = SIF / k # [W m^-2 sr^-1 um^-1]
+        fO = numpy.clip(1 - Rgsw,0,1)
+
+        class PhotosynthesisParam_Def():
+            pass
+        PhotoParam = PhotosynthesisParam_Def()
+        PhotoParam.C3 = C3
+        PhotoParam.Ts = Ts
+        PhotoParam.Ds = Ds
+        PhotoParam.Vmax = Vmax
+        PhotoParam.FI = FI
+        PhotoParam.Do = Do
+        PhotoParam.a1 = a1
+        PhotoParam.Pre_local = Pre_local
+        PhotoParam.IPAR_local = IPAR_local
+        PhotoParam.ra_local = ra_local
+        PhotoParam.rb_local = rb_local
+        PhotoParam.Oa_local = Oa_local
+        PhotoParam.Csl_local = Csl_local
+        PhotoParam.rmes = rmes
+        PhotoParam.go_local = go_local
+        PhotoParam.Vm = Vm
+        PhotoParam.TPU = TPU
+        PhotoParam.ke = ke
+        PhotoParam.GAM = GAM
+        PhotoParam.Kc = Kc
+        PhotoParam.Ko = Ko
+        PhotoParam.Rdark = Rdark
+        PhotoParam.Q = Q
+        PhotoParam.J = J
+        PhotoParam.fO = fO
+
+        return PhotoParam
+
+    def Photosynthesis_Leaf(self,Cc,PhotoParam,Fluorescence=True):
+
+        # Terms of the photosynthesis model that depend on the leaf interior CO2 concentration Cc [umolCO2 mol^-1]. The
+        # fluorescence is not needed during the iterations of CO2_Concentration_Batch and is skipped if Fluorescence is False
+        C3 = PhotoParam.C3
+        Ts = PhotoParam.Ts
+        Ds = PhotoParam.Ds
+        Vmax = PhotoParam.Vmax
+        FI = PhotoParam.FI
+        Do = PhotoParam.Do
+        a1 = PhotoParam.a1
+        Pre_local = PhotoParam.Pre_local
+        IPAR_local = PhotoParam.IPAR_local
+        ra_local = PhotoParam.ra_local
+        rb_local = PhotoParam.rb_local
+        Oa_local = PhotoParam.Oa_local
+        Csl_local = PhotoParam.Csl_local
+        rmes = PhotoParam.rmes
+        go_local = PhotoParam.go_local
+        Vm = PhotoParam.Vm
+        TPU = PhotoParam.TPU
+        ke = PhotoParam.ke
+        GAM = PhotoParam.GAM
+        Kc = PhotoParam.Kc
+        Ko = PhotoParam.Ko
+        Rdark = PhotoParam.Rdark
+        Q = PhotoParam.Q
+        J = PhotoParam.J
+        fO = PhotoParam.fO
+
+        Pre0 = 101325 # [Pa]
+        Tf = 273.15   # [K]
+        Cc_local = Cc * 10 ** (-6) * Pre_local   # Partial Pressure [Pa * molCO2 molAIR^-1]
+
+        # Gross Assimilation Rate Limited by Rubisco [umolCO2 s^-1 m^-2]
+        # C3: Rubisco limited; C4: Rubisco Limited
+        JC = numpy.where(C3,Vm * (Cc_local - GAM) / (Cc_local + Kc * (1 + Oa_local / Ko)),Vm)
+        # Light Limited
+        # Gross Assimilation Rate Limited by Light [umolCO2 s^-1 m^-2]
+        JL = numpy.where(C3,J * (Cc_local - GAM) / (Cc_local + 2 * GAM),Q)
+        # C3: Capacity of the leaf to export or utilize the products of photosynthesis
+        # Gross Assimilation Rate Limited by Export [umolCO2 s^-1 m^-2]
+        # C4: PEP Carboxylase Limited
+        JE = numpy.where(C3,3 * TPU,ke * Cc_local / Pre_local)
+
+        # First Polynomium
+        b1 = numpy.where(C3,0.98,0.80)
+        b2 = -(JC + JL)
+        b3 = JC * JL
+
+        # Smoothed Minimum between JC and JE [umolCO2 s^-1 m^-2] (smaller root, b1 > 0)
+        JP = (-b2 - numpy.sqrt(b2 ** 2 - 4 * b1 * b3)) / (2 * b1)
+
+        # Second Polynomium
+        c1 = 0.95
+        c2 = -(JP + JE)
+        c3 = JP * JE
+        # Gross Assimilation Rate Potential [umolCO2 s^-1 m^-2] (smaller root, c1 > 0)
+        A = (-c2 - numpy.sqrt(c2 ** 2 - 4 * c1 * c3)) / (2 * c1)
+
+        F755nm = None
+        if Fluorescence:
+            # Solar-induced chlorophyll fluorescence (SIF)
+            # Je is the actual electron transport rate calculated from the CO2 exchange data
+            Jfe = numpy.where(C3,A * (Cc_local + 2 * GAM) / (Cc_local - GAM),A)
+
+            fiP0= FI*4 # [umol Electrons umolPhotons^-1]
+            fiP = fiP0 * Jfe / Q # [0.4 max - stress decrease ]
+            # degree of light saturation
+            dls = 1 - fiP / fiP0
+
+            kf = 0.05
+            kd = numpy.maximum(0.03 * Ts + 0.0773, 0.087)
+            kn = (6.2473 * dls - 0.5944) * dls
+
+            fiF = kf / (kf + kd + kn) * (1 - fiP) # [umol Electrons umolPhotons^-1]
+            SIF = IPAR_local * fiF # [umol electrons s^-1 m^-2]
+
+            # k theoretically a function of Vmax and Chlorophyll content
+            k = 0.0375 * Vmax + 8.25 # [umol m^-2 s^-1 / W m^-2 sr^-1 um^-1]
+            F755nm = SIF / k # [W m^-2 sr^-1 um^-1]
 
         # Gross Assimilation Rate [umolCO2 s^-1 m^-2]
         A = A * fO
@@ -430,15 +511,13 @@ class Ressitance_Calculations(object):
 
         # Stomatal Conductance
         gsCO2 = go_local + a1 * An * Pre_local / ((Cc_local - GAM) * (1 + Ds / Do))
-        if gsCO2 < go_local:
-            gsCO2 = go_local
+        gsCO2 = numpy.where(gsCO2 < go_local,go_local,gsCO2)
 
         # Stomatal resistance or Canopy [s m^2 umolCO2^-1]
         rsCO2 = 1 / gsCO2
 
         CcF = Csl_local - An * Pre_local * (rsCO2 + rmes + 1.37 * rb_local + ra_local) # [Pa]
-        if CcF < 0:
-            CcF = 0
+        CcF = numpy.where(CcF < 0,0,CcF)
 
         # Stomatal resistance or canopy [s m^2 molH2O^-1]
         rsH20 = (rsCO2 / 1.64) * (10 ** 6)
@@ -0,0 +1,38 @@
+"""
+Run an ensemble of VCWG simulations (parameter sweep) for 12 months using parallel processing
+Last update: October 2026
+Each member overrides some parameters of the 12 initialization files in memory; the files are not modified.
+"""
+
+from Ensemble import RunEnsemble,EnsembleGrid
+from datetime import datetime
+
+# Define city and year
+city = "Toronto"
+year = 2020
+
+# Automatically generate file names based on city and year
+epwFileName = f'ERA5-{city}-{year}.epw'                              # EPW weather file
+TopForcingFileName = None                                            # No top forcing file
+ViewFactorFileName = f'ViewFactor_{city}_MOST.txt'                   # View factor file
+case = city                                                          # Case name for output file naming
+initialization_name = f'initialize_{city}'                           # Initialization file prefix
+
+# Months and their initialization files
+Months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+VCWGParamFileNames = [f'{initialization_name}_{i}.uwg' for i in range(1, 13)]
+
+# Ensemble members: any variable of the .uwg files can be swept (must match the variables in the initialization files)
+Overrides = EnsembleGrid({'SmartHumidistat': [0, 1]})
+
+# Number of processes (None: all CPU cores)
+nProcesses = None
+
+# Get current date and time for unique output folder naming
+now = datetime.now()
+date_str = now.strftime("%Y-%m-%d_%H-%M")
+
+if __name__ == "__main__":
+    # Outputs of member i are written to Results/date_str/Member_i, with an index in Results/date_str/EnsembleIndex.json
+    Results = RunEnsemble(epwFileName, TopForcingFileName, VCWGParamFileNames, ViewFactorFileName, case, Months,
+                          date_str, Overrides, nProcesses)
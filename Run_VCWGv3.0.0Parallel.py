@@ -7,9 +7,9 @@ Utilizes all CPU cores to run simulations in parallel.
 Significantly reduces simulation time compared to the serial script.
 """
 
-from VCWG_Smart import VCWG_Smart
 from datetime import datetime
 from UpdateInitialParam import update_uwg_files
+from ParallelMonths import RunMonths
 
 
 '''
@@ -23,6 +23,7 @@ Instructions:
 4. Set a debug point at the `epwFileName` line and debug the code.
 5. This will update all 12 initialization files accordingly.
 6. Once modifications are confirmed, uncomment the two lines again to run the code.
+To sweep parameters without modifying the initialization files, use Run_VCWGv3.0.0Ensemble.py.
 
 file_names = [f'initialize_Toronto_{i}.uwg' for i in range(1, 13)]
 update_uwg_files('resources/Parameters', file_names, 'SmartHumidistat', '1')
@@ -47,19 +48,14 @@ Months = ['Jan.txt', 'Feb.txt', 'Mar.txt', 'Apr.txt', 'May.txt', 'Jun.txt',
 now = datetime.now()
 date_str = now.strftime("%Y-%m-%d_%H-%M")
 
-# Function to process each month in parallel
-import multiprocessing
-def process_month(month_index):
-    VCWGParamFileName = f'{initialization_name}_{month_index}.uwg'  # Generate file name
-    Month_name = Months[month_index - 1].split('.')[0]              # Extract month name
-    
-    # Run simulation
-    VCWG = VCWG_Smart(epwFileName, TopForcingFileName, VCWGParamFileName,
-                      ViewFactorFileName, case, Month_name, date_str)
-    VCWG.run()
+# Parallel settings
+nProcesses = None                                                   # Number of processes (None: all CPU cores)
+chunksize = 1                                                       # Number of months handed to a process at a time
 
 if __name__ == "__main__":
-    pool = multiprocessing.Pool()                                   # Create a multiprocessing pool
-    pool.map(process_month, range(1, 13))                           # Run simulations in parallel
-    pool.close()                                                    # Close the pool
-    pool.join()                                                     # Wait for all processes to complete
+    # The .uwg files, forcing, solar geometry, view factors, and DOE library are prepared once in this process and
+    # shared with the workers (see ParallelMonths)
+    VCWGParamFileNames = [f'{initialization_name}_{m}.uwg' for m in range(1, 13)]
+    Month_names = [Month.split('.')[0] for Month in Months]
+    Results = RunMonths(epwFileName, TopForcingFileName, VCWGParamFileNames, ViewFactorFileName, case, Month_names,
+                        date_str, nProcesses, chunksize)
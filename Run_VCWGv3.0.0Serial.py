@@ -22,6 +22,7 @@ Instructions:
 4. Set a debug point at the `epwFileName` line and debug the code.
 5. This will update all 12 initialization files accordingly.
 6. Once modifications are confirmed, uncomment the two lines again to run the code.
+To sweep parameters without modifying the initialization files, use Run_VCWGv3.0.0Ensemble.py.
 
 file_names = [f'initialize_Toronto_{i}.uwg' for i in range(1, 13)]
 update_uwg_files('resources/Parameters', file_names, 'SmartHumidistat', '1')
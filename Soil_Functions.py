@@ -11,6 +11,30 @@ Atmospheric Innovations Research (AIR) Laboratory, University of Guelph, Guelph,
 Last update: June 2021
 '''
 
+# Soil parameters of each soil column. They only depend on the soil composition, the root profiles, and the layer
+# discretization, which are constant during a run, but Soil_Parameters_Total is called several times per time step
+# for each soil column. They are computed once per set of parameters and reused.
+_SoilParametersTotalCache = {}
+
+def ClearSoilParametersCache():
+
+    """
+    Remove the cached soil parameters, e.g. when a new simulation is instantiated. Parameters that change during a run
+    do not require this as they define a new cache entry.
+    """
+
+    _SoilParametersTotalCache.clear()
+
+def _SoilParametersKey(Param):
+    # Hashable key of the input parameters; arrays and lists are converted to tuples. NaN (e.g. unused root depths) is
+    # replaced as it is not equal to itself and would never match a cache entry.
+    def Value(x):
+        if isinstance(x,(list,tuple,numpy.ndarray)):
+            x = numpy.asarray(x,dtype=float)
+            return (x.shape,numpy.where(numpy.isnan(x),-1,x).tobytes())
+        return 'nan' if x != x else x
+    return tuple(Value(x) for x in Param)
+
 class Soil_Calculations(object):
 
     def Conductivity_Suction(self,SPAR,Ks,Osat,Ohy,L,Pe,O33,alpVG,nVG,O):
@@ -895,6 +919,34 @@ class Soil_Calculations(object):
         return O,ZWT,OF,OS,Psi_s_H,Psi_s_L,gsr_H,gsr_L,Exwat_H,Exwat_L,Rd,WTR,POT,OH,OL
 
     def Soil_Parameters_Total(self,Pcla,Psan,Porg,Kfc,Phy,SPAR,Kbot,CASE_ROOT_H,CASE_ROOT_L,ZR95_H,ZR95_L,ZR50_H,ZR50_L,ZRmax_H,ZRmax_L,Zs):
+
+        """
+        Soil parameters of a soil column, taken from the cache if they were calculated before with the same inputs
+        (see Soil_Parameters_Table for the inputs and outputs). Copies are returned so that the cached values can not
+        be modified by the caller.
+        """
+
+        key = _SoilParametersKey((Pcla,Psan,Porg,Kfc,Phy,SPAR,Kbot,CASE_ROOT_H,CASE_ROOT_L,ZR95_H,ZR95_L,ZR50_H,ZR50_L,ZRmax_H,
+                                  ZRmax_L,Zs))
+        SoilParamTotal = _SoilParametersTotalCache.get(key)
+        if SoilParamTotal is None:
+            self.Soil_Parameters_Table(Pcla,Psan,Porg,Kfc,Phy,SPAR,Kbot,CASE_ROOT_H,CASE_ROOT_L,ZR95_H,ZR95_L,ZR50_H,ZR50_L,
+                                       ZRmax_H,ZRmax_L,Zs)
+            SoilParamTotal = self.SoilParamTotal
+            # Parameters changed (e.g. a new run in the same process); keep the cache small
+            if len(_SoilParametersTotalCache) >= 64:
+                _SoilParametersTotalCache.clear()
+            _SoilParametersTotalCache[key] = SoilParamTotal
+
+        self.SoilParamTotal = SoilParametersTotal()
+        for attr, value in vars(SoilParamTotal).items():
+            setattr(self.SoilParamTotal,attr,copy.copy(value) if isinstance(value,(numpy.ndarray,list)) else value)
+
+        return tuple(getattr(self.SoilParamTotal,attr) for attr in ['Zs','dz','ms','Osat','Ohy','nVG','alpVG','Ks_Zs','L',
+                     'Pe','O33','SPAR','EvL_Zs','Inf_Zs','RfH_Zs','RfL_Zs','Zinf','Kbot','Slo_pot','Dz','aR','aTop','rsd',
+                     'lan_dry','lan_s','cv_s'])
+
+    def Soil_Parameters_Table(self,Pcla,Psan,Porg,Kfc,Phy,SPAR,Kbot,CASE_ROOT_H,CASE_ROOT_L,ZR95_H,ZR95_L,ZR50_H,ZR50_L,ZRmax_H,ZRmax_L,Zs):
         """
         ------
         INPUT:
@@ -1250,79 +1302,162 @@ class Soil_Calculations(object):
         dV: Change in volume of water in each soil layer [mm s^-1]
         """
 
-        O = [V[i]/dz[i]+Ohy[i] for i in range(0,len(V))]
-        for i in range(0,len(O)):
-            if O[i] >= Osat[i]-1e-5:
-                O[i] = Osat[i]
-            if O[i] <= Ohy[i]+1e-5:
-                O[i] = Ohy[i]+1e-5
+        O,K,P = self.Conductivity_Suction_Layers(V,SPAR,Osat,Ohy,O33,dz,Ks_Zs,L,Pe,alpVG,nVG)[0:3]
+        q = self.Richards_Fluxes(O,K,P,Osat,Dz,cosalp)[0]
+
+        # Trasmissivity  unsaturated/saturated [mm^2 s^-1]
+        To = K * aR * numpy.asarray(dz)
+
+        # Slo_pot: Slope Total Hydraulic Head [mm s^-1]
+        if SN == 1:
+            Qi_out = numpy.asarray(IS) * (To / aT) * sinalp
+        else:
+            Qi_out = (To / aT) * sinalp
+
+        # Soils water balance without other terms. The first layer receives the infiltration and the last layer loses
+        # the leakage at bedrock
+        q_in = numpy.concatenate(([f],q))
+        q_out = numpy.concatenate((q,[Lk]))
+        dV = q_in - q_out - numpy.asarray(T_H) - numpy.asarray(T_L) - numpy.asarray(EG) + numpy.asarray(Qi_in)[0:numn] - Qi_out
+
+        return dV
+
+    def Soil_Moistures_Rich_Comp_Jacobian(self,V,t,Lk,f,EG,T_H,T_L,Qi_in,Slo_pot,IS,SPAR,Osat,Ohy,O33,dz,Ks_Zs,Dz,numn,L,Pe,
+                                          aR,aT,alpVG,nVG,Zs,cosalp,sinalp,SN):
+
+        """
+        Jacobian of Soil_Moistures_Rich_Comp with respect to V for odeint with ml = mu = 1. The flux between two layers only
+        depends on the water content of these layers, so the Jacobian is tri-diagonal.
+        ------
+        INPUT:
+        Same as Soil_Moistures_Rich_Comp
+        -------
+        OUTPUT:
+        jac: Banded Jacobian, jac[i-j+1,j] is the derivative of dV[i] with respect to V[j] [s^-1]
+        """
+
+        O,K,P,dK,dP,dOdV = self.Conductivity_Suction_Layers(V,SPAR,Osat,Ohy,O33,dz,Ks_Zs,L,Pe,alpVG,nVG,True)
+        q,Gradient,Blocked = self.Richards_Fluxes(O,K,P,Osat,Dz,cosalp)
+        Dz = numpy.asarray(Dz)
+
+        # Derivatives of the flux between layer i and i+1 with respect to the water content of layer i and i+1 [mm s^-1]
+        Khalf = 0.5*(K[:-1]+K[1:])
+        dq_up = numpy.where(Blocked,0,0.5*dK[:-1]*Gradient + Khalf*dP[:-1]/Dz[1:])
+        dq_dn = numpy.where(Blocked,0,0.5*dK[1:]*Gradient - Khalf*dP[1:]/Dz[1:])
+
+        # Derivative of the lateral outflow [mm s^-1]
+        dQi_out = dK * aR * numpy.asarray(dz) / aT * sinalp
+        if SN == 1:
+            dQi_out = numpy.asarray(IS) * dQi_out
 
-        numnm1 = numn - 1
-        vap = Osat[0:numnm1]
+        jac = numpy.zeros((3,len(O)))
+        jac[0,1:] = -dq_dn * dOdV[1:]
+        jac[1,:] = -dQi_out
+        jac[1,1:] += dq_dn
+        jac[1,:-1] -= dq_up
+        jac[1,:] *= dOdV
+        jac[2,:-1] = dq_up * dOdV[:-1]
 
-        # Soil water
-        dV = numpy.zeros(len(V))
-        K = numpy.zeros(len(Osat))
-        P = numpy.zeros(len(Osat))
-        Khalf = numpy.zeros(len(vap))
-        q = numpy.zeros(len(vap))
-        qf = numpy.zeros(len(vap))
+        return jac
+
+    def Conductivity_Suction_Layers(self,V,SPAR,Osat,Ohy,O33,dz,Ks_Zs,L,Pe,alpVG,nVG,Derivative=False):
+
+        """
+        Soil moisture, hydraulic conductivity, and soil water potential of all soil layers for the Richards model
+        ------
+        INPUT:
+        V: Volume of water in each soil layer [mm]
+        Derivative: Also calculate the derivatives with respect to the soil moisture
+        Other inputs as in Soil_Moistures_Rich_Comp
+        -------
+        OUTPUT:
+        O: Soil moisture/water content in each soil layer [-]
+        K: Hydraulic conductivity at O [mm s^-1]
+        P: Soil water potential at O [mm]
+        dK: Derivative of K with respect to O [mm s^-1]
+        dP: Derivative of P with respect to O [mm]
+        dOdV: Derivative of O with respect to V, zero if the soil moisture is limited to saturation or residual [mm^-1]
+        """
+
+        V = numpy.asarray(V,dtype=float)
+        Osat = numpy.asarray(Osat)
+        Ohy = numpy.asarray(Ohy)
+        dz = numpy.asarray(dz)
+
+        O = V/dz+Ohy
+        Saturated = O >= Osat-1e-5
+        O = numpy.where(Saturated,Osat,O)
+        Dry = O <= Ohy+1e-5
+        O = numpy.where(Dry,Ohy+1e-5,O)
 
         if SPAR == 1:
-            mVG = [1 - 1 / nVG[i] for i in range(len(nVG))] # [mm]
-            Se = [(O[i] - Ohy[i]) / (Osat[i] - Ohy[i]) for i in range(len(O))] # [-]
-            P = [(1 / alpVG[i]) * ((Se[i])**(-1 / mVG[i]) - 1)** (1 / nVG[i]) for i in range(0,len(nVG))] # [mm]
-            K = [Ks_Zs[i] * ((Se[i])**(0.5)) * (1 - (1 - (Se[i])**(1 / mVG[i]))** mVG[i])** 2 for i in range(0,len(Se))] # [mm s^-1]
+            nVG = numpy.asarray(nVG)
+            alpVG = numpy.asarray(alpVG)
+            mVG = 1 - 1 / nVG # [mm]
+            Se = (O - Ohy) / (Osat - Ohy) # [-]
+            P = (1 / alpVG) * ((Se)**(-1 / mVG) - 1)** (1 / nVG) # [mm]
+            K = Ks_Zs * ((Se)**(0.5)) * (1 - (1 - (Se)**(1 / mVG))** mVG)** 2 # [mm s^-1]
         else:
-            B = [1/L[i] for i in range(0,len(L))]
+            L = numpy.asarray(L)
+            O33 = numpy.asarray(O33)
+            B = 1/L
             # Coefficient of moisture tension
-            A = [numpy.exp(math.log(33) + B[i] * math.log(O33[i])) for i in range(0,len(B))]
-            for i in range(0,numn):
-                K[i] = Ks_Zs[i] * (O[i] / Osat[i])**(3 + (2 / L[i])) # [mm s^-1]
-                if O[i] < O33[i]:
-                    P[i] = A[i]*(O[i]**(-B[i])) # [kPa]
-                else:
-                    P[i] = 33 - ((O[i] - O33[i]) * (33 - Pe[i]) / (Osat[i] - O33[i]))
+            A = numpy.exp(math.log(33) + B * numpy.log(O33))
+            K = Ks_Zs * (O / Osat)**(3 + (2 / L)) # [mm s^-1]
+            Below33 = O < O33
+            P = numpy.where(Below33,A*(O**(-B)),33 - ((O - O33) * (33 - numpy.asarray(Pe)) / (Osat - O33))) # [kPa]
+            P = -101.9368*P # [mm]
 
-            P = [-101.9368*P[i] for i in range(0,len(P))] # [mm]
+        if not Derivative:
+            return O,K,P
 
-        # Trasmissivity  unsaturated/saturated [mm^2 s^-1]
-        To = [K[i] * aR * dz[i] for i in range(0,len(dz))]
+        # The soil moisture does not change with V where it is limited
+        Limited = Saturated | Dry
+        dOdV = numpy.where(Limited,0,1/dz)
 
-        # Slo_pot: Slope Total Hydraulic Head [mm s^-1]
-        if SN == 1:
-            Qi_out = [IS[i] * (To[i] / aT) * sinalp for i in range(0,len(To))]
+        if SPAR == 1:
+            # Evaluate the derivatives of the limited layers at Se = 0.5 to avoid the singularity at saturation
+            Se = numpy.where(Limited,0.5,Se)
+            u = Se**(1 / mVG)
+            g = 1 - (1 - u)**mVG
+            dK = Ks_Zs * (0.5 * Se**(-0.5) * g**2 + 2 * g * Se**0.5 * (1 - u)**(mVG - 1) * u / Se) / (Osat - Ohy)
+            dP = -(1 / alpVG) / (nVG * mVG) * (Se**(-1 / mVG) - 1)**(1 / nVG - 1) * Se**(-1 / mVG - 1) / (Osat - Ohy)
         else:
-            Qi_out = [(To[i] / aT) * sinalp for i in range(0,len(To))]
-
-        #---------------
-        # Richards Model
-        #---------------
-        Khalf = [0.5*(K[i]+K[i+1]) for i in range(0,len(K)-1)] # [mm s^-1]
-        # Flux positive downward from layer i+1 (above) to i (below) [mm s^-1]
-        q = [Khalf[i]*(1*cosalp - (P[i+1]-P[i])/Dz[i+1]) for i in range(0,len(Khalf))]
-
-        qf = copy.copy(q)
-        for i in range(1,numn):
-            if O[i] >= Osat[i]-1e-5:
-                qf[i-1] = 0
-
-        for i in range(0,len(q)):
-            if q[i] > 0:
-                q[i] = qf[i]
-
-        # Soils water balance without other terms
-        dV[0] = f - q[0] - T_H[0] - T_L[0] - EG[0] + Qi_in[0] - Qi_out[0]
-        Test = numpy.zeros(numn)
-        Test[0] = f - q[0] - T_H[0] - T_L[0] - EG[0] + Qi_in[0] - Qi_out[0] - dV[0]
-        for i in range(1,numn-1):
-            dV[i] = q[i-1] - q[i] - T_H[i] - T_L[i] - EG[i] + Qi_in[i] - Qi_out[i]
-            Test[i] = q[i-1] - q[i] - T_H[i] - T_L[i] - EG[i] + Qi_in[i] - Qi_out[i] - dV[i]
-
-        dV[numn-1] = q[numnm1-1] - Lk - T_H[numn-1] - T_L[numn-1] - EG[numn-1] + Qi_in[numn-1] - Qi_out[numn-1]
-        Test[numn-1] = q[numnm1-1] - Lk - T_H[numn-1] - T_L[numn-1] - EG[numn-1] + Qi_in[numn-1] - Qi_out[numn-1] - dV[numn-1]
+            dK = K * (3 + (2 / L)) / O
+            dP = -101.9368*numpy.where(Below33,-B*A*(O**(-B-1)),-(33 - numpy.asarray(Pe)) / (Osat - O33))
 
-        return dV
+        return O,K,P,dK,dP,dOdV
+
+    def Richards_Fluxes(self,O,K,P,Osat,Dz,cosalp):
+
+        """
+        Water flux between the soil layers in the Richards model
+        ------
+        INPUT:
+        O: Soil moisture/water content in each soil layer [-]
+        K: Hydraulic conductivity at O [mm s^-1]
+        P: Soil water potential at O [mm]
+        Osat: Water content at saturation, saturation moisture 0 kPa  [-]
+        Dz: Delta Depth Between First Middle Layer and soil surface [mm]
+        cosalp:
+        -------
+        OUTPUT:
+        q: Flux positive downward from layer i (above) to i+1 (below) [mm s^-1]
+        Gradient: Total hydraulic head gradient between layer i and i+1 [-]
+        Blocked: Downward flux into a saturated layer, set to zero
+        """
+
+        Dz = numpy.asarray(Dz)
+        # [mm s^-1]
+        Khalf = 0.5*(K[:-1]+K[1:])
+        Gradient = 1*cosalp - (P[1:]-P[:-1])/Dz[1:]
+        q = Khalf*Gradient
+
+        # No downward flux into a saturated layer
+        Blocked = (q > 0) & (O[1:] >= numpy.asarray(Osat)[1:]-1e-5)
+        q = numpy.where(Blocked,0,q)
+
+        return q,Gradient,Blocked
 
     def Soil_Moistures_Rich_Comp_Lat2(self,Vlat,t,dz,SPAR,Ks,Osat,Ohy,L,Pe,O33,alpVG,nVG,C1,C2,f1,f2,Wcan):
         """
@@ -1350,47 +1485,8 @@ class Soil_Calculations(object):
         dVlat: Soil water balance without other terms [mm s^-1]
         """
 
-        Olat = [Vlat[i] / dz + Ohy for i in range(0, len(Vlat))]
-        for i in range(0, len(Olat)):
-            if Olat[i] >= Osat - 1e-5:
-                Olat[i] = Osat - 1e-5
-            if Olat[i] <= Ohy + 1e-5:
-                Olat[i] = Ohy + 1e-5
-
-        # Hydraulic conductivity and soil water potential
-        self.Conductivity_Suction(SPAR,Ks,Osat,Ohy,L,Pe,O33,alpVG,nVG,Olat)
-        Ko = self.CondSuc.Ko # [mm s^-1]
-        Po = self.CondSuc.Po # [mm]
-
-        # Lateral water re-distribution
-        # Assumption: horizontal and vertical unsaturated conductivity is the same
-        a = 15
-        dxsoil = 1000 # [mm] = 1 [m]
-
-        # Calculate lateral water flow [mm s^-1]
-        # The higher the soil water potential the drier the soil. Hence, I put a minus to change flux direction.
-        Qlat_1to2 = -a * (Ko[0] + Ko[1]) / 2 * (Po[0] - Po[1]) / dxsoil
-        Qlat_2to1 = -a * (Ko[0] + Ko[1]) / 2 * (Po[1] - Po[0]) / dxsoil
-
-        # Transmissivity [mm^2 s^-1]
-        T_1to2 = Qlat_1to2 * dz
-        T_2to1 = Qlat_2to1 * dz
-
-        T_totflux = sum(numpy.nansum([[T_1to2],[T_2to1]],axis=0))
-        if T_totflux != 0:
-            print('The lateral transmissivities do not add up to 0. Please check Soil_Moistures_Rich_Comp_Lat.m')
-
-        # Re-scale the horizontal water flux over given layer depth [mm s^-1]
-        Qin_1to2 = T_1to2 / (f2 * 1000 * Wcan) * C1 * C2
-        Qin_2to1 = T_2to1 / (f1 * 1000 * Wcan) * C2 * C1
-
-        # Total flux incoming to one soil column from the two other soil columns [mm s^-1]
-        Qin_1 = numpy.nansum(Qin_2to1,axis=0)
-        Qin_2 = numpy.nansum(Qin_1to2,axis=0)
-
         # Soil water balance without other terms [mm s^-1]
-        dVlat = [Qin_1,Qin_2]
-
+        dVlat = self.Lateral_Water_Exchange(Vlat,dz,SPAR,Ks,Osat,Ohy,L,Pe,O33,alpVG,nVG,[C1,C2],[f1,f2],Wcan)
 
         return dVlat
 
@@ -1423,70 +1519,61 @@ class Soil_Calculations(object):
         """
 
 
-        Olat = [Vlat[i] / dz + Ohy for i in range(0, len(Vlat))]
-        for i in range(0, len(Olat)):
-            if Olat[i] >= Osat - 1e-5:
-                Olat[i] = Osat - 1e-5
-            if Olat[i] <= Ohy + 1e-5:
-                Olat[i] = Ohy + 1e-5
+        # Soil water balance without other terms [mm s^-1]
+        dVlat = self.Lateral_Water_Exchange(Vlat,dz,SPAR,Ks,Osat,Ohy,L,Pe,O33,alpVG,nVG,[Cimp,Cbare,Cveg],[fimp,fbare,fveg],
+                                            Wcan)
+
+        return dVlat
+
+    def Lateral_Water_Exchange(self,Vlat,dz,SPAR,Ks,Osat,Ohy,L,Pe,O33,alpVG,nVG,C,f,Wcan):
+
+        """
+        Lateral water exchange between the soil columns of one soil layer
+        ------
+        INPUT:
+        Vlat: Water volume in the layer of each soil column [mm]
+        C: Boolean operator for presence and absence of each soil column
+        f: Fraction of ground covered by each soil column [-]
+        Other inputs as in Soil_Moistures_Rich_Comp_Lat3
+        -------
+        OUTPUT:
+        Qin: Total flux incoming to each soil column from the other soil columns [mm s^-1]
+        """
+
+        Olat = numpy.asarray(Vlat,dtype=float) / dz + Ohy
+        Olat = numpy.where(Olat >= Osat - 1e-5,Osat - 1e-5,Olat)
+        Olat = numpy.where(Olat <= Ohy + 1e-5,Ohy + 1e-5,Olat)
 
         # Hydraulic conductivity and soil water potential
-        CondSuc = self.Conductivity_Suction(SPAR,Ks,Osat,Ohy,L,Pe,O33,alpVG,nVG,Olat)
-        Ko = CondSuc[0]  # [mm s^-1]
-        Po = CondSuc[1]  # [mm]
+        Ko,Po = self.Conductivity_Suction(SPAR,Ks,Osat,Ohy,L,Pe,O33,alpVG,nVG,Olat)
 
         # Lateral water re-distribution
         # Assumption: horizontal and vertical unsaturated conductivity is the same
         a = 15
         dxsoil = 1000  # [mm] = 1 [m]
 
-        Kf_gimp = Ko[0]  # [mm s^-1]
-        Kf_gbare = Ko[1] # [mm s^-1]
-        Kf_gveg = Ko[2]  # [mm s^-1]
-
-        Psi_soil_gimp = Po[0]  # [mm]
-        Psi_soil_gbare = Po[1] # [mm]
-        Psi_soil_gveg = Po[2]  # [mm]
-
-        # Calculate lateral water flow [mm s^-1]
+        # Calculate lateral water flow from column j to column i [mm s^-1]
         # The higher the soil water potential the drier the soil. Hence, I put a minus to change flux direction.
-        Qlat_bare2imp = -a * (Kf_gbare + Kf_gimp) / 2 * (Psi_soil_gbare - Psi_soil_gimp) / dxsoil
-        Qlat_veg2imp = -a * (Kf_gveg + Kf_gimp) / 2 * (Psi_soil_gveg - Psi_soil_gimp) / dxsoil
-        Qlat_veg2bare = -a * (Kf_gbare + Kf_gveg) / 2 * (Psi_soil_gveg - Psi_soil_gbare) / dxsoil
-        Qlat_imp2bare = -a * (Kf_gbare + Kf_gimp) / 2 * (Psi_soil_gimp - Psi_soil_gbare) / dxsoil
-        Qlat_bare2veg = -a * (Kf_gbare + Kf_gveg) / 2 * (Psi_soil_gbare - Psi_soil_gveg) / dxsoil
-        Qlat_imp2veg = -a * (Kf_gveg + Kf_gimp) / 2 * (Psi_soil_gimp - Psi_soil_gveg) / dxsoil
+        Qlat = -a * ((Ko[None,:] + Ko[:,None]) / 2) * (Po[None,:] - Po[:,None]) / dxsoil
 
         # Transmissivity [mm^2 s^-1]
-        Tveg2imp = Qlat_veg2imp * dz
-        Tbare2imp = Qlat_bare2imp * dz
-        Tveg2bare = Qlat_veg2bare * dz
-        Timp2bare = Qlat_imp2bare * dz
-        Tbare2veg = Qlat_bare2veg * dz
-        Timp2veg = Qlat_imp2veg * dz
-
-        T_totflux = sum(numpy.nansum([[Tbare2veg],[Tveg2bare],[Tbare2imp],[Timp2bare],[Tveg2imp],[Timp2veg]],axis=0))
+        T = Qlat * dz
+
+        # The flux from column j to column i is the opposite of the flux from column i to column j
+        T_totflux = numpy.nansum(T + T.T)
         if T_totflux != 0:
             print('The lateral transmissivities do not add up to 0. Please check Soil_Moistures_Rich_Comp_Lat.m')
 
         # Re-scale the horizontal water flux over given layer depth [mm s^-1]
-        # incoming flux 2imp, 2bare, 2veg are positive, outgoing negative
-        Qin_veg2imp = Tveg2imp / (fimp * 1000 * Wcan) * Cveg * Cimp
-        Qin_bare2imp = Tbare2imp / (fimp * 1000 * Wcan) * Cbare * Cimp
-        Qin_veg2bare = Tveg2bare / (fbare * 1000 * Wcan) * Cveg * Cbare
-        Qin_imp2bare = Timp2bare / (fbare * 1000 * Wcan) * Cimp * Cbare
-        Qin_bare2veg = Tbare2veg / (fveg * 1000 * Wcan) * Cbare * Cveg
-        Qin_imp2veg = Timp2veg / (fveg * 1000 * Wcan) * Cimp * Cveg
-
-        # Total flux incoming to one soil column from the two other soil columns  [mm s^-1]
-        Qin_imp = numpy.nansum([Qin_veg2imp,Qin_bare2imp], axis=0)
-        Qin_bare = numpy.nansum([Qin_veg2bare,Qin_imp2bare], axis=0)
-        Qin_veg = numpy.nansum([Qin_bare2veg,Qin_imp2veg], axis=0)
+        # incoming fluxes are positive, outgoing negative
+        C = numpy.asarray(C,dtype=float)
+        f = numpy.asarray(f,dtype=float)
+        Qin = T / (f[:,None] * 1000 * Wcan) * C[None,:] * C[:,None]
 
-        # Soil water balance without other terms [mm s^-1]
-        dVlat = [Qin_imp,Qin_bare,Qin_veg]
+        # Total flux incoming to one soil column from the other soil columns [mm s^-1]
+        Qin = numpy.nansum(Qin,axis=1)
 
-        return dVlat
+        return Qin
 
     def Soil_Moisture_Conductivity_Update(self,V,Pcla,Psan,Porg,Kfc,Phy,SPAR,Kbot,CASE_ROOT_H,CASE_ROOT_L,ZR95_H,ZR95_L,
                                           ZR50_H,ZR50_L,ZRmax_H,ZRmax_L,Zs,Rrootl_H,Rrootl_L,PsiL50_H,PsiL50_L,PsiX50_H,PsiX50_L):
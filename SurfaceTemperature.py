@@ -8,9 +8,9 @@ import matplotlib.pyplot as plt
 from scipy.integrate import odeint
 from WaterFunctionsDef import IntDef
 from scipy.optimize import least_squares
-import copy
 
 from Soil_Functions import Soil_Calculations
+from Invert import SolveTridiagonal
 
 """
 Compute urban surfaces temperature by solving conduction equation
@@ -82,92 +82,171 @@ class Tsurf_Def(object):
 
     def Conduction(self,dt, flx1, bc, temp2, flx2, layerTemp_old, layerVolHeat, layerThermalCond, layerThickness):
 
-        def is_near_zero(num, eps=1e-10):
-            return abs(float(num)) < eps
-
-        def invert(nz, A, C):
-            X = [0 for i in range(nz)]
-
-            for i in reversed(range(nz - 1)):
-                C[i] = C[i] - A[i][2] * C[i + 1] / A[i + 1][1]
-                A[i][1] = A[i][1] - A[i][2] * A[i + 1][0] / A[i + 1][1]
-
-            for i in range(1, nz, 1):
-                C[i] = C[i] - A[i][0] * C[i - 1] / A[i - 1][1]
-
-            for i in range(nz):
-                X[i] = C[i] / A[i][1]
-
-            return X
-
-        t = copy.copy(layerTemp_old)     # vector of layer temperatures [K]
-        hc = copy.copy(layerVolHeat)     # vector of layer volumetric heat [J m^-3 K^-1]
-        tc = copy.copy(layerThermalCond) # vector of layer thermal conductivities [W m^-1 K^-1]
-        d = copy.copy(layerThickness)    # vector of layer thicknesses [m]
-
         # flx1                      : net heat flux on surface
         # bc                        : boundary condition parameter (1 or 2)
         # temp2                     : deep soil temperature (avg of air temperature)
         # flx2                      : surface flux (sum of absorbed, emitted, etc.)
 
-        fimp = 0.5    # implicit coefficient
-        fexp = 0.5    # explicit coefficient
-        num = len(t)  # number of layers
-
-        # Mean thermal conductivity over distance between 2 layers [W m^-1 K^-1]
-        tcp = [0 for x in range(num)]
-        # Thermal capacity times layer depth [J m^-2 K^-1]
-        hcp = [0 for x in range(num)]
-        # lower, main, and upper diagonals
-        za = [[0 for y in range(3)] for x in range(num)]
-        # RHS
-        zy = [0 for x in range(num)]
-
-        # --------------------------------------------------------------------------
-        # Define the column vectors for heat capacity and conductivity
-        hcp[0] = hc[0] * d[0]
-        for j in range(1, num):
-            tcp[j] = 2. / (d[j - 1] / tc[j - 1] + d[j] / tc[j])
-            hcp[j] = hc[j] * d[j]
-
-        # --------------------------------------------------------------------------
-        # Define the first row of za matrix, and RHS column vector
-        za[0][0] = 0.
-        za[0][1] = hcp[0] / dt + fimp * tcp[1]
-        za[0][2] = -fimp * tcp[1]
-        zy[0] = hcp[0] / dt * t[0] - fexp * tcp[1] * (t[0] - t[1]) + flx1
-
-        # --------------------------------------------------------------------------
-        # Define other rows
-        for j in range(1, num - 1):
-            za[j][0] = fimp * (-tcp[j])
-            za[j][1] = hcp[j] / dt + fimp * (tcp[j] + tcp[j + 1])
-            za[j][2] = fimp * (-tcp[j + 1])
-            zy[j] = hcp[j] / dt * t[j] + fexp * \
-                    (tcp[j] * t[j - 1] - tcp[j] * t[j] - tcp[j + 1] * t[j] + tcp[j + 1] * t[j + 1])
-
-        # --------------------------------------------------------------------------
-        # Boundary conditions
-        # heat flux
-        if is_near_zero(bc - 1.):
-            za[num - 1][0] = fimp * (-tcp[num - 1])
-            za[num - 1][1] = hcp[num - 1] / dt + fimp * tcp[num - 1]
-            za[num - 1][2] = 0.
-            zy[num - 1] = hcp[num - 1] / dt * t[num - 1] + fexp * tcp[num - 1] * (t[num - 2] - t[num - 1]) + flx2
-        # deep-temperature
-        elif is_near_zero(bc - 2.):
-            za[num - 1][0] = 0.
-            za[num - 1][1] = 1.
-            za[num - 1][2] = 0.
-            zy[num - 1] = temp2
-        else:
-            print('ERROR: check input parameters in the Conduction routine')
-
-        # --------------------------------------------------------------------------
-
-        zx = invert(num, za, zy)
+        hcp, tcp = ConductionCoefficients(layerVolHeat, layerThermalCond, layerThickness)
+        zx = ConductionSolve(numpy.array([dt]), numpy.array([flx1]), numpy.array([bc]), numpy.array([temp2]),
+                             numpy.array([flx2]), numpy.array([layerTemp_old],dtype=float), numpy.array([hcp]),
+                             numpy.array([tcp]), numpy.array([len(layerTemp_old)]))
         # return zx as 1d vector of temperature layers
-        return zx
-
+        return list(zx[0])
+
+def ConductionCoefficients(layerVolHeat, layerThermalCond, layerThickness):
+
+    """
+    ------
+    INPUT:
+    layerVolHeat: Volumetric heat capacity of the layers [J m^-3 K^-1]
+    layerThermalCond: Thermal conductivity of the layers [W m^-1 K^-1]
+    layerThickness: Thickness of the layers [m]
+    -------
+    OUTPUT:
+    hcp: Thermal capacity times layer depth [J m^-2 K^-1]
+    tcp: Mean thermal conductivity over distance between a layer and the layer above [W m^-2 K^-1]
+    """
+
+    hc = layerVolHeat
+    tc = layerThermalCond
+    d = layerThickness
+    num = len(d)
+
+    tcp = [0 for x in range(num)]
+    hcp = [0 for x in range(num)]
+    hcp[0] = hc[0] * d[0]
+    for j in range(1, num):
+        tcp[j] = 2. / (d[j - 1] / tc[j - 1] + d[j] / tc[j])
+        hcp[j] = hc[j] * d[j]
+
+    return hcp, tcp
+
+def ConductionSolve(dt, flx1, bc, temp2, flx2, t, hcp, tcp, num):
+
+    """
+    Crank-Nicolson step of the conduction equation of several layered elements
+    The arrays of the layers are padded to the largest number of layers (padded layers must have tcp = 0); all
+    elements are solved in one banded solve.
+    ------
+    INPUT:
+    dt: Time step of each element [s]
+    flx1: Net heat flux on the surface of each element [W m^-2]
+    bc: Boundary condition at the bottom layer of each element. 1: flux, 2:constant value
+    temp2: Deep temperature of each element [K]
+    flx2: Heat flux at the last layer of each element [W m^-2]
+    t: Layer temperatures, shape (number of elements, maximum number of layers) [K]
+    hcp, tcp: Coefficients of the layers (see ConductionCoefficients), same shape as t
+    num: Number of layers of each element
+    -------
+    OUTPUT:
+    Layer temperatures at the end of the time step, same shape as t [K]
+    """
+
+    fimp = 0.5    # implicit coefficient
+    fexp = 0.5    # explicit coefficient
+    rows = numpy.arange(t.shape[0])
+    last = num - 1
+    dt = dt[:, None]
+
+    # Conductance to the layer above (zero for the first layer) and below (zero for the last layer; the padded layers
+    # have zero conductance and are not coupled to the element)
+    tcpUp = tcp
+    tcpDn = numpy.concatenate((tcp[:, 1:], numpy.zeros((t.shape[0], 1))), axis=1)
+    tUp = numpy.concatenate((t[:, 0:1], t[:, :-1]), axis=1)
+    tDn = numpy.concatenate((t[:, 1:], t[:, -1:]), axis=1)
+
+    # --------------------------------------------------------------------------
+    # lower, main, and upper diagonals, and RHS of all rows
+    za = numpy.empty(t.shape + (3,))
+    za[:, :, 0] = -fimp * tcpUp
+    za[:, :, 1] = hcp / dt + fimp * (tcpUp + tcpDn)
+    za[:, :, 2] = -fimp * tcpDn
+    zy = hcp / dt * t + fexp * (tcpUp * (tUp - t) + tcpDn * (tDn - t))
+    # net heat flux on the surface
+    zy[:, 0] += flx1
+
+    # --------------------------------------------------------------------------
+    # Boundary conditions
+    # heat flux
+    bcFlux = abs(bc - 1.) < 1e-10
+    # deep-temperature
+    bcTemp = abs(bc - 2.) < 1e-10
+    if not numpy.all(bcFlux | bcTemp):
+        print('ERROR: check input parameters in the Conduction routine')
+    zy[rows[bcFlux], last[bcFlux]] += flx2[bcFlux]
+    za[rows[bcTemp], last[bcTemp], 0] = 0.
+    za[rows[bcTemp], last[bcTemp], 1] = 1.
+    zy[rows[bcTemp], last[bcTemp]] = temp2[bcTemp]
+
+    # --------------------------------------------------------------------------
+    # Tridiagonal systems of all elements solved in one banded solve
+    return SolveTridiagonal(za, zy)
+
+class LayeredConduction_Def(object):
+
+    """
+    Conduction in several layered elements (e.g. the walls, roofs, and mass of all building types, and the ground)
+    solved in one step. The layer temperatures of the elements are stored in one array padded to the largest number of
+    layers, and the layerTemp of each element is a view into this array.
+    ------
+    elements: List of Tsurf_Def objects
+    """
+
+    def __init__(self,elements):
+
+        self.elements = elements
+        self.index = {id(e): k for k, e in enumerate(elements)}
+        n = len(elements)
+        self.num = numpy.array([len(e.layerThickness) for e in elements])
+        nMax = max(self.num)
+
+        self.layerTemp = numpy.zeros((n,nMax))
+        self.hcp = numpy.ones((n,nMax))
+        self.tcp = numpy.zeros((n,nMax))
+        for k, e in enumerate(elements):
+            num = self.num[k]
+            self.hcp[k,0:num], self.tcp[k,0:num] = ConductionCoefficients(e.layerVolHeat,e.layerThermalCond,e.layerThickness)
+            self.layerTemp[k,0:num] = e.layerTemp
+            e.layerTemp = self.layerTemp[k,0:num]
+
+        # Boundary conditions of the elements to advance in the next call of Solve
+        self.dt = numpy.ones(n)
+        self.flux1 = numpy.zeros(n)
+        self.flux2 = numpy.zeros(n)
+        self.Tdp = numpy.zeros(n)
+        self.bc = numpy.ones(n)
+        self.Active = numpy.zeros(n,dtype=bool)
+
+    def Element(self,element,SWRabs,LWRabs,LE,Hf,dt,Tdp,bc,flux1=None,flux2=0):
 
+        """
+        Set the boundary conditions of an element (inputs as in Tsurf_Def.Element); its layer temperatures are advanced
+        by the next call of Solve
+        """
 
+        k = self.index[id(element)]
+        # If no heat flux at the exterior surface is not given, it should be calculated from energy balance equation [W m^-2]
+        if flux1 == None:
+            flux1 = SWRabs + LWRabs - LE - Hf
+        self.dt[k] = dt
+        self.flux1[k] = flux1
+        self.flux2[k] = flux2
+        self.Tdp[k] = Tdp
+        self.bc[k] = bc
+        self.Active[k] = True
+
+    def Solve(self):
+
+        # Advance the layer temperatures of the elements whose boundary conditions were set
+        if not numpy.any(self.Active):
+            return
+        T = ConductionSolve(self.dt,self.flux1,self.bc,self.Tdp,self.flux2,self.layerTemp,self.hcp,self.tcp,self.num)
+        self.layerTemp[self.Active] = T[self.Active]
+        for k in numpy.flatnonzero(self.Active):
+            e = self.elements[k]
+            # external surface temperature [K]
+            e.Text = e.layerTemp[0]
+            # internal surface temperature [K]
+            e.Tint = e.layerTemp[-1]
+        self.Active[:] = False
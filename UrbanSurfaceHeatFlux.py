@@ -14,6 +14,10 @@ Atmospheric Innovations Research (AIR) Laboratory, University of Guelph, Guelph,
 Last update: June 2021
 '''
 
+class HeatFluxGroundParam_Def():
+    # Terms of the heat fluxes from the ground that do not depend on the tree temperature (see HeatFlux_ground_Param)
+    pass
+
 class Surface_HeatFlux(object):
 
     def ForceRestore_Conductive_Heat_Imp(self,TemperatureC,TempDamp,TempVec,ParCalculation,ParThermalGround,FractionsGround):
@@ -450,12 +454,111 @@ class Surface_HeatFlux(object):
         Fshd_L: Fraction of shaded for low vegetation [-]
         dw_L: Fraction of ground vegetation covered by intercepted water [-]
         """
+        # Terms that do not depend on the tree temperature
+        Ground = self.HeatFlux_ground_Param(TemperatureC,MeteoData,Gemeotry_m,geometry,FractionsGround,ParTree,ParVegGround,
+                                            ParVegTree,ParSoilGround,SoilPotW,Owater,Vwater,ExWater,Int,CiCO2Leaf,
+                                            ParInterceptionTree,ParCalculation,SWRdir_abs_tree,SWRdiff_abs_tree,
+                                            SWRdir_abs_groundveg,SWRdiff_abs_groundveg,VerticalProfUrban,ColParam)
+        Ttree = TemperatureC[5]
+        Cveg = Ground.Cveg
+        rho_atm = Ground.rho_atm
+        cp_atm = Ground.cp_atm
+        L_heat = Ground.L_heat
+        qcanyon = Ground.qcanyon
+        qsat_T_veg = Ground.qsat_T_veg
+        rap_can = Ground.rap_can
+        rb_L = Ground.rb_L
+        Fsun_L = Ground.Fsun_L
+        Fshd_L = Ground.Fshd_L
+        dw_L = Ground.dw_L
+
+        # Stomatal resistance [s m^-1]; tree and ground vegetation are calculated together
+        rb_H, CanopyTree = self.Canopy_Tree(Ttree,Ground,MeteoData,ParVegTree)
+        (rs_sun_H,rs_shd_H,Ci_sun_H,Ci_shd_H), (rs_sun_L,rs_shd_L,Ci_sun_L,Ci_shd_L) = \
+            self.Stomatal_Resistance([CanopyTree,Ground.CanopyGroundVeg])
+
+        # Turbulent heat fluxes from trees
+        Htree,Etree_int,TEtree,Etree,LEtree_int,LTEtree,LEtree,Ci_sun_H,Ci_shd_H,rap_Htree_In,rb_H,rs_sun_H,rs_shd_H = \
+            self.HeatFlux_tree_1D(Ttree,Ground,MeteoData,ParVegTree,(rb_H,rs_sun_H,rs_shd_H,Ci_sun_H,Ci_shd_H))
+
+        if Cveg == 0:
+            # Potential transpiration from sunlit vegetated ground [kg m^-2 s^-1]
+            TEveg_sun_pot = 0
+            # Potential transpiration from shaded vegetated ground [kg m^-2 s^-1]
+            TEveg_shd_pot = 0
+        else:
+            # Potential transpiration from sunlit vegetated ground [kg m^-2 s^-1]
+            TEveg_sun_pot = Cveg * (rho_atm*(qsat_T_veg-qcanyon)/ (rb_L/((ParVegGround.LAI)*Fsun_L*(1-dw_L))+rap_can +
+                                                                   rs_sun_L / ((ParVegGround.LAI)*Fsun_L*(1-dw_L))))
+            # Potential transpiration from shaded vegetated ground [kg m^-2 s^-1]
+            TEveg_shd_pot = Cveg * (rho_atm * (qsat_T_veg - qcanyon)/ (rb_L / ((ParVegGround.LAI) * Fshd_L * (1 - dw_L)) + rap_can +
+                                                                   rs_shd_L / ((ParVegGround.LAI) * Fshd_L * (1 - dw_L))))
+        # Total potential transpiration from shaded and sunlit vegetated ground [kg m^-2 s^-1]
+        TEveg_pot = Cveg * (TEveg_sun_pot + TEveg_shd_pot)
+
+        # Water limitation for ground vegetation transpiration [kg m^-2 s^-1]
+        TEveg = min(TEveg_pot, Ground.Vavail_plant_tm1_L)
+
+        # Evapotranspiration [kg m^-2 s^-1]
+        Eveg = Cveg * (Ground.Eveg_int + Ground.Eveg_pond + Ground.Eveg_soil + TEveg)
+
+        # Latent heat [W m^-2]
+        LTEveg = Cveg * (L_heat * TEveg)
+        LEveg = Cveg * (Ground.LEveg_int + Ground.LEveg_pond + Ground.LEveg_soil + LTEveg)
+
+        class thb_ground_Def():
+            pass
+        self.thb_ground = thb_ground_Def()
+        self.thb_ground.ground_imp = Ground.Himp/(cp_atm*rho_atm)
+        self.thb_ground.ground_bare = Ground.Hbare/(cp_atm*rho_atm)
+        self.thb_ground.ground_veg = Ground.Hveg/(cp_atm*rho_atm)
+        self.thb_ground.tree = Htree/(cp_atm*rho_atm)
+        self.thb_ground.ustar = Ground.Ustar_Atm
+
+        class qhb_ground_Def():
+            pass
+        self.qhb_ground = qhb_ground_Def()
+        self.qhb_ground.ground_imp = Ground.LEimp/(L_heat*rho_atm)
+        self.qhb_ground.ground_bare = (Ground.LEbare_pond+Ground.LEbare_soil)/(L_heat*rho_atm)
+        self.qhb_ground.ground_veg = (Ground.LEveg_int+Ground.LEveg_pond+Ground.LEveg_soil+LTEveg)/(L_heat*rho_atm)
+        self.qhb_ground.tree = LEtree/(L_heat*rho_atm)
+
+        class HfGruond_otherparam_Def():
+            pass
+        self.HfGruond_otherparam = HfGruond_otherparam_Def()
+        self.HfGruond_otherparam.Ri_nearGround = 0
+        self.HfGruond_otherparam.Utotal_nearGround = 0
+        self.HfGruond_otherparam.T_nearGround = Ground.Tcanyon
+        self.HfGruond_otherparam.Tground = Ground.Tground
+
+
+        return Ground.Himp,Ground.Hbare,Ground.Hveg,Htree,Ground.Eimp,Ground.Ebare_pond,Ground.Ebare_soil,Ground.Eveg_int,\
+               Ground.Eveg_pond,Ground.Eveg_soil,TEveg,Etree_int,TEtree,Ground.Ebare,Eveg,Etree,Ground.LEimp,Ground.LEbare_pond,\
+               Ground.LEbare_soil,Ground.LEveg_int,Ground.LEveg_pond,Ground.LEveg_soil,LTEveg,LEtree_int,LTEtree,Ground.LEbare,\
+               LEveg,LEtree, Ci_sun_H,Ci_shd_H,Ci_sun_L,Ci_shd_L, rap_can,rap_Htree_In,rb_H,rb_L, Ground.r_soil_bare,\
+               Ground.r_soil_veg,Ground.alp_soil_bare,Ground.alp_soil_veg, rs_sun_L,rs_shd_L,rs_sun_H,rs_shd_H,Fsun_L,Fshd_L,dw_L
+
+    def HeatFlux_ground_Param(self,TemperatureC,MeteoData,Gemeotry_m,geometry,FractionsGround,ParTree,ParVegGround,ParVegTree,
+                              ParSoilGround,SoilPotW,Owater,Vwater,ExWater,Int,CiCO2Leaf,ParInterceptionTree,ParCalculation,
+                              SWRdir_abs_tree,SWRdiff_abs_tree,SWRdir_abs_groundveg,SWRdiff_abs_groundveg,VerticalProfUrban,
+                              ColParam):
+        """
+        Terms of HeatFlux_ground_1D that do not depend on the tree temperature: air properties, resistances, soil
+        parameters, fluxes from the ground, and the water available to the trees. They are calculated once when the tree
+        energy balance is solved (see HeatFlux_tree_1D).
+        ------
+        INPUT:
+        As HeatFlux_ground_1D; the tree temperature (TemperatureC[5]) is not used
+        -------
+        OUTPUT:
+        Ground: Terms of the heat fluxes; CanopyGroundVeg holds the inputs of the stomatal resistance of the ground
+                vegetation (None if there is no ground vegetation), which is solved together with the trees
+        """
 
         # Parameter specification
         Timp = TemperatureC[0]
         Tbare = TemperatureC[1]
         Tveg = TemperatureC[2]
-        Ttree = TemperatureC[5]
         Tcanyon = copy.copy(VerticalProfUrban.th[0])
         qcanyon = copy.copy(VerticalProfUrban.qn[0])
         WindSpeed_top = numpy.sqrt(VerticalProfUrban.vx[-1]**2 + VerticalProfUrban.vy[-1]**2)
@@ -522,10 +625,6 @@ class Surface_HeatFlux(object):
         esat_T_veg = 611 * numpy.exp(17.27 * (Tveg - 273.16) / (237.3 + (Tveg - 273.16)))
         # Saturated specific humidity at Tground_veg [kg kg^-1]
         qsat_T_veg = round((0.622 * esat_T_veg) / (MeteoData.Pre - 0.378 * esat_T_veg),4)
-        # vapor pressure saturation at Ttree [Pa]
-        esat_T_tree = 611 * numpy.exp(17.27 * (Ttree - 273.16) / (237.3 + (Ttree - 273.16)))
-        # Saturated specific humidity at Ttree [kg kg^-1]
-        qsat_T_tree = round((0.622 * esat_T_tree) / (MeteoData.Pre - 0.378 * esat_T_tree),4)
         # vapor pressure saturation at T_canyon [Pa]
         esat_T_canyon = 611 * numpy.exp(17.27 * (Tcanyon - 273.16) / (237.3 + (Tcanyon - 273.16)))
         # Vapor pressure at T_canyon [Pa]
@@ -542,7 +641,6 @@ class Surface_HeatFlux(object):
         Citm1_shd_L = Cveg * CiCO2Leaf.CiCO2LeafGroundVegShd
         # Vapor Pressure Deficit [Pa]
         Ds_canyon = esat_T_canyon - e_T_canyon
-        Ds_tree = esat_T_tree - e_T_tree
 
 
         # Partitioning of radiation into sunlit and shaded area
@@ -609,53 +707,31 @@ class Surface_HeatFlux(object):
                                                            Gemeotry_m.Height_canyon,dcan,zomcan,zom_ground,Gemeotry_m.Height_tree,
                                                            Gemeotry_m.Radius_tree,ColParam)
 
-        # Calculate stomatal and leaf boundary resistances of tree
-        if Ctree == 1 and ParVegTree.LAI > 0:
-
-            # Calculate temperature and pressure at the height of tree [K]
+        # Temperature [K] and pressure [Pa] at the height of tree
+        TreeCanopy = Ctree == 1 and ParVegTree.LAI > 0
+        if TreeCanopy:
             Tcanyon_tree = th_intp(Gemeotry_m.Height_tree)
             Pre_tree = Pre_intp(Gemeotry_m.Height_tree)
-
-            # Leaf boundary resistance [s m^-1]
-            rb_H = ResistanceCal.Leaf_BR(u_tree, Ttree - 273.15, Tcanyon_tree - 273.15, ParVegTree.d_leaf, alpha)
-            # Stomatal resistance [s m^-1]
-            rs_sun_H, rs_shd_H, Ci_sun_H, Ci_shd_H, _An_, _Rdark_, _Lpho_, _SIF_, _DCi_ = \
-                ResistanceCal.Canopy_Resistance_An_Evolution(PAR_sun_H, PAR_shd_H, ParVegTree.LAI, ParVegTree.Kopt, ParVegTree.Knit,
-                                                             Fsun_H, Fshd_H, Citm1_sun_H, Citm1_shd_H, MeteoData.Catm_CO2, rap_Htree_In,
-                                                             rb_H, Ttree - 273.15, Pre_tree/100, Ds_tree, Psi_H_tm1,
-                                                             ParVegTree.Psi_sto_50, ParVegTree.Psi_sto_00, ParVegTree.CT, ParVegTree.Vmax,
-                                                             ParVegTree.DSE, ParVegTree.Ha, ParVegTree.FI, MeteoData.Catm_O2, ParVegTree.Do,
-                                                             ParVegTree.a1,ParVegTree.go, ParVegTree.e_rel, ParVegTree.e_relN,
-                                                             ParVegTree.gmes, ParVegTree.rjv)
-
         else:
-            rb_H = numpy.inf
-            rs_sun_H = numpy.inf
-            rs_shd_H = numpy.inf
-            Ci_sun_H = 0
-            Ci_shd_H = 0
-            Tcanyon_tree = Ttree
+            Tcanyon_tree = numpy.nan
+            Pre_tree = numpy.nan
 
         # Calculate stomatal and leaf boundary resistances of ground vegetation
         if Cveg == 1 and ParVegGround.LAI > 0:
 
             # Leaf boundary resistance [s m^-1]
             rb_L = ResistanceCal.Leaf_BR(u_Lveg, Tveg - 273.15, Tcanyon - 273.15, ParVegGround.d_leaf, alpha)
-            # Stomatal resistance [s m^-1]
-            rs_sun_L, rs_shd_L, Ci_sun_L, Ci_shd_L, _An_, _Rdark_, _Lpho_, _SIF_, _DCi_ = \
-                ResistanceCal.Canopy_Resistance_An_Evolution(PAR_sun_L, PAR_shd_L, ParVegGround.LAI, ParVegGround.Kopt, ParVegGround.Knit,
-                                                             Fsun_L,Fshd_L, Citm1_sun_L, Citm1_shd_L, MeteoData.Catm_CO2, rap_can, rb_L,
-                                                             Tveg - 273.15, MeteoData.Pre/100, Ds_canyon, Psi_L_tm1,
-                                                             ParVegGround.Psi_sto_50, ParVegGround.Psi_sto_00, ParVegGround.CT,
-                                                             ParVegGround.Vmax, ParVegGround.DSE, ParVegGround.Ha, ParVegGround.FI,
-                                                             MeteoData.Catm_O2, ParVegGround.Do, ParVegGround.a1, ParVegGround.go,
-                                                             ParVegGround.e_rel, ParVegGround.e_relN, ParVegGround.gmes, ParVegGround.rjv)
+            # Parameters of the stomatal resistance
+            CanopyGroundVeg = [PAR_sun_L, PAR_shd_L, ParVegGround.LAI, ParVegGround.Kopt, ParVegGround.Knit,
+                               Fsun_L,Fshd_L, Citm1_sun_L, Citm1_shd_L, MeteoData.Catm_CO2, rap_can, rb_L,
+                               Tveg - 273.15, MeteoData.Pre/100, Ds_canyon, Psi_L_tm1,
+                               ParVegGround.Psi_sto_50, ParVegGround.Psi_sto_00, ParVegGround.CT,
+                               ParVegGround.Vmax, ParVegGround.DSE, ParVegGround.Ha, ParVegGround.FI,
+                               MeteoData.Catm_O2, ParVegGround.Do, ParVegGround.a1, ParVegGround.go,
+                               ParVegGround.e_rel, ParVegGround.e_relN, ParVegGround.gmes, ParVegGround.rjv]
         else:
             rb_L = numpy.inf
-            rs_sun_L = numpy.inf
-            rs_shd_L = numpy.inf
-            Ci_sun_L = 0
-            Ci_shd_L = 0
+            CanopyGroundVeg = None
 
 
         numpy.nan, numpy.nan, numpy.nan, Osat, Ohy, nVG, alpVG, Ks_Zs, L, Pe, O33, SPAR, numpy.nan, numpy.nan, RfH_Zs, \
@@ -678,17 +754,6 @@ class Surface_HeatFlux(object):
         Himp = Cimp * (cp_atm*rho_atm * (Timp-Tcanyon) / rap_can)
         Hbare = Cbare * (cp_atm*rho_atm * (Tbare-Tcanyon) / rap_can)
         Hveg = Cveg * (cp_atm*rho_atm * (Tveg-Tcanyon) / (rb_L / (2*(ParVegGround.LAI+ParVegGround.SAI))+rap_can))
-        Htree = Ctree * (cp_atm*rho_atm * (Ttree-Tcanyon_tree) / (rb_H/(2*(ParVegTree.LAI+ParVegTree.SAI))+rap_Htree_In))
-
-
-        ###############
-        leaf_dim = 0.72 * 0.05
-        gHa = 1.4 * 0.135 * numpy.sqrt(u_tree / leaf_dim)
-        cp_mol = 29.3
-        Htree = 2*gHa*cp_mol*(Ttree-Tcanyon_tree)
-        if Htree != 0:
-            rap_Htree_In = (cp_atm*rho_atm * (Ttree-Tcanyon_tree))/Htree
-        ###############
 
         # Potential evaporation from impervious surface [kg m^-2 s^-1]
         Eimp_pot = Cimp * (rho_atm * (qsat_T_imp-qcanyon)/ rap_can)
@@ -700,42 +765,11 @@ class Surface_HeatFlux(object):
             Eveg_int_pot = 0
             # Potential evaporation from soil under vegetated ground [kg m^-2 s^-1]
             Eveg_soil_pot = 0
-            # Potential transpiration from sunlit vegetated ground [kg m^-2 s^-1]
-            TEveg_sun_pot = 0
-            # Potential transpiration from shaded vegetated ground [kg m^-2 s^-1]
-            TEveg_shd_pot = 0
         else:
             # Potential evaporation from intercepted water on vegetated ground [kg m^-2 s^-1]
             Eveg_int_pot = Cveg * (rho_atm*(qsat_T_veg-qcanyon)/ (rb_L/((ParVegGround.LAI+ParVegGround.SAI)*dw_L)+rap_can))
             # Potential evaporation from soil under vegetated ground [kg m^-2 s^-1]
             Eveg_soil_pot = Cveg * (rho_atm*(alp_soil_veg*qsat_T_veg-qcanyon) / (rap_can+r_soil_veg))
-            # Potential transpiration from sunlit vegetated ground [kg m^-2 s^-1]
-            TEveg_sun_pot = Cveg * (rho_atm*(qsat_T_veg-qcanyon)/ (rb_L/((ParVegGround.LAI)*Fsun_L*(1-dw_L))+rap_can +
-                                                                   rs_sun_L / ((ParVegGround.LAI)*Fsun_L*(1-dw_L))))
-            # Potential transpiration from shaded vegetated ground [kg m^-2 s^-1]
-            TEveg_shd_pot = Cveg * (rho_atm * (qsat_T_veg - qcanyon)/ (rb_L / ((ParVegGround.LAI) * Fshd_L * (1 - dw_L)) + rap_can +
-                                                                   rs_shd_L / ((ParVegGround.LAI) * Fshd_L * (1 - dw_L))))
-        # Total potential transpiration from shaded and sunlit vegetated ground [kg m^-2 s^-1]
-        TEveg_pot = Cveg * (TEveg_sun_pot + TEveg_shd_pot)
-
-        if Ctree == 0:
-            # Potential evaporation from intercepted water on tree [kg m^-2 s^-1]
-            Etree_int_pot = 0
-            # Potential transpiration from sunlit tree [kg m^-2 s^-1]
-            TEtree_sun_pot = 0
-            # Potential transpiration from shaded tree [kg m^-2 s^-1]
-            TEtree_shd_pot = 0
-        else:
-            # Potential evaporation from intercepted water on tree [kg m^-2 s^-1]
-            Etree_int_pot = Ctree * (rho_atm * (qsat_T_tree - q_tree)/ (rb_H / ((ParVegTree.LAI + ParVegTree.SAI) * dw_H) + rap_Htree_In))
-            # Potential transpiration from sunlit tree [kg m^-2 s^-1]
-            TEtree_sun_pot = Ctree * (rho_atm * (qsat_T_tree - q_tree)/ (rb_H / ((ParVegTree.LAI) * Fsun_H * (1 - dw_H)) +
-                                                                      rap_Htree_In + rs_sun_H / ((ParVegTree.LAI) * Fsun_H * (1 - dw_H))))
-            # Potential transpiration from shaded tree [kg m^-2 s^-1]
-            TEtree_shd_pot = Ctree * (rho_atm * (qsat_T_tree - q_tree)/ (rb_H / ((ParVegTree.LAI) * Fshd_H * (1 - dw_H)) +
-                                                                      rap_Htree_In + rs_shd_H / ((ParVegTree.LAI) * Fsun_H * (1 - dw_H))))
-        # Total potential transpiration from shaded and sunlit tree [kg m^-2 s^-1]
-        TEtree_pot = Ctree * (TEtree_sun_pot + TEtree_shd_pot)
 
         # Condition that evapotranspiration does not exceed available water
         # Water limitations of interception and ponding
@@ -757,8 +791,8 @@ class Surface_HeatFlux(object):
         # Evaporation from soil under vegetated surface [kg m^-2 s^-1]
         Eveg_soil_pot = Eveg_soil_pot - Eveg_pond
 
-        # Real max water evaporation from interception [kg m^-2 s^-1]
-        Etree_int = min(Etree_int_pot, (Int.IntTree / (1000 * ParCalculation.dts) * ParCalculation.rhow))
+        # Max water evaporation from interception on trees [kg m^-2 s^-1]
+        Etree_int_max = (Int.IntTree / (1000 * ParCalculation.dts) * ParCalculation.rhow)
 
         # Water limitation to soil evaporation
         # Water mass flux in each soil layer [kg m^-2 s^-1]
@@ -787,7 +821,6 @@ class Surface_HeatFlux(object):
                                           ZR50_L,ZRmax_H,ZRmax_L,Zs[2:])
         RfH_Zs_Imp[0:2] = [0,0]
         RfH_Zs_Imp[2:] = RfH_Zs_ImpL2
-
         # How much water is available per crown area
         if SPARTREE == 1:
             # Tree roots can access all water in the soil (imp, bare, veg)
@@ -874,13 +907,9 @@ class Surface_HeatFlux(object):
         # Water limitation for tree and ground vegetation transpiration [kg m^-2 s^-1]
         Vavail_plant_tm1_H = (Ccrown[0] * Vavail_Veg_tm1_H + Ccrown[1] * Vavail_Bare_tm1_H + Ccrown[2] * Vavail_Imp_tm1_H) / Ccrown[3]
         Vavail_plant_tm1_L = Vavail_Veg_tm1_L
-        TEveg = min(TEveg_pot, Vavail_plant_tm1_L)
-        TEtree = min(TEtree_pot, Vavail_plant_tm1_H)
 
         # Evapotranspiration [kg m^-2 s^-1]
         Ebare = Cbare * (Ebare_pond + Ebare_soil)
-        Eveg = Cveg * (Eveg_int + Eveg_pond + Eveg_soil + TEveg)
-        Etree = Ctree * (Etree_int + TEtree)
 
         # Latent heat [W m^-2]
         LEimp = Cimp * (L_heat * Eimp)
@@ -890,42 +919,236 @@ class Surface_HeatFlux(object):
         LEveg_int = Cveg * (L_heat * Eveg_int)
         LEveg_pond = Cveg * (L_heat * Eveg_pond)
         LEveg_soil = Cveg * (L_heat * Eveg_soil)
-        LTEveg = Cveg * (L_heat * TEveg)
-        LEveg = Cveg * (LEveg_int + LEveg_pond + LEveg_soil + LTEveg)
-        LEtree_int = Ctree * (L_heat * Etree_int)
-        LTEtree = Ctree * (L_heat * TEtree)
-        LEtree = Ctree * (LEtree_int + LTEtree)
 
-        class thb_ground_Def():
-            pass
-        self.thb_ground = thb_ground_Def()
-        self.thb_ground.ground_imp = Himp/(cp_atm*rho_atm)
-        self.thb_ground.ground_bare = Hbare/(cp_atm*rho_atm)
-        self.thb_ground.ground_veg = Hveg/(cp_atm*rho_atm)
-        self.thb_ground.tree = Htree/(cp_atm*rho_atm)
-        self.thb_ground.ustar = ResistanceCal.Ustar_Atm
+        Ground = HeatFluxGroundParam_Def()
+        # Presence of trees and vegetated ground
+        Ground.Ctree = Ctree
+        Ground.Cveg = Cveg
+        Ground.TreeCanopy = TreeCanopy
+        # Air properties in the canyon and at the height of tree
+        Ground.Tcanyon = Tcanyon
+        Ground.qcanyon = qcanyon
+        Ground.cp_atm = cp_atm
+        Ground.rho_atm = rho_atm
+        Ground.L_heat = L_heat
+        Ground.Tground = Tground
+        Ground.qsat_T_veg = qsat_T_veg
+        Ground.Tcanyon_tree = Tcanyon_tree
+        Ground.Pre_tree = Pre_tree
+        Ground.q_tree = q_tree
+        Ground.e_T_tree = e_T_tree
+        Ground.u_tree = u_tree
+        # Resistances
+        Ground.alpha = alpha
+        Ground.rap_can = rap_can
+        Ground.rap_Htree_In = rap_Htree_In
+        Ground.Ustar_Atm = ResistanceCal.Ustar_Atm
+        Ground.rb_L = rb_L
+        Ground.r_soil_bare = r_soil_bare
+        Ground.r_soil_veg = r_soil_veg
+        Ground.alp_soil_bare = alp_soil_bare
+        Ground.alp_soil_veg = alp_soil_veg
+        # Partitioning of radiation and interception of trees and ground vegetation
+        Ground.Fsun_H = Fsun_H
+        Ground.Fshd_H = Fshd_H
+        Ground.PAR_sun_H = PAR_sun_H
+        Ground.PAR_shd_H = PAR_shd_H
+        Ground.Citm1_sun_H = Citm1_sun_H
+        Ground.Citm1_shd_H = Citm1_shd_H
+        Ground.Psi_H_tm1 = Psi_H_tm1
+        Ground.dw_H = dw_H
+        Ground.Fsun_L = Fsun_L
+        Ground.Fshd_L = Fshd_L
+        Ground.dw_L = dw_L
+        Ground.CanopyGroundVeg = CanopyGroundVeg
+        # Water available to the trees and ground vegetation [kg m^-2 s^-1]
+        Ground.Etree_int_max = Etree_int_max
+        Ground.Vavail_plant_tm1_H = Vavail_plant_tm1_H
+        Ground.Vavail_plant_tm1_L = Vavail_plant_tm1_L
+        # Sensible heat [W m^-2], evaporation [kg m^-2 s^-1], and latent heat [W m^-2] of the ground
+        Ground.Himp = Himp
+        Ground.Hbare = Hbare
+        Ground.Hveg = Hveg
+        Ground.Eimp = Eimp
+        Ground.Ebare_pond = Ebare_pond
+        Ground.Ebare_soil = Ebare_soil
+        Ground.Ebare = Ebare
+        Ground.Eveg_int = Eveg_int
+        Ground.Eveg_pond = Eveg_pond
+        Ground.Eveg_soil = Eveg_soil
+        Ground.LEimp = LEimp
+        Ground.LEbare_pond = LEbare_pond
+        Ground.LEbare_soil = LEbare_soil
+        Ground.LEbare = LEbare
+        Ground.LEveg_int = LEveg_int
+        Ground.LEveg_pond = LEveg_pond
+        Ground.LEveg_soil = LEveg_soil
+
+        return Ground
+
+    def Canopy_Tree(self,Ttree,Ground,MeteoData,ParVegTree):
 
-        class qhb_ground_Def():
-            pass
-        self.qhb_ground = qhb_ground_Def()
-        self.qhb_ground.ground_imp = LEimp/(L_heat*rho_atm)
-        self.qhb_ground.ground_bare = (LEbare_pond+LEbare_soil)/(L_heat*rho_atm)
-        self.qhb_ground.ground_veg = (LEveg_int+LEveg_pond+LEveg_soil+LTEveg)/(L_heat*rho_atm)
-        self.qhb_ground.tree = LEtree/(L_heat*rho_atm)
+        """
+        ------
+        INPUT:
+        Ttree: Trees temperature [K]
+        Ground: Terms that do not depend on the tree temperature from HeatFlux_ground_Param
+        MeteoData: Forcing variables
+        ParVegTree: Trees parameter
+        -------
+        OUTPUT:
+        rb_H: Leaf boundary layer resistance for trees [s m^-1]
+        CanopyTree: Inputs of the stomatal resistance of the trees (None if there are no trees)
+        """
 
-        class HfGruond_otherparam_Def():
-            pass
-        self.HfGruond_otherparam = HfGruond_otherparam_Def()
-        self.HfGruond_otherparam.Ri_nearGround = 0
-        self.HfGruond_otherparam.Utotal_nearGround = 0
-        self.HfGruond_otherparam.T_nearGround = Tcanyon
-        self.HfGruond_otherparam.Tground = Tground
+        if Ground.TreeCanopy:
 
+            ResistanceCal = Ressitance_Calculations()
 
-        return Himp,Hbare,Hveg,Htree,Eimp,Ebare_pond,Ebare_soil,Eveg_int,Eveg_pond,Eveg_soil,TEveg,Etree_int,TEtree, Ebare,\
-               Eveg,Etree, LEimp,LEbare_pond,LEbare_soil,LEveg_int, LEveg_pond,LEveg_soil,LTEveg,LEtree_int,LTEtree, LEbare,\
-               LEveg,LEtree, Ci_sun_H,Ci_shd_H,Ci_sun_L,Ci_shd_L, rap_can,rap_Htree_In,rb_H,rb_L, r_soil_bare,r_soil_veg,\
-               alp_soil_bare,alp_soil_veg, rs_sun_L,rs_shd_L,rs_sun_H,rs_shd_H,Fsun_L,Fshd_L,dw_L
+            # vapor pressure saturation at Ttree [Pa]
+            esat_T_tree = 611 * numpy.exp(17.27 * (Ttree - 273.16) / (237.3 + (Ttree - 273.16)))
+            # Vapor Pressure Deficit [Pa]
+            Ds_tree = esat_T_tree - Ground.e_T_tree
 
+            # Leaf boundary resistance [s m^-1]
+            rb_H = ResistanceCal.Leaf_BR(Ground.u_tree, Ttree - 273.15, Ground.Tcanyon_tree - 273.15, ParVegTree.d_leaf,
+                                         Ground.alpha)
+            # Parameters of the stomatal resistance
+            CanopyTree = [Ground.PAR_sun_H, Ground.PAR_shd_H, ParVegTree.LAI, ParVegTree.Kopt, ParVegTree.Knit,
+                          Ground.Fsun_H, Ground.Fshd_H, Ground.Citm1_sun_H, Ground.Citm1_shd_H, MeteoData.Catm_CO2,
+                          Ground.rap_Htree_In, rb_H, Ttree - 273.15, Ground.Pre_tree/100, Ds_tree, Ground.Psi_H_tm1,
+                          ParVegTree.Psi_sto_50, ParVegTree.Psi_sto_00, ParVegTree.CT, ParVegTree.Vmax,
+                          ParVegTree.DSE, ParVegTree.Ha, ParVegTree.FI, MeteoData.Catm_O2, ParVegTree.Do,
+                          ParVegTree.a1,ParVegTree.go, ParVegTree.e_rel, ParVegTree.e_relN,
+                          ParVegTree.gmes, ParVegTree.rjv]
+        else:
+            rb_H = numpy.inf
+            CanopyTree = None
+
+        return rb_H, CanopyTree
+
+    def Stomatal_Resistance(self,Canopy):
+
+        """
+        Stomatal resistance of several canopies calculated together with Canopy_Resistance_An_Evolution
+        ------
+        INPUT:
+        Canopy: List of the inputs of the stomatal resistance of each canopy (None if the canopy is absent)
+        -------
+        OUTPUT:
+        Stomata: List of (rs_sun, rs_shd, Ci_sun, Ci_shd) of each canopy; (inf, inf, 0, 0) if the canopy is absent
+        """
+
+        Stomata = [(numpy.inf,numpy.inf,0,0) for i in range(len(Canopy))]
+        Present = [i for i in range(len(Canopy)) if Canopy[i] is not None]
+        if len(Present) > 0:
+            ResistanceCal = Ressitance_Calculations()
+            rs_sun, rs_shd, Ci_sun, Ci_shd, _An_, _Rdark_, _Lpho_, _SIF_, _DCi_ = \
+                ResistanceCal.Canopy_Resistance_An_Evolution(*[numpy.array(x,dtype=float) for x in zip(*[Canopy[i] for i in Present])])
+            for ic in range(len(Present)):
+                Stomata[Present[ic]] = (rs_sun[ic], rs_shd[ic], Ci_sun[ic], Ci_shd[ic])
+
+        return Stomata
+
+    def HeatFlux_tree_1D(self,Ttree,Ground,MeteoData,ParVegTree,Stomata=None):
+
+        """
+        Turbulent heat fluxes from trees; only these depend on the tree temperature
+        ------
+        INPUT:
+        Ttree: Trees temperature [K]
+        Ground: Terms that do not depend on the tree temperature from HeatFlux_ground_Param
+        MeteoData: Forcing variables
+        ParVegTree: Trees parameter
+        Stomata: (rb_H, rs_sun_H, rs_shd_H, Ci_sun_H, Ci_shd_H) of the trees at Ttree; calculated if not given
+        -------
+        OUTPUT:
+        Htree: Sensible heat flux from tree [W m^-2]
+        Etree_int: Evaporation from intercepted water on trees [kg m^-2 s^-1]
+        TEtree: Transpiration from trees [kg m^-2 s^-1]
+        Etree: Evaporation from tree [kg m^-2 s^-1]
+        LEtree_int: Latent heat flux from intercepted water on tree [W m^-2]
+        LTEtree: Latent heat of transpiration from tree [W m^-2]
+        LEtree: Latent heat flux from tree [W m^-2]
+        Ci_sun_H: Leaf Interior CO2 mixing ratio of sunlit tree [umolCO2 mol^-1]
+        Ci_shd_H: Leaf Interior CO2 mixing ratio shaded tree [umolCO2 mol^-1]
+        rap_Htree_In: Aerodynamic resistance between trees and canyon air [s m^-1]
+        rb_H: Leaf boundary layer resistance for trees [s m^-1]
+        rs_sun_H: Stomatal resistance of sunlit trees [s m^-1]
+        rs_shd_H: Stomatal resistance of shaded trees [s m^-1]
+        """
+
+        # Calculate stomatal and leaf boundary resistances of tree
+        if Stomata is None:
+            rb_H, CanopyTree = self.Canopy_Tree(Ttree,Ground,MeteoData,ParVegTree)
+            [(rs_sun_H,rs_shd_H,Ci_sun_H,Ci_shd_H)] = self.Stomatal_Resistance([CanopyTree])
+        else:
+            rb_H,rs_sun_H,rs_shd_H,Ci_sun_H,Ci_shd_H = Stomata
+
+        Ctree = Ground.Ctree
+        cp_atm = Ground.cp_atm
+        rho_atm = Ground.rho_atm
+        L_heat = Ground.L_heat
+        q_tree = Ground.q_tree
+        u_tree = Ground.u_tree
+        Fsun_H = Ground.Fsun_H
+        Fshd_H = Ground.Fshd_H
+        dw_H = Ground.dw_H
+        rap_Htree_In = Ground.rap_Htree_In
+        if Ground.TreeCanopy:
+            Tcanyon_tree = Ground.Tcanyon_tree
+        else:
+            Tcanyon_tree = Ttree
+
+        # vapor pressure saturation at Ttree [Pa]
+        esat_T_tree = 611 * numpy.exp(17.27 * (Ttree - 273.16) / (237.3 + (Ttree - 273.16)))
+        # Saturated specific humidity at Ttree [kg kg^-1]
+        qsat_T_tree = round((0.622 * esat_T_tree) / (MeteoData.Pre - 0.378 * esat_T_tree),4)
+
+        # Calculate sensible heat flux [W m^-2]
+        Htree = Ctree * (cp_atm*rho_atm * (Ttree-Tcanyon_tree) / (rb_H/(2*(ParVegTree.LAI+ParVegTree.SAI))+rap_Htree_In))
+
+
+        ###############
+        leaf_dim = 0.72 * 0.05
+        gHa = 1.4 * 0.135 * numpy.sqrt(u_tree / leaf_dim)
+        cp_mol = 29.3
+        Htree = 2*gHa*cp_mol*(Ttree-Tcanyon_tree)
+        if Htree != 0:
+            rap_Htree_In = (cp_atm*rho_atm * (Ttree-Tcanyon_tree))/Htree
+        ###############
+
+        if Ctree == 0:
+            # Potential evaporation from intercepted water on tree [kg m^-2 s^-1]
+            Etree_int_pot = 0
+            # Potential transpiration from sunlit tree [kg m^-2 s^-1]
+            TEtree_sun_pot = 0
+            # Potential transpiration from shaded tree [kg m^-2 s^-1]
+            TEtree_shd_pot = 0
+        else:
+            # Potential evaporation from intercepted water on tree [kg m^-2 s^-1]
+            Etree_int_pot = Ctree * (rho_atm * (qsat_T_tree - q_tree)/ (rb_H / ((ParVegTree.LAI + ParVegTree.SAI) * dw_H) + rap_Htree_In))
+            # Potential transpiration from sunlit tree [kg m^-2 s^-1]
+            TEtree_sun_pot = Ctree * (rho_atm * (qsat_T_tree - q_tree)/ (rb_H / ((ParVegTree.LAI) * Fsun_H * (1 - dw_H)) +
+                                                                      rap_Htree_In + rs_sun_H / ((ParVegTree.LAI) * Fsun_H * (1 - dw_H))))
+            # Potential transpiration from shaded tree [kg m^-2 s^-1]
+            TEtree_shd_pot = Ctree * (rho_atm * (qsat_T_tree - q_tree)/ (rb_H / ((ParVegTree.LAI) * Fshd_H * (1 - dw_H)) +
+                                                                      rap_Htree_In + rs_shd_H / ((ParVegTree.LAI) * Fsun_H * (1 - dw_H))))
+        # Total potential transpiration from shaded and sunlit tree [kg m^-2 s^-1]
+        TEtree_pot = Ctree * (TEtree_sun_pot + TEtree_shd_pot)
+
+        # Real max water evaporation from interception [kg m^-2 s^-1]
+        Etree_int = min(Etree_int_pot, Ground.Etree_int_max)
+        # Water limitation for tree transpiration [kg m^-2 s^-1]
+        TEtree = min(TEtree_pot, Ground.Vavail_plant_tm1_H)
+
+        # Evapotranspiration [kg m^-2 s^-1]
+        Etree = Ctree * (Etree_int + TEtree)
+
+        # Latent heat [W m^-2]
+        LEtree_int = Ctree * (L_heat * Etree_int)
+        LTEtree = Ctree * (L_heat * TEtree)
+        LEtree = Ctree * (LEtree_int + LTEtree)
 
+        return Htree,Etree_int,TEtree,Etree,LEtree_int,LTEtree,LEtree,Ci_sun_H,Ci_shd_H,rap_Htree_In,rb_H,rs_sun_H,rs_shd_H
 
@@ -16,11 +16,10 @@ import matplotlib.pyplot as plt
 from scipy.integrate import odeint
 import matplotlib.gridspec as gridspec
 import copy
-import _pickle as cPickle
 from EB_Roof import EnergyBalanceRoof_Def
 from EB_Canyon import EnergyBalanceCanyon_Def
 from EB_Rural import EnergyBalanceRural_Def
-from SurfaceTemperature import Tsurf_Def
+from SurfaceTemperature import Tsurf_Def,LayeredConduction_Def
 from UrbanModel import UCM_Def
 from WB_Roof import WaterBalanceRoof_Def
 from WB_Canyon import WaterBalanceCanyon_Def
@@ -28,35 +27,57 @@ from weather import Weather
 from forcing import Forcing
 from Simparam import SimParam
 from Write_Output import Write_Forcing,Write_EB,Write_Tsurf,Write_WB,Write_TdeepProfiles,Write_1Dprofiles,\
-    Write_Ruralprofiles,Write_BEM
+    Write_Ruralprofiles,Write_BEM,Output_fields,Profile_fields,Write_NPZ
+from OutputRecorder import OutputRecorder
+from Checkpoint import GetState,SetState,SaveCheckpoint,LoadCheckpoint
 from Radiation_Functions import RadiationFunctions
+from Soil_Functions import ClearSoilParametersCache
 from RSM import RSMDef
-from Read_Input import read_VCWG_param,ForcingData,Data_Site
-from ReadDOE import readDOE
+from Read_Input import read_VCWG_param,ForcingData,Data_Site,SolarEphemeris
+from ReadDOE import GetDOELibrary
 from Material import Material
+from BuildingEnergy import BuildingStock
 from psychrometrics import HumFromRHumTemp
 from EPWGenerator import write_epw
 from datetime import datetime
 
 class VCWG_Smart(object):
 
-    def __init__(self,epwFileName,TopForcingFileName,VCWGParamFileName,ViewFactorFileName,case,month_name, date_str):
+    # Model objects saved in checkpoints
+    Checkpoint_objects = ['simTime','UCM','RSM','EBRoof','EBCanyon','EBRural','WBRoof','WBCanyon','BEM','GroundImp','GroundVeg',
+                          'GroundBare','Rural','dayType','time','Recorder']
+
+    def __init__(self,epwFileName,TopForcingFileName,VCWGParamFileName,ViewFactorFileName,case,month_name, date_str,
+                 VCWGParam=None,Prepared=None):
+        # VCWGParam: Parameters to use instead of reading VCWGParamFileName (e.g. with overrides of an ensemble member)
+        # Prepared: Run-invariant inputs (view factors and interpolated forcing) computed beforehand, e.g. by the parent
+        # process of ParallelMonths; None: they are computed by read_input and read_epw
         self.epwFileName = epwFileName
         self.VCWGParamFileName = os.path.join(os.path.join('resources','Parameters'),VCWGParamFileName)
+        self.VCWGParam = VCWGParam
         self.ViewFactorFileName = os.path.join(os.path.join('resources','Parameters'),ViewFactorFileName)
         self.case = case
         self.TopForcingFileName = TopForcingFileName
         self.month_name = month_name                         # Name of the Specific Month/Initialization File Under Processing
         self.date_str=date_str
+        self.Prepared = Prepared
 
     def read_input(self):
 
+        # Parse the initialization file once; the parameter object is shared by all time steps
+        if self.VCWGParam is None:
+            self.VCWGParam = read_VCWG_param(self.VCWGParamFileName)
+
         # Read the site parameters
         self.Geometry_m, self.ParTree, self.geometry, self.FractionsRoof, self.FractionsGround, self.WallLayers, self.ParSoilRoof, \
         self.ParSoilGround, self.ParInterceptionTree, self.PropOpticalRoof, self.PropOpticalGround, self.PropOpticalWall, \
         self.PropOpticalTree, self.ParThermalRoof, self.ParThermalGround, self.ParThermalWall,self.ParVegRoof,\
         self.ParVegGround,self.ParVegTree,self.Person,self.ColParam,self.RSMParam,self.TimeParam,ViewFactorCal_Param,self.bld,self.zone,\
-        self.charLength,self.BEMParam,self.SmartBuildingParam, self.TOU = Data_Site(self.VCWGParamFileName)
+        self.charLength,self.BEMParam,self.SmartBuildingParam, self.TOU = Data_Site(self.VCWGParam)
+
+        if self.Prepared is not None:
+            self.ViewFactor = self.Prepared.ViewFactor
+            return
 
         # Calculate view factors
         RadFun = RadiationFunctions()
@@ -67,6 +88,12 @@ class VCWG_Smart(object):
 
         self.simTime = SimParam(self.TimeParam.dts,self.TimeParam.dtWeather,self.TimeParam.Month,self.TimeParam.Day,self.TimeParam.nDay)
 
+        if self.Prepared is not None:
+            self.epwFileName = self.Prepared.epwFileName
+            self.time_n = self.Prepared.time_n
+            self.MeteoDataRaw_intp = self.Prepared.MeteoDataRaw_intp
+            return
+
         # Build a new epw file using TopForcing dataset, if there is no information from rural site
         if self.epwFileName == None:
             epw_precision = 1
@@ -88,69 +115,49 @@ class VCWG_Smart(object):
         n = len(forcIP.temp)
         Meteo_time_step = int(self.TimeParam.dtWeather)
         Sim_time_step = int(self.TimeParam.dts)
-        time_Meteo = [i for i in range(0, n*Meteo_time_step, Meteo_time_step)]
-        self.time_n = [i for i in range(0, max(time_Meteo), Sim_time_step)]
-
-        f_LWR_in = interp1d(time_Meteo, forcIP.infra)
-        f_Dif_in = interp1d(time_Meteo, forcIP.dif)
-        f_Dir_in = interp1d(time_Meteo, forcIP.dir)
-        f_T_atm = interp1d(time_Meteo, forcIP.temp)
-        f_windspeed_u = interp1d(time_Meteo, forcIP.wind)
-        f_pressure_atm = interp1d(time_Meteo, forcIP.pres)
-        f_rain = interp1d(time_Meteo, forcIP.prec)
-        f_rel_humidity = interp1d(time_Meteo, forcIP.rHum)
-        f_Spc_humidity = interp1d(time_Meteo, forcIP.hum)
-        f_uDir = interp1d(time_Meteo, forcIP.uDir)
+        time_Meteo = numpy.arange(0, n*Meteo_time_step, Meteo_time_step)
+        self.time_n = numpy.arange(0, time_Meteo[-1], Sim_time_step)
 
+        # Interpolate forcing variables from weather time step to simulation time step over the whole time vector
         class MeteoDataRaw_intp_Def():
             pass
         self.MeteoDataRaw_intp = MeteoDataRaw_intp_Def()
-        self.MeteoDataRaw_intp.LWR_in = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.Dif_in = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.Dir_in = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.T_atm = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.windspeed_u = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.uDir = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.pressure_atm = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.rain = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.rel_humidity = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.Spc_humidity = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.Tdeepsoil = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.Year = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.Month = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.Day = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.Hour = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.Min = numpy.zeros(len(self.time_n))
-        self.MeteoDataRaw_intp.Sec = numpy.zeros(len(self.time_n))
-        count = 0
-        for i in self.time_n:
-            self.MeteoDataRaw_intp.LWR_in[count] = f_LWR_in(i)
-            self.MeteoDataRaw_intp.Dif_in[count] = f_Dif_in(i)
-            self.MeteoDataRaw_intp.Dir_in[count] = f_Dir_in(i)
-            self.MeteoDataRaw_intp.T_atm[count] = f_T_atm(i)
-            self.MeteoDataRaw_intp.windspeed_u[count] = f_windspeed_u(i)
-            self.MeteoDataRaw_intp.uDir[count] = f_uDir(i)
-            self.MeteoDataRaw_intp.pressure_atm[count] = f_pressure_atm(i)
-            self.MeteoDataRaw_intp.rain[count] = f_rain(i)
-            self.MeteoDataRaw_intp.rel_humidity[count] = f_rel_humidity(i) / 100
-            self.MeteoDataRaw_intp.Spc_humidity[count] = f_Spc_humidity(i)
-            self.MeteoDataRaw_intp.Year[count] = forcIP.Year[0]
-            self.MeteoDataRaw_intp.Month[count] = forcIP.Month[0]
-            self.MeteoDataRaw_intp.Day[count] = forcIP.Day[i // Meteo_time_step]
-            self.MeteoDataRaw_intp.Hour[count] = forcIP.Hour[i // Meteo_time_step]
-            self.MeteoDataRaw_intp.Min[count] = int((i % Meteo_time_step) / 60)
-            self.MeteoDataRaw_intp.Sec[count] = 0
-            self.MeteoDataRaw_intp.lat = weather.lat
-            self.MeteoDataRaw_intp.lon = weather.lon
-            self.MeteoDataRaw_intp.GMT = weather.GMT
-            count = count + 1
-        self.MeteoDataRaw_intp.Tdeepsoil = [Tdeepsoil_z[int(self.MeteoDataRaw_intp.Month[i]-1)] for i in range(len(self.time_n))]
+        self.MeteoDataRaw_intp.LWR_in = interp1d(time_Meteo, forcIP.infra)(self.time_n)
+        self.MeteoDataRaw_intp.Dif_in = interp1d(time_Meteo, forcIP.dif)(self.time_n)
+        self.MeteoDataRaw_intp.Dir_in = interp1d(time_Meteo, forcIP.dir)(self.time_n)
+        self.MeteoDataRaw_intp.T_atm = interp1d(time_Meteo, forcIP.temp)(self.time_n)
+        self.MeteoDataRaw_intp.windspeed_u = interp1d(time_Meteo, forcIP.wind)(self.time_n)
+        self.MeteoDataRaw_intp.uDir = interp1d(time_Meteo, forcIP.uDir)(self.time_n)
+        self.MeteoDataRaw_intp.pressure_atm = interp1d(time_Meteo, forcIP.pres)(self.time_n)
+        self.MeteoDataRaw_intp.rain = interp1d(time_Meteo, forcIP.prec)(self.time_n)
+        self.MeteoDataRaw_intp.rel_humidity = interp1d(time_Meteo, forcIP.rHum)(self.time_n) / 100
+        self.MeteoDataRaw_intp.Spc_humidity = interp1d(time_Meteo, forcIP.hum)(self.time_n)
+
+        # Calendar fields: index of the weather record containing each simulation time
+        Meteo_index = self.time_n // Meteo_time_step
+        nt = len(self.time_n)
+        self.MeteoDataRaw_intp.Year = numpy.full(nt, forcIP.Year[0], dtype=float)
+        self.MeteoDataRaw_intp.Month = numpy.full(nt, forcIP.Month[0], dtype=float)
+        self.MeteoDataRaw_intp.Day = numpy.asarray(forcIP.Day, dtype=float)[Meteo_index]
+        self.MeteoDataRaw_intp.Hour = numpy.asarray(forcIP.Hour, dtype=float)[Meteo_index]
+        self.MeteoDataRaw_intp.Min = ((self.time_n % Meteo_time_step) // 60).astype(float)
+        self.MeteoDataRaw_intp.Sec = numpy.zeros(nt)
+        self.MeteoDataRaw_intp.lat = weather.lat
+        self.MeteoDataRaw_intp.lon = weather.lon
+        self.MeteoDataRaw_intp.GMT = weather.GMT
+        self.MeteoDataRaw_intp.Tdeepsoil = Tdeepsoil_z[self.MeteoDataRaw_intp.Month.astype(int) - 1]
+
+        # Solar geometry for all time steps
+        SolarEphemeris(self.MeteoDataRaw_intp)
 
     def is_near_zero(self,num,eps=1e-10):
         return abs(float(num)) < eps
 
     def instantiate_input(self):
 
+        # The soil parameters of the soil columns are calculated once and cached; discard those of a previous simulation
+        ClearSoilParametersCache()
+
         # -------------------------
         # Initialize energy balance
         # -------------------------
@@ -178,12 +185,8 @@ class VCWG_Smart(object):
         # Initialize building energy
         # --------------------------
         # Define BEM for each DOE type (read the fraction)
-        # Open pickle file in binary form
-        readDOE_file = open('readDOE.PKL', 'rb')
-        refDOE = cPickle.load(readDOE_file)
-        refBEM = cPickle.load(readDOE_file)
-        refSchedule = cPickle.load(readDOE_file)
-        readDOE_file.close()
+        # Only the records of the building types in the urban area are loaded from the DOE library
+        DOE = GetDOELibrary()
 
         k = 0
         # Glazing ratio for total building stock
@@ -200,7 +203,8 @@ class VCWG_Smart(object):
             for j in range(3):
                 if self.bld[i][j] > 0.:
                     # Add to BEM list
-                    self.BEM.append(refBEM[i][j][self.zone])
+                    refBEM, refSchedule = DOE.record(i,j,self.zone)
+                    self.BEM.append(refBEM)
                     self.BEM[k].frac = self.bld[i][j]
                     self.BEM[k].fl_area = self.bld[i][j] * total_urban_bld_area
 
@@ -213,7 +217,7 @@ class VCWG_Smart(object):
                     SHGC = SHGC + self.BEM[k].frac * self.BEM[k].building.shgc
 
                     # Add to schedule list
-                    self.Sch.append(refSchedule[i][j][self.zone])
+                    self.Sch.append(refSchedule)
                     k += 1
 
         for i in range(len(self.BEM)):
@@ -368,38 +372,30 @@ class VCWG_Smart(object):
             print('Error: Soil depth at the ground is too shallow for accomodatig roots or too deep. Please check "Zs_G" in the input file.')
             quit()
 
-    def Simulate(self):
+    def Simulate(self,checkpointFileName=None):
 
         # total number of hours in simulation
         self.N = int(self.simTime.days * 24)
         # weather time step counter
         n = 0
-        # Define output data
-        self.EBRoofData = [None for x in range(self.N)]
-        self.EBCanyonData = [None for x in range(self.N)]
-        self.EBRuralData = [None for x in range(self.N)]
-        self.RuralData = [None for x in range(self.N)]
-        self.RoofImpData = [None for x in range(self.N)]
-        self.RoofVegData = [None for x in range(self.N)]
-        self.GroundImpData = [None for x in range(self.N)]
-        self.GroundVegData = [None for x in range(self.N)]
-        self.GroundBareData = [None for x in range(self.N)]
-        self.WallSunData = [None for x in range(self.N)]
-        self.WallShadeData = [None for x in range(self.N)]
+        # Define output data; only the fields declared by the writers are recorded. With streamed output, the time series
+        # fields only hold the nFlush records not written yet and the profile fields hold all records
+        if self.TimeParam.StreamOutput == 1:
+            self.Recorder = OutputRecorder(self.N,Output_fields,int(self.TimeParam.nFlush),Profile_fields)
+        else:
+            self.Recorder = OutputRecorder(self.N,Output_fields)
+        for name in self.Recorder.fields:
+            setattr(self,name,self.Recorder.view(name))
         self.RuralGroundImpData = [None for x in range(self.N)]
         self.RuralGroundBareData = [None for x in range(self.N)]
         self.RuralGroundVegData = [None for x in range(self.N)]
-        self.RSMData = [None for x in range(self.N)]
-        self.UBLData = [None for x in range(self.N)]
-        self.UCMData = [None for x in range(self.N)]
-        self.WBRoofData = [None for x in range(self.N)]
-        self.WBCanyonData = [None for x in range(self.N)]
-        self.WBRuralData = [None for x in range(self.N)]
-        self.ForcingData = [None for x in range(self.N)]
-        self.BEMData = [None for x in range(self.N)]
         self.time = [None for x in range(self.N)]
         self.SmartThermostat = [None for x in range(self.N)]
         self.SmartHumidistat = [None for x in range(self.N)]
+        # Streamed output: create the time series files now and append to them every nFlush records
+        self.nWritten = 0
+        if self.TimeParam.StreamOutput == 1:
+            self.write_timeseries(self.output_dir(),[],"w")
 
         # Define surface temperature of two steps back
         TwallSun_ext = 0
@@ -432,8 +428,40 @@ class VCWG_Smart(object):
         TWallIntSun_2last = numpy.zeros(2)
         TWallIntShade_2last = numpy.zeros(2)
 
+        # Restart from a checkpoint; the state of the model objects is restored into the objects instantiated from the
+        # input files, so a checkpoint (e.g. after spin-up) can be branched into scenarios with different inputs
+        it_start = 0
+        if checkpointFileName is not None:
+            checkpoint = LoadCheckpoint(checkpointFileName)
+            SetState(self,checkpoint['model'])
+            SetState(Tsurf_2back,checkpoint['Tsurf_2back'])
+            TGroundImp_2last[:] = checkpoint['TGroundImp_2last']
+            TGroundBare_2last[:] = checkpoint['TGroundBare_2last']
+            TGroundVeg_2last[:] = checkpoint['TGroundVeg_2last']
+            TTree_2last[:] = checkpoint['TTree_2last']
+            TWallSun_2last[:] = checkpoint['TWallSun_2last']
+            TWallShade_2last[:] = checkpoint['TWallShade_2last']
+            TWallIntSun_2last[:] = checkpoint['TWallIntSun_2last']
+            TWallIntShade_2last[:] = checkpoint['TWallIntShade_2last']
+            n = checkpoint['n']
+            it_start = checkpoint['it']
+            # Streamed output holds only the records not written before the checkpoint; append from the first of them
+            if self.TimeParam.StreamOutput == 1:
+                self.nWritten = checkpoint.get('nWritten',0)
+
+        # Conduction in the building elements and the ground is solved for all elements at once; the layer temperatures
+        # of the elements become views into the arrays of self.Conduction
+        Elements = [self.GroundImp,self.GroundVeg,self.GroundBare]
+        for i in range(len(self.BEM)):
+            Elements += [self.BEM[i].mass,self.BEM[i].roofImp,self.BEM[i].roofVeg,self.BEM[i].wallSun,self.BEM[i].wallShade]
+        self.Conduction = LayeredConduction_Def(Elements)
+        # Building energy model of all building types advanced together with array operations
+        self.BuildingStock = None
+        if self.BEMParam.VectorizedBEM == 1:
+            self.BuildingStock = BuildingStock(self.BEM,self.Sch)
+
         # Start simulation
-        for it in range(0,self.simTime.nt-1,1):
+        for it in range(it_start,self.simTime.nt-1,1):
             progress_percentage = numpy.round(100 * it / self.simTime.nt, 2)
             # Print progress every 10 iterations
             if it % 10 == 0:
@@ -441,7 +469,7 @@ class VCWG_Smart(object):
 
             # Simulation time increment raised to weather time step
             SunPosition,MeteoData,Anthropogenic,location,ParCalculation = \
-                ForcingData(self.MeteoDataRaw_intp,it, self.WBCanyon.SoilPotW, self.VCWGParamFileName,self.simTime)
+                ForcingData(self.MeteoDataRaw_intp,it, self.WBCanyon.SoilPotW, self.VCWGParam,self.simTime)
             self.simTime.UpdateDate()
 
             #----------------------
@@ -571,103 +599,125 @@ class VCWG_Smart(object):
             else:
                 self.dayType = 1  # Weekday
             # Update the energy components for building types
-            for i in range(len(self.BEM)):
-                # Set point temperature [K]
-                # Add from temperature schedule for cooling
-                self.BEM[i].building.coolTempSetpointDay = self.Sch[i].Cool[self.dayType - 1][self.simTime.hourDay] + 273.15
-                self.BEM[i].building.coolTempSetpointNight = self.BEM[i].building.coolTempSetpointDay
-                # Add from temperature schedule for heating
-                self.BEM[i].building.heatTempSetpointDay = self.Sch[i].Heat[self.dayType - 1][self.simTime.hourDay] + 273.15
-                self.BEM[i].building.heatTempSetpointNight = self.BEM[i].building.heatTempSetpointDay
-                # Add from Relative Humidity (RH) schedule for cooling
-                self.BEM[i].building.coolRHSetpointDay = self.Sch[i].RHCool[self.dayType - 1][self.simTime.hourDay]
-                self.BEM[i].building.coolRHSetpointNight = self.BEM[i].building.coolRHSetpointDay
-                # Add from Relative Humidity (RH) schedule for heating
-                self.BEM[i].building.heatRHSetpointDay = self.Sch[i].RHHeat[self.dayType - 1][self.simTime.hourDay]
-                self.BEM[i].building.heatRHSetpointNight = self.BEM[i].building.heatRHSetpointDay
-                # Add from Occupant Presence Schedule
-                self.BEM[i].building.Nocc = self.Sch[i].Nocc * self.Sch[i].Occ[self.dayType - 1][self.simTime.hourDay]
-
-                # Internal Heat Load Schedule per unit floor area [W m^-2]
-                # Electricity consumption per unit floor area [W m^-2] = max for electrical plug process * electricity fraction for the day
-                self.BEM[i].Elec = self.Sch[i].Qelec * self.Sch[i].Elec[self.dayType - 1][self.simTime.hourDay]
-                # Lighting per unit floor area [W m^-2] = max for light * light fraction for the day
-                self.BEM[i].Light = self.Sch[i].Qlight * self.Sch[i].Light[self.dayType - 1][self.simTime.hourDay]
-                # Number of occupants x occ fraction for day
-                self.BEM[i].Nocc = self.Sch[i].Nocc * self.Sch[i].Occ[self.dayType - 1][self.simTime.hourDay]
-                # Sensible Q occupant * fraction occupant sensible Q * number of occupants
-                self.BEM[i].Qocc = self.BEMParam.sensOcc*(1-self.BEMParam.LatFOcc)*self.BEM[i].Nocc
-
-                # SWH and ventilation schedule
-                # Solar water heating per unit floor area [W m^-2] = Peak Service Hot Water per unit floor [kg hr^-1 m^-2] * SWH fraction for the day
-                self.BEM[i].SWH = self.Sch[i].Vswh * self.Sch[i].SWH[self.dayType - 1][self.simTime.hourDay]
-                # Ventilation rate per unit floor area [m^3 s^-1 m^-2]
-                self.BEM[i].building.vent = self.Sch[i].Vent
-                # Gas consumption per unit floor area [W m^-2] = max for gas * Gas fraction for the day
-                self.BEM[i].Gas = self.Sch[i].Qgas * self.Sch[i].Gas[self.dayType - 1][self.simTime.hourDay]
-
-                # This is quite messy, should update
-                # Update internal heat and corresponding fractional loads per unit floor area [W m^-2]
-                intHeat = self.BEM[i].Light + self.BEM[i].Elec + self.BEM[i].Qocc
-                self.BEM[i].building.intHeatDay = intHeat
-                self.BEM[i].building.intHeatNight = intHeat
-                # Fraction of radiant heat from light and equipment of whole internal heat per unit floor area [W m^-2]
-                self.BEM[i].building.intHeatFRad = (self.BEMParam.RadFLight*self.BEM[i].Light+self.BEMParam.RadFEquip*self.BEM[i].Elec)/intHeat
-                # fraction of latent heat (from occupants) of whole internal heat per unit floor area [W m^-2]
-                self.BEM[i].building.intHeatFLat = self.BEMParam.LatFOcc*self.BEMParam.sensOcc*self.BEM[i].Nocc/intHeat
-
-                # Update envelope temperature layers [K]
-                # Wall temperature exposed to outdoor environment [K]
-                self.BEM[i].T_wallex = (self.BEM[i].wallSun.Text + self.BEM[i].wallShade.Text)/2
-                # Wall temperature exposed to indoor environment [K]
-                self.BEM[i].T_wallin = (self.BEM[i].wallSun.Tint + self.BEM[i].wallShade.Tint)/2
-                # Roof temperature exposed to outdoor environment [K]
-                self.BEM[i].T_roofex = self.FractionsRoof.fimp*self.BEM[i].roofImp.Text+self.FractionsRoof.fveg*self.BEM[i].roofVeg.Text
-                # Roof temperature exposed to indoor environment [K]
-                self.BEM[i].T_roofin = self.FractionsRoof.fimp*self.BEM[i].roofImp.Tint+self.FractionsRoof.fveg*self.BEM[i].roofVeg.Tint
-
-                # Calculate one-point temperature and humidity in the canyon: Using 1-D profiles in the canyon
+            if self.BuildingStock is not None:
+                # All building types together
+                self.BuildingStock.UpdateSchedule(self.dayType,self.simTime.hourDay,self.BEMParam,self.FractionsRoof)
                 canTemp = numpy.mean(self.UCM.VerticalProfUrban.th[0:self.Geometry_m.nz_u])
                 canHum = numpy.mean(self.UCM.VerticalProfUrban.qn[0:self.Geometry_m.nz_u])
-                self.BEM[i].building.BEMCalc(canTemp,canHum,self.BEM[i],MeteoData,ParCalculation,self.simTime,self.Geometry_m,
-                                             self.FractionsRoof,self.EBCanyon.SWR,self.SmartBuildingParam, self.TOU)
-
-                # Electricity consumption of urban area [W]
-                self.BEM[i].ElecTotal = self.BEM[i].building.ElecTotal * self.BEM[i].fl_area
+                self.BuildingStock.BEMCalc(canTemp,canHum,MeteoData,ParCalculation,self.simTime,self.Geometry_m,
+                                           self.FractionsRoof,self.EBCanyon.SWR,self.SmartBuildingParam,self.TOU)
+            else:
+                for i in range(len(self.BEM)):
+                    # Set point temperature [K]
+                    # Add from temperature schedule for cooling
+                    self.BEM[i].building.coolTempSetpointDay = self.Sch[i].Cool[self.dayType - 1][self.simTime.hourDay] + 273.15
+                    self.BEM[i].building.coolTempSetpointNight = self.BEM[i].building.coolTempSetpointDay
+                    # Add from temperature schedule for heating
+                    self.BEM[i].building.heatTempSetpointDay = self.Sch[i].Heat[self.dayType - 1][self.simTime.hourDay] + 273.15
+                    self.BEM[i].building.heatTempSetpointNight = self.BEM[i].building.heatTempSetpointDay
+                    # Add from Relative Humidity (RH) schedule for cooling
+                    self.BEM[i].building.coolRHSetpointDay = self.Sch[i].RHCool[self.dayType - 1][self.simTime.hourDay]
+                    self.BEM[i].building.coolRHSetpointNight = self.BEM[i].building.coolRHSetpointDay
+                    # Add from Relative Humidity (RH) schedule for heating
+                    self.BEM[i].building.heatRHSetpointDay = self.Sch[i].RHHeat[self.dayType - 1][self.simTime.hourDay]
+                    self.BEM[i].building.heatRHSetpointNight = self.BEM[i].building.heatRHSetpointDay
+                    # Add from Occupant Presence Schedule
+                    self.BEM[i].building.Nocc = self.Sch[i].Nocc * self.Sch[i].Occ[self.dayType - 1][self.simTime.hourDay]
+
+                    # Internal Heat Load Schedule per unit floor area [W m^-2]
+                    # Electricity consumption per unit floor area [W m^-2] = max for electrical plug process * electricity fraction for the day
+                    self.BEM[i].Elec = self.Sch[i].Qelec * self.Sch[i].Elec[self.dayType - 1][self.simTime.hourDay]
+                    # Lighting per unit floor area [W m^-2] = max for light * light fraction for the day
+                    self.BEM[i].Light = self.Sch[i].Qlight * self.Sch[i].Light[self.dayType - 1][self.simTime.hourDay]
+                    # Number of occupants x occ fraction for day
+                    self.BEM[i].Nocc = self.Sch[i].Nocc * self.Sch[i].Occ[self.dayType - 1][self.simTime.hourDay]
+                    # Sensible Q occupant * fraction occupant sensible Q * number of occupants
+                    self.BEM[i].Qocc = self.BEMParam.sensOcc*(1-self.BEMParam.LatFOcc)*self.BEM[i].Nocc
+
+                    # SWH and ventilation schedule
+                    # Solar water heating per unit floor area [W m^-2] = Peak Service Hot Water per unit floor [kg hr^-1 m^-2] * SWH fraction for the day
+                    self.BEM[i].SWH = self.Sch[i].Vswh * self.Sch[i].SWH[self.dayType - 1][self.simTime.hourDay]
+                    # Ventilation rate per unit floor area [m^3 s^-1 m^-2]
+                    self.BEM[i].building.vent = self.Sch[i].Vent
+                    # Gas consumption per unit floor area [W m^-2] = max for gas * Gas fraction for the day
+                    self.BEM[i].Gas = self.Sch[i].Qgas * self.Sch[i].Gas[self.dayType - 1][self.simTime.hourDay]
+
+                    # This is quite messy, should update
+                    # Update internal heat and corresponding fractional loads per unit floor area [W m^-2]
+                    intHeat = self.BEM[i].Light + self.BEM[i].Elec + self.BEM[i].Qocc
+                    self.BEM[i].building.intHeatDay = intHeat
+                    self.BEM[i].building.intHeatNight = intHeat
+                    # Fraction of radiant heat from light and equipment of whole internal heat per unit floor area [W m^-2]
+                    self.BEM[i].building.intHeatFRad = (self.BEMParam.RadFLight*self.BEM[i].Light+self.BEMParam.RadFEquip*self.BEM[i].Elec)/intHeat
+                    # fraction of latent heat (from occupants) of whole internal heat per unit floor area [W m^-2]
+                    self.BEM[i].building.intHeatFLat = self.BEMParam.LatFOcc*self.BEMParam.sensOcc*self.BEM[i].Nocc/intHeat
+
+                    # Update envelope temperature layers [K]
+                    # Wall temperature exposed to outdoor environment [K]
+                    self.BEM[i].T_wallex = (self.BEM[i].wallSun.Text + self.BEM[i].wallShade.Text)/2
+                    # Wall temperature exposed to indoor environment [K]
+                    self.BEM[i].T_wallin = (self.BEM[i].wallSun.Tint + self.BEM[i].wallShade.Tint)/2
+                    # Roof temperature exposed to outdoor environment [K]
+                    self.BEM[i].T_roofex = self.FractionsRoof.fimp*self.BEM[i].roofImp.Text+self.FractionsRoof.fveg*self.BEM[i].roofVeg.Text
+                    # Roof temperature exposed to indoor environment [K]
+                    self.BEM[i].T_roofin = self.FractionsRoof.fimp*self.BEM[i].roofImp.Tint+self.FractionsRoof.fveg*self.BEM[i].roofVeg.Tint
+
+                    # Calculate one-point temperature and humidity in the canyon: Using 1-D profiles in the canyon
+                    canTemp = numpy.mean(self.UCM.VerticalProfUrban.th[0:self.Geometry_m.nz_u])
+                    canHum = numpy.mean(self.UCM.VerticalProfUrban.qn[0:self.Geometry_m.nz_u])
+                    self.BEM[i].building.BEMCalc(canTemp,canHum,self.BEM[i],MeteoData,ParCalculation,self.simTime,self.Geometry_m,
+                                                 self.FractionsRoof,self.EBCanyon.SWR,self.SmartBuildingParam, self.TOU)
+
+                    # Electricity consumption of urban area [W]
+                    self.BEM[i].ElecTotal = self.BEM[i].building.ElecTotal * self.BEM[i].fl_area
 
-                # Update surface temperature of building surfaces
+            for i in range(len(self.BEM)):
+                # Set the boundary conditions of the building surfaces; their temperatures are updated together with the
+                # ground below
                 # Mass
-                self.BEM[i].mass.Element(0,0,0,0,self.TimeParam.dts,0.,1,self.BEM[i].building.fluxMass,self.BEM[i].building.fluxMass)
+                self.Conduction.Element(self.BEM[i].mass,0,0,0,0,self.TimeParam.dts,0.,1,self.BEM[i].building.fluxMass,
+                                        self.BEM[i].building.fluxMass)
                 # Roof
                 if self.FractionsRoof.fimp > 0:
-                    self.BEM[i].roofImp.Element(self.EBRoof.SWR.SWRabsRoofImp,self.EBRoof.LWR.LWRabsRoofImp,self.EBRoof.LEflux.LEfluxRoofImp,
-                                                self.EBRoof.Hflux.HfluxRoofImp,self.TimeParam.dts,0.,1,None,self.BEM[i].building.fluxRoof)
+                    self.Conduction.Element(self.BEM[i].roofImp,self.EBRoof.SWR.SWRabsRoofImp,
+                                            self.EBRoof.LWR.LWRabsRoofImp,self.EBRoof.LEflux.LEfluxRoofImp,
+                                            self.EBRoof.Hflux.HfluxRoofImp,self.TimeParam.dts,0.,1,None,
+                                            self.BEM[i].building.fluxRoof)
                 if self.FractionsRoof.fveg > 0:
-                    self.BEM[i].roofVeg.Element(self.EBRoof.SWR.SWRabsRoofVeg,self.EBRoof.LWR.LWRabsRoofVeg,self.EBRoof.LEflux.LEfluxRoofVeg,
-                                                self.EBRoof.Hflux.HfluxRoofVeg,self.TimeParam.dts,0.,1,None,self.BEM[i].building.fluxRoof)
+                    self.Conduction.Element(self.BEM[i].roofVeg,self.EBRoof.SWR.SWRabsRoofVeg,
+                                            self.EBRoof.LWR.LWRabsRoofVeg,self.EBRoof.LEflux.LEfluxRoofVeg,
+                                            self.EBRoof.Hflux.HfluxRoofVeg,self.TimeParam.dts,0.,1,None,
+                                            self.BEM[i].building.fluxRoof)
                 # Walls
-                self.BEM[i].wallSun.Element(self.EBCanyon.SWR.SWRabs.SWRabsWallSun,self.EBCanyon.LWR.LWRabs.LWRabsWallSun,
-                                            self.EBCanyon.LEflux.LEfluxWallSun,self.EBCanyon.Hflux.HfluxWallSun,self.TimeParam.dts,
-                                            0.,1,None,self.BEM[i].building.fluxWall)
-                self.BEM[i].wallShade.Element(self.EBCanyon.SWR.SWRabs.SWRabsWallShade,self.EBCanyon.LWR.LWRabs.LWRabsWallShade,
-                                              self.EBCanyon.LEflux.LEfluxWallShade,self.EBCanyon.Hflux.HfluxWallShade,self.TimeParam.dts,
-                                              0.,1,None,self.BEM[i].building.fluxWall)
+                self.Conduction.Element(self.BEM[i].wallSun,self.EBCanyon.SWR.SWRabs.SWRabsWallSun,
+                                        self.EBCanyon.LWR.LWRabs.LWRabsWallSun,self.EBCanyon.LEflux.LEfluxWallSun,
+                                        self.EBCanyon.Hflux.HfluxWallSun,self.TimeParam.dts,0.,1,None,
+                                        self.BEM[i].building.fluxWall)
+                self.Conduction.Element(self.BEM[i].wallShade,self.EBCanyon.SWR.SWRabs.SWRabsWallShade,
+                                        self.EBCanyon.LWR.LWRabs.LWRabsWallShade,self.EBCanyon.LEflux.LEfluxWallShade,
+                                        self.EBCanyon.Hflux.HfluxWallShade,self.TimeParam.dts,0.,1,None,
+                                        self.BEM[i].building.fluxWall)
 
             # -----------------------------------
             # Update outdoor surface temperatures
             # -----------------------------------
             if self.FractionsGround.fimp > 0:
-                self.GroundImp.Element(self.EBCanyon.SWR.SWRabs.SWRabsGroundImp,self.EBCanyon.LWR.LWRabs.LWRabsGroundImp,
-                                       self.EBCanyon.LEflux.LEfluxGroundImp,self.EBCanyon.Hflux.HfluxGroundImp,self.TimeParam.dts,
-                                       self.EBCanyon.Tdepth.TDampGroundImp,2)
+                self.Conduction.Element(self.GroundImp,self.EBCanyon.SWR.SWRabs.SWRabsGroundImp,
+                                        self.EBCanyon.LWR.LWRabs.LWRabsGroundImp,self.EBCanyon.LEflux.LEfluxGroundImp,
+                                        self.EBCanyon.Hflux.HfluxGroundImp,self.TimeParam.dts,
+                                        self.EBCanyon.Tdepth.TDampGroundImp,2)
             if self.FractionsGround.fveg > 0:
-                self.GroundVeg.Element(self.EBCanyon.SWR.SWRabs.SWRabsGroundVeg,self.EBCanyon.LWR.LWRabs.LWRabsGroundVeg,
-                                       self.EBCanyon.LEflux.LEfluxGroundVeg,self.EBCanyon.Hflux.HfluxGroundVeg,self.TimeParam.dts,
-                                       self.EBCanyon.Tdepth.TDampGroundVeg,2)
+                self.Conduction.Element(self.GroundVeg,self.EBCanyon.SWR.SWRabs.SWRabsGroundVeg,
+                                        self.EBCanyon.LWR.LWRabs.LWRabsGroundVeg,self.EBCanyon.LEflux.LEfluxGroundVeg,
+                                        self.EBCanyon.Hflux.HfluxGroundVeg,self.TimeParam.dts,
+                                        self.EBCanyon.Tdepth.TDampGroundVeg,2)
             if self.FractionsGround.fbare > 0:
-                self.GroundBare.Element(self.EBCanyon.SWR.SWRabs.SWRabsGroundBare,self.EBCanyon.LWR.LWRabs.LWRabsGroundBare,
-                                        self.EBCanyon.LEflux.LEfluxGroundBare,self.EBCanyon.Hflux.HfluxGroundBare,self.TimeParam.dts,
+                self.Conduction.Element(self.GroundBare,self.EBCanyon.SWR.SWRabs.SWRabsGroundBare,
+                                        self.EBCanyon.LWR.LWRabs.LWRabsGroundBare,self.EBCanyon.LEflux.LEfluxGroundBare,
+                                        self.EBCanyon.Hflux.HfluxGroundBare,self.TimeParam.dts,
                                         self.EBCanyon.Tdepth.TDampGroundBare,2)
+            # Update the layer temperatures of the building surfaces and the ground [K]
+            self.Conduction.Solve()
 
             #-----------------------
             # Update hydrology model
@@ -714,28 +764,32 @@ class VCWG_Smart(object):
             # Save simulation results in an hourly basis
             if self.is_near_zero(self.simTime.secDay % self.simTime.timePrint) and n < self.N:
 
-                self.EBRoofData[n] = copy.deepcopy(self.EBRoof)
-                self.EBCanyonData[n] = copy.deepcopy(self.EBCanyon)
-                self.EBRuralData[n] = copy.deepcopy(self.EBRural)
-                self.RoofImpData[n] = copy.deepcopy(self.BEM[0].roofImp)
-                self.RoofVegData[n] = copy.deepcopy(self.BEM[0].roofVeg)
-                self.GroundImpData[n] = copy.deepcopy(self.GroundImp)
-                self.GroundVegData[n] = copy.deepcopy(self.GroundVeg)
-                self.GroundBareData[n] = copy.deepcopy(self.GroundBare)
-                self.WallSunData[n] = copy.deepcopy(self.BEM[0].wallSun)
-                self.WallShadeData[n] = copy.deepcopy(self.BEM[0].wallShade)
-                self.RSMData[n] = copy.deepcopy(self.RSM)
-                self.UCMData[n] = copy.deepcopy(self.UCM)
-                self.WBRoofData[n] = copy.deepcopy(self.WBRoof)
-                self.WBCanyonData[n] = copy.deepcopy(self.WBCanyon)
-                self.ForcingData[n] = copy.deepcopy(MeteoData)
-                self.BEMData[n] = copy.deepcopy(self.BEM)
+                self.Recorder.record(n,{'EBRoofData': self.EBRoof, 'EBCanyonData': self.EBCanyon, 'EBRuralData': self.EBRural,
+                                        'RoofImpData': self.BEM[0].roofImp, 'RoofVegData': self.BEM[0].roofVeg,
+                                        'GroundImpData': self.GroundImp, 'GroundVegData': self.GroundVeg,
+                                        'GroundBareData': self.GroundBare, 'WallSunData': self.BEM[0].wallSun,
+                                        'WallShadeData': self.BEM[0].wallShade, 'RSMData': self.RSM, 'UCMData': self.UCM,
+                                        'WBRoofData': self.WBRoof, 'WBCanyonData': self.WBCanyon, 'ForcingData': MeteoData,
+                                        'BEMData': self.BEM, 'RuralData': self.Rural})
                 self.time[n] = self.time_n[it]
-                self.RuralData[n] = copy.deepcopy(self.Rural)
 
                 n += 1
 
-    def write_output(self):
+                if self.TimeParam.StreamOutput == 1 and n - self.nWritten >= self.TimeParam.nFlush:
+                    self.write_timeseries(self.output_dir(),range(self.nWritten,n),"a")
+                    self.nWritten = n
+
+                # Save the simulation state every nCheckpoint records
+                if self.TimeParam.nCheckpoint > 0 and n % self.TimeParam.nCheckpoint == 0:
+                    SaveCheckpoint(os.path.join(self.output_dir(),"Checkpoint" + self.case + self.month_name + "_" + str(n) + ".pkl"),
+                                   {'it': it+1, 'n': n, 'nWritten': self.nWritten, 'model': GetState(self,self.Checkpoint_objects),
+                                    'Tsurf_2back': GetState(Tsurf_2back), 'TGroundImp_2last': TGroundImp_2last,
+                                    'TGroundBare_2last': TGroundBare_2last, 'TGroundVeg_2last': TGroundVeg_2last,
+                                    'TTree_2last': TTree_2last, 'TWallSun_2last': TWallSun_2last,
+                                    'TWallShade_2last': TWallShade_2last, 'TWallIntSun_2last': TWallIntSun_2last,
+                                    'TWallIntShade_2last': TWallIntShade_2last})
+
+    def output_dir(self):
 
         # Create Results directory if it doesn't exist
         if not os.path.exists("Results"):
@@ -745,18 +799,35 @@ class VCWG_Smart(object):
         Output_dir = os.path.join("Results", self.date_str)
         os.makedirs(Output_dir, exist_ok=True)  # Create folder if it doesn't exist, otherwise ignore
 
-        Write_Forcing(self.case,self.ForcingData,self.time,Output_dir, self.month_name)
+        return Output_dir
 
-        Write_EB(self.case,self.FractionsRoof, self.FractionsGround, self.ParTree, self.RSMParam, self.EBRoofData,self.EBCanyonData,self.EBRuralData,self.UCMData,self.time,Output_dir, self.month_name)
+    def write_timeseries(self,Output_dir,rows=None,mode="w"):
+
+        # Write the time series output files; rows is the range of records to write (all records by default) and
+        # mode is "w" to create the files with their headers or "a" to append to them
+        Write_Forcing(self.case,self.ForcingData,self.time,Output_dir, self.month_name, rows, mode)
+
+        Write_EB(self.case,self.FractionsRoof, self.FractionsGround, self.ParTree, self.RSMParam, self.EBRoofData,self.EBCanyonData,self.EBRuralData,self.UCMData,self.time,Output_dir, self.month_name, rows, mode)
 
         Write_Tsurf(self.case, self.FractionsRoof, self.FractionsGround, self.ParTree,self.RoofImpData,self.RoofVegData,self.GroundImpData,self.GroundBareData,self.GroundVegData,self.WallSunData,
                     self.WallShadeData,self.EBCanyonData,self.RuralData,self.RuralGroundImpData,self.RuralGroundBareData,self.RuralGroundVegData,
-                    self.RSMParam,self.time,Output_dir, self.month_name)
+                    self.RSMParam,self.time,Output_dir, self.month_name, rows, mode)
 
-        Write_WB(self.case,self.FractionsRoof, self.FractionsGround, self.ParTree,self.WBRoofData,self.WBCanyonData,self.time, Output_dir, self.month_name)
+        Write_WB(self.case,self.FractionsRoof, self.FractionsGround, self.ParTree,self.WBRoofData,self.WBCanyonData,self.time, Output_dir, self.month_name, rows, mode)
 
-        Write_BEM(self.BEMData,self.time,self.case,Output_dir, self.month_name)
+        Write_BEM(self.BEMData,self.time,self.case,Output_dir, self.month_name, rows, mode)
 
+    def write_output(self):
+
+        Output_dir = self.output_dir()
+
+        if self.TimeParam.StreamOutput == 1:
+            # Time series files were created at the start of the simulation; append the records not written yet
+            self.write_timeseries(Output_dir,range(self.nWritten,self.N),"a")
+        else:
+            self.write_timeseries(Output_dir)
+
+        # Profile files have one column per record and are written at the end of the simulation
         # Generate output text file for deep ground temperature profiles in the urban area
         # SurfType = 1 (GroundImp), 2 (GroundVeg), 3 (GroundBare)
         Write_TdeepProfiles("Tdeep_imp",self.FractionsGround,1,self.GroundImpData,self.GroundImpData[0].z_depth[1:],self.time,self.case,Output_dir, self.month_name)
@@ -789,12 +860,17 @@ class VCWG_Smart(object):
         # Generate output text file for P profile in rural area
         Write_Ruralprofiles("P_rural",self.RSMParam.Rural_Model_name,self.RSMData,'presProf',self.RSMData[0].z,self.time,self.case,Output_dir, self.month_name)
 
-    def run(self):
+        # Binary output of all recorded fields; written after the text files so that it includes their NaN masks
+        if self.TimeParam.BinaryOutput == 1:
+            Write_NPZ(self.Recorder,self.time,self.case,Output_dir, self.month_name)
+
+    def run(self,checkpointFileName=None):
 
+        # checkpointFileName: checkpoint written by a previous run to restart from (None to start from the initial state)
         self.read_input()
         self.read_epw()
         self.instantiate_input()
         self.CheckInputs()
-        self.Simulate()
+        self.Simulate(checkpointFileName)
         self.write_output()
 
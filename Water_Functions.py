@@ -271,6 +271,7 @@ class Water_Calculations(object):
         Qlat_in_local = [Qlat_in_local[i]/dts for i in range(0,len(Qlat_in_local))]
 
         # Solving Richards equation and calculating the change in water volume
+        # The Jacobian is tri-diagonal as the water flux only connects neighbouring layers
         # Initial value for water volume in each layer [mm]
         V0 = [(Otm1[i] - Ohy[i])*dz[i] for i in range(0,len(dz))]
         T_SPAN = [0,dts]
@@ -278,7 +279,8 @@ class Water_Calculations(object):
         # Water content in each soil layer [mm]. V never includes the residual water content Ohy
         Vout = odeint(SoilCal.Soil_Moistures_Rich_Comp,V0,T_SPAN,args=(Lk,f,E_soil_dis,TE_dis_H,TE_dis_L,Qlat_in_local,Slo_pot,
                                                                        ISeep,SPAR,Osat,Ohy,O33,dz,Ks_Zs,Dz,ms,L,Pe,aR,aTop,
-                                                                       alpVG,nVG,Zs,1,0,0))
+                                                                       alpVG,nVG,Zs,1,0,0),
+                     Dfun=SoilCal.Soil_Moistures_Rich_Comp_Jacobian,ml=1,mu=1)
         V = [Vout[-1,iV] for iV in range(len(V0))]
         if numpy.isnan(sum(V)):
             print('NaN values in the Volumes')
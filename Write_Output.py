@@ -1,5 +1,6 @@
 import numpy
 import os
+import json
 
 """
 Write output
@@ -9,35 +10,67 @@ Originally developed by Naika Meili
 Last update: February 2021
 """
 
-def Write_Forcing(case,ForcingData,time,Output_dir, month_name):
+# Fields needed by each writer. Keys are the record names passed to the writers and values are attribute paths of the
+# recorded model objects; a path to an object covers all numeric attributes below it (see OutputRecorder)
+Forcing_fields = {'ForcingData': ['Tatm','Uatm','rel_hum','q_atm','Pre','Rain']}
+
+EB_fields = {'EBRoofData': ['SWR','LWR','Hflux','LEflux','Gflux','Eflux'],
+             'EBCanyonData': ['SWR','LWR','Hflux','LEflux','Gflux','Eflux'],
+             'EBRuralData': ['EnergyFlux'],
+             'UCMData': ['UrbanFlux_H','UrbanFlux_LE']}
+
+Tsurf_fields = {'RoofImpData': ['Text'], 'RoofVegData': ['Text'], 'GroundImpData': ['Text'], 'GroundBareData': ['Text'],
+                'GroundVegData': ['Text'], 'WallSunData': ['Text'], 'WallShadeData': ['Text'], 'EBCanyonData': ['Ttree'],
+                'RuralData': ['Text']}
+
+WB_fields = {'WBRoofData': ['Anthp','Leakage','Runoff','RunoffRoofTot','RunonRoofTot','dInt_dt','dVRoofSoil_dt','fRoofVeg'],
+             'WBCanyonData': ['Anth_gbare','Anth_gveg','EfluxCanyon','Egimp_soil1','Egveg_Soil1','Infiltration','Leakage',
+                              'RainGround','Rd','Runoff','Runon','SoilPotW','TE','WBIndv','WaterStorageCanyon','dInt_dt',
+                              'dVwater_dt']}
+
+TdeepProfiles_fields = {'GroundImpData': ['layerTemp','z_depth'], 'GroundVegData': ['layerTemp','z_depth'],
+                        'GroundBareData': ['layerTemp','z_depth']}
+
+Profiles1D_fields = {'UCMData': ['VerticalProfUrban.qn','VerticalProfUrban.tke','VerticalProfUrban.th','VerticalProfUrban.vx',
+                                 'VerticalProfUrban.vy','VerticalProfUrban.s','VerticalProfUrban.LEflux','VerticalProfUrban.Hflux']}
+
+Ruralprofiles_fields = {'RSMData': ['T_rural','q_rural','presProf','z']}
+
+def _rows(time,rows):
+    # Records written by a time series writer; all records unless a range is given (streamed output)
+    return range(len(time)) if rows is None else rows
+
+def Write_Forcing(case,ForcingData,time,Output_dir, month_name, rows=None, mode="w"):
 
     timeseriesFilename = os.path.join(Output_dir,"Forcing" + case + month_name + ".txt")
-    outputFile_Forcing = open(timeseriesFilename, "w")
-    outputFile_Forcing.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_Forcing.write("# Forcing parameters near surface or top of the domain based on user's choice \n")
-    outputFile_Forcing.write("# 0:time [hr] 1:T [K] 2:S [m s^-1] 3:RH [-] 4:q [kg kg^-1] 5:Pressure [Pa] 6:Rain [mm s^-1] \n")
-    for i in range(len(time)):
+    outputFile_Forcing = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_Forcing.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_Forcing.write("# Forcing parameters near surface or top of the domain based on user's choice \n")
+        outputFile_Forcing.write("# 0:time [hr] 1:T [K] 2:S [m s^-1] 3:RH [-] 4:q [kg kg^-1] 5:Pressure [Pa] 6:Rain [mm s^-1] \n")
+    for i in _rows(time,rows):
         outputFile_Forcing.write("%i %f %f %f %f %f %f \n"
                                  % (i, ForcingData[i].Tatm, ForcingData[i].Uatm,ForcingData[i].rel_hum,
                                     ForcingData[i].q_atm, ForcingData[i].Pre,ForcingData[i].Rain))
     outputFile_Forcing.close()
 
-def Write_EB(case,FractionsRoof,FractionsGround,ParTree,RSMParam, EBRoofData,EBCanyonData,EBRuralData,UCMData,time,Output_dir, month_name):
+def Write_EB(case,FractionsRoof,FractionsGround,ParTree,RSMParam, EBRoofData,EBCanyonData,EBRuralData,UCMData,time,Output_dir, month_name, rows=None, mode="w"):
 
     timeseriesFilename = os.path.join(Output_dir,"SWR"+case+  month_name +".txt")
-    outputFile_SWR = open(timeseriesFilename, "w")
-    outputFile_SWR.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_SWR.write("# Shortwave radiative fluxes at the surfaces \n")
-    outputFile_SWR.write("# 0:time [hr] 1:SWRabsRoofImp [W m^-2] 2:SWRabsRoofVeg [W m^-2] 3:SWRabsTotalRoof [W m^-2] 4:SWRabsGroundImp [W m^-2] "
-                         "5:SWRabsGroundBare [W m^-2] 6:SWRabsGroundVeg [W m^-2] 7:SWRabsTree [W m^-2] 8:SWRabsWallSun [W m^-2] "
-                         "9:SWRabsWallShade [W m^-2] 10:SWRabsTotalGround [W m^-2] 11:SWRabsTotalCanyon [W m^-2] 12:SWRabsTotalUrban [W m^-2] "
-                         "13:SWRinRoofImp [W m^-2] 14:SWRinRoofVeg [W m^-2] 15:SWRinTotalRoof [W m^-2] 16:SWRinGroundImp [W m^-2] 17:SWRinGroundBare [W m^-2] "
-                         "18:SWRinGroundVeg [W m^-2] 19:SWRinTree [W m^-2] 20:SWRinWallSun [W m^-2] 21:SWRinWallShade [W m^-2] 22:SWRinTotalGround [W m^-2] "
-                         "23:SWRinTotalCanyon [W m^-2] 24:SWRinTotalUrban [W m^-2] 25:SWRoutRoofImp [W m^-2] 26:SWRoutRoofVeg [W m^-2] 27:SWRoutTotalRoof [W m^-2] "
-                         "28:SWRoutGroundImp [W m^-2] 29:SWRoutGroundBare [W m^-2] 30:SWRoutGroundVeg [W m^-2] 31:SWRoutTree [W m^-2] 32:SWRoutWallSun [W m^-2] "
-                         "33:SWRoutWallShade [W m^-2] 34:SWRoutTotalGround [W m^-2] 35:SWRoutTotalCanyon [W m^-2] 36:SWRoutTotalUrban [W m^-2] "
-                         "37:SWRinRural [W m^-2] 38:SWRoutRural [W m^-2] 39:SWRabsRural [W m^-2] \n")
-    for i in range(len(time)):
+    outputFile_SWR = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_SWR.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_SWR.write("# Shortwave radiative fluxes at the surfaces \n")
+        outputFile_SWR.write("# 0:time [hr] 1:SWRabsRoofImp [W m^-2] 2:SWRabsRoofVeg [W m^-2] 3:SWRabsTotalRoof [W m^-2] 4:SWRabsGroundImp [W m^-2] "
+                             "5:SWRabsGroundBare [W m^-2] 6:SWRabsGroundVeg [W m^-2] 7:SWRabsTree [W m^-2] 8:SWRabsWallSun [W m^-2] "
+                             "9:SWRabsWallShade [W m^-2] 10:SWRabsTotalGround [W m^-2] 11:SWRabsTotalCanyon [W m^-2] 12:SWRabsTotalUrban [W m^-2] "
+                             "13:SWRinRoofImp [W m^-2] 14:SWRinRoofVeg [W m^-2] 15:SWRinTotalRoof [W m^-2] 16:SWRinGroundImp [W m^-2] 17:SWRinGroundBare [W m^-2] "
+                             "18:SWRinGroundVeg [W m^-2] 19:SWRinTree [W m^-2] 20:SWRinWallSun [W m^-2] 21:SWRinWallShade [W m^-2] 22:SWRinTotalGround [W m^-2] "
+                             "23:SWRinTotalCanyon [W m^-2] 24:SWRinTotalUrban [W m^-2] 25:SWRoutRoofImp [W m^-2] 26:SWRoutRoofVeg [W m^-2] 27:SWRoutTotalRoof [W m^-2] "
+                             "28:SWRoutGroundImp [W m^-2] 29:SWRoutGroundBare [W m^-2] 30:SWRoutGroundVeg [W m^-2] 31:SWRoutTree [W m^-2] 32:SWRoutWallSun [W m^-2] "
+                             "33:SWRoutWallShade [W m^-2] 34:SWRoutTotalGround [W m^-2] 35:SWRoutTotalCanyon [W m^-2] 36:SWRoutTotalUrban [W m^-2] "
+                             "37:SWRinRural [W m^-2] 38:SWRoutRural [W m^-2] 39:SWRabsRural [W m^-2] \n")
+    for i in _rows(time,rows):
 
         #Write NaN if an urban feature is non-existent
         if not int(FractionsRoof.fimp > 0) == 1:
@@ -91,19 +124,20 @@ def Write_EB(case,FractionsRoof,FractionsGround,ParTree,RSMParam, EBRoofData,EBC
 
 
     timeseriesFilename = os.path.join(Output_dir,"LWR"+case+month_name+".txt")
-    outputFile_LWR = open(timeseriesFilename, "w")
-    outputFile_LWR.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_LWR.write("# Longwave radiative fluxes at the surfaces \n")
-    outputFile_LWR.write("# 0:time [hr] 1:LWRabsRoofImp [W m^-2] 2:LWRabsRoofVeg [W m^-2] 3:LWRabsTotalRoof [W m^-2] 4:LWRabsGroundImp [W m^-2] "
-                         "5:LWRabsGroundBare [W m^-2] 6:LWRabsGroundVeg [W m^-2] 7:LWRabsTree [W m^-2] 8:LWRabsWallSun [W m^-2] "
-                         "9:LWRabsWallShade [W m^-2] 10:LWRabsTotalGround [W m^-2] 11:LWRabsTotalCanyon [W m^-2] 12:LWRabsTotalUrban [W m^-2] "
-                         "13:LWRinRoofImp [W m^-2] 14:LWRinRoofVeg [W m^-2] 15:LWRinTotalRoof [W m^-2] 16:LWRinGroundImp [W m^-2] 17:LWRinGroundBare [W m^-2] "
-                         "18:LWRinGroundVeg [W m^-2] 19:LWRinTree [W m^-2] 20:LWRinWallSun [W m^-2] 21:LWRinWallShade [W m^-2] 22:LWRinTotalGround [W m^-2] "
-                         "23:LWRinTotalCanyon [W m^-2] 24:LWRinTotalUrban [W m^-2] 25:LWRoutRoofImp [W m^-2] 26:LWRoutRoofVeg [W m^-2] 27:LWRoutTotalRoof [W m^-2] "
-                         "28:LWRoutGroundImp [W m^-2] 29:LWRoutGroundBare [W m^-2] 30:LWRoutGroundVeg [W m^-2] 31:LWRoutTree [W m^-2] 32:LWRoutWallSun [W m^-2] "
-                         "33:LWRoutWallShade [W m^-2] 34:LWRoutTotalGround [W m^-2] 35:LWRoutTotalCanyon [W m^-2] 36:LWRoutTotalUrban [W m^-2] "
-                         "37:LWRinRural [W m^-2] 38:LWRoutRural [W m^-2] 39:LWRabsRural [W m^-2] \n")
-    for i in range(len(time)):
+    outputFile_LWR = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_LWR.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_LWR.write("# Longwave radiative fluxes at the surfaces \n")
+        outputFile_LWR.write("# 0:time [hr] 1:LWRabsRoofImp [W m^-2] 2:LWRabsRoofVeg [W m^-2] 3:LWRabsTotalRoof [W m^-2] 4:LWRabsGroundImp [W m^-2] "
+                             "5:LWRabsGroundBare [W m^-2] 6:LWRabsGroundVeg [W m^-2] 7:LWRabsTree [W m^-2] 8:LWRabsWallSun [W m^-2] "
+                             "9:LWRabsWallShade [W m^-2] 10:LWRabsTotalGround [W m^-2] 11:LWRabsTotalCanyon [W m^-2] 12:LWRabsTotalUrban [W m^-2] "
+                             "13:LWRinRoofImp [W m^-2] 14:LWRinRoofVeg [W m^-2] 15:LWRinTotalRoof [W m^-2] 16:LWRinGroundImp [W m^-2] 17:LWRinGroundBare [W m^-2] "
+                             "18:LWRinGroundVeg [W m^-2] 19:LWRinTree [W m^-2] 20:LWRinWallSun [W m^-2] 21:LWRinWallShade [W m^-2] 22:LWRinTotalGround [W m^-2] "
+                             "23:LWRinTotalCanyon [W m^-2] 24:LWRinTotalUrban [W m^-2] 25:LWRoutRoofImp [W m^-2] 26:LWRoutRoofVeg [W m^-2] 27:LWRoutTotalRoof [W m^-2] "
+                             "28:LWRoutGroundImp [W m^-2] 29:LWRoutGroundBare [W m^-2] 30:LWRoutGroundVeg [W m^-2] 31:LWRoutTree [W m^-2] 32:LWRoutWallSun [W m^-2] "
+                             "33:LWRoutWallShade [W m^-2] 34:LWRoutTotalGround [W m^-2] 35:LWRoutTotalCanyon [W m^-2] 36:LWRoutTotalUrban [W m^-2] "
+                             "37:LWRinRural [W m^-2] 38:LWRoutRural [W m^-2] 39:LWRabsRural [W m^-2] \n")
+    for i in _rows(time,rows):
 
         #Write NaN if an urban feature is non-existent
         if not int(FractionsRoof.fimp > 0) == 1:
@@ -156,14 +190,15 @@ def Write_EB(case,FractionsRoof,FractionsGround,ParTree,RSMParam, EBRoofData,EBC
     outputFile_LWR.close()
 
     timeseriesFilename = os.path.join(Output_dir,"Hfluxes"+case+month_name+".txt")
-    outputFile_Hflux = open(timeseriesFilename, "w")
-    outputFile_Hflux.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_Hflux.write("# Sensible heat fluxes at the surfaces \n")
-    outputFile_Hflux.write("# 0:time [hr] 1:HfluxRoofImp [W m^-2] 2:HfluxRoofVeg [W m^-2] 3:HfluxRoof [W m^-2] 4:HfluxGroundImp [W m^-2] "
-                           "5:HfluxGroundBare [W m^-2] 6:HfluxGroundVeg [W m^-2] 7:HfluxGround [W m^-2] 8:HfluxTree [W m^-2] "
-                           "9:HfluxWallSun [W m^-2] 10:HfluxWallShade [W m^-2] 11:HfluxCanyon [W m^-2] 12:HfluxRural [W m^-2] "
-                           "13:HfluxUrban [W m^-2] \n")
-    for i in range(len(time)):
+    outputFile_Hflux = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_Hflux.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_Hflux.write("# Sensible heat fluxes at the surfaces \n")
+        outputFile_Hflux.write("# 0:time [hr] 1:HfluxRoofImp [W m^-2] 2:HfluxRoofVeg [W m^-2] 3:HfluxRoof [W m^-2] 4:HfluxGroundImp [W m^-2] "
+                               "5:HfluxGroundBare [W m^-2] 6:HfluxGroundVeg [W m^-2] 7:HfluxGround [W m^-2] 8:HfluxTree [W m^-2] "
+                               "9:HfluxWallSun [W m^-2] 10:HfluxWallShade [W m^-2] 11:HfluxCanyon [W m^-2] 12:HfluxRural [W m^-2] "
+                               "13:HfluxUrban [W m^-2] \n")
+    for i in _rows(time,rows):
 
         #Write NaN if an urban feature is non-existent
         if not int(FractionsRoof.fimp > 0) == 1:
@@ -190,17 +225,18 @@ def Write_EB(case,FractionsRoof,FractionsGround,ParTree,RSMParam, EBRoofData,EBC
     outputFile_Hflux.close()
 
     timeseriesFilename = os.path.join(Output_dir,"LEfluxes"+case+month_name+".txt")
-    outputFile_LEfluxes = open(timeseriesFilename, "w")
-    outputFile_LEfluxes.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_LEfluxes.write("# Latent heat fluxes at the surfaces \n")
-    outputFile_LEfluxes.write("# 0:time [hr] 1:LEfluxRoofImp [W m^-2] 2:LEfluxRoofVegInt [W m^-2] 3:LEfluxRoofVegPond [W m^-2] 4:LEfluxRoofVegSoil [W m^-2] "
-                              "5:LTEfluxRoofVeg [W m^-2] 6:LEfluxRoofVeg [W m^-2] 7:LEfluxRoof [W m^-2] 8:LEfluxGroundImp [W m^-2] "
-                              "9:LEfluxGroundBarePond [W m^-2] 10:LEfluxGroundBareSoil [W m^-2] 11:LEfluxGroundBare 12:LEfluxGroundVegInt "
-                              "13:LEfluxGroundVegPond [W m^-2] 14:LEfluxGroundVegSoil [W m^-2] 15:LTEfluxGroundVeg [W m^-2] "
-                              "16:LEfluxGroundVeg [W m^-2] 17:LEfluxGround [W m^-2] 18:LEfluxTreeInt [W m^-2] 19:LTEfluxTree [W m^-2] "
-                              "20:LEfluxTree [W m^-2] 21:LEfluxWallSun [W m^-2] 22:LEfluxWallShade [W m^-2] 23:LEfluxCanyon [W m^-2] "
-                              "24:LEfluxRural [W m^-2] 25:LEfluxUrban [W m^-2] \n")
-    for i in range(len(time)):
+    outputFile_LEfluxes = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_LEfluxes.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_LEfluxes.write("# Latent heat fluxes at the surfaces \n")
+        outputFile_LEfluxes.write("# 0:time [hr] 1:LEfluxRoofImp [W m^-2] 2:LEfluxRoofVegInt [W m^-2] 3:LEfluxRoofVegPond [W m^-2] 4:LEfluxRoofVegSoil [W m^-2] "
+                                  "5:LTEfluxRoofVeg [W m^-2] 6:LEfluxRoofVeg [W m^-2] 7:LEfluxRoof [W m^-2] 8:LEfluxGroundImp [W m^-2] "
+                                  "9:LEfluxGroundBarePond [W m^-2] 10:LEfluxGroundBareSoil [W m^-2] 11:LEfluxGroundBare 12:LEfluxGroundVegInt "
+                                  "13:LEfluxGroundVegPond [W m^-2] 14:LEfluxGroundVegSoil [W m^-2] 15:LTEfluxGroundVeg [W m^-2] "
+                                  "16:LEfluxGroundVeg [W m^-2] 17:LEfluxGround [W m^-2] 18:LEfluxTreeInt [W m^-2] 19:LTEfluxTree [W m^-2] "
+                                  "20:LEfluxTree [W m^-2] 21:LEfluxWallSun [W m^-2] 22:LEfluxWallShade [W m^-2] 23:LEfluxCanyon [W m^-2] "
+                                  "24:LEfluxRural [W m^-2] 25:LEfluxUrban [W m^-2] \n")
+    for i in _rows(time,rows):
 
         #Write NaN if an urban feature is non-existent
         if not int(FractionsRoof.fimp > 0) == 1:
@@ -245,13 +281,14 @@ def Write_EB(case,FractionsRoof,FractionsGround,ParTree,RSMParam, EBRoofData,EBC
     outputFile_LEfluxes.close()
 
     timeseriesFilename = os.path.join(Output_dir,"Gfluxes"+case+month_name+".txt")
-    outputFile_Gfluxes = open(timeseriesFilename, "w")
-    outputFile_Gfluxes.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_Gfluxes.write("# Conductive heat fluxes at the surfaces \n")
-    outputFile_Gfluxes.write("# 0:time [hr] 1:GfluxRoofImp [W m^-2] 2:GfluxRoofVeg [W m^-2] 3:GfluxRoof [W m^-2] 4:GfluxGroundImp [W m^-2] "
-                             "5:GfluxGroundBare [W m^-2] 6:GfluxGroundVeg [W m^-2] 7:GfluxGround [W m^-2] 8:GfluxWallSun [W m^-2] "
-                             "9:GfluxWallShade [W m^-2] 10:GfluxRural [W m^-2] \n")
-    for i in range(len(time)):
+    outputFile_Gfluxes = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_Gfluxes.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_Gfluxes.write("# Conductive heat fluxes at the surfaces \n")
+        outputFile_Gfluxes.write("# 0:time [hr] 1:GfluxRoofImp [W m^-2] 2:GfluxRoofVeg [W m^-2] 3:GfluxRoof [W m^-2] 4:GfluxGroundImp [W m^-2] "
+                                 "5:GfluxGroundBare [W m^-2] 6:GfluxGroundVeg [W m^-2] 7:GfluxGround [W m^-2] 8:GfluxWallSun [W m^-2] "
+                                 "9:GfluxWallShade [W m^-2] 10:GfluxRural [W m^-2] \n")
+    for i in _rows(time,rows):
 
         #Write NaN if an urban feature is non-existent
         if not int(FractionsRoof.fimp > 0) == 1:
@@ -275,16 +312,17 @@ def Write_EB(case,FractionsRoof,FractionsGround,ParTree,RSMParam, EBRoofData,EBC
     outputFile_Gfluxes.close()
 
     timeseriesFilename = os.path.join(Output_dir,"Efluxes"+case+month_name+".txt")
-    outputFile_Efluxes = open(timeseriesFilename, "w")
-    outputFile_Efluxes.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_Efluxes.write("# Evaporative fluxes at the surfaces \n")
-    outputFile_Efluxes.write("# 0:time [hr] 1:EfluxRoofImp [kg m^-2 s^-1] 2:LEfluxRoofVegInt [kg m^-2 s^-1] 3:EfluxRoofVegPond [kg m^-2 s^-1] 4:EfluxRoofVegSoil [kg m^-2 s^-1] "
-                             "5:TEfluxRoofVeg [kg m^-2 s^-1] 6:EfluxRoofVeg [kg m^-2 s^-1] 7:EfluxRoof [kg m^-2 s^-1] 8:EfluxGroundImp [kg m^-2 s^-1]"
-                             "9:EfluxGroundBarePond [kg m^-2 s^-1] 10:EfluxGroundBareSoil [kg m^-2 s^-1] 11:EfluxGroundBare [kg m^-2 s^-1] 12:EfluxGroundVegInt [kg m^-2 s^-1] "
-                             "13:EfluxGroundVegPond [kg m^-2 s^-1] 14:EfluxGroundVegSoil [kg m^-2 s^-1] 15:TEfluxGroundVeg [kg m^-2 s^-1] "
-                             "16:EfluxGroundVeg [kg m^-2 s^-1] 17:EfluxGround [kg m^-2 s^-1] 18:EfluxTreeInt [kg m^-2 s^-1] 19:TEfluxTree [kg m^-2 s^-1] "
-                             "20:EfluxTree [kg m^-2 s^-1] 21:EfluxWallSun [kg m^-2 s^-1] 22:EfluxWallShade [kg m^-2 s^-1] \n")
-    for i in range(len(time)):
+    outputFile_Efluxes = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_Efluxes.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_Efluxes.write("# Evaporative fluxes at the surfaces \n")
+        outputFile_Efluxes.write("# 0:time [hr] 1:EfluxRoofImp [kg m^-2 s^-1] 2:LEfluxRoofVegInt [kg m^-2 s^-1] 3:EfluxRoofVegPond [kg m^-2 s^-1] 4:EfluxRoofVegSoil [kg m^-2 s^-1] "
+                                 "5:TEfluxRoofVeg [kg m^-2 s^-1] 6:EfluxRoofVeg [kg m^-2 s^-1] 7:EfluxRoof [kg m^-2 s^-1] 8:EfluxGroundImp [kg m^-2 s^-1]"
+                                 "9:EfluxGroundBarePond [kg m^-2 s^-1] 10:EfluxGroundBareSoil [kg m^-2 s^-1] 11:EfluxGroundBare [kg m^-2 s^-1] 12:EfluxGroundVegInt [kg m^-2 s^-1] "
+                                 "13:EfluxGroundVegPond [kg m^-2 s^-1] 14:EfluxGroundVegSoil [kg m^-2 s^-1] 15:TEfluxGroundVeg [kg m^-2 s^-1] "
+                                 "16:EfluxGroundVeg [kg m^-2 s^-1] 17:EfluxGround [kg m^-2 s^-1] 18:EfluxTreeInt [kg m^-2 s^-1] 19:TEfluxTree [kg m^-2 s^-1] "
+                                 "20:EfluxTree [kg m^-2 s^-1] 21:EfluxWallSun [kg m^-2 s^-1] 22:EfluxWallShade [kg m^-2 s^-1] \n")
+    for i in _rows(time,rows):
 
         #Write NaN if an urban feature is non-existent
         if not int(FractionsRoof.fimp > 0) == 1:
@@ -324,24 +362,25 @@ def Write_EB(case,FractionsRoof,FractionsGround,ParTree,RSMParam, EBRoofData,EBC
     outputFile_Efluxes.close()
 
 def Write_Tsurf(case,FractionsRoof,FractionsGround,ParTree,RoofImpData,RoofVegData,GroundImpData,GroundBareData,GroundVegData,WallSunData,WallShadeData,EBCanyonData,
-                RuralData,RuralGroundImpData,RuralGroundBareData,RuralGroundVegData,RSMParam,time,Output_dir, month_name):
+                RuralData,RuralGroundImpData,RuralGroundBareData,RuralGroundVegData,RSMParam,time,Output_dir, month_name, rows=None, mode="w"):
     if RSMParam.Rural_Model_name == 'Forcing_extFile':
-        TextRural = [0 for i in range(len(RuralGroundVegData))]
+        TextRural = {i: 0 for i in _rows(time,rows)}
     else:
         if RuralData[0] is not None:
-            TextRural = [RuralData[i].Text for i in range(len(RuralData))]
+            TextRural = {i: RuralData[i].Text for i in _rows(time,rows)}
         else:
-            TextRural = [RSMParam.fimp*RuralGroundImpData[i].Text+RSMParam.fbare*RuralGroundBareData[i].Text+
-                         RSMParam.fveg*RuralGroundVegData[i].Text for i in range(len(RuralGroundVegData))]
+            TextRural = {i: RSMParam.fimp*RuralGroundImpData[i].Text+RSMParam.fbare*RuralGroundBareData[i].Text+
+                         RSMParam.fveg*RuralGroundVegData[i].Text for i in _rows(time,rows)}
 
     timeseriesFilename = os.path.join(Output_dir,"Tsurf" + case +  month_name + ".txt")
-    outputFile_Tsurf = open(timeseriesFilename, "w")
-    outputFile_Tsurf.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_Tsurf.write("# Temperature at the surfaces \n")
-    outputFile_Tsurf.write(
-        "# 0:time [hr] 1:TRoofImp [K] 2:TRoofVeg [K] 3:TGroundImp [K] 4:TGroundBare [K] 5:TGroundVeg [K] "
-        "6:TWallSun [K] 7:TWallShade [K] 8:TTree [K] 9:TRural [K]\n")
-    for i in range(len(time)):
+    outputFile_Tsurf = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_Tsurf.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_Tsurf.write("# Temperature at the surfaces \n")
+        outputFile_Tsurf.write(
+            "# 0:time [hr] 1:TRoofImp [K] 2:TRoofVeg [K] 3:TGroundImp [K] 4:TGroundBare [K] 5:TGroundVeg [K] "
+            "6:TWallSun [K] 7:TWallShade [K] 8:TTree [K] 9:TRural [K]\n")
+    for i in _rows(time,rows):
 
         #Write NaN if an urban feature is non-existent
         if not int(FractionsRoof.fimp > 0) == 1:
@@ -365,17 +404,18 @@ def Write_Tsurf(case,FractionsRoof,FractionsGround,ParTree,RoofImpData,RoofVegDa
                                   TextRural[i]))
     outputFile_Tsurf.close()
 
-def Write_WB(case,FractionsRoof,FractionsGround,ParTree, WBRoofData,WBCanyonData,time,Output_dir, month_name):
+def Write_WB(case,FractionsRoof,FractionsGround,ParTree, WBRoofData,WBCanyonData,time,Output_dir, month_name, rows=None, mode="w"):
 
     # Generate output text file for leakage
     timeseriesFilename = os.path.join(Output_dir,"Leakage" + case +  month_name + ".txt")
-    outputFile_Lk = open(timeseriesFilename, "w")
-    outputFile_Lk.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_Lk.write("# Water leakage from roof and ground \n")
-    outputFile_Lk.write(
-        "# 0:time [hr] 1:LkRoofImp [mm s^-1] 2:LkRoofVeg [mm s^-1] 3:LkRoof [mm s^-1] 4:LkGroundImp [mm s^-1] 5:LkGroundBare [mm s^-1] "
-        "6:LkGroundVeg [mm s^-1] 7:LkGround [mm s^-1] \n")
-    for i in range(len(time)):
+    outputFile_Lk = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_Lk.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_Lk.write("# Water leakage from roof and ground \n")
+        outputFile_Lk.write(
+            "# 0:time [hr] 1:LkRoofImp [mm s^-1] 2:LkRoofVeg [mm s^-1] 3:LkRoof [mm s^-1] 4:LkGroundImp [mm s^-1] 5:LkGroundBare [mm s^-1] "
+            "6:LkGroundVeg [mm s^-1] 7:LkGround [mm s^-1] \n")
+    for i in _rows(time,rows):
 
         #Write NaN if an urban feature is non-existent
         if not int(FractionsRoof.fimp > 0) == 1:
@@ -397,14 +437,15 @@ def Write_WB(case,FractionsRoof,FractionsGround,ParTree, WBRoofData,WBCanyonData
 
     # Generate output text file for dInt_dt
     timeseriesFilename = os.path.join(Output_dir,"InterceptionChange" + case +month_name+ ".txt")
-    outputFile_dInt = open(timeseriesFilename, "w")
-    outputFile_dInt.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_dInt.write("# Change in water interception at roof and ground \n")
-    outputFile_dInt.write(
-        "# 0:time [hr] 1:dInt_dtRoofImp [mm s^-1] 2:dInt_dtRoofVegPlant [mm s^-1] 3:dInt_dtRoofVegGround [mm s^-1]"
-        " 4:dInt_dtRooftot [mm s^-1] 5:dInt_dtGroundImp [mm s^-1] 6:dInt_dtGroundBare [mm s^-1] 7:dInt_dtGroundVegPlant [mm s^-1] "
-        "8:dInt_dtGroundVegGround [mm s^-1] 9:dInt_dtTree [mm s^-1] \n")
-    for i in range(len(time)):
+    outputFile_dInt = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_dInt.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_dInt.write("# Change in water interception at roof and ground \n")
+        outputFile_dInt.write(
+            "# 0:time [hr] 1:dInt_dtRoofImp [mm s^-1] 2:dInt_dtRoofVegPlant [mm s^-1] 3:dInt_dtRoofVegGround [mm s^-1]"
+            " 4:dInt_dtRooftot [mm s^-1] 5:dInt_dtGroundImp [mm s^-1] 6:dInt_dtGroundBare [mm s^-1] 7:dInt_dtGroundVegPlant [mm s^-1] "
+            "8:dInt_dtGroundVegGround [mm s^-1] 9:dInt_dtTree [mm s^-1] \n")
+    for i in _rows(time,rows):
 
         # Write NaN if an urban feature is non-existent
         if not int(FractionsRoof.fimp > 0) == 1:
@@ -432,12 +473,13 @@ def Write_WB(case,FractionsRoof,FractionsGround,ParTree, WBRoofData,WBCanyonData
 
     # Generate output text file for Infiltration
     timeseriesFilename = os.path.join(Output_dir,"Infiltration" + case +month_name+ ".txt")
-    outputFile_Inf = open(timeseriesFilename, "w")
-    outputFile_Inf.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_Inf.write("# Infiltration at roof and ground \n")
-    outputFile_Inf.write(
-        "# 0:time [hr] 1:fRoofVeg [mm s^-1] 2:fGroundBare [mm s^-1] 3:fGroundVeg [mm s^-1] 4:fGroundImp [mm s^-1] \n")
-    for i in range(len(time)):
+    outputFile_Inf = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_Inf.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_Inf.write("# Infiltration at roof and ground \n")
+        outputFile_Inf.write(
+            "# 0:time [hr] 1:fRoofVeg [mm s^-1] 2:fGroundBare [mm s^-1] 3:fGroundVeg [mm s^-1] 4:fGroundImp [mm s^-1] \n")
+    for i in _rows(time,rows):
 
         # Write NaN if an urban feature is non-existent
         if not int(FractionsRoof.fveg > 0) == 1:
@@ -458,14 +500,15 @@ def Write_WB(case,FractionsRoof,FractionsGround,ParTree, WBRoofData,WBCanyonData
 
     # Generate output text file for Runoff
     timeseriesFilename = os.path.join(Output_dir,"Runoff" + case +month_name+ ".txt")
-    outputFile_Runoff = open(timeseriesFilename, "w")
-    outputFile_Runoff.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_Runoff.write("# Runoff at roof and ground \n")
-    outputFile_Runoff.write(
-        "# 0:time [hr] 1:QRoofImp [mm s^-1] 2:QRoofVegDrip [mm s^-1] 3:QRoofVegPond [mm s^-1] 4:QRoofVegSoil [mm s^-1] 5:QGroundImp [mm s^-1] "
-        "6:QGroundBarePond [mm s^-1] 7:QGroundBareSoil [mm s^-1] 8:QTree [mm s^-1] 9:QGroundVegDrip [mm s^-1] 10:QGroundVegPond [mm s^-1] "
-        " 11:QGroundVegSoil [mm s^-1], 12:RunoffGroundTot [mm s^-1]\n")
-    for i in range(len(time)):
+    outputFile_Runoff = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_Runoff.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_Runoff.write("# Runoff at roof and ground \n")
+        outputFile_Runoff.write(
+            "# 0:time [hr] 1:QRoofImp [mm s^-1] 2:QRoofVegDrip [mm s^-1] 3:QRoofVegPond [mm s^-1] 4:QRoofVegSoil [mm s^-1] 5:QGroundImp [mm s^-1] "
+            "6:QGroundBarePond [mm s^-1] 7:QGroundBareSoil [mm s^-1] 8:QTree [mm s^-1] 9:QGroundVegDrip [mm s^-1] 10:QGroundVegPond [mm s^-1] "
+            " 11:QGroundVegSoil [mm s^-1], 12:RunoffGroundTot [mm s^-1]\n")
+    for i in _rows(time,rows):
 
         # Write NaN if an urban feature is non-existent
         if not int(FractionsRoof.fimp > 0) == 1:
@@ -498,13 +541,14 @@ def Write_WB(case,FractionsRoof,FractionsGround,ParTree, WBRoofData,WBCanyonData
 
     # Generate output text file for Runon
     timeseriesFilename = os.path.join(Output_dir,"Runon" + case +month_name+ ".txt")
-    outputFile_Runon = open(timeseriesFilename, "w")
-    outputFile_Runon.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_Runon.write("# Runon at roof and ground \n")
-    outputFile_Runon.write(
-        "# 0:time [hr] 1:RunonRoofTot [mm s^-1] 2:RunoffRoofTot [mm s^-1] 3:RunonGroundTot [mm s^-1] 4:RunoffGroundTot [mm s^-1] 5:RunonUrban [mm s^-1] "
-        "6:RunoffUrban [mm s^-1]\n")
-    for i in range(len(time)):
+    outputFile_Runon = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_Runon.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_Runon.write("# Runon at roof and ground \n")
+        outputFile_Runon.write(
+            "# 0:time [hr] 1:RunonRoofTot [mm s^-1] 2:RunoffRoofTot [mm s^-1] 3:RunonGroundTot [mm s^-1] 4:RunoffGroundTot [mm s^-1] 5:RunonUrban [mm s^-1] "
+            "6:RunoffUrban [mm s^-1]\n")
+    for i in _rows(time,rows):
         outputFile_Runon.write("%i %f %f %f %f %f %f \n"
                                % (i,WBRoofData[i].RunonRoofTot,WBRoofData[i].RunoffRoofTot,WBCanyonData[i].Runon.RunonGroundTot,
                                   WBCanyonData[i].Runoff.RunoffGroundTot,WBCanyonData[i].Runon.RunonUrban,WBCanyonData[i].Runoff.RunoffUrban))
@@ -512,13 +556,14 @@ def Write_WB(case,FractionsRoof,FractionsGround,ParTree, WBRoofData,WBCanyonData
 
     # Generate output text file for dVwater
     timeseriesFilename = os.path.join(Output_dir,"SoilWaterVolumeChange" + case +month_name+ ".txt")
-    outputFile_dVwater = open(timeseriesFilename, "w")
-    outputFile_dVwater.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_dVwater.write("# Change in water volume of soil \n")
-    outputFile_dVwater.write(
-        "# 0:time [hr] 1:dVRoofSoilVeg_dt [mm s^-1] 2:dVGroundSoilImp_dt [mm s^-1] 3:dVGroundSoilBare_dt [mm s^-1] 4:dVGroundSoilVeg_dt [mm s^-1] "
-        "5:dVGroundSoilTot_dt \n")
-    for i in range(len(time)):
+    outputFile_dVwater = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_dVwater.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_dVwater.write("# Change in water volume of soil \n")
+        outputFile_dVwater.write(
+            "# 0:time [hr] 1:dVRoofSoilVeg_dt [mm s^-1] 2:dVGroundSoilImp_dt [mm s^-1] 3:dVGroundSoilBare_dt [mm s^-1] 4:dVGroundSoilVeg_dt [mm s^-1] "
+            "5:dVGroundSoilTot_dt \n")
+    for i in _rows(time,rows):
 
         # Write NaN if an urban feature is non-existent
         if not int(FractionsGround.fimp > 0) == 1:
@@ -536,13 +581,14 @@ def Write_WB(case,FractionsRoof,FractionsGround,ParTree, WBRoofData,WBCanyonData
 
     # Generate output text file for WB_OtherParam
     timeseriesFilename = os.path.join(Output_dir,"OtherWaterTerms" + case +month_name+ ".txt")
-    outputFile_WB_OtherParam = open(timeseriesFilename, "w")
-    outputFile_WB_OtherParam.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_WB_OtherParam.write("# Other water terms \n")
-    outputFile_WB_OtherParam.write(
-        "# 0:time [hr] 1:RainGround [mm s^-1] 2:Anthropogenic_Bare [mm s^-1] 3:Anthropogenic_Veg [mm s^-1] 4:Egveg_Soil [kg m^-2 s^-1] "
-        "5:Egimp_soil [kg m^-2 s^-1] 6:Rd_gimp [mm] 7:Rd_gveg [mm] 8:Rd_gbare [mm] 9:Anthropogenic_Roof [mm s^-1] 10: Etot [mm s^-1] 11:StorageTot [mm s^-1] \n")
-    for i in range(len(time)):
+    outputFile_WB_OtherParam = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_WB_OtherParam.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_WB_OtherParam.write("# Other water terms \n")
+        outputFile_WB_OtherParam.write(
+            "# 0:time [hr] 1:RainGround [mm s^-1] 2:Anthropogenic_Bare [mm s^-1] 3:Anthropogenic_Veg [mm s^-1] 4:Egveg_Soil [kg m^-2 s^-1] "
+            "5:Egimp_soil [kg m^-2 s^-1] 6:Rd_gimp [mm] 7:Rd_gveg [mm] 8:Rd_gbare [mm] 9:Anthropogenic_Roof [mm s^-1] 10: Etot [mm s^-1] 11:StorageTot [mm s^-1] \n")
+    for i in _rows(time,rows):
 
         # Write NaN if an urban feature is non-existent
         ## Check if these terms are appropriately set to NaN
@@ -565,13 +611,14 @@ def Write_WB(case,FractionsRoof,FractionsGround,ParTree, WBRoofData,WBCanyonData
 
     # Generate output text file for TE
     timeseriesFilename = os.path.join(Output_dir,"Transpiration" + case +month_name+ ".txt")
-    outputFile_TE = open(timeseriesFilename, "w")
-    outputFile_TE.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_TE.write("# Transpiration from low and high vegetation \n")
-    outputFile_TE.write(
-        "# 0:time [hr] 1:TEgveg_imp [kg m^-2 s^-1] 2:TEtree_imp [kg m^-2 s^-1] 3:TEgveg_bare [kg m^-2 s^-1] 4:TEtree_bare [kg m^-2 s^-1]"
-        " 5:TEgveg_veg [kg m^-2 s^-1] 6:TEtree_veg [kg m^-2 s^-1]\n")
-    for i in range(len(time)):
+    outputFile_TE = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_TE.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_TE.write("# Transpiration from low and high vegetation \n")
+        outputFile_TE.write(
+            "# 0:time [hr] 1:TEgveg_imp [kg m^-2 s^-1] 2:TEtree_imp [kg m^-2 s^-1] 3:TEgveg_bare [kg m^-2 s^-1] 4:TEtree_bare [kg m^-2 s^-1]"
+            " 5:TEgveg_veg [kg m^-2 s^-1] 6:TEtree_veg [kg m^-2 s^-1]\n")
+    for i in _rows(time,rows):
 
         # Write NaN if an urban feature is non-existent
         ## Check if these terms are appropriately set to NaN
@@ -592,13 +639,14 @@ def Write_WB(case,FractionsRoof,FractionsGround,ParTree, WBRoofData,WBCanyonData
 
     # Generate output text file for WBIndv
     timeseriesFilename = os.path.join(Output_dir,"WaterBalanceResiduals" + case +month_name+ ".txt")
-    outputFile_WB = open(timeseriesFilename, "w")
-    outputFile_WB.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_WB.write("# Water balance residual terms \n")
-    outputFile_WB.write(
-        "# 0:time [hr] 1:WB_In_tree [mm s^-1] 2:WB_In_gveg [mm s^-1] 3:WB_In_gimp [mm s^-1] 4:WB_In_gbare [mm s^-1] 5:WB_Pond_gveg [mm s^-1]"
-        " 6:WB_Soil_gimp [mm s^-1] 7:WB_Soil_gbare [mm s^-1] 8:WB_Soil_gveg [mm s^-1] \n")
-    for i in range(len(time)):
+    outputFile_WB = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_WB.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_WB.write("# Water balance residual terms \n")
+        outputFile_WB.write(
+            "# 0:time [hr] 1:WB_In_tree [mm s^-1] 2:WB_In_gveg [mm s^-1] 3:WB_In_gimp [mm s^-1] 4:WB_In_gbare [mm s^-1] 5:WB_Pond_gveg [mm s^-1]"
+            " 6:WB_Soil_gimp [mm s^-1] 7:WB_Soil_gbare [mm s^-1] 8:WB_Soil_gveg [mm s^-1] \n")
+    for i in _rows(time,rows):
 
         # Write NaN if an urban feature is non-existent
         ## Check if these terms are appropriately set to NaN
@@ -623,12 +671,13 @@ def Write_WB(case,FractionsRoof,FractionsGround,ParTree, WBRoofData,WBCanyonData
 
     # Generate output text file for SoilPotW
     timeseriesFilename = os.path.join(Output_dir,"SoilWaterPotential" + case +month_name+ ".txt")
-    outputFile_SoilPotW = open(timeseriesFilename, "w")
-    outputFile_SoilPotW.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-    outputFile_SoilPotW.write("# Soil water potential \n")
-    outputFile_SoilPotW.write(
-        "# 0:time [hr] 1:SoilPotWGroundTot_H [MPa] 2:SoilPotWGroundTot_L [MPa] \n")
-    for i in range(len(time)):
+    outputFile_SoilPotW = open(timeseriesFilename, mode)
+    if mode == "w":
+        outputFile_SoilPotW.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+        outputFile_SoilPotW.write("# Soil water potential \n")
+        outputFile_SoilPotW.write(
+            "# 0:time [hr] 1:SoilPotWGroundTot_H [MPa] 2:SoilPotWGroundTot_L [MPa] \n")
+    for i in _rows(time,rows):
 
         outputFile_SoilPotW.write("%i %f %f \n"
                             % (i,WBCanyonData[i].SoilPotW.SoilPotWGroundTot_H,WBCanyonData[i].SoilPotW.SoilPotWGroundTot_L))
@@ -808,32 +857,130 @@ BEMvariables = {
         'wTemp': 'Temperature w Factor  [-]',
         'wHum': 'Humidity w Factor  [-]'
     }
-def Write_BEM(BEMData, time, case, Output_dir, month_name):
+BEM_fields = {'BEMData': ['frac'] + ['building.' + var for var in BEMvariables]}
+
+# Fields recorded for all writers
+Output_fields = [Forcing_fields,EB_fields,Tsurf_fields,WB_fields,TdeepProfiles_fields,Profiles1D_fields,
+                 Ruralprofiles_fields,BEM_fields]
+
+# Fields of the profile writers, which have one column per record and are written at the end of the simulation
+Profile_fields = [TdeepProfiles_fields,Profiles1D_fields,Ruralprofiles_fields]
+
+# Units of the recorded fields; a path to an object applies to all attributes below it
+Output_units = {
+    'ForcingData': {'Tatm': 'K', 'Uatm': 'm s^-1', 'rel_hum': '-', 'q_atm': 'kg kg^-1', 'Pre': 'Pa', 'Rain': 'mm s^-1'},
+    'EBRoofData': {'SWR': 'W m^-2', 'LWR': 'W m^-2', 'Hflux': 'W m^-2', 'LEflux': 'W m^-2', 'Gflux': 'W m^-2',
+                   'Eflux': 'kg m^-2 s^-1'},
+    'EBCanyonData': {'SWR': 'W m^-2', 'LWR': 'W m^-2', 'Hflux': 'W m^-2', 'LEflux': 'W m^-2', 'Gflux': 'W m^-2',
+                     'Eflux': 'kg m^-2 s^-1', 'Ttree': 'K'},
+    'EBRuralData': {'EnergyFlux': 'W m^-2'},
+    'UCMData': {'UrbanFlux_H': 'W m^-2', 'UrbanFlux_LE': 'W m^-2', 'VerticalProfUrban.qn': 'kg kg^-1',
+                'VerticalProfUrban.tke': 'm^2 s^-2', 'VerticalProfUrban.th': 'K', 'VerticalProfUrban.vx': 'm s^-1',
+                'VerticalProfUrban.vy': 'm s^-1', 'VerticalProfUrban.s': 'm s^-1', 'VerticalProfUrban.LEflux': 'W m^-2',
+                'VerticalProfUrban.Hflux': 'W m^-2'},
+    'RoofImpData': {'Text': 'K'}, 'RoofVegData': {'Text': 'K'}, 'WallSunData': {'Text': 'K'}, 'WallShadeData': {'Text': 'K'},
+    'GroundImpData': {'Text': 'K', 'layerTemp': 'K', 'z_depth': 'm'},
+    'GroundBareData': {'Text': 'K', 'layerTemp': 'K', 'z_depth': 'm'},
+    'GroundVegData': {'Text': 'K', 'layerTemp': 'K', 'z_depth': 'm'},
+    'RuralData': {'Text': 'K'},
+    'WBRoofData': {'Anthp': 'mm s^-1', 'Leakage': 'mm s^-1', 'Runoff': 'mm s^-1', 'RunoffRoofTot': 'mm s^-1',
+                   'RunonRoofTot': 'mm s^-1', 'dInt_dt': 'mm s^-1', 'dVRoofSoil_dt': 'mm s^-1', 'fRoofVeg': 'mm s^-1'},
+    'WBCanyonData': {'Anth_gbare': 'mm s^-1', 'Anth_gveg': 'mm s^-1', 'EfluxCanyon': 'mm s^-1', 'Egimp_soil1': 'kg m^-2 s^-1',
+                     'Egveg_Soil1': 'kg m^-2 s^-1', 'Infiltration': 'mm s^-1', 'Leakage': 'mm s^-1', 'RainGround': 'mm s^-1',
+                     'Rd': 'mm', 'Runoff': 'mm s^-1', 'Runon': 'mm s^-1', 'SoilPotW': 'MPa', 'TE': 'kg m^-2 s^-1',
+                     'WBIndv': 'mm s^-1', 'WaterStorageCanyon': 'mm s^-1', 'dInt_dt': 'mm s^-1', 'dVwater_dt': 'mm s^-1'},
+    'RSMData': {'T_rural': 'K', 'q_rural': 'kg kg^-1', 'presProf': 'Pa', 'z': 'm'},
+    'BEMData': dict([('frac', '-')] + [('building.' + var, desc[desc.rfind('[')+1:desc.rfind(']')])
+                                       for var, desc in BEMvariables.items()])
+    }
+
+def Output_unit(name,path):
+    # Unit of a recorded field from the longest matching path in Output_units
+    units = Output_units.get(name,{})
+    attrs = path.split('.')
+    for k in range(len(attrs),0,-1):
+        if '.'.join(attrs[0:k]) in units:
+            return units['.'.join(attrs[0:k])]
+    return ''
+
+def Write_NPZ(Recorder,time,case,Output_dir, month_name):
+
+    """
+    Write all recorded fields of the simulation in one compressed binary file (numpy .npz)
+    Each field is stored as an array with the record index as the first dimension under the key "RecordName/path"
+    (e.g. "EBRoofData/SWR.SWRabsRoofImp"); units and other metadata are stored as a JSON string under "metadata".
+    With streamed output, only the profile fields hold all records; the time series fields are in the text files.
+    """
+
+    Data = Recorder.complete()
+    Fields = {}
+    Units = {}
+    for name in Data:
+        for path in Data[name]:
+            Fields[name + '/' + path] = Data[name][path]
+            Units[name + '/' + path] = Output_unit(name,path)
+
+    metadata = {'case': case, 'month_name': month_name, 'nRecord': Recorder.nRecord, 'time': 's',
+                'units': Units, 'nElem': {name: Recorder.nElem[name] for name in Data}}
+
+    npzFilename = os.path.join(Output_dir,"Output" + case + month_name + ".npz")
+    numpy.savez_compressed(npzFilename, time=numpy.array([numpy.NaN if t is None else t for t in time],dtype=float),
+                           metadata=numpy.array(json.dumps(metadata)), **Fields)
+
+def Read_NPZ(npzFilename,fields=None):
+
+    """
+    Read the output written by Write_NPZ
+    ------
+    INPUT:
+    npzFilename: Path of the .npz file
+    fields: Keys or key prefixes to read (e.g. "EBRoofData/SWR" or "UCMData/VerticalProfUrban.th"); all fields if None.
+            Only the requested arrays are decompressed.
+    -------
+    OUTPUT:
+    time: Time of each record [s]
+    data: Dictionary of arrays with "RecordName/path" keys
+    metadata: Dictionary with the units of each field ("units") and run information
+    """
+
+    with numpy.load(npzFilename) as container:
+        metadata = json.loads(str(container['metadata']))
+        time = container['time']
+        keys = [k for k in container.files if k not in ('time','metadata')]
+        if fields is not None:
+            keys = [k for k in keys if any(k == f or k.startswith(f + '.') or k.startswith(f + '/') for f in fields)]
+        data = {k: container[k] for k in keys}
+
+    return time,data,metadata
+
+def Write_BEM(BEMData, time, case, Output_dir, month_name, rows=None, mode="w"):
     # Initialize all the variables in a dictionary
 
 
-    data = {var: numpy.zeros(len(BEMData)) for var in BEMvariables}
+    rows = _rows(time,rows)
+    data = {var: numpy.zeros(len(rows)) for var in BEMvariables}
 
     # Process each BEMData
-    for i in range(len(BEMData)):
+    for k,i in enumerate(rows):
         BEM = BEMData[i]
         for j in range(len(BEM)):
             for var in BEMvariables:
                 building_value = getattr(BEM[j].building, var)
                 if numpy.isnan(building_value):
-                    data[var][i] = 'NaN'  # Set the value to 'NaN' as a string
+                    data[var][k] = 'NaN'  # Set the value to 'NaN' as a string
                 else:
-                    data[var][i] += BEM[j].frac * building_value
+                    data[var][k] += BEM[j].frac * building_value
 
     # Generate output text file for BEM
     timeseriesFilename = os.path.join(Output_dir, "BEM" + case + month_name + ".txt")
-    with open(timeseriesFilename, "w") as outputFile_BEM:
-        outputFile_BEM.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
-        outputFile_BEM.write("# Building energy model terms \n")
-        outputFile_BEM.write(
-            "# time [hr] " + " ".join([f"{i}:{desc}" for i, desc in enumerate(BEMvariables.values())]) + " \n")
-
-        for i in range(len(time)):
+    with open(timeseriesFilename, mode) as outputFile_BEM:
+        if mode == "w":
+            outputFile_BEM.write("#### \t Vertical City Weather Generator (VCWG)  \t #### \n")
+            outputFile_BEM.write("# Building energy model terms \n")
+            outputFile_BEM.write(
+                "# time [hr] " + " ".join([f"{i}:{desc}" for i, desc in enumerate(BEMvariables.values())]) + " \n")
+
+        for k,i in enumerate(rows):
             outputFile_BEM.write("%i " % i + " ".join(
-                [f"{data[var][i]:.6f}" if isinstance(data[var][i], (int, float)) else 'NaN' for var in
+                [f"{data[var][k]:.6f}" if isinstance(data[var][k], (int, float)) else 'NaN' for var in
                  BEMvariables]) + "\n")
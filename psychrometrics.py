@@ -1,4 +1,5 @@
 from math import log, pow, exp
+import numpy
 
 """
 Calculate dew point temperature, saturation pressure, specific humidity
@@ -100,6 +101,30 @@ def saturation_pressure(Tdb_):
 
     return _Pws
 
+def relative_humidity(Tdb_in, w_in, P):
+
+    """
+    Relative humidity as calculated by psychrometrics; the inputs may be arrays
+    ------
+    INPUT:
+    Tdb_in: Dry bulb temperature [K]
+    w_in: Specific humidity [kg kg^-1]
+    P: Pressure [Pa]
+    -------
+    OUTPUT:
+    phi: Relative humidity [%]
+    """
+
+    P = P/1000.                                           # convert from [Pa] to [kPa]
+    Tdb = Tdb_in - 273.15                                 # [C]
+    Pw = (w_in*P)/(0.621945 + w_in)                       # partial pressure of water vapor [kPa]
+    T = Tdb + 273.15                                      # [K]
+    # Saturation pressure [kPa] as in saturation_pressure
+    Pws = numpy.exp(-1*(5.8002206e3) / T+1.3914993 + (4.8640239e-2)*T*(-1.) + (4.1764768e-5)*T**2 - (1.4452093e-8)*T**3 +
+                    6.5459673*numpy.log(T))/1000.
+
+    return (Pw/Pws)*100.0
+
 def moist_air_density(P,Tdb,H):
     # Moist air density [kgv m^-3] given dry bulb temperature, humidity ratio, and pressure.
     # ASHRAE Fundamentals (2005) ch. 6 eqn. 28
@@ -112,6 +137,7 @@ def moist_air_density(P,Tdb,H):
 def HumFromRHumTemp(RH,T,P):
 
     """
+    The inputs may be arrays
     ------
     INPUT:
     RH: Relative humidity [%]
@@ -132,9 +158,9 @@ def HumFromRHumTemp(RH,T,P):
     C13 = 6.5459673
 
     # Convert temperature from Celcius [C] to Kelvin [K]
-    T += 273.15
+    T = T + 273.15
 
-    PWS = exp(C8/T + C9 + C10*T + C11 * pow(T,2) + C12 * pow(T,3) + C13 * log(T))
+    PWS = numpy.exp(C8/T + C9 + C10*T + C11 * T**2 + C12 * T**3 + C13 * numpy.log(T))
     PW = RH*PWS/100.0        # Vapour pressure
     W = 0.62198*PW/(P-PW)    # Specific humidity
 
@@ -3,6 +3,7 @@ from math import pow, log, exp
 from psychrometrics import HumFromRHumTemp
 import numpy
 import os
+from FileUtilities import CacheKey,WriteFileAtomic
 
 """
 Developed by Bruno Bueno
@@ -38,12 +39,9 @@ class Weather(object):
         #H1 and HF define the row we want
         EPW_path = os.path.join('resources','epw')
         Climate_file = os.path.join(EPW_path,EPW_file)
-        # Open .epw file and feed csv data to self.climate_data
-        with open(Climate_file) as f:
-            lines = f.readlines()
-        self.climate_data = []
-        for i in range(len(lines)):
-            self.climate_data.append(list(lines[i].split(",")))
+        # Header lines of the .epw file and the rows of the file as an array (memory-mapped from the weather cache)
+        header, data = ReadEPW(Climate_file)
+        self.climate_data = [list(header[i].split(",")) for i in range(len(header))]
 
         # Read header lines (1 to 8) from EPW and ensure TMY2 format.
         self._header = self.climate_data[0:8]
@@ -67,33 +65,107 @@ class Weather(object):
                 self.Tsoil[i][j] = float(soilData[6 + (i * 16) + j]) + 273.15  # 12 months of soil T for specific depth
 
         self.location = self.climate_data[0][1]
-        cd = self.climate_data[HI:HF+1]
-        self.staYear = numpy.array([cd[i][0] for i in range(len(cd))],dtype=float)
-        self.staMonth = numpy.array([cd[i][1] for i in range(len(cd))],dtype=float)
-        self.staDay = numpy.array([cd[i][2] for i in range(len(cd))],dtype=float)
-        self.staHour = numpy.array([cd[i][3] for i in range(len(cd))],dtype=float)
-        self.staMin = numpy.array([cd[i][4] for i in range(len(cd))],dtype=float)
-        self.staTemp = numpy.array([cd[i][6] for i in range(len(cd))],dtype=float)           # drybulb [C]
-        self.staTdp = numpy.array([cd[i][7] for i in range(len(cd))],dtype=float)            # dewpoint [C]
-        self.staRhum = numpy.array([cd[i][8] for i in range(len(cd))],dtype=float)           # air relative humidity [%]
-        self.staPres = numpy.array([cd[i][9] for i in range(len(cd))],dtype=float)           # air pressure [Pa]
-        self.staInfra = numpy.array([cd[i][12] for i in range(len(cd))],dtype=float)         # horizontal Infrared Radiation Intensity [W m^-2]
-        self.staHor = numpy.array([cd[i][13] for i in range(len(cd))],dtype=float)           # horizontal radiation [W m^-2]
-        self.staDir = numpy.array([cd[i][14] for i in range(len(cd))],dtype=float)           # normal solar direct radiation [W m^-2]
-        self.staDif = numpy.array([cd[i][15] for i in range(len(cd))],dtype=float)           # horizontal solar diffuse radiation [W m^-2]
-        self.staUdir = numpy.array([cd[i][20] for i in range(len(cd))],dtype=float)          # wind direction [deg]
-        self.staUmod = numpy.array([cd[i][21] for i in range(len(cd))],dtype=float)          # wind speed [m s^-1]
-        self.staRobs = numpy.array([cd[i][33] for i in range(len(cd))],dtype=float)          # Precipitation [mm h^-1]
-        self.staHum = [0.0] * len(self.staTemp)                              # specific humidity [kg kg^-1]
-        for i in range(len(self.staTemp)):
-            self.staHum[i] = HumFromRHumTemp(self.staRhum[i], self.staTemp[i], self.staPres[i])
-        #print(self.staHum)
-        self.staTemp = [s+273.15 for s in self.staTemp]                      # air temperature [K]
-        #print(HI)
-        #print(HF)
+        # Only the rows of the simulation period are read from the file
+        cd = numpy.array(data[HI:HF+1])
+        self.staYear = cd[:,0]
+        self.staMonth = cd[:,1]
+        self.staDay = cd[:,2]
+        self.staHour = cd[:,3]
+        self.staMin = cd[:,4]
+        self.staTemp = cd[:,6]           # drybulb [C]
+        self.staTdp = cd[:,7]            # dewpoint [C]
+        self.staRhum = cd[:,8]           # air relative humidity [%]
+        self.staPres = cd[:,9]           # air pressure [Pa]
+        self.staInfra = cd[:,12]         # horizontal Infrared Radiation Intensity [W m^-2]
+        self.staHor = cd[:,13]           # horizontal radiation [W m^-2]
+        self.staDir = cd[:,14]           # normal solar direct radiation [W m^-2]
+        self.staDif = cd[:,15]           # horizontal solar diffuse radiation [W m^-2]
+        self.staUdir = cd[:,20]          # wind direction [deg]
+        self.staUmod = cd[:,21]          # wind speed [m s^-1]
+        self.staRobs = cd[:,33]          # Precipitation [mm h^-1]
+        self.staHum = HumFromRHumTemp(self.staRhum, self.staTemp, self.staPres).tolist()   # specific humidity [kg kg^-1]
+        self.staTemp = (self.staTemp+273.15).tolist()                                        # air temperature [K]
+
     def __repr__(self):
         return "Weather: {a}, HI Tdb:{b}, HF Tdb:{c}".format(
             a=self.location,
             b=self.staTemp[0]-273.15,
             c=self.staTemp[-1]-273.15
             )
+
+# The rows of an .epw file are converted once to a binary array file in this directory (next to the .epw files), which
+# is memory-mapped so that a simulation only reads the rows of its period. The cache file name depends on the path,
+# modification time, and size of the .epw file, so a modified or regenerated file (e.g. TopForcing.epw) is converted again.
+WeatherCacheDir = 'WeatherCache'
+WeatherCacheVersion = 1
+# Number of header lines of an .epw file
+EPWHeaderLines = 8
+
+def WeatherCacheFile(Climate_file):
+
+    """
+    ------
+    INPUT:
+    Climate_file: Path of the .epw file
+    -------
+    OUTPUT:
+    CacheFile: Path of the cache file of the rows (.npy); the header lines are stored in the same path with .txt
+    """
+
+    st = os.stat(Climate_file)
+    Param = (WeatherCacheVersion,os.path.abspath(Climate_file),st.st_mtime_ns,st.st_size)
+    return os.path.join(os.path.dirname(Climate_file),WeatherCacheDir,'EPW_' + CacheKey(*Param) + '.npy')
+
+def _field(value):
+    try:
+        return float(value)
+    except ValueError:
+        return numpy.NaN
+
+def ParseEPW(Climate_file):
+
+    """
+    ------
+    INPUT:
+    Climate_file: Path of the .epw file
+    -------
+    OUTPUT:
+    header: Header lines of the file
+    data: Array of the fields of every line of the file [line, column]; the header lines and fields that are not numbers
+          (e.g. the data source flags) are NaN
+    """
+
+    with open(Climate_file) as f:
+        lines = f.readlines()
+    header = lines[0:EPWHeaderLines]
+    rows = [line.split(",") for line in lines[EPWHeaderLines:]]
+    nColumn = max([len(row) for row in rows] + [0])
+    data = numpy.full((len(lines),nColumn),numpy.NaN)
+    for i in range(len(rows)):
+        data[EPWHeaderLines+i,0:len(rows[i])] = [_field(value) for value in rows[i]]
+    return header, data
+
+def ReadEPW(Climate_file):
+
+    """
+    Return the header lines and rows (see ParseEPW) of an .epw file; the file is converted to the weather cache if it is
+    not converted yet, and the rows are memory-mapped from the cache file
+    """
+
+    CacheFile = WeatherCacheFile(Climate_file)
+    HeaderFile = CacheFile[:-len('.npy')] + '.txt'
+    if os.path.isfile(CacheFile) and os.path.isfile(HeaderFile):
+        with open(HeaderFile) as f:
+            header = f.readlines()
+        return header, numpy.load(CacheFile,mmap_mode='r')
+
+    header, data = ParseEPW(Climate_file)
+    try:
+        os.makedirs(os.path.dirname(CacheFile),exist_ok=True)
+        # The header file is written first since the .npy file marks a complete conversion
+        WriteFileAtomic(HeaderFile,lambda f: f.writelines(header))
+        WriteFileAtomic(CacheFile,lambda f: numpy.save(f,data),binary=True)
+    except OSError:
+        # Read-only resources: use the parsed file without caching it
+        return header, data
+    return header, numpy.load(CacheFile,mmap_mode='r')